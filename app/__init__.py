@@ -1,12 +1,13 @@
 from venv import logger
 from flask import Flask
-from neo4j import GraphDatabase
 import os
 import logging
 
 from app.algoritmo.label_propagation import MotoLabelPropagation
 from app.algoritmo.moto_ideal import MotoIdealRecommender
 from app.algoritmo.pagerank import MotoPageRank
+from app.algoritmo.neo4j_driver import get_driver
+from app.algoritmo.log_config import configure_logging
 from .adapter_factory import create_adapter
 
 def create_app():
@@ -23,24 +24,17 @@ def create_app():
     # Configuración básica
     app.config['SECRET_KEY'] = 'your-secret-key-here'
     
-    # Configurar logging
-    logging.basicConfig(level=logging.INFO)
+    # Configurar logging (niveles por subsistema de LOGGING_CONFIG)
+    configure_logging(app.config.get('LOGGING_CONFIG'))
     
     # Fix database connection issues
     fix_database_connection()
     
     # Inicializar conexión a Neo4j
     try:
-        # Crear una conexión de prueba para verificar la configuración
+        # Crear (y verificar) el driver compartido del proceso
         neo4j_config = app.config.get('NEO4J_CONFIG')
-        driver = GraphDatabase.driver(
-            neo4j_config['uri'],
-            auth=(neo4j_config['user'], neo4j_config['password'])
-        )
-        # Verificar conexión
-        with driver.session() as session:
-            session.run("RETURN 1")
-        driver.close()
+        get_driver(neo4j_config['uri'], neo4j_config['user'], neo4j_config['password'])
         app.logger.info("Conexión a Neo4j establecida correctamente")
     except Exception as e:
         app.logger.error(f"Error al conectar con Neo4j: {str(e)}")
@@ -64,6 +58,14 @@ def create_app():
         except ImportError as e:
             app.logger.warning(f"No se pudo registrar el blueprint de amigos: {str(e)}")
         
+        # Registrar la API JSON versionada
+        try:
+            from .api_v1 import api_v1
+            app.register_blueprint(api_v1, url_prefix='/api/v1')
+            app.logger.info("API JSON v1 registrada correctamente")
+        except ImportError as e:
+            app.logger.warning(f"No se pudo registrar la API JSON: {str(e)}")
+        
         # Asegurar que las importaciones de utils estén disponibles
         try:
             from .utils import login_required
@@ -26,18 +26,10 @@ def ensure_neo4j_connection_patch(adapter):
                     logger.warning("No hay un driver de Neo4j, intentando conectar...")
                     return self.connect_to_neo4j()
                 
-                # Probar la conexión existente
-                with self.driver.session() as session:
-                    try:
-                        result = session.run("RETURN 'Conexión verificada' as mensaje")
-                        message = result.single()["mensaje"]
-                        logger.debug(f"Neo4j conexión verificada: {message}")
-                        return True
-                    except Exception as session_error:
-                        logger.warning(f"Error con la sesión actual: {str(session_error)}. Reconectando...")
-                        self.driver.close()
-                        self.driver = None
-                        return self.connect_to_neo4j()
+                # Comprobación barata mediante el proveedor compartido (sin consulta por petición)
+                from app.algoritmo.neo4j_driver import ensure_driver
+                self.driver = ensure_driver(self.driver, self.neo4j_uri, self.neo4j_user, self.neo4j_password)
+                return self.driver is not None
             except Exception as e:
                 logger.error(f"Error al verificar conexión Neo4j: {str(e)}")
                 return False
@@ -81,6 +73,12 @@ def create_adapter(app=None, use_mock_data=False):
     try:
         from moto_adapter_fixed import MotoRecommenderAdapter
         
+        from app.algoritmo.shared_catalog import MANIFEST_ENV_VAR, attach_catalog
+        
+        # Si el proceso maestro publicó un catálogo compartido, adjuntarse a él
+        # en lugar de volver a cargar los datos desde Neo4j
+        use_shared_catalog = bool(os.environ.get(MANIFEST_ENV_VAR))
+        
         # Extraer los parámetros individuales del diccionario neo4j_config
         if neo4j_config:
             uri = neo4j_config.get('uri', 'bolt://localhost:7687')
@@ -91,11 +89,16 @@ def create_adapter(app=None, use_mock_data=False):
             adapter = MotoRecommenderAdapter(
                 uri=uri,
                 user=user, 
-                password=password
+                password=password,
+                load_on_init=not use_shared_catalog
             )
         else:
             # Si no hay configuración, usar valores predeterminados
-            adapter = MotoRecommenderAdapter()
+            adapter = MotoRecommenderAdapter(load_on_init=not use_shared_catalog)
+        
+        if use_shared_catalog and not attach_catalog(adapter):
+            logger.warning("No se pudo adjuntar el catálogo compartido, cargando desde Neo4j")
+            adapter.load_data()
         
         # Establecer flag de datos simulados
         adapter.use_mock_data = use_mock_data
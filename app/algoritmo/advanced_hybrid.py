@@ -19,8 +19,13 @@ import pickle
 import os
 import logging
 
-# Configuración de logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from .id_registry import IdSpace, MISSING_ID
+from .sparse_interactions import SparseInteractionFrame, sparse_matrix
+from .topk import top_k, top_k_rows, CandidateAccumulator
+from .ann_index import build_ann_index
+from .diversity import MMRReranker
+from .training_data import TripletTrainingData
+
 logger = logging.getLogger(__name__)
 
 class AdvancedHybridRecommender:
@@ -45,6 +50,10 @@ class AdvancedHybridRecommender:
                 - epochs: Número de épocas para entrenamiento
                 - batch_size: Tamaño de lote para entrenamiento
                 - contextual_weight: Peso de los factores contextuales
+                - content_neighbors: Motos similares precalculadas por moto
+                - ann_index: Índice de vecinos ('auto', 'exact', 'ivf'; None para no usarlo)
+                - ann_min_items: Motos a partir de las que 'auto' usa el índice IVF
+                - ann_params: Parámetros del índice (n_lists, n_probe...)
         """
         # Configuración predeterminada
         self.config = {
@@ -57,6 +66,10 @@ class AdvancedHybridRecommender:
             'contextual_weight': 0.3,
             'feature_weight': 0.4,
             'collaborative_weight': 0.3,
+            'content_neighbors': 50,
+            'ann_index': 'auto',
+            'ann_min_items': 2000,
+            'ann_params': {},
             'model_path': 'models/'
         }
         
@@ -214,41 +227,34 @@ class AdvancedHybridRecommender:
         Args:
             interactions (pandas.DataFrame): Datos de interacciones
         """
-        # Crear mapeos de IDs a índices
-        unique_users = interactions['user_id'].unique()
-        unique_motos = interactions['moto_id'].unique()
-        
-        self.user_map = {user: i for i, user in enumerate(unique_users)}
-        self.moto_map = {moto: i for i, moto in enumerate(unique_motos)}
-        self.inv_user_map = {i: user for user, i in self.user_map.items()}
-        self.inv_moto_map = {i: moto for moto, i in self.moto_map.items()}
+        # Crear mapeos de IDs a índices con un espacio de ids propio de esta
+        # carga: fila/columna de las matrices coinciden con el código del id y
+        # las matrices no crecen con los ids internados por otros algoritmos
+        self.id_space = IdSpace(interactions['user_id'], interactions['moto_id'])
+        user_codes = self.id_space.users.intern_many(interactions['user_id'])
+        moto_codes = self.id_space.motos.intern_many(interactions['moto_id'])
+        valid = (user_codes != MISSING_ID) & (moto_codes != MISSING_ID)
+        
+        self.user_map = self.id_space.users.as_dict()
+        self.moto_map = self.id_space.motos.as_dict()
+        user_index = pd.Index(self.id_space.users.ids, name='user_id')
+        moto_index = pd.Index(self.id_space.motos.ids, name='moto_id')
+        self.inv_user_map = dict(enumerate(user_index))
+        self.inv_moto_map = dict(enumerate(moto_index))
+        shape = (len(user_index), len(moto_index))
         
         # Crear matriz de valoraciones si existe la columna 'rating'
         if 'rating' in interactions.columns:
-            # Pivot table para matriz de valoraciones
-            self.ratings_df = interactions.pivot_table(
-                index='user_id', 
-                columns='moto_id', 
-                values='rating',
-                fill_value=0
-            )
-            
-            # Convertir a matriz dispersa para eficiencia
-            self.ratings_matrix = csr_matrix(self.ratings_df.values)
+            ratings = pd.to_numeric(interactions['rating'], errors='coerce').to_numpy(dtype=np.float64)
+            rated = valid & ~np.isnan(ratings)
+            # Media de las valoraciones repetidas (como el antiguo pivot_table)
+            totals = sparse_matrix(user_codes[rated], moto_codes[rated], ratings[rated], shape)
+            counts = sparse_matrix(user_codes[rated], moto_codes[rated], np.ones(rated.sum()), shape)
+            self.ratings_matrix = totals.multiply(counts.power(-1)).tocsr() if counts.nnz else totals
+            self.ratings_df = SparseInteractionFrame(self.ratings_matrix, user_index, moto_index)
             
         # Crear matriz de interacciones generales (vistas, clicks, etc.)
         if 'interaction_type' in interactions.columns and 'weight' in interactions.columns:
-            # Agregar por usuario, moto y tipo de interacción
-            agg_interactions = interactions.groupby(['user_id', 'moto_id', 'interaction_type'])['weight'].sum().reset_index()
-            
-            # Pivotar para tener tipos de interacción como columnas
-            interaction_pivot = agg_interactions.pivot_table(
-                index=['user_id', 'moto_id'], 
-                columns='interaction_type', 
-                values='weight',
-                fill_value=0
-            ).reset_index()
-            
             # Simplificar a una puntuación ponderada de interacción
             # (esto podría ser más sofisticado en una implementación real)
             interaction_weights = {
@@ -258,24 +264,15 @@ class AdvancedHybridRecommender:
                 'purchase': 5
             }
             
-            # Aplicar pesos a cada tipo de interacción
-            for int_type, weight in interaction_weights.items():
-                if int_type in interaction_pivot.columns:
-                    interaction_pivot[int_type] = interaction_pivot[int_type] * weight
-            
-            # Suma ponderada de interacciones
-            interaction_pivot['total_weighted'] = interaction_pivot.drop(['user_id', 'moto_id'], axis=1).sum(axis=1)
+            # Suma ponderada por tipo de interacción; los pares repetidos se suman
+            types = interactions['interaction_type']
+            typed = valid & types.notna().to_numpy()
+            weights = pd.to_numeric(interactions['weight'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+            type_weights = types.map(interaction_weights).fillna(1).to_numpy(dtype=np.float64)
             
-            # Crear matriz de interacciones
-            interaction_matrix_df = interaction_pivot.pivot_table(
-                index='user_id', 
-                columns='moto_id', 
-                values='total_weighted',
-                fill_value=0
-            )
-            
-            self.interaction_matrix = csr_matrix(interaction_matrix_df.values)
-            self.interaction_df = interaction_matrix_df
+            self.interaction_matrix = sparse_matrix(user_codes[typed], moto_codes[typed],
+                                                    (weights * type_weights)[typed], shape)
+            self.interaction_df = SparseInteractionFrame(self.interaction_matrix, user_index, moto_index)
         
     def train_models(self):
         """
@@ -323,6 +320,10 @@ class AdvancedHybridRecommender:
         # Guardar embeddings para uso posterior
         self.user_embeddings = U
         self.moto_embeddings = Vt.T
+        self.mfm_sigma = sigma
+        
+        # Índice de vecinos sobre los embeddings de motos (producto interno)
+        self.collaborative_index = self._build_ann_index(self.moto_embeddings, metric='ip')
         
         # Guardar modelo
         model_data = {
@@ -350,63 +351,32 @@ class AdvancedHybridRecommender:
             return
             
         # Usar valoraciones o interacciones según disponibilidad
-        if hasattr(self, 'ratings_df'):
-            interactions_df = self.ratings_df.reset_index()
-            value_col = 'rating'
-        else:
-            interactions_df = self.interaction_df.reset_index()
-            value_col = 'total_weighted'
-            
-        # Preparar datos para el entrenamiento
-        train_data = []
-        
-        for _, row in interactions_df.iterrows():
-            user_id = row['user_id']
-            for col in interactions_df.columns:
-                if col != 'user_id' and row[col] > 0:
-                    moto_id = col
-                    value = row[col]
-                    
-                    # Agregar características de usuario y moto si están disponibles
-                    user_features = []
-                    if self.user_features is not None and user_id in self.user_features.index:
-                        user_features = self.user_features.loc[user_id].values.tolist()
-                        
-                    moto_features = []
-                    if self.moto_features is not None and moto_id in self.moto_features.index:
-                        moto_features = self.moto_features.loc[moto_id].values.tolist()
-                        
-                    # Añadir a datos de entrenamiento
-                    train_data.append({
-                        'user_id': self.user_map.get(user_id, -1),
-                        'moto_id': self.moto_map.get(moto_id, -1),
-                        'value': value,
-                        'user_features': user_features,
-                        'moto_features': moto_features
-                    })
-        
-        if not train_data:
-            logger.warning("No hay datos de entrenamiento para la red neuronal")
+        matrix = self.ratings_matrix if hasattr(self, 'ratings_df') else self.interaction_matrix
+        if matrix is None:
+            logger.warning("No hay datos de interacción para entrenar la red neuronal")
             return
             
-        # Verificar que hay mapeos válidos
-        valid_data = [d for d in train_data if d['user_id'] != -1 and d['moto_id'] != -1]
+        # Tripletes (usuario, moto, valor) no nulos de la matriz dispersa; las
+        # características se recogen por lote indexando por código
+        train_data = TripletTrainingData(
+            matrix,
+            user_features=self.user_features,
+            moto_features=self.moto_features,
+            user_ids=[self.inv_user_map[i] for i in range(matrix.shape[0])],
+            moto_ids=[self.inv_moto_map[i] for i in range(matrix.shape[1])]
+        )
         
-        if not valid_data:
-            logger.warning("No hay mapeos válidos de usuarios/motos para entrenar la red neuronal")
+        if len(train_data) == 0:
+            logger.warning("No hay datos de entrenamiento para la red neuronal")
             return
             
         # Preparar tensores para entrenamiento
         num_users = len(self.user_map)
         num_motos = len(self.moto_map)
         
-        user_ids = np.array([d['user_id'] for d in valid_data])
-        moto_ids = np.array([d['moto_id'] for d in valid_data])
-        values = np.array([d['value'] for d in valid_data])
-        
         # Normalizar valores
         values_scaler = MinMaxScaler()
-        values = values_scaler.fit_transform(values.reshape(-1, 1)).flatten()
+        values = values_scaler.fit_transform(train_data.values.reshape(-1, 1)).flatten()
         self.feature_scalers['values'] = values_scaler
         
         # Construir modelo de red neuronal
@@ -427,29 +397,17 @@ class AdvancedHybridRecommender:
         vectors = [user_vec, moto_vec]
         
         # Características de usuario
-        if valid_data[0]['user_features']:
-            user_feat_dim = len(valid_data[0]['user_features'])
-            user_feat_input = Input(shape=(user_feat_dim,), name='user_feat_input')
+        if train_data.user_feature_dim:
+            user_feat_input = Input(shape=(train_data.user_feature_dim,), name='user_feat_input')
             inputs.append(user_feat_input)
             vectors.append(user_feat_input)
             
-            # Preparar tensor de características de usuario
-            user_features_array = np.array([d['user_features'] for d in valid_data])
-        else:
-            user_features_array = None
-            
         # Características de moto
-        if valid_data[0]['moto_features']:
-            moto_feat_dim = len(valid_data[0]['moto_features'])
-            moto_feat_input = Input(shape=(moto_feat_dim,), name='moto_feat_input')
+        if train_data.moto_feature_dim:
+            moto_feat_input = Input(shape=(train_data.moto_feature_dim,), name='moto_feat_input')
             inputs.append(moto_feat_input)
             vectors.append(moto_feat_input)
             
-            # Preparar tensor de características de moto
-            moto_features_array = np.array([d['moto_features'] for d in valid_data])
-        else:
-            moto_features_array = None
-            
         # Concatenar todas las entradas
         concat = Concatenate()(vectors)
         
@@ -469,23 +427,19 @@ class AdvancedHybridRecommender:
             loss='mean_squared_error'
         )
         
-        # Preparar datos de entrenamiento
-        train_inputs = [user_ids, moto_ids]
-        
-        if user_features_array is not None:
-            train_inputs.append(user_features_array)
-        
-        if moto_features_array is not None:
-            train_inputs.append(moto_features_array)
+        # Lotes generados al vuelo (10% de los tripletes para validación)
+        batch_size = self.config['batch_size']
+        train_idx, validation_idx = train_data.split(validation_fraction=0.1, seed=42)
+        train_dataset = train_data.dataset(batch_size, train_idx, values, shuffle=True, seed=42)
+        validation_dataset = (train_data.dataset(batch_size, validation_idx, values)
+                              if len(validation_idx) else None)
         
         # Entrenar modelo
         model.fit(
-            train_inputs, 
-            values,
+            train_dataset,
             epochs=self.config['epochs'],
-            batch_size=self.config['batch_size'],
             verbose=1,
-            validation_split=0.1
+            validation_data=validation_dataset
         )
         
         # Guardar modelo
@@ -508,9 +462,16 @@ class AdvancedHybridRecommender:
         # Calcular matriz de similitud entre motos basada en características
         self.moto_similarity = cosine_similarity(self.moto_features.values)
         
+        # Índice de vecinos sobre las características normalizadas (coseno)
+        self.content_index = self._build_ann_index(self.moto_features.values, metric='cosine')
+        
+        # Precalcular las motos más similares a cada moto
+        self._build_moto_neighbors()
+        
         # Guardar modelo
         model_data = {
             'moto_similarity': self.moto_similarity,
+            'moto_neighbors': self.moto_neighbors,
             'moto_features': self.moto_features,
             'moto_indices': {moto: i for i, moto in enumerate(self.moto_features.index)}
         }
@@ -566,15 +527,12 @@ class AdvancedHybridRecommender:
                 all_recs[moto_id] += boost * self.config['contextual_weight']
                 reasons[moto_id].append("Recomendado para tu contexto actual")
                 
-        # Aplicar factor de diversidad (exploración vs explotación)
-        final_recs = self._apply_diversity(all_recs, diversity_factor)
-        
-        # Ordenar por puntuación
-        sorted_recs = sorted(final_recs.items(), key=lambda x: x[1], reverse=True)
+        # Aplicar factor de diversidad (exploración vs explotación) y quedarse con las top_n
+        sorted_recs = self._apply_diversity(all_recs, diversity_factor, top_n)
         
         # Preparar resultados con razones
         detailed_recs = []
-        for moto_id, score in sorted_recs[:top_n]:
+        for moto_id, score in sorted_recs:
             # Obtener características de la moto
             moto_info = None
             if hasattr(self, 'moto_features_raw'):
@@ -606,37 +564,74 @@ class AdvancedHybridRecommender:
             return []
             
         user_idx = self.user_map[user_id]
+        if user_idx >= self.mfm_predictions.shape[0]:
+            logger.warning(f"Usuario {user_id} no estaba en la matriz usada para entrenar")
+            return []
         
-        # Obtener predicciones para este usuario
-        user_predictions = self.mfm_predictions[user_idx]
+        # Excluir los ítems que el usuario ya ha valorado/interactuado (columnas
+        # no nulas de su fila dispersa) y seleccionar los n mejores sin ordenar todo
+        rated = self._rated_matrix()
+        exclude = None
+        if rated is not None and user_idx < rated.shape[0]:
+            exclude = rated.indices[rated.indptr[user_idx]:rated.indptr[user_idx + 1]]
         
-        # Obtener ítems que el usuario no ha valorado/interactuado
-        unrated_items = []
+        # Con índice de vecinos solo se puntúan los candidatos que devuelve
+        index = getattr(self, 'collaborative_index', None)
+        if index is not None:
+            query = self.user_embeddings[user_idx] * self.mfm_sigma
+            indices, scores = index.search(query, n, exclude=exclude)
+            return [(self.inv_moto_map[idx], score) for idx, score in zip(indices.tolist(), scores.tolist())]
         
-        if hasattr(self, 'ratings_df'):
-            # Si tenemos ratings explícitos
-            user_ratings = self.ratings_df.loc[user_id] if user_id in self.ratings_df.index else pd.Series()
-            unrated_items = [(self.moto_map[moto_id], moto_id) 
-                            for moto_id in self.moto_map.keys() 
-                            if moto_id not in user_ratings or user_ratings[moto_id] == 0]
-        else:
-            # Si solo tenemos interacciones implícitas
-            if hasattr(self, 'interaction_df') and user_id in self.interaction_df.index:
-                user_interactions = self.interaction_df.loc[user_id]
-                unrated_items = [(self.moto_map[moto_id], moto_id) 
-                               for moto_id in self.moto_map.keys() 
-                               if moto_id not in user_interactions or user_interactions[moto_id] == 0]
-            else:
-                # Si no hay datos del usuario, recomendar todos los ítems
-                unrated_items = [(idx, self.inv_moto_map[idx]) for idx in range(len(self.inv_moto_map))]
-        
-        # Predecir puntuaciones
-        predictions = [(moto_id, user_predictions[idx]) for idx, moto_id in unrated_items]
-        
-        # Ordenar por puntuación
-        sorted_predictions = sorted(predictions, key=lambda x: x[1], reverse=True)
+        user_predictions = self.mfm_predictions[user_idx]
+        top = top_k(user_predictions, n, exclude=exclude)
+        return [(self.inv_moto_map[idx], user_predictions[idx]) for idx in top]
+    
+    def get_collaborative_recommendations_batch(self, user_ids, n=10):
+        """
+        Recomendaciones colaborativas para varios usuarios a la vez (procesos offline).
         
-        return sorted_predictions[:n]
+        Args:
+            user_ids (iterable): IDs de los usuarios
+            n (int): Número de recomendaciones por usuario
+            
+        Returns:
+            dict: {user_id: lista de tuplas (moto_id, score)}; los usuarios
+            desconocidos reciben una lista vacía
+        """
+        user_ids = list(user_ids)
+        results = {user_id: [] for user_id in user_ids}
+        if not hasattr(self, 'mfm_predictions'):
+            logger.warning("El modelo de factorización matricial no está entrenado")
+            return results
+        
+        known = [(user_id, self.user_map[user_id]) for user_id in user_ids
+                 if user_id in self.user_map and self.user_map[user_id] < self.mfm_predictions.shape[0]]
+        if not known:
+            return results
+        rows = np.array([user_idx for _, user_idx in known])
+        
+        # Filas dispersas de los ítems ya valorados, alineadas con las predicciones
+        rated = self._rated_matrix()
+        exclude = rated[rows] if rated is not None and rated.shape == self.mfm_predictions.shape else None
+        
+        index = getattr(self, 'collaborative_index', None)
+        if index is not None:
+            indices, scores = index.search_batch(self.user_embeddings[rows] * self.mfm_sigma, n, exclude=exclude)
+        else:
+            indices, scores = top_k_rows(self.mfm_predictions[rows], n, exclude=exclude)
+        for (user_id, _), row_indices, row_scores in zip(known, indices, scores):
+            results[user_id] = [(self.inv_moto_map[idx], score)
+                                for idx, score in zip(row_indices.tolist(), row_scores.tolist())
+                                if score > -np.inf]
+        return results
+    
+    def _rated_matrix(self):
+        """Matriz dispersa de valoraciones o, si no hay, de interacciones (o None)."""
+        if hasattr(self, 'ratings_df'):
+            return self.ratings_matrix
+        if hasattr(self, 'interaction_df'):
+            return self.interaction_matrix
+        return None
     
     def _get_content_based_recommendations(self, user_id, n=10):
         """
@@ -679,39 +674,87 @@ class AdvancedHybridRecommender:
                 reason = self._get_feature_based_reason(user_profile, moto_features)
                 recommendations.append((moto_id, compatibility, reason))
         else:
-            # Usar motos previamente valoradas para encontrar similares
+            # Usar motos previamente valoradas para encontrar similares; cada
+            # candidato conserva su mejor puntuación y se evitan las ya valoradas
+            neighbor_indices, neighbor_scores = self._get_moto_neighbors()
+            candidates = CandidateAccumulator(exclude=(item[0] for item in user_items))
+            
             for moto_id, rating in sorted(user_items, key=lambda x: x[1], reverse=True)[:5]:
                 if moto_id not in self.moto_features.index:
                     continue
                     
-                # Encontrar motos similares
+                # Motos más similares (precalculadas y ordenadas)
                 moto_idx = self.moto_features.index.get_loc(moto_id)
-                similarities = list(enumerate(self.moto_similarity[moto_idx]))
-                
-                for i, similarity in sorted(similarities, key=lambda x: x[1], reverse=True):
-                    if similarity > 0.1:  # Umbral mínimo de similitud
-                        similar_moto = self.moto_features.index[i]
-                        
-                        # Evitar recomendar la misma moto u otras ya valoradas
-                        if similar_moto == moto_id or any(item[0] == similar_moto for item in user_items):
-                            continue
-                        
-                        score = similarity * rating if rating else similarity
-                        reason = self._get_similarity_reason(moto_id, similar_moto)
-                        
-                        # Agregar a recomendaciones o actualizar si ya existe con mayor score
-                        existing = next((i for i, rec in enumerate(recommendations) if rec[0] == similar_moto), None)
-                        if existing is not None:
-                            if recommendations[existing][1] < score:
-                                recommendations[existing] = (similar_moto, score, reason)
-                        else:
-                            recommendations.append((similar_moto, score, reason))
+                for i, similarity in zip(neighbor_indices[moto_idx].tolist(), neighbor_scores[moto_idx].tolist()):
+                    if similarity <= 0.1:  # Umbral mínimo de similitud
+                        break
+                    similar_moto = self.moto_features.index[i]
+                    score = similarity * rating if rating else similarity
+                    candidates.add(similar_moto, score,
+                                   lambda base=moto_id, similar=similar_moto: self._get_similarity_reason(base, similar))
+            
+            return candidates.top(n)
         
         # Ordenar por puntuación
         sorted_recs = sorted(recommendations, key=lambda x: x[1], reverse=True)
         
         return sorted_recs[:n]
     
+    def _build_moto_neighbors(self):
+        """Precalcula para cada moto las ``content_neighbors`` motos más similares (sin ella misma)."""
+        k = self.config.get('content_neighbors', 50)
+        n_motos = len(self.moto_features)
+        itself = csr_matrix((np.ones(n_motos), (np.arange(n_motos), np.arange(n_motos))), shape=(n_motos, n_motos))
+        index = getattr(self, 'content_index', None)
+        if index is not None:
+            self.moto_neighbors = index.search_batch(self.moto_features.values, k, exclude=itself)
+        else:
+            similarity = np.asarray(self.moto_similarity, dtype=np.float64)
+            self.moto_neighbors = top_k_rows(similarity, k, exclude=itself)
+        return self.moto_neighbors
+    
+    def _build_ann_index(self, vectors, metric):
+        """Construye el índice de vecinos configurado (None si está desactivado o falla)."""
+        kind = self.config.get('ann_index')
+        if not kind:
+            return None
+        try:
+            return build_ann_index(np.asarray(vectors, dtype=np.float64), kind=kind, metric=metric,
+                                   min_items=self.config.get('ann_min_items', 2000),
+                                   **self.config.get('ann_params', {}))
+        except Exception as e:
+            logger.error(f"Error al construir el índice de vecinos: {str(e)}")
+            return None
+    
+    def get_similar_motos(self, moto_id, n=10):
+        """
+        Motos más parecidas a una moto según sus características.
+        
+        Args:
+            moto_id: ID de la moto
+            n (int): Número de motos similares
+            
+        Returns:
+            list: Lista de tuplas (moto_id, similitud)
+        """
+        if self.moto_features is None or moto_id not in self.moto_features.index:
+            return []
+        position = self.moto_features.index.get_loc(moto_id)
+        index = getattr(self, 'content_index', None)
+        if index is None:
+            index = self.content_index = self._build_ann_index(self.moto_features.values, metric='cosine')
+            if index is None:
+                return []
+        query = np.asarray(self.moto_features.iloc[position].values, dtype=np.float64)
+        indices, scores = index.search(query, n, exclude=[position])
+        return [(self.moto_features.index[i], score) for i, score in zip(indices.tolist(), scores.tolist())]
+    
+    def _get_moto_neighbors(self):
+        """Vecinos precalculados (índices, similitudes); se calculan si faltan."""
+        if getattr(self, 'moto_neighbors', None) is None:
+            self._build_moto_neighbors()
+        return self.moto_neighbors
+    
     def _get_user_profile(self, user_id):
         """
         Obtiene o genera el perfil de un usuario.
@@ -979,60 +1022,43 @@ class AdvancedHybridRecommender:
                             
         return context_boost
     
-    def _apply_diversity(self, recommendations, diversity_factor):
+    def _apply_diversity(self, recommendations, diversity_factor, top_n):
         """
         Aplica un factor de diversidad a las recomendaciones.
         
+        Reordena con MMR (λ = 1 - diversity_factor) sobre las características
+        normalizadas de las motos, precalculadas una vez por catálogo.
+        
         Args:
             recommendations (dict): Diccionario de recomendaciones {moto_id: score}
             diversity_factor (float): Factor de diversidad (0-1)
+            top_n (int): Número de recomendaciones
             
         Returns:
-            dict: Recomendaciones con diversidad aplicada
+            list: Lista de tuplas (moto_id, score) en el orden final
         """
         if not recommendations:
-            return {}
-            
-        diverse_recs = recommendations.copy()
-        
-        # Si no hay características de motos, no se puede aplicar diversidad basada en ellas
-        if not hasattr(self, 'moto_features'):
-            return diverse_recs
-            
-        # Obtener tipos únicos de motos recomendadas
-        moto_types = {}
-        type_counts = defaultdict(int)
+            return []
         
-        for moto_id in recommendations:
-            if moto_id in self.moto_features.index:
-                # Intentar encontrar columnas de tipo
-                tipo_cols = [col for col in self.moto_features.columns if 'tipo_' in col]
-                
-                if tipo_cols:
-                    # Para cada moto, identificar su tipo
-                    for col in tipo_cols:
-                        if self.moto_features.loc[moto_id, col] > 0:
-                            moto_type = col
-                            moto_types[moto_id] = moto_type
-                            type_counts[moto_type] += 1
-                            break
-        
-        # Si no hay suficiente variedad de tipos, no aplicar penalización
-        if len(type_counts) <= 1:
-            return diverse_recs
-            
-        # Aplicar factor de diversidad para penalizar tipos sobrerrepresentados
-        for moto_id, score in recommendations.items():
-            if moto_id in moto_types:
-                moto_type = moto_types[moto_id]
-                
-                # Penalizar motos de tipos que ya están bien representados
-                if type_counts[moto_type] > 1:
-                    # Ajustar el score según la proporción del tipo
-                    diversity_penalty = (type_counts[moto_type] - 1) / sum(type_counts.values())
-                    diverse_recs[moto_id] = score * (1 - diversity_factor * diversity_penalty)
-                    
-        return diverse_recs
+        # Candidatos por relevancia (los empates conservan el orden de llegada)
+        candidates = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
+        
+        # Sin características de motos solo cuenta la relevancia
+        vectors = None
+        if self.moto_features is not None:
+            if getattr(self, '_diversity_source', None) is not self.moto_features:
+                self._diversity_vectors = np.vstack([
+                    np.asarray(self.moto_features.values, dtype=np.float64),
+                    np.zeros((1, self.moto_features.shape[1]))
+                ])
+                self._diversity_source = self.moto_features
+            positions = self.moto_features.index.get_indexer([moto_id for moto_id, _ in candidates])
+            # Las motos sin características usan la fila de ceros del final
+            vectors = self._diversity_vectors[np.where(positions >= 0, positions, len(self.moto_features))]
+        
+        reranker = MMRReranker(lambda_=1 - diversity_factor)
+        order = reranker.rerank([score for _, score in candidates], top_n, vectors=vectors)
+        return [candidates[i] for i in order]
     
     def _get_detailed_reasons(self, user_id, moto_id, moto_info, base_reasons):
         """
@@ -1374,6 +1400,8 @@ def ejemplo_uso_adaptador_corregido():
         print(f"  Razones: {', '.join(reasons)}")
 
 if __name__ == "__main__":
+    from .log_config import configure_logging
+    configure_logging()
     # Ejemplo de uso para pruebas
     print("Ejecutando ejemplo de uso del adaptador corregido:")
     try:
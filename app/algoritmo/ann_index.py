@@ -0,0 +1,221 @@
+"""
+Índices de vecinos más cercanos sobre embeddings y vectores de características.
+
+Una vez entrenado ``AdvancedHybridRecommender``, las recomendaciones
+colaborativas puntuaban todas las motos para cada usuario y las "motos
+similares" salían de la matriz completa ``moto_similarity``. Estos índices
+responden a las mismas consultas (producto interno o coseno) sin servicios
+externos, solo con NumPy:
+
+- ``ExactIndex``: búsqueda exhaustiva vectorizada (resultado exacto; es el que
+  se usa con catálogos pequeños).
+- ``IVFIndex``: cuantizador grueso estilo IVF. Los vectores se agrupan con
+  k-means esférico en ``n_lists`` listas y cada consulta solo puntúa las
+  ``n_probe`` listas cuyo centroide está más cerca, de modo que el coste por
+  consulta es proporcional a ``n_probe · n / n_lists`` en lugar de ``n``.
+
+``build_ann_index`` elige la implementación (``kind='auto'`` usa IVF a partir
+de ``min_items`` vectores) y admite registrar otras en ``ANN_INDEXES``.
+"""
+import logging
+
+import numpy as np
+
+from .topk import top_k, top_k_rows
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(vectors):
+    """Normaliza filas (o un vector) a norma 1; los vectores nulos se quedan a cero."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class ExactIndex:
+    """Búsqueda exhaustiva (producto interno o coseno)."""
+
+    dtype = np.float64
+
+    def __init__(self, metric='ip'):
+        """
+        Args:
+            metric (str): 'ip' (producto interno) o 'cosine'
+        """
+        if metric not in ('ip', 'cosine'):
+            raise ValueError(f"Métrica no soportada: {metric}")
+        self.metric = metric
+        self._vectors = None
+
+    def __len__(self):
+        return 0 if self._vectors is None else len(self._vectors)
+
+    def _prepare(self, vectors):
+        vectors = np.asarray(vectors, dtype=self.dtype)
+        return _normalize(vectors) if self.metric == 'cosine' else vectors
+
+    def build(self, vectors):
+        """
+        Indexa los vectores (la posición de cada fila es su identificador).
+
+        Args:
+            vectors (np.ndarray): Matriz n x d
+        """
+        self._vectors = self._prepare(vectors)
+        return self
+
+    def search(self, query, k, exclude=None):
+        """
+        Los k vectores más cercanos a una consulta.
+
+        Args:
+            query (np.ndarray): Vector de consulta
+            k (int): Número de resultados
+            exclude (array-like, optional): Posiciones que no se pueden devolver
+
+        Returns:
+            tuple: (posiciones, puntuaciones) de mayor a menor puntuación
+        """
+        scores = self._vectors @ self._prepare(query)
+        top = top_k(scores, k, exclude=exclude)
+        return top, scores[top].astype(np.float64)
+
+    def search_batch(self, queries, k, exclude=None):
+        """
+        Búsqueda para varias consultas.
+
+        Args:
+            queries (np.ndarray): Matriz de consultas
+            k (int): Resultados por consulta
+            exclude (scipy.sparse matrix, optional): Celdas no nulas = posiciones excluidas por consulta
+
+        Returns:
+            tuple: (posiciones, puntuaciones) consultas x k (``-inf`` donde no hay candidato)
+        """
+        scores = self._prepare(queries) @ self._vectors.T
+        return top_k_rows(scores, k, exclude=exclude)
+
+
+class IVFIndex(ExactIndex):
+    """Índice de listas invertidas con cuantizador grueso (k-means esférico)."""
+
+    dtype = np.float32
+
+    def __init__(self, metric='ip', n_lists=None, n_probe=8, iterations=10, train_size=65536, seed=42):
+        """
+        Args:
+            metric (str): 'ip' (producto interno) o 'cosine'
+            n_lists (int, optional): Número de listas (por defecto ~sqrt(n))
+            n_probe (int): Listas que se recorren por consulta
+            iterations (int): Iteraciones de k-means
+            train_size (int): Vectores máximos usados para entrenar los centroides
+            seed (int): Semilla del muestreo
+        """
+        super().__init__(metric)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iterations = iterations
+        self.train_size = train_size
+        self.seed = seed
+        self.centroids = None
+        self._ids = None
+        self._offsets = None
+
+    def _kmeans(self, directions, n_lists, rng):
+        """Centroides (normalizados) por k-means esférico sobre una muestra."""
+        sample = directions
+        if len(directions) > self.train_size:
+            sample = directions[rng.choice(len(directions), self.train_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=n_lists)
+            # Las listas vacías se vuelven a sembrar con un vector al azar
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = _normalize(sums)
+        return centroids
+
+    def build(self, vectors):
+        vectors = self._prepare(vectors)
+        n_vectors = len(vectors)
+        n_lists = self.n_lists or max(1, int(np.sqrt(n_vectors)))
+        n_lists = max(1, min(n_lists, n_vectors))
+        rng = np.random.default_rng(self.seed)
+
+        # Las listas se forman por dirección, también con producto interno
+        directions = _normalize(vectors)
+        self.centroids = self._kmeans(directions, n_lists, rng)
+        assignment = np.empty(n_vectors, dtype=np.int64)
+        for start in range(0, n_vectors, 65536):
+            block = directions[start:start + 65536]
+            assignment[start:start + 65536] = np.argmax(block @ self.centroids.T, axis=1)
+
+        # Vectores de cada lista contiguos en memoria
+        order = np.argsort(assignment, kind='stable')
+        self._ids = order
+        self._vectors = vectors[order]
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+        logger.info(f"Índice IVF construido: {n_vectors} vectores en {n_lists} listas")
+        return self
+
+    def _candidates(self, query):
+        """Posiciones (en el orden interno) de las listas más cercanas a la consulta."""
+        probe = top_k(self.centroids @ _normalize(query), self.n_probe)
+        return np.concatenate([np.arange(self._offsets[i], self._offsets[i + 1]) for i in probe])
+
+    def search(self, query, k, exclude=None):
+        query = self._prepare(query)
+        candidates = self._candidates(query)
+        scores = self._vectors[candidates] @ query
+        ids = self._ids[candidates]
+        if exclude is not None and len(exclude):
+            scores = np.where(np.isin(ids, exclude), -np.inf, scores)
+        top = top_k(scores, k)
+        return ids[top], scores[top].astype(np.float64)
+
+    def search_batch(self, queries, k, exclude=None):
+        queries = np.asarray(queries, dtype=self.dtype)
+        exclude = exclude.tocsr() if exclude is not None else None
+        indices = np.zeros((len(queries), k), dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf)
+        for row, query in enumerate(queries):
+            excluded = exclude.indices[exclude.indptr[row]:exclude.indptr[row + 1]] if exclude is not None else None
+            found, found_scores = self.search(query, k, exclude=excluded)
+            indices[row, :len(found)] = found
+            scores[row, :len(found)] = found_scores
+        return indices, scores
+
+
+# Implementaciones disponibles para build_ann_index(kind=...)
+ANN_INDEXES = {
+    'exact': ExactIndex,
+    'ivf': IVFIndex
+}
+
+
+def build_ann_index(vectors, kind='auto', metric='ip', min_items=2000, **params):
+    """
+    Construye un índice de vecinos sobre unos vectores.
+
+    Args:
+        vectors (np.ndarray): Matriz n x d
+        kind (str): 'auto', 'exact', 'ivf' o cualquier clave de ``ANN_INDEXES``
+        metric (str): 'ip' o 'cosine'
+        min_items (int): Con ``kind='auto'``, vectores a partir de los que se usa IVF
+        **params: Parámetros de la implementación (n_lists, n_probe...)
+
+    Returns:
+        ExactIndex: Índice construido
+    """
+    if kind == 'auto':
+        kind = 'ivf' if len(vectors) >= min_items else 'exact'
+    index_class = ANN_INDEXES.get(kind)
+    if index_class is None:
+        raise ValueError(f"Tipo de índice desconocido: {kind}")
+    if index_class is ExactIndex:
+        params = {}
+    return index_class(metric=metric, **params).build(vectors)
@@ -2,7 +2,6 @@
 Script de inicialización para la base de datos Neo4j de MotoMatch.
 Este script crea las estructuras iniciales necesarias y carga datos de ejemplo.
 """
-from neo4j import GraphDatabase
 import logging
 import argparse
 import os
@@ -13,9 +12,10 @@ import pandas as pd
 from app.algoritmo.label_propagation import MotoLabelPropagation
 from app.algoritmo.moto_ideal import MotoIdealRecommender
 from app.algoritmo.pagerank import MotoPageRank
+from app.algoritmo.neo4j_driver import get_driver
+from app.algoritmo.query_profiler import profiler, run_query
+from app.algoritmo.like_counters import materialize_like_counters
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Configuración por defecto
@@ -64,11 +64,8 @@ class Neo4jInitializer:
             user = getattr(self, 'user', DEFAULT_USER)
             password = getattr(self, 'password', DEFAULT_PASSWORD)
             
-            self.neo4j_driver = GraphDatabase.driver(uri, auth=(user, password))
-            
-            # Verificar que la conexión funciona
-            with self.neo4j_driver.session() as session:
-                session.run("RETURN 1")
+            # Driver compartido del proceso (verifica la conectividad al crearse)
+            self.neo4j_driver = get_driver(uri, user, password)
                 
             self.db_connected = True
             logger.info(f"Conectado a Neo4j correctamente (URI: {uri}, usuario: {user})")
@@ -77,10 +74,11 @@ class Neo4jInitializer:
             self.db_connected = False
     
     def close(self):
-        """Cierra la conexión a la base de datos"""
+        """Libera la conexión a la base de datos (el driver compartido se cierra al salir del proceso)"""
         if self.db_connected and self.neo4j_driver:
-            self.neo4j_driver.close()
-            logger.info("Conexión a Neo4j cerrada")
+            self.neo4j_driver = None
+            self.db_connected = False
+            logger.info("Conexión a Neo4j liberada")
         
     def clear_database(self):
         """Limpia todos los datos existentes en la base de datos"""
@@ -89,7 +87,7 @@ class Neo4jInitializer:
             return
         
         with self.neo4j_driver.session() as session:
-            session.run("MATCH (n) DETACH DELETE n")
+            run_query(session, 'init_clear_database', "MATCH (n) DETACH DELETE n")
             logger.info("Base de datos limpiada correctamente")
             
     def create_constraints(self):
@@ -101,19 +99,19 @@ class Neo4jInitializer:
         with self.neo4j_driver.session() as session:
             # Crear restricciones de unicidad para nodos principales
             try:
-                session.run("CREATE CONSTRAINT user_id IF NOT EXISTS FOR (u:User) REQUIRE u.id IS UNIQUE")
-                session.run("CREATE CONSTRAINT moto_id IF NOT EXISTS FOR (m:Moto) REQUIRE m.id IS UNIQUE")
-                session.run("CREATE CONSTRAINT marca_nombre IF NOT EXISTS FOR (m:Marca) REQUIRE m.nombre IS UNIQUE")
-                session.run("CREATE CONSTRAINT estilo_nombre IF NOT EXISTS FOR (e:Estilo) REQUIRE e.nombre IS UNIQUE")
+                run_query(session, 'init_constraint', "CREATE CONSTRAINT user_id IF NOT EXISTS FOR (u:User) REQUIRE u.id IS UNIQUE")
+                run_query(session, 'init_constraint', "CREATE CONSTRAINT moto_id IF NOT EXISTS FOR (m:Moto) REQUIRE m.id IS UNIQUE")
+                run_query(session, 'init_constraint', "CREATE CONSTRAINT marca_nombre IF NOT EXISTS FOR (m:Marca) REQUIRE m.nombre IS UNIQUE")
+                run_query(session, 'init_constraint', "CREATE CONSTRAINT estilo_nombre IF NOT EXISTS FOR (e:Estilo) REQUIRE e.nombre IS UNIQUE")
                 logger.info("Restricciones creadas correctamente")
             except Exception as e:
                 # Para versiones antiguas de Neo4j
                 logger.warning(f"Error al crear restricciones modernas, intentando sintaxis antigua: {str(e)}")
                 try:
-                    session.run("CREATE CONSTRAINT ON (u:User) ASSERT u.id IS UNIQUE")
-                    session.run("CREATE CONSTRAINT ON (m:Moto) ASSERT m.id IS UNIQUE")
-                    session.run("CREATE CONSTRAINT ON (m:Marca) ASSERT m.nombre IS UNIQUE")
-                    session.run("CREATE CONSTRAINT ON (e:Estilo) ASSERT e.nombre IS UNIQUE")
+                    run_query(session, 'init_constraint', "CREATE CONSTRAINT ON (u:User) ASSERT u.id IS UNIQUE")
+                    run_query(session, 'init_constraint', "CREATE CONSTRAINT ON (m:Moto) ASSERT m.id IS UNIQUE")
+                    run_query(session, 'init_constraint', "CREATE CONSTRAINT ON (m:Marca) ASSERT m.nombre IS UNIQUE")
+                    run_query(session, 'init_constraint', "CREATE CONSTRAINT ON (e:Estilo) ASSERT e.nombre IS UNIQUE")
                     logger.info("Restricciones creadas correctamente (sintaxis antigua)")
                 except Exception as e2:
                     logger.error(f"Error al crear restricciones: {str(e2)}")
@@ -139,7 +137,7 @@ class Neo4jInitializer:
         with self.neo4j_driver.session() as session:
             # Crear nodos de usuarios
             for user in self.users:
-                session.run("""
+                run_query(session, 'init_create_user', """
                     MERGE (u:User {id: $id})
                     SET u.experiencia = $experiencia,
                         u.uso_previsto = $uso_previsto,
@@ -202,7 +200,7 @@ class Neo4jInitializer:
             # Crear nodos de motos y relaciones con marcas y estilos
             for moto in self.motos:
                 # Crear nodo de moto
-                session.run("""
+                run_query(session, 'init_create_moto', """
                     MERGE (m:Moto {id: $id})
                     SET m.potencia = $potencia,
                         m.peso = $peso,
@@ -215,14 +213,14 @@ class Neo4jInitializer:
                 """, **moto)
                 
                 # Crear nodo de marca y relación
-                session.run("""
+                run_query(session, 'init_moto_marca', """
                     MERGE (m:Moto {id: $id})
                     MERGE (ma:Marca {nombre: $marca})
                     MERGE (m)-[:DE_MARCA]->(ma)
                 """, id=moto["id"], marca=moto["marca"])
                 
                 # Crear nodo de estilo y relación
-                session.run("""
+                run_query(session, 'init_moto_estilo', """
                     MERGE (m:Moto {id: $id})
                     MERGE (e:Estilo {nombre: $tipo})
                     MERGE (m)-[:DE_ESTILO]->(e)
@@ -249,7 +247,7 @@ class Neo4jInitializer:
             
             # Crear relaciones de amistad bidireccionales
             for user1, user2 in friendships:
-                session.run("""
+                run_query(session, 'init_create_friendship', """
                     MATCH (u1:User {id: $user1}), (u2:User {id: $user2})
                     MERGE (u1)-[:FRIEND]->(u2)
                     MERGE (u2)-[:FRIEND]->(u1)
@@ -265,8 +263,8 @@ class Neo4jInitializer:
         
         with self.neo4j_driver.session() as session:
             # Obtener IDs de usuarios y motos
-            result_users = session.run("MATCH (u:User) RETURN u.id AS user_id")
-            result_motos = session.run("MATCH (m:Moto) RETURN m.id AS moto_id")
+            result_users = run_query(session, 'init_user_ids', "MATCH (u:User) RETURN u.id AS user_id")
+            result_motos = run_query(session, 'init_moto_ids', "MATCH (m:Moto) RETURN m.id AS moto_id")
             
             users = [record["user_id"] for record in result_users]
             motos = [record["moto_id"] for record in result_motos]
@@ -297,7 +295,7 @@ class Neo4jInitializer:
             
             # Crear las relaciones de valoración
             for user_id, moto_id, rating in ratings:
-                session.run("""
+                run_query(session, 'init_create_rating', """
                     MATCH (u:User {id: $user_id}), (m:Moto {id: $moto_id})
                     MERGE (u)-[r:RATED]->(m)
                     SET r.rating = $rating,
@@ -314,8 +312,8 @@ class Neo4jInitializer:
         
         with self.neo4j_driver.session() as session:
             # Obtener IDs de usuarios y motos
-            result_users = session.run("MATCH (u:User) RETURN u.id AS user_id")
-            result_motos = session.run("MATCH (m:Moto) RETURN m.id AS moto_id")
+            result_users = run_query(session, 'init_user_ids', "MATCH (u:User) RETURN u.id AS user_id")
+            result_motos = run_query(session, 'init_moto_ids', "MATCH (m:Moto) RETURN m.id AS moto_id")
             
             users = [record["user_id"] for record in result_users]
             motos = [record["moto_id"] for record in result_motos]
@@ -345,7 +343,7 @@ class Neo4jInitializer:
             
             # Crear las relaciones de interacción
             for user_id, moto_id, interaction_type, weight in interactions:
-                session.run("""
+                run_query(session, 'init_create_interaction', """
                     MATCH (u:User {id: $user_id}), (m:Moto {id: $moto_id})
                     MERGE (u)-[i:INTERACTED]->(m)
                     SET i.type = $type,
@@ -390,7 +388,7 @@ class Neo4jInitializer:
             for user_id, preferences in user_preferences.items():
                 # Preferencias de estilos
                 for estilo, valor in preferences["estilos"].items():
-                    session.run("""
+                    run_query(session, 'init_prefers_estilo', """
                         MATCH (u:User {id: $user_id})
                         MERGE (e:Estilo {nombre: $estilo})
                         MERGE (u)-[p:PREFIERE]->(e)
@@ -399,7 +397,7 @@ class Neo4jInitializer:
                 
                 # Preferencias de marcas
                 for marca, valor in preferences["marcas"].items():
-                    session.run("""
+                    run_query(session, 'init_prefers_marca', """
                         MATCH (u:User {id: $user_id})
                         MERGE (m:Marca {nombre: $marca})
                         MERGE (u)-[p:PREFIERE]->(m)
@@ -426,6 +424,10 @@ class Neo4jInitializer:
         self.create_interactions()
         self.create_user_preferences()
         
+        # Contadores de likes y último like por usuario (las vistas solo los leen)
+        if self.db_connected:
+            materialize_like_counters(self.neo4j_driver)
+        
         logger.info("Inicialización de la base de datos completada")
     
     def import_motos_from_csv(self, csv_path):
@@ -460,7 +462,7 @@ class Neo4jInitializer:
                     }
                     
                     # Crear nodo de moto
-                    session.run("""
+                    run_query(session, 'import_moto', """
                         MERGE (m:Moto {id: $id})
                         SET m.marca = $marca,
                             m.modelo = $modelo,
@@ -474,14 +476,14 @@ class Neo4jInitializer:
                     """, **properties)
                     
                     # Crear nodo de marca y relación
-                    session.run("""
+                    run_query(session, 'import_moto_marca', """
                         MERGE (m:Moto {id: $id})
                         MERGE (ma:Marca {nombre: $marca})
                         MERGE (m)-[:DE_MARCA]->(ma)
                     """, id=moto_id, marca=row['Marca'])
                     
                     # Crear nodo de estilo y relación
-                    session.run("""
+                    run_query(session, 'import_moto_estilo', """
                         MERGE (m:Moto {id: $id})
                         MERGE (e:Estilo {nombre: $tipo})
                         MERGE (m)-[:DE_ESTILO]->(e)
@@ -497,6 +499,8 @@ def main():
     parser.add_argument("--user", default=DEFAULT_USER, help=f"Usuario de Neo4j (por defecto: {DEFAULT_USER})")
     parser.add_argument("--password", default=DEFAULT_PASSWORD, help="Contraseña de Neo4j")
     parser.add_argument("--clear", action="store_true", help="Limpiar la base de datos antes de inicializarla")
+    parser.add_argument("--informe-consultas", action="store_true",
+                        help="Escribir al terminar el informe de tiempos de las consultas a Neo4j")
     
     args = parser.parse_args()
     
@@ -512,6 +516,10 @@ def main():
         sys.exit(1)
     finally:
         initializer.close()
+        if args.informe_consultas:
+            profiler.dump_report()
 
 if __name__ == "__main__":
+    from app.algoritmo.log_config import configure_logging
+    configure_logging()
     main()
@@ -0,0 +1,89 @@
+"""
+Presupuesto de latencia de una petición de recomendaciones.
+
+``MotoRecommenderAdapter.get_recommendations`` crea un ``Deadline`` (o recibe
+el de la ruta) y lo pasa a ``MotoIdealRecommender`` y ``HybridMotoRecommender``.
+Cada etapa consulta el tiempo restante: ``SourceFanout`` recorta el tiempo
+máximo de cada fuente al presupuesto que queda y la combinación omite los
+refinamientos pendientes cuando se agota, devolviendo la mejor mezcla
+disponible. Las fuentes o etapas descartadas quedan registradas en
+``Deadline.dropped`` para que la ruta pueda informarlas.
+"""
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _load_budget():
+    """Presupuesto por defecto (RECOMMENDATION_CONFIG['latency_budget'] de app/config.py)."""
+    try:
+        from app.config import RECOMMENDATION_CONFIG
+        return RECOMMENDATION_CONFIG.get('latency_budget')
+    except ImportError:
+        return None
+
+
+class Deadline:
+    """
+    Instante límite de una petición y registro de lo que se descartó por él.
+
+    Un ``Deadline`` sin presupuesto nunca expira; así las funciones pueden
+    recibir siempre uno aunque la llamada no imponga límite.
+    """
+
+    def __init__(self, budget=None):
+        """
+        Args:
+            budget (float, optional): Segundos disponibles desde ahora (None = sin límite)
+        """
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget if budget else None
+        self.dropped = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls):
+        """Deadline con el presupuesto configurado en RECOMMENDATION_CONFIG."""
+        return cls(_load_budget())
+
+    @classmethod
+    def ensure(cls, deadline):
+        """Devuelve ``deadline`` o uno sin límite si es None."""
+        return deadline if deadline is not None else cls()
+
+    def remaining(self):
+        """
+        Segundos que quedan.
+
+        Returns:
+            float: Tiempo restante (``inf`` si no hay límite, 0 si ya expiró)
+        """
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        """bool: True si el presupuesto se ha agotado."""
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def cap(self, timeout):
+        """Recorta un tiempo máximo al presupuesto restante."""
+        return min(timeout, self.remaining())
+
+    def drop(self, source, reason='deadline'):
+        """
+        Registra una fuente o etapa descartada.
+
+        Args:
+            source (str): Nombre de la fuente o etapa
+            reason (str): Motivo ('deadline', 'timeout', 'error: ...')
+        """
+        with self._lock:
+            self.dropped[source] = reason
+
+    def __repr__(self):
+        return f"Deadline(budget={self.budget}, remaining={self.remaining():.3f}, dropped={self.dropped})"
@@ -0,0 +1,164 @@
+"""
+Reordenación por diversidad (MMR) compartida por los sistemas híbridos.
+
+``AdvancedHybridRecommender._apply_diversity`` buscaba las columnas ``tipo_``
+de ``moto_features`` dentro del bucle de cada moto, y
+``HybridMotoRecommender._ensure_final_diversity`` volvía a contar marcas y
+tipos de los resultados ya elegidos por cada candidato (coste cuadrático).
+
+``MMRReranker`` aplica Maximal Marginal Relevance de forma voraz: en cada paso
+elige el candidato que maximiza
+
+    λ · relevancia − (1 − λ) · máx. similitud con los ya elegidos
+
+sobre vectores de características precalculados. La similitud máxima de cada
+candidato se actualiza con un producto matriz-vector por paso y los límites
+por categoría (p. ej. 2 motos por marca) se llevan con contadores
+incrementales, así que elegir k de n candidatos cuesta O(k·n).
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIVERSITY_CONFIG = {
+    'lambda': 0.8,
+    'caps': {}
+}
+
+
+def _load_diversity_config():
+    """Lee DIVERSITY_CONFIG de app/config.py (con valores por defecto si no existe)."""
+    config = dict(DEFAULT_DIVERSITY_CONFIG)
+    try:
+        from app.config import DIVERSITY_CONFIG
+        config.update(DIVERSITY_CONFIG)
+    except ImportError:
+        pass
+    return config
+
+
+def _normalize_rows(vectors):
+    """Normaliza cada fila a norma 1 (las filas nulas se quedan a cero)."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def feature_vectors(df, numeric=(), categorical=()):
+    """
+    Vectores normalizados para medir la similitud entre motos.
+
+    Args:
+        df (pd.DataFrame): Catálogo de motos
+        numeric (iterable): Columnas numéricas (se estandarizan)
+        categorical (iterable): Columnas categóricas (one-hot, sin distinguir mayúsculas)
+
+    Returns:
+        np.ndarray: Matriz len(df) x d con filas de norma 1 (o nulas)
+    """
+    blocks = []
+    for column in numeric:
+        if column in df:
+            values = pd.to_numeric(df[column], errors='coerce').astype(float)
+            values = values.fillna(values.median() if values.notna().any() else 0.0)
+            std = values.std()
+            blocks.append(((values - values.mean()) / std if std > 0 else values * 0.0).to_numpy()[:, None])
+    for column in categorical:
+        if column in df:
+            labels = df[column].fillna('').astype(str).str.lower()
+            blocks.append(pd.get_dummies(labels).to_numpy(dtype=np.float64))
+    if not blocks:
+        return np.zeros((len(df), 0))
+    return _normalize_rows(np.hstack(blocks))
+
+
+class MMRReranker:
+    """
+    Selección voraz por Maximal Marginal Relevance con límites por categoría.
+
+    Con ``lambda_=1`` (o sin vectores) el orden es el de la relevancia y solo
+    actúan los límites por categoría. Si los límites impiden completar los k
+    resultados, los huecos se rellenan sin límites (como hacía la segunda
+    pasada de ``_ensure_final_diversity``).
+    """
+
+    def __init__(self, lambda_=0.8, caps=None):
+        """
+        Args:
+            lambda_ (float): Peso de la relevancia frente a la novedad (0-1)
+            caps (dict, optional): {categoría: máximo de resultados por valor}
+        """
+        self.lambda_ = float(lambda_)
+        self.caps = dict(caps or {})
+
+    @classmethod
+    def from_config(cls):
+        """Reordenador con la configuración de DIVERSITY_CONFIG."""
+        config = _load_diversity_config()
+        return cls(config['lambda'], config['caps'])
+
+    def rerank(self, relevance, k, vectors=None, categories=None):
+        """
+        Elige k candidatos equilibrando relevancia y diversidad.
+
+        Args:
+            relevance (array-like): Relevancia de cada candidato (en caso de
+                empate gana el que aparece antes)
+            k (int): Número de resultados
+            vectors (np.ndarray, optional): Vectores de cada candidato (fila a fila)
+            categories (dict, optional): {categoría: etiqueta de cada candidato};
+                solo se limitan las categorías presentes en ``caps``
+
+        Returns:
+            np.ndarray: Posiciones de los candidatos elegidos, en orden
+        """
+        relevance = np.asarray(relevance, dtype=np.float64)
+        n = len(relevance)
+        k = min(k, n)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        # Relevancia en [0, 1] para que sea comparable con la similitud coseno
+        span = relevance.max() - relevance.min()
+        gain = self.lambda_ * ((relevance - relevance.min()) / span if span > 0 else np.zeros(n))
+
+        if vectors is not None and self.lambda_ < 1:
+            vectors = _normalize_rows(np.asarray(vectors, dtype=np.float64))
+            if vectors.shape[1] == 0:
+                vectors = None
+        else:
+            vectors = None
+
+        # Códigos enteros y contadores por categoría limitada
+        limited = []
+        for name, cap in self.caps.items():
+            if categories and name in categories and cap:
+                codes, uniques = pd.factorize(pd.Series(categories[name], dtype=object))
+                limited.append((codes, np.zeros(len(uniques), dtype=np.int64), cap))
+
+        available = np.ones(n, dtype=bool)
+        blocked = np.zeros(n, dtype=bool)
+        redundancy = None
+        selected = []
+        for _ in range(k):
+            score = gain if redundancy is None else gain - (1 - self.lambda_) * redundancy
+            eligible = available & ~blocked
+            if not eligible.any():
+                eligible = available
+            pick = int(np.argmax(np.where(eligible, score, -np.inf)))
+            selected.append(pick)
+            available[pick] = False
+
+            for codes, counts, cap in limited:
+                code = codes[pick]
+                if code >= 0:
+                    counts[code] += 1
+                    if counts[code] >= cap:
+                        blocked |= codes == code
+            if vectors is not None:
+                similarity = vectors @ vectors[pick]
+                redundancy = similarity if redundancy is None else np.maximum(redundancy, similarity)
+
+        return np.array(selected, dtype=np.int64)
@@ -0,0 +1,337 @@
+"""
+Índice en memoria del grafo de amistades.
+
+Las rutas sociales (``/friends``, ``/motos-recomendadas``,
+``/motos-que-podrian-gustarte``) consultaban Neo4j en cada petición para
+obtener los amigos del usuario, y label propagation reconstruía su grafo a
+partir de otra consulta. ``FriendGraphIndex`` carga las relaciones
+``FRIEND|FRIEND_OF`` una sola vez en formato CSR sobre los códigos enteros del
+espacio de ids compartido (``id_registry``) y se actualiza en memoria cuando
+``/agregar_amigo`` o ``/eliminar_amigo`` modifican una amistad.
+
+Las filas modificadas se guardan en una capa de conjuntos encima del CSR; al
+superar ``compact_threshold`` filas modificadas se reconstruye el CSR.
+"""
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from .id_registry import current_id_space, MISSING_ID
+from .query_profiler import run_query
+
+logger = logging.getLogger(__name__)
+
+LOAD_FRIENDSHIPS_QUERY = """
+MATCH (u:User)-[:FRIEND|FRIEND_OF]->(f:User)
+RETURN DISTINCT u.id AS user_id, u.username AS username,
+       f.id AS friend_id, f.username AS friend_username
+"""
+
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+class FriendGraphIndex:
+    """
+    Lista de adyacencia CSR (dirigida, como las relaciones en Neo4j) de amistades.
+
+    ``friends(u)`` devuelve los usuarios a los que ``u`` apunta con
+    ``FRIEND`` o ``FRIEND_OF``, igual que la consulta
+    ``(u)-[:FRIEND|FRIEND_OF]->(f)`` que sustituye.
+    """
+
+    def __init__(self, compact_threshold=256):
+        """
+        Inicializa un índice vacío.
+
+        Args:
+            compact_threshold (int): Filas modificadas que fuerzan la reconstrucción del CSR
+        """
+        self.compact_threshold = compact_threshold
+        self._registry = None
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = _EMPTY
+        self._overlay = {}
+        self._usernames = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        # Cambia con cada carga o modificación del índice
+        self.version = 0
+
+    @property
+    def loaded(self):
+        """bool: True si el índice se ha cargado."""
+        return self._loaded
+
+    @property
+    def users(self):
+        """IdRegistry: Registro de usuarios cuyos códigos usa el índice."""
+        if self._registry is None:
+            self._registry = current_id_space().users
+        return self._registry
+
+    def __len__(self):
+        """Número de relaciones de amistad (aristas dirigidas)."""
+        n_rows = len(self._indptr) - 1
+        total = int(self._indptr[-1])
+        for code, neighbours in list(self._overlay.items()):
+            base = int(self._indptr[code + 1] - self._indptr[code]) if code < n_rows else 0
+            total += len(neighbours) - base
+        return total
+
+    # ---- Carga -----------------------------------------------------------------
+
+    def load(self, driver):
+        """
+        Carga todas las amistades con una sola consulta.
+
+        Args:
+            driver: Driver de Neo4j
+
+        Returns:
+            bool: True si la carga fue correcta
+        """
+        try:
+            with driver.session() as session:
+                records = run_query(session, 'load_friendships', LOAD_FRIENDSHIPS_QUERY).data()
+            usernames = {}
+            for record in records:
+                usernames[record['user_id']] = record['username']
+                usernames[record['friend_id']] = record['friend_username']
+            self.load_edges([(r['user_id'], r['friend_id']) for r in records], usernames)
+            logger.info(f"Índice de amistades cargado: {len(records)} relaciones")
+            return True
+        except Exception as e:
+            logger.error(f"Error al cargar el índice de amistades: {str(e)}")
+            return False
+
+    def ensure_loaded(self, driver):
+        """Carga el índice si aún no se ha cargado."""
+        if not self._loaded and driver is not None:
+            self.load(driver)
+        return self._loaded
+
+    def load_edges(self, edges, usernames=None):
+        """
+        Construye el índice a partir de pares (user_id, friend_id).
+
+        Args:
+            edges (iterable): Pares (user_id, friend_id)
+            usernames (dict, optional): {user_id: username}
+        """
+        edges = list(edges)
+        registry = current_id_space().users
+        if edges:
+            sources = registry.intern_many([e[0] for e in edges])
+            targets = registry.intern_many([e[1] for e in edges])
+        else:
+            sources = targets = _EMPTY
+        indptr, indices = self._build_csr(sources, targets, len(registry))
+
+        with self._lock:
+            self._registry = registry
+            self._indptr, self._indices = indptr, indices
+            self._overlay = {}
+            self._usernames = {str(k): v for k, v in (usernames or {}).items() if k is not None and v}
+            self._loaded = True
+            self.version += 1
+
+    @staticmethod
+    def _build_csr(sources, targets, n_users):
+        """CSR ordenado y sin duplicados ni aristas inválidas."""
+        valid = (sources != MISSING_ID) & (targets != MISSING_ID) & (sources != targets)
+        sources, targets = sources[valid].astype(np.int64), targets[valid].astype(np.int64)
+        keys = np.unique(sources * max(n_users, 1) + targets)
+        sources, targets = keys // max(n_users, 1), keys % max(n_users, 1)
+        indptr = np.zeros(n_users + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n_users), out=indptr[1:])
+        return indptr, targets.astype(np.int32)
+
+    def _compact(self):
+        """Vuelca la capa de filas modificadas a un CSR nuevo (con el lock tomado)."""
+        n_users = len(self.users)
+        n_rows = len(self._indptr) - 1
+        counts = np.diff(self._indptr)
+        keep = np.ones(n_rows, dtype=bool)
+        keep[[code for code in self._overlay if code < n_rows]] = False
+        sources = np.repeat(np.arange(n_rows), counts)
+        mask = keep[sources]
+        sources, targets = [sources[mask]], [self._indices[mask].astype(np.int64)]
+        for code, neighbours in self._overlay.items():
+            sources.append(np.full(len(neighbours), code, dtype=np.int64))
+            targets.append(np.fromiter(neighbours, dtype=np.int64, count=len(neighbours)))
+        self._indptr, self._indices = self._build_csr(np.concatenate(sources), np.concatenate(targets), n_users)
+        self._overlay = {}
+
+    # ---- Consultas ---------------------------------------------------------------
+
+    def _row(self, code):
+        """Vecinos de un código (array int32 ordenado)."""
+        if code == MISSING_ID:
+            return _EMPTY
+        neighbours = self._overlay.get(code)
+        if neighbours is not None:
+            return np.array(sorted(neighbours), dtype=np.int32)
+        indptr = self._indptr
+        if code + 1 >= len(indptr):
+            return _EMPTY
+        return self._indices[indptr[code]:indptr[code + 1]]
+
+    def friend_codes(self, user_id):
+        """
+        Códigos de los amigos de un usuario.
+
+        Returns:
+            np.ndarray: Códigos int32 ordenados
+        """
+        return self._row(self.users.encode_one(user_id))
+
+    def friends(self, user_id):
+        """
+        Amigos de un usuario.
+
+        Args:
+            user_id: ID del usuario
+
+        Returns:
+            list: IDs de los amigos
+        """
+        return self.users.decode(self.friend_codes(user_id)).tolist()
+
+    def friend_records(self, user_id):
+        """
+        Amigos con su nombre, en el formato de las consultas que sustituye.
+
+        Returns:
+            list: Diccionarios ``{'friend_id', 'friend_username'}``
+        """
+        return [{'friend_id': friend_id, 'friend_username': self._usernames.get(friend_id)}
+                for friend_id in self.friends(user_id)]
+
+    def username(self, user_id):
+        """Nombre de usuario conocido para un ID (o None)."""
+        return self._usernames.get(user_id)
+
+    def mutual_friends(self, user_id, other_id):
+        """
+        Amigos en común de dos usuarios.
+
+        Returns:
+            list: IDs de los amigos comunes
+        """
+        common = np.intersect1d(self.friend_codes(user_id), self.friend_codes(other_id), assume_unique=True)
+        return self.users.decode(common).tolist()
+
+    def two_hop(self, user_id, exclude_friends=True):
+        """
+        Vecindario a dos saltos (amigos de amigos) con el número de caminos.
+
+        Args:
+            user_id: ID del usuario
+            exclude_friends (bool): Omitir a los que ya son amigos directos
+
+        Returns:
+            dict: {user_id: amigos en común}
+        """
+        code = self.users.encode_one(user_id)
+        direct = self._row(code)
+        if len(direct) == 0:
+            return {}
+        reached = np.concatenate([self._row(int(friend)) for friend in direct])
+        candidates, counts = np.unique(reached, return_counts=True)
+        mask = candidates != code
+        if exclude_friends:
+            mask &= ~np.isin(candidates, direct, assume_unique=True)
+        ids = self.users.decode(candidates[mask]).tolist()
+        return dict(zip(ids, counts[mask].tolist()))
+
+    def edges(self):
+        """
+        Todas las amistades como pares de IDs.
+
+        Returns:
+            list: Pares (user_id, friend_id)
+        """
+        with self._lock:
+            if self._overlay:
+                self._compact()
+            indptr, indices = self._indptr, self._indices
+        sources = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        decoded = self.users.decode(np.concatenate([sources, indices]))
+        return list(zip(decoded[:len(sources)].tolist(), decoded[len(sources):].tolist()))
+
+    def to_dataframe(self):
+        """Amistades como DataFrame con columnas ``user_id`` y ``friend_id``."""
+        return pd.DataFrame(self.edges(), columns=['user_id', 'friend_id'])
+
+    def to_csr(self, symmetric=False):
+        """
+        Matriz de adyacencia sobre los códigos del espacio de ids.
+
+        Args:
+            symmetric (bool): Incluir también la arista inversa de cada amistad
+
+        Returns:
+            scipy.sparse.csr_matrix: Matriz binaria n_users x n_users
+        """
+        with self._lock:
+            if self._overlay:
+                self._compact()
+            indptr, indices = self._indptr, self._indices
+        n_users = len(indptr) - 1
+        matrix = csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n_users, n_users))
+        if symmetric:
+            matrix = ((matrix + matrix.T) > 0).astype(np.float64).tocsr()
+        return matrix
+
+    # ---- Actualizaciones -----------------------------------------------------------
+
+    def add_friendship(self, user_id, friend_id, username=None, friend_username=None):
+        """
+        Registra una amistad creada en Neo4j.
+
+        Args:
+            user_id: Usuario que agrega
+            friend_id: Usuario agregado
+            username (str, optional): Nombre del usuario
+            friend_username (str, optional): Nombre del amigo
+        """
+        source, target = self.users.intern(user_id), self.users.intern(friend_id)
+        if MISSING_ID in (source, target) or source == target:
+            return
+        with self._lock:
+            neighbours = self._overlay.get(source)
+            if neighbours is None:
+                neighbours = set(self._row(source).tolist())
+                self._overlay[source] = neighbours
+            neighbours.add(target)
+            self.version += 1
+            if username:
+                self._usernames[str(user_id)] = username
+            if friend_username:
+                self._usernames[str(friend_id)] = friend_username
+            if len(self._overlay) > self.compact_threshold:
+                self._compact()
+
+    def remove_friendship(self, user_id, friend_id):
+        """
+        Elimina una amistad borrada en Neo4j.
+
+        Args:
+            user_id: Usuario que elimina
+            friend_id: Usuario eliminado
+        """
+        source, target = self.users.encode_one(user_id), self.users.encode_one(friend_id)
+        if MISSING_ID in (source, target):
+            return
+        with self._lock:
+            neighbours = self._overlay.get(source)
+            if neighbours is None:
+                neighbours = set(self._row(source).tolist())
+                self._overlay[source] = neighbours
+            neighbours.discard(target)
+            self.version += 1
+            if len(self._overlay) > self.compact_threshold:
+                self._compact()
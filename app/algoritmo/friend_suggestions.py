@@ -0,0 +1,173 @@
+"""
+Sugerencias de amistad paginadas y cacheadas.
+
+La página ``/friends`` cargaba todos los usuarios y filtraba con ``u not in
+amigos`` sobre una lista, de modo que el coste y el tamaño de la respuesta
+crecían con toda la base de usuarios. Este servicio ordena a los candidatos por
+amigos en común y likes compartidos con una única consulta sobre el grafo
+social, guarda el resultado por usuario y sirve las páginas desde la caché.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Candidatos por amigos en común (amigos de mis amigos) y por likes compartidos
+SUGGESTIONS_QUERY = """
+MATCH (me:User {id: $user_id})
+CALL {
+    WITH me
+    MATCH (me)-[:FRIEND|FRIEND_OF]->(f:User)-[:FRIEND|FRIEND_OF]->(cand:User)
+    RETURN cand, count(DISTINCT f) AS mutual, 0 AS shared
+    UNION ALL
+    WITH me
+    MATCH (me)-[:INTERACTED {type: 'like'}]->(m:Moto)<-[:INTERACTED {type: 'like'}]-(cand:User)
+    RETURN cand, 0 AS mutual, count(DISTINCT m) AS shared
+}
+WITH me, cand, sum(mutual) AS mutual_friends, sum(shared) AS shared_likes
+WHERE cand <> me AND NOT (me)-[:FRIEND|FRIEND_OF]->(cand) AND cand.username IS NOT NULL
+WITH cand, mutual_friends, shared_likes,
+     mutual_friends * $mutual_weight + shared_likes * $likes_weight AS score
+RETURN cand.username AS username, mutual_friends, shared_likes, score
+ORDER BY score DESC, username
+LIMIT $limit
+"""
+
+# Relleno para usuarios sin conexiones (arranque en frío). Sin ORDER BY: el
+# LIMIT corta el recorrido de :User en cuanto hay bastantes filas, en lugar de
+# recorrer y ordenar todos los usuarios en cada fallo de caché. El orden del
+# relleno no importa (todos tienen score 0) y las páginas salen de la caché.
+FILL_QUERY = """
+MATCH (me:User {id: $user_id})
+MATCH (cand:User)
+WHERE cand <> me AND cand.username IS NOT NULL AND NOT cand.username IN $exclude
+  AND NOT (me)-[:FRIEND|FRIEND_OF]->(cand)
+RETURN cand.username AS username, 0 AS mutual_friends, 0 AS shared_likes, 0.0 AS score
+LIMIT $limit
+"""
+
+
+class FriendSuggestionService:
+    """
+    Calcula, cachea y pagina las sugerencias de amistad de cada usuario.
+
+    La caché es LRU (``max_users`` entradas) con caducidad ``ttl``; las rutas
+    que cambian amistades llaman a ``invalidate`` para los usuarios afectados.
+    """
+
+    def __init__(self, get_driver, page_size=20, max_candidates=200, ttl=300.0,
+                 max_users=1000, mutual_weight=2.0, likes_weight=1.0):
+        """
+        Inicializa el servicio.
+
+        Args:
+            get_driver (callable): Devuelve el driver de Neo4j (o None)
+            page_size (int): Sugerencias por página
+            max_candidates (int): Candidatos máximos calculados por usuario
+            ttl (float): Segundos de validez de la caché de un usuario
+            max_users (int): Usuarios máximos en la caché
+            mutual_weight (float): Peso de cada amigo en común
+            likes_weight (float): Peso de cada moto con like compartido
+        """
+        self._get_driver = get_driver
+        self.page_size = page_size
+        self.max_candidates = max_candidates
+        self.ttl = ttl
+        self.max_users = max_users
+        self.mutual_weight = mutual_weight
+        self.likes_weight = likes_weight
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _compute(self, user_id):
+        """Consulta y ordena los candidatos de un usuario."""
+        driver = self._get_driver()
+        if driver is None:
+            raise ConnectionError("No hay conexión a Neo4j")
+
+        with driver.session() as session:
+            candidates = [record.data() for record in session.run(
+                SUGGESTIONS_QUERY, user_id=user_id, limit=self.max_candidates,
+                mutual_weight=self.mutual_weight, likes_weight=self.likes_weight)]
+
+            # Completar con otros usuarios si no hay suficientes candidatos conectados
+            missing = self.max_candidates - len(candidates)
+            if missing > 0:
+                exclude = [candidate['username'] for candidate in candidates]
+                candidates.extend(record.data() for record in session.run(
+                    FILL_QUERY, user_id=user_id, exclude=exclude, limit=missing))
+        return candidates
+
+    def get_suggestions(self, user_id):
+        """
+        Devuelve todos los candidatos ordenados de un usuario (desde la caché si es posible).
+
+        Args:
+            user_id: ID del usuario
+
+        Returns:
+            list: Diccionarios con username, mutual_friends, shared_likes y score
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._cache.move_to_end(user_id)
+                return entry[1]
+
+        candidates = self._compute(user_id)
+        with self._lock:
+            self._cache[user_id] = (now, candidates)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.max_users:
+                self._cache.popitem(last=False)
+        logger.info(f"Sugerencias de amistad calculadas para {user_id}: {len(candidates)} candidatos")
+        return candidates
+
+    def get_page(self, user_id, page=1, page_size=None, exclude=None):
+        """
+        Devuelve una página de sugerencias.
+
+        Args:
+            user_id: ID del usuario
+            page (int): Número de página (desde 1)
+            page_size (int, optional): Tamaño de página (por defecto ``self.page_size``)
+            exclude (iterable, optional): Usernames a omitir (p. ej. amigos en memoria)
+
+        Returns:
+            dict: ``{'items': [...], 'page': n, 'page_size': n, 'has_next': bool, 'total': n}``
+        """
+        page = max(1, int(page))
+        page_size = page_size or self.page_size
+        candidates = self.get_suggestions(user_id)
+        if exclude:
+            exclude = set(exclude)
+            candidates = [c for c in candidates if c['username'] not in exclude]
+
+        start = (page - 1) * page_size
+        items = candidates[start:start + page_size]
+        return {
+            'items': items,
+            'page': page,
+            'page_size': page_size,
+            'has_next': start + page_size < len(candidates),
+            'total': len(candidates)
+        }
+
+    def invalidate(self, *user_ids):
+        """
+        Descarta las sugerencias cacheadas de los usuarios dados.
+
+        Args:
+            *user_ids: IDs de usuario afectados por un cambio
+        """
+        with self._lock:
+            for user_id in user_ids:
+                self._cache.pop(user_id, None)
+
+    def clear(self):
+        """Vacía la caché completa."""
+        with self._lock:
+            self._cache.clear()
@@ -6,9 +6,18 @@ import numpy as np
 import logging
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.preprocessing import StandardScaler
-import random
+import hashlib
 from typing import List, Dict, Any
 from .quantitative_evaluator import QuantitativeEvaluator
+from .id_registry import current_id_space
+from .moto_record import MotoCatalog
+from .source_fanout import SourceFanout
+from .deadline import Deadline
+from .knowledge_rules import KnowledgeRulesEngine
+from .popularity_baseline import PopularityBaseline
+from .diversity import MMRReranker, feature_vectors
+from .tracing import tracer
+from .log_config import item_logger
 
 logger = logging.getLogger(__name__)
 
@@ -21,16 +30,38 @@ class HybridMotoRecommender:
     4. Diversificación activa
     5. Exploración vs Explotación
     """
-    def __init__(self, neo4j_connector=None):
+    def __init__(self, neo4j_connector=None, fanout=None):
+        """
+        Args:
+            neo4j_connector: Conector con ``driver`` de Neo4j
+            fanout (SourceFanout, optional): Ejecutor de las fuentes (por defecto
+                uno propio configurado desde SOURCE_FANOUT_CONFIG)
+        """
         self.neo4j_connector = neo4j_connector
         self.motos_df = None
         self.users_df = None
         self.interactions_df = None
         self.user_similarity_matrix = None
+        self.user_moto_matrix = None
         self.moto_features_matrix = None
+        self.moto_catalog = None
+        self._moto_catalog_source = None
         self.scaler = StandardScaler()
         self.quantitative_evaluator = QuantitativeEvaluator()
         self.logger = logging.getLogger(__name__)
+        # Diagnóstico por moto: DEBUG y muestreado
+        self._item_log = item_logger(self.logger)
+        self.fanout = fanout or SourceFanout(name='hybrid-source')
+        # Reglas expertas con características precalculadas por catálogo
+        self.knowledge_engine = KnowledgeRulesEngine()
+        # Popularidad agregada y ordenada (se actualiza con cada like)
+        self.popularity = PopularityBaseline()
+        self._moto_positions = None
+        self._moto_positions_source = None
+        # Reordenación final por diversidad (MMR con límites por marca y tipo)
+        self.diversity = MMRReranker.from_config()
+        self._diversity_vectors = None
+        self._diversity_vectors_source = None
         
     def _load_data(self):
         """Carga y prepara todos los datos necesarios"""
@@ -108,6 +139,7 @@ class HybridMotoRecommender:
                         'timestamp': record['timestamp']
                     })
                 self.interactions_df = pd.DataFrame(interactions_data)
+                self.popularity.load(self.interactions_df, self.motos_df)
                 
                 logger.info(f"Datos cargados: {len(self.motos_df)} motos, {len(self.users_df)} usuarios, {len(self.interactions_df)} interacciones")
                 return True
@@ -116,6 +148,13 @@ class HybridMotoRecommender:
             logger.error(f"Error cargando datos: {str(e)}")
             return False
     
+    def _get_moto_catalog(self):
+        """Devuelve los MotoRecord de motos_df, reconstruyéndolos si el DataFrame cambió"""
+        if self.moto_catalog is None or self._moto_catalog_source is not self.motos_df:
+            self.moto_catalog = MotoCatalog.from_dataframe(self.motos_df)
+            self._moto_catalog_source = self.motos_df
+        return self.moto_catalog
+    
     def _parse_numeric(self, value):
         """Convierte valores a numérico de forma segura"""
         if value is None:
@@ -170,59 +209,85 @@ class HybridMotoRecommender:
         if self.users_df is None or self.interactions_df is None:
             return
             
-        # Crear matriz usuario-moto
-        users_list = self.users_df['id'].tolist()
-        motos_list = self.motos_df['id'].tolist()
-        
-        user_moto_matrix = np.zeros((len(users_list), len(motos_list)))
-        
-        for _, interaction in self.interactions_df.iterrows():
-            try:
-                user_idx = users_list.index(interaction['user_id'])
-                moto_idx = motos_list.index(interaction['moto_id'])
-                
-                # Pesos diferentes según tipo de interacción
-                weight = interaction['weight']
-                if interaction['interaction_type'] == 'like':
-                    weight *= 2.0
-                elif interaction['interaction_type'] == 'view':
-                    weight *= 0.5
-                
-                user_moto_matrix[user_idx, moto_idx] = weight
-            except ValueError:
-                continue  # Usuario o moto no encontrados
+        # Crear matriz usuario-moto sobre el espacio de ids compartido
+        id_space = current_id_space()
+        user_codes = id_space.users.intern_many(self.users_df['id'])
+        moto_codes = id_space.motos.intern_many(self.motos_df['id'])
+        
+        # Traducir códigos a filas/columnas (orden de users_df y motos_df)
+        user_rows = np.full(len(id_space.users), -1, dtype=np.int64)
+        user_rows[user_codes[user_codes >= 0]] = np.flatnonzero(user_codes >= 0)
+        moto_cols = np.full(len(id_space.motos), -1, dtype=np.int64)
+        moto_cols[moto_codes[moto_codes >= 0]] = np.flatnonzero(moto_codes >= 0)
+        
+        user_moto_matrix = np.zeros((len(user_codes), len(moto_codes)))
+        
+        if not self.interactions_df.empty:
+            interaction_users = id_space.users.encode(self.interactions_df['user_id'])
+            interaction_motos = id_space.motos.encode(self.interactions_df['moto_id'])
+            rows = np.where(interaction_users >= 0, user_rows[interaction_users], -1)
+            cols = np.where(interaction_motos >= 0, moto_cols[interaction_motos], -1)
+            
+            # Pesos diferentes según tipo de interacción
+            weights = self.interactions_df['weight'].to_numpy(dtype=np.float64)
+            interaction_types = self.interactions_df['interaction_type'].to_numpy()
+            weights = np.where(interaction_types == 'like', weights * 2.0,
+                               np.where(interaction_types == 'view', weights * 0.5, weights))
+            
+            # Ignorar usuarios o motos no encontrados
+            valid = (rows >= 0) & (cols >= 0)
+            user_moto_matrix[rows[valid], cols[valid]] = weights[valid]
         
         # Calcular similitud coseno entre usuarios
+        self.user_moto_matrix = user_moto_matrix
         self.user_similarity_matrix = cosine_similarity(user_moto_matrix)
         logger.info(f"Matriz de similitud de usuarios calculada: {self.user_similarity_matrix.shape}")
     
-    def get_hybrid_recommendations(self, user_id: str, preferences: Dict, top_n: int = 10) -> List[Dict]:
+    def get_hybrid_recommendations(self, user_id: str, preferences: Dict, top_n: int = 10,
+                                   deadline: Deadline = None) -> List[Dict]:
         """
         Obtiene recomendaciones híbridas combinando múltiples enfoques
+        
+        Args:
+            deadline (Deadline, optional): Presupuesto de latencia de la petición;
+                las fuentes y etapas que no quepan se descartan y quedan registradas en él
         """
+        deadline = Deadline.ensure(deadline)
         # Asegurar que los datos están cargados
         if self.motos_df is None:
-            if not self._load_data():
-                return []
-            self._prepare_feature_matrices()
-            self._calculate_user_similarity()
-        
-        # 1. FILTRADO BASADO EN CONTENIDO (40% del peso)
-        content_recs = self._content_based_recommendations(user_id, preferences, top_n * 2)
-        
-        # 2. FILTRADO COLABORATIVO (30% del peso)
-        collaborative_recs = self._collaborative_filtering_recommendations(user_id, top_n * 2)
-        
-        # 3. ALGORITMO BASADO EN CONOCIMIENTO (20% del peso)
-        knowledge_recs = self._knowledge_based_recommendations(preferences, top_n * 2)
-        
-        # 4. RECOMENDACIONES POPULARES/TENDENCIAS (10% del peso)
-        popularity_recs = self._popularity_based_recommendations(top_n)
+            with tracer.span('hybrid.load_data'):
+                if not self._load_data():
+                    return []
+                self._prepare_feature_matrices()
+                self._calculate_user_similarity()
+        
+        # Las cuatro fuentes son independientes: se evalúan a la vez y la que
+        # falle o supere su tiempo límite se descarta sin bloquear la respuesta
+        outcome = self.fanout.run({
+            # 1. FILTRADO BASADO EN CONTENIDO (40% del peso)
+            'content': tracer.traced('hybrid.content',
+                                     lambda: self._content_based_recommendations(user_id, preferences, top_n * 2)),
+            # 2. FILTRADO COLABORATIVO (30% del peso)
+            'collaborative': tracer.traced('hybrid.collaborative',
+                                           lambda: self._collaborative_filtering_recommendations(user_id, top_n * 2)),
+            # 3. ALGORITMO BASADO EN CONOCIMIENTO (20% del peso)
+            'knowledge': tracer.traced('hybrid.knowledge',
+                                       lambda: self._knowledge_based_recommendations(preferences, top_n * 2)),
+            # 4. RECOMENDACIONES POPULARES/TENDENCIAS (10% del peso)
+            'popularity': tracer.traced('hybrid.popularity',
+                                        lambda: self._popularity_based_recommendations(top_n))
+        }, deadline=deadline)
+        if outcome.dropped:
+            logger.warning(f"Recomendación híbrida para {user_id} sin las fuentes: {outcome.dropped}")
+        content_recs = outcome.get('content', [])
+        collaborative_recs = outcome.get('collaborative', [])
+        knowledge_recs = outcome.get('knowledge', [])
+        popularity_recs = outcome.get('popularity', [])
         
         # 5. COMBINAR Y DIVERSIFICAR
         final_recs = self._combine_and_diversify_recommendations(
             content_recs, collaborative_recs, knowledge_recs, popularity_recs,
-            user_id, preferences, top_n
+            user_id, preferences, top_n, deadline=deadline
         )
         
         return final_recs
@@ -234,26 +299,24 @@ class HybridMotoRecommender:
             return []
         
         scores = {}
-        self.logger.info(f"[HYBRID] FORZANDO uso de QuantitativeEvaluator para {len(self.motos_df)} motos")
-        self.logger.info(f"[HYBRID] Preferencias recibidas: {preferences}")
+        self.logger.debug("[HYBRID] Evaluando %d motos con QuantitativeEvaluator; preferencias: %s",
+                          len(self.motos_df), preferences)
         
         # FORZAR el uso del evaluador cuantitativo para TODAS las motos
         motos_evaluadas = 0
-        for idx, moto in self.motos_df.iterrows():
+        for moto in self._get_moto_catalog():
             try:
-                self.logger.info(f"[HYBRID] Evaluando moto {moto['id']} con QuantitativeEvaluator")
-                
                 # USAR OBLIGATORIAMENTE el evaluador cuantitativo
                 score, reasons = self.quantitative_evaluator.evaluate_moto_quantitative(preferences, moto)
                 
-                self.logger.info(f"[HYBRID] Moto {moto['id']} - Score obtenido: {score}")
+                self._item_log.debug("[HYBRID] Moto %s - Score obtenido: %s", moto['id'], score)
                 
                 if score > 0:
                     scores[moto['id']] = {
                         'score': score,
                         'reasons': reasons,
                         'method': 'content_quantitative',
-                        'moto_data': moto.to_dict()
+                        'moto_data': self._get_moto_data(moto['id'])
                     }
                 
                 motos_evaluadas += 1
@@ -261,129 +324,124 @@ class HybridMotoRecommender:
                     break
                     
             except Exception as e:
-                self.logger.error(f"[HYBRID] ERROR evaluando moto {moto.get('id', 'unknown')}: {str(e)}")
-                import traceback
-                self.logger.error(f"[HYBRID] Traceback completo: {traceback.format_exc()}")
+                self.logger.error("[HYBRID] ERROR evaluando moto %s: %s", moto.get('id', 'unknown'), e,
+                                  exc_info=self.logger.isEnabledFor(logging.DEBUG))
                 continue
         
-        self.logger.info(f"[HYBRID] Motas evaluadas: {motos_evaluadas}, Motos con score > 0: {len(scores)}")
+        self.logger.debug("[HYBRID] Motos evaluadas: %d, Motos con score > 0: %d", motos_evaluadas, len(scores))
         
         # Ordenar y devolver top N
         sorted_scores = sorted(scores.items(), key=lambda x: x[1]['score'], reverse=True)
-        self.logger.info(f"[HYBRID] Top 5 motos por score: {[(k, v['score']) for k, v in sorted_scores[:5]]}")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("[HYBRID] Top 5 motos por score: %s", [(k, v['score']) for k, v in sorted_scores[:5]])
         
         return [{'moto_id': k, **v} for k, v in sorted_scores[:top_n]]
     
-    def _knowledge_based_recommendations(self, preferences: Dict, top_n: int) -> List[Dict]:
-        """Recomendaciones basadas en reglas expertas"""
-        if self.motos_df is None:
+    def _collaborative_filtering_recommendations(self, user_id: str, top_n: int) -> List[Dict]:
+        """Recomendaciones de motos valoradas por usuarios con interacciones similares"""
+        if self.user_similarity_matrix is None or self.user_moto_matrix is None or self.users_df is None:
             return []
         
-        recommendations = {}
+        rows = np.flatnonzero(self.users_df['id'].astype(str).to_numpy() == str(user_id))
+        if len(rows) == 0:
+            return []
+        row = rows[0]
         
-        # Reglas expertas basadas en uso previsto
-        uso = preferences.get('uso', preferences.get('uso_previsto', '')).lower()
-        experiencia = preferences.get('experiencia', '').lower()
+        # Puntuación de cada moto: interacciones de los demás ponderadas por su similitud
+        similarity = self.user_similarity_matrix[row].copy()
+        similarity[row] = 0.0
+        scores = similarity @ self.user_moto_matrix
+        scores[self.user_moto_matrix[row] > 0] = 0.0
         
-        for _, moto in self.motos_df.iterrows():
-            score = 0.0
-            reasons = []
-            
-            tipo_moto = str(moto['tipo']).lower()
-            cilindrada = moto['cilindrada']
-            
-            # Reglas por uso
-            if uso == 'ciudad':
-                if any(x in tipo_moto for x in ['naked', 'scooter', 'urbana']):
-                    score += 3.0
-                    reasons.append("Ideal para ciudad")
-                if cilindrada <= 400:
-                    score += 1.0
-                    reasons.append("Cilindrada urbana")
-                    
-            elif uso == 'carretera':
-                if any(x in tipo_moto for x in ['sport', 'touring', 'deportiva']):
-                    score += 3.0
-                    reasons.append("Perfecta para carretera")
-                if cilindrada >= 500:
-                    score += 1.0
-                    reasons.append("Potencia para carretera")
-                    
-            elif uso == 'mixto':
-                if any(x in tipo_moto for x in ['trail', 'adventure', 'naked']):
-                    score += 3.0
-                    reasons.append("Versátil para uso mixto")
-                if 300 <= cilindrada <= 700:
-                    score += 1.0
-                    reasons.append("Cilindrada versátil")
-            
-            # Reglas por experiencia
-            if experiencia == 'principiante':
-                if cilindrada <= 400:
-                    score += 2.0
-                    reasons.append("Adecuada para principiantes")
-                elif cilindrada > 600:
-                    score -= 2.0  # Penalizar motos muy potentes
-                    
-            elif experiencia == 'intermedio':
-                if 300 <= cilindrada <= 700:
-                    score += 2.0
-                    reasons.append("Perfecta para nivel intermedio")
-                    
-            elif experiencia == 'avanzado':
-                if cilindrada >= 600:
-                    score += 2.0
-                    reasons.append("Potencia para expertos")
-            
-            # Regla de seguridad moderna
-            descripcion = str(moto['descripcion']).lower()
-            if any(x in descripcion for x in ['abs', 'tcs', 'control tracción']):
-                score += 0.5
-                reasons.append("Sistemas de seguridad modernos")
-            
-            if score > 0:
-                recommendations[moto['id']] = {
-                    'score': score,
-                    'reasons': reasons,
-                    'method': 'knowledge',
-                    'moto_data': moto.to_dict()
-                }
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) == 0:
+            return []
+        best = candidates[np.argsort(-scores[candidates], kind='stable')[:top_n]]
+        
+        result = []
+        for col in best.tolist():
+            moto = self.motos_df.iloc[col]
+            result.append({
+                'moto_id': moto['id'],
+                'score': float(scores[col]),
+                'reasons': ["Gusta a usuarios con intereses similares"],
+                'method': 'collaborative',
+                'moto_data': moto.to_dict()
+            })
+        return result
+    
+    def _knowledge_based_recommendations(self, preferences: Dict, top_n: int) -> List[Dict]:
+        """Recomendaciones basadas en reglas expertas (ver knowledge_rules.KNOWLEDGE_RULES)"""
+        if self.motos_df is None:
+            return []
         
-        sorted_recs = sorted(recommendations.items(), key=lambda x: x[1]['score'], reverse=True)
-        return [{'moto_id': k, **v} for k, v in sorted_recs[:top_n]]
+        return self.knowledge_engine.recommend(self.motos_df, preferences, top_n)
     
-    def _popularity_based_recommendations(self, top_n: int) -> List[Dict]:
-        """Recomendaciones basadas en popularidad general"""
+    def _popularity_based_recommendations(self, top_n: int, tipo: str = None,
+                                          price_band: str = None) -> List[Dict]:
+        """
+        Recomendaciones basadas en popularidad general
+        
+        Args:
+            tipo (str, optional): Limitar a un tipo de moto
+            price_band (str, optional): Limitar a una franja de precio (ver popularity_baseline.PRICE_BANDS)
+        """
         if self.interactions_df is None:
             return []
         
-        # Calcular popularidad por número de interacciones
-        popularity = self.interactions_df.groupby('moto_id').agg({
-            'weight': 'sum',
-            'user_id': 'count'
-        }).reset_index()
-        
-        popularity['popularity_score'] = popularity['weight'] + (popularity['user_id'] * 0.5)
-        popularity = popularity.sort_values('popularity_score', ascending=False)
+        # La popularidad se agrega una vez por carga y se mantiene ordenada
+        if not self.popularity.loaded:
+            self.popularity.load(self.interactions_df, self.motos_df)
         
         result = []
-        for _, row in popularity.head(top_n).iterrows():
-            moto_data = self.motos_df[self.motos_df['id'] == row['moto_id']]
-            if not moto_data.empty:
+        for moto_id, score, count in self.popularity.top(top_n, tipo, price_band):
+            moto_data = self._get_moto_data(moto_id)
+            if moto_data is not None:
                 result.append({
-                    'moto_id': row['moto_id'],
-                    'score': row['popularity_score'],
-                    'reasons': [f"Popular entre usuarios ({row['user_id']} interacciones)"],
+                    'moto_id': moto_id,
+                    'score': score,
+                    'reasons': [f"Popular entre usuarios ({count} interacciones)"],
                     'method': 'popularity',
-                    'moto_data': moto_data.iloc[0].to_dict()
+                    'moto_data': moto_data
                 })
         
         return result
     
+    def _get_moto_data(self, moto_id):
+        """
+        Fila de motos_df de una moto como diccionario.
+        
+        Todas las fuentes (contenido, colaborativo, conocimiento, popularidad)
+        rellenan 'moto_data' desde la fila del DataFrame, con sus columnas y
+        nombres originales.
+        """
+        position = self._get_moto_positions().get(moto_id)
+        if position is None:
+            return None
+        return self.motos_df.iloc[position].to_dict()
+    
+    def _get_moto_positions(self):
+        """Posición en motos_df de cada ID de moto (se recalcula si cambia el DataFrame)"""
+        if self._moto_positions is None or self._moto_positions_source is not self.motos_df:
+            positions = {}
+            for position, moto_id in enumerate(self.motos_df['id']):
+                positions.setdefault(moto_id, position)
+            self._moto_positions = positions
+            self._moto_positions_source = self.motos_df
+        return self._moto_positions
+    
     def _combine_and_diversify_recommendations(self, content_recs, collaborative_recs, 
                                              knowledge_recs, popularity_recs, 
-                                             user_id, preferences, top_n):
-        """Combina recomendaciones de diferentes métodos y asegura diversidad"""
+                                             user_id, preferences, top_n, deadline=None):
+        """
+        Combina recomendaciones de diferentes métodos y asegura diversidad.
+        
+        Es un algoritmo "anytime": la mezcla ponderada de las fuentes disponibles
+        siempre se calcula, y los ajustes de diversidad y exploración solo se
+        aplican si queda presupuesto. Si el presupuesto se agota se devuelve la
+        mejor mezcla disponible y las etapas omitidas se registran en ``deadline``.
+        """
+        deadline = Deadline.ensure(deadline)
         
         # Pesos para cada método
         weights = {
@@ -395,42 +453,75 @@ class HybridMotoRecommender:
         
         all_recommendations = {}
         
-        # Combinar todas las recomendaciones
-        for recs, weight in [(content_recs, weights['content']), 
-                           (collaborative_recs, weights['collaborative']),
-                           (knowledge_recs, weights['knowledge']), 
-                           (popularity_recs, weights['popularity'])]:
-            
-            for rec in recs:
-                moto_id = rec['moto_id']
-                if moto_id not in all_recommendations:
-                    all_recommendations[moto_id] = {
-                        'combined_score': 0.0,
-                        'methods': [],
-                        'all_reasons': [],
-                        'moto_data': rec.get('moto_data', {})
-                    }
+        with tracer.span('hybrid.combine') as span:
+            # Combinar todas las recomendaciones
+            for recs, weight in [(content_recs, weights['content']), 
+                               (collaborative_recs, weights['collaborative']),
+                               (knowledge_recs, weights['knowledge']), 
+                               (popularity_recs, weights['popularity'])]:
                 
-                # Agregar score ponderado
-                all_recommendations[moto_id]['combined_score'] += rec['score'] * weight
-                all_recommendations[moto_id]['methods'].append(rec.get('method', 'unknown'))
-                all_recommendations[moto_id]['all_reasons'].extend(rec.get('reasons', []))
-        
-        # Agregar factor de diversidad
-        all_recommendations = self._add_diversity_factor(all_recommendations, preferences)
-        
-        # Agregar factor de exploración vs explotación
-        all_recommendations = self._add_exploration_factor(all_recommendations, user_id)
-        
-        # Ordenar por score combinado
-        sorted_recs = sorted(all_recommendations.items(), 
-                           key=lambda x: x[1]['combined_score'], reverse=True)
-        
-        # Asegurar diversidad en el resultado final
-        final_recs = self._ensure_final_diversity(sorted_recs, top_n)
-        
+                for rec in recs:
+                    moto_id = rec['moto_id']
+                    if moto_id not in all_recommendations:
+                        all_recommendations[moto_id] = {
+                            'combined_score': 0.0,
+                            'methods': [],
+                            'all_reasons': [],
+                            'moto_data': rec.get('moto_data', {})
+                        }
+                    
+                    # Agregar score ponderado
+                    all_recommendations[moto_id]['combined_score'] += rec['score'] * weight
+                    all_recommendations[moto_id]['methods'].append(rec.get('method', 'unknown'))
+                    all_recommendations[moto_id]['all_reasons'].extend(rec.get('reasons', []))
+            span.set(candidates=len(all_recommendations))
+            
+            # Agregar factor de diversidad
+            if deadline.expired:
+                deadline.drop('diversity_factor')
+            else:
+                all_recommendations = self._add_diversity_factor(all_recommendations, preferences)
+            
+            # Agregar factor de exploración vs explotación
+            if deadline.expired:
+                deadline.drop('exploration_factor')
+            else:
+                all_recommendations = self._add_exploration_factor(all_recommendations, user_id)
+            
+            # Ordenar por score combinado (empates según la clave de exploración)
+            sorted_recs = sorted(all_recommendations.items(), 
+                               key=lambda x: (x[1]['combined_score'], x[1].get('exploration_key', '')),
+                               reverse=True)
+        
+        # Asegurar diversidad en el resultado final (o la mejor mezcla si no queda tiempo)
+        if deadline.expired:
+            deadline.drop('final_diversity')
+            with tracer.span('hybrid.hydration'):
+                final_recs = [self._format_recommendation(moto_id, rec_data) for moto_id, rec_data in sorted_recs[:top_n]]
+        else:
+            final_recs = self._ensure_final_diversity(sorted_recs, top_n)
+        
+        if deadline.dropped:
+            logger.warning(f"Recomendación híbrida para {user_id} parcial; descartado: {deadline.dropped}")
         return final_recs
     
+    def _format_recommendation(self, moto_id, rec_data):
+        """Convierte una entrada de la mezcla en el resultado que devuelve el sistema híbrido"""
+        moto_data = rec_data['moto_data']
+        return {
+            'moto_id': moto_id,
+            'score': rec_data['combined_score'],
+            'marca': moto_data.get('marca', ''),
+            'modelo': moto_data.get('modelo', ''),
+            'tipo': moto_data.get('tipo', ''),
+            'precio': moto_data.get('precio', 0),
+            'cilindrada': moto_data.get('cilindrada', 0),
+            'imagen': moto_data.get('imagen', ''),
+            'methods_used': sorted(set(rec_data['methods'])),
+            'note': ' | '.join(list(set(rec_data['all_reasons']))),
+            'details': moto_data
+        }
+    
     def _add_diversity_factor(self, recommendations, preferences):
         """Añade factor de diversidad para evitar recomendaciones muy similares"""
         
@@ -461,7 +552,15 @@ class HybridMotoRecommender:
         return recommendations
     
     def _add_exploration_factor(self, recommendations, user_id):
-        """Añade factor de exploración para mostrar opciones nuevas"""
+        """
+        Añade factor de exploración para mostrar opciones nuevas.
+        
+        El desempate entre motos con la misma puntuación se siembra con el
+        usuario y la versión del espacio de ids (una por carga de datos): cada
+        usuario explora un orden distinto, pero la misma petición sobre los
+        mismos datos devuelve siempre el mismo ranking, que es lo que permite
+        revalidarla por ETag en la API.
+        """
         
         # Obtener motos ya vistas por el usuario
         seen_motos = set()
@@ -470,74 +569,53 @@ class HybridMotoRecommender:
             seen_motos = set(user_interactions['moto_id'].tolist())
         
         # Dar boost a motos no vistas (exploración)
+        seed = f"{current_id_space().version}:{user_id}:"
         for moto_id, rec in recommendations.items():
             if moto_id not in seen_motos:
                 rec['combined_score'] *= 1.1  # 10% de boost por exploración
                 rec['all_reasons'].append("Nueva opción para explorar")
+            rec['exploration_key'] = hashlib.sha1(f"{seed}{moto_id}".encode()).hexdigest()
         
         return recommendations
     
     def _ensure_final_diversity(self, sorted_recs, top_n):
-        """Asegura diversidad en el resultado final"""
-        
-        final_results = []
-        used_marcas = set()
-        used_tipos = set()
-        
-        # Primera pasada: seleccionar diversas opciones
-        for moto_id, rec_data in sorted_recs:
-            if len(final_results) >= top_n:
-                break
-                
-            moto_data = rec_data['moto_data']
-            marca = moto_data.get('marca', '').lower()
-            tipo = moto_data.get('tipo', '').lower()
-            
-            # Permitir máximo 2 motos por marca y 3 por tipo
-            marca_count = sum(1 for r in final_results if r['marca'].lower() == marca)
-            tipo_count = sum(1 for r in final_results if r['tipo'].lower() == tipo)
-            
-            if marca_count < 2 and tipo_count < 3:
-                final_results.append({
-                    'moto_id': moto_id,
-                    'score': rec_data['combined_score'],
-                    'marca': moto_data.get('marca', ''),
-                    'modelo': moto_data.get('modelo', ''),
-                    'tipo': moto_data.get('tipo', ''),
-                    'precio': moto_data.get('precio', 0),
-                    'cilindrada': moto_data.get('cilindrada', 0),
-                    'imagen': moto_data.get('imagen', ''),
-                    'methods_used': list(set(rec_data['methods'])),
-                    'note': ' | '.join(list(set(rec_data['all_reasons']))),
-                    'details': moto_data
-                })
-                used_marcas.add(marca)
-                used_tipos.add(tipo)
+        """
+        Asegura diversidad en el resultado final.
         
-        # Segunda pasada: llenar espacios restantes si es necesario
-        if len(final_results) < top_n:
-            for moto_id, rec_data in sorted_recs:
-                if len(final_results) >= top_n:
-                    break
-                    
-                # Si no está ya en los resultados, agregarlo
-                if not any(r['moto_id'] == moto_id for r in final_results):
-                    moto_data = rec_data['moto_data']
-                    final_results.append({
-                        'moto_id': moto_id,
-                        'score': rec_data['combined_score'],
-                        'marca': moto_data.get('marca', ''),
-                        'modelo': moto_data.get('modelo', ''),
-                        'tipo': moto_data.get('tipo', ''),
-                        'precio': moto_data.get('precio', 0),
-                        'cilindrada': moto_data.get('cilindrada', 0),
-                        'imagen': moto_data.get('imagen', ''),
-                        'methods_used': list(set(rec_data['methods'])),
-                        'note': ' | '.join(list(set(rec_data['all_reasons']))),
-                        'details': moto_data
-                    })
+        Reordena los candidatos con MMR (``self.diversity``) sobre los vectores
+        precalculados del catálogo, limitando las motos por marca y tipo.
+        """
+        if not sorted_recs:
+            return []
         
-        return final_results
+        with tracer.span('hybrid.diversity', candidates=len(sorted_recs)):
+            relevance = [rec_data['combined_score'] for _, rec_data in sorted_recs]
+            categories = {
+                'marca': [str(rec_data['moto_data'].get('marca', '') or '').lower() for _, rec_data in sorted_recs],
+                'tipo': [str(rec_data['moto_data'].get('tipo', '') or '').lower() for _, rec_data in sorted_recs]
+            }
+            vectors = self._get_diversity_vectors([moto_id for moto_id, _ in sorted_recs])
+            order = self.diversity.rerank(relevance, top_n, vectors=vectors, categories=categories)
+        with tracer.span('hybrid.hydration'):
+            return [self._format_recommendation(*sorted_recs[i]) for i in order]
+    
+    def _get_diversity_vectors(self, moto_ids):
+        """Vectores de diversidad de unas motos (fila nula si no están en el catálogo)"""
+        if self.motos_df is None or self.motos_df.empty:
+            return None
+        if self._diversity_vectors is None or self._diversity_vectors_source is not self.motos_df:
+            self._diversity_vectors = feature_vectors(self.motos_df,
+                                                      numeric=('precio', 'cilindrada', 'potencia', 'peso'),
+                                                      categorical=('tipo', 'marca'))
+            self._diversity_vectors_source = self.motos_df
+        
+        positions = self._get_moto_positions()
+        vectors = np.zeros((len(moto_ids), self._diversity_vectors.shape[1]))
+        for row, moto_id in enumerate(moto_ids):
+            position = positions.get(moto_id)
+            if position is not None:
+                vectors[row] = self._diversity_vectors[position]
+        return vectors
     
     def _calculate_experience_score(self, cilindrada, experiencia):
         """Calcula puntuación basada en experiencia y cilindrada"""
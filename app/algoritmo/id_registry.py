@@ -0,0 +1,251 @@
+"""
+Registro central de identificadores internos.
+
+Los algoritmos (PageRank, label propagation, recomendadores híbridos) reciben
+identificadores de usuario y de moto como strings desde Neo4j. Este módulo
+asigna una única vez por carga de datos un entero int32 denso a cada id y
+ofrece codificación/decodificación vectorizada, de modo que todas las
+estructuras se construyan sobre el mismo espacio de enteros.
+"""
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Código reservado para ids desconocidos o vacíos
+MISSING_ID = -1
+
+_EMPTY_VALUES = {'', 'None', 'nan', 'NaN'}
+
+
+def normalize_id(value):
+    """
+    Normaliza un identificador a su forma canónica (string sin espacios).
+
+    Args:
+        value: Identificador original
+
+    Returns:
+        str or None: Identificador normalizado o None si está vacío
+    """
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    value = str(value).strip()
+    return None if value in _EMPTY_VALUES else value
+
+
+def _normalize_array(values):
+    """Versión vectorizada de ``normalize_id``; devuelve un array de objetos."""
+    series = pd.Series(list(values) if not isinstance(values, (pd.Series, np.ndarray, pd.Index)) else values,
+                       dtype=object)
+    missing = series.isna().to_numpy().copy()
+    normalized = series.astype(str).str.strip().to_numpy(dtype=object).copy()
+    missing |= np.isin(normalized, list(_EMPTY_VALUES))
+    normalized[missing] = None
+    return normalized
+
+
+class IdRegistry:
+    """
+    Asigna enteros densos (int32) a identificadores externos.
+
+    Los códigos son estables mientras viva el registro: un id recibe su código
+    la primera vez que se interna y nunca cambia.
+    """
+
+    def __init__(self, name, ids=None):
+        """
+        Inicializa el registro.
+
+        Args:
+            name (str): Nombre descriptivo ('users', 'motos'...)
+            ids (iterable, optional): Ids a internar de entrada
+        """
+        self.name = name
+        self._ids = []
+        self._lookup = {}
+        self._index = None
+        self._lock = threading.Lock()
+        if ids is not None:
+            self.intern_many(ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, value):
+        return normalize_id(value) in self._lookup
+
+    @property
+    def ids(self):
+        """np.ndarray: Ids internados, en orden de código."""
+        return np.array(self._ids, dtype=object)
+
+    def as_dict(self):
+        """
+        Devuelve una copia del mapeo id -> código.
+
+        Returns:
+            dict: Mapeo de ids normalizados a códigos
+        """
+        return dict(self._lookup)
+
+    def _get_index(self):
+        """Índice de pandas para búsquedas vectorizadas (se invalida al crecer)."""
+        index = self._index
+        if index is None or len(index) != len(self._ids):
+            index = pd.Index(self._ids, dtype=object)
+            self._index = index
+        return index
+
+    def intern(self, value):
+        """
+        Devuelve el código de un id, asignándole uno nuevo si no existe.
+
+        Args:
+            value: Identificador
+
+        Returns:
+            int: Código asignado o MISSING_ID si el id está vacío
+        """
+        key = normalize_id(value)
+        if key is None:
+            return MISSING_ID
+        code = self._lookup.get(key)
+        if code is not None:
+            return code
+        with self._lock:
+            code = self._lookup.get(key)
+            if code is None:
+                code = len(self._ids)
+                self._ids.append(key)
+                self._lookup[key] = code
+        return code
+
+    def intern_many(self, values):
+        """
+        Versión vectorizada de ``intern``.
+
+        Args:
+            values (iterable): Identificadores
+
+        Returns:
+            np.ndarray: Códigos int32 (MISSING_ID para ids vacíos)
+        """
+        normalized = _normalize_array(values)
+        if len(normalized) == 0:
+            return np.empty(0, dtype=np.int32)
+
+        codes = self._get_index().get_indexer(normalized).astype(np.int32)
+        unknown = (codes == MISSING_ID) & pd.notna(normalized)
+        if unknown.any():
+            with self._lock:
+                for key in pd.unique(normalized[unknown]):
+                    if key not in self._lookup:
+                        self._lookup[key] = len(self._ids)
+                        self._ids.append(key)
+            codes[unknown] = self._get_index().get_indexer(normalized[unknown])
+        return codes
+
+    def encode(self, values):
+        """
+        Codifica ids sin internar los desconocidos.
+
+        Args:
+            values (iterable): Identificadores
+
+        Returns:
+            np.ndarray: Códigos int32 (MISSING_ID si el id no está registrado)
+        """
+        normalized = _normalize_array(values)
+        if len(normalized) == 0:
+            return np.empty(0, dtype=np.int32)
+        return self._get_index().get_indexer(normalized).astype(np.int32)
+
+    def encode_one(self, value):
+        """
+        Codifica un único id sin internarlo.
+
+        Returns:
+            int: Código o MISSING_ID
+        """
+        return self._lookup.get(normalize_id(value), MISSING_ID)
+
+    def decode(self, codes):
+        """
+        Decodifica códigos a sus ids.
+
+        Args:
+            codes (array-like): Códigos enteros
+
+        Returns:
+            np.ndarray: Ids (None para MISSING_ID o códigos fuera de rango)
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        ids = np.array(self._ids + [None], dtype=object)
+        safe = np.where((codes >= 0) & (codes < len(self._ids)), codes, len(self._ids))
+        return ids[safe]
+
+    def decode_one(self, code):
+        """
+        Decodifica un único código.
+
+        Returns:
+            str or None: Id asociado
+        """
+        return self._ids[code] if 0 <= code < len(self._ids) else None
+
+
+class IdSpace:
+    """
+    Espacio de enteros compartido por todos los algoritmos para una carga de
+    datos: un registro para usuarios y otro para motos.
+    """
+
+    def __init__(self, user_ids=None, moto_ids=None, version=0):
+        self.users = IdRegistry('users', user_ids)
+        self.motos = IdRegistry('motos', moto_ids)
+        self.version = version
+
+
+_current_space = IdSpace()
+_space_lock = threading.Lock()
+
+
+def current_id_space():
+    """
+    Devuelve el espacio de ids activo.
+
+    Returns:
+        IdSpace: Espacio compartido por los algoritmos
+    """
+    return _current_space
+
+
+def reset_id_space(user_ids=None, moto_ids=None):
+    """
+    Crea un espacio de ids nuevo para una carga de datos y lo activa.
+
+    Los algoritmos construidos con el espacio anterior conservan su referencia,
+    por lo que sus arrays siguen siendo coherentes hasta que se reconstruyan.
+
+    Args:
+        user_ids (iterable, optional): Ids de usuario a internar de entrada
+        moto_ids (iterable, optional): Ids de moto a internar de entrada
+
+    Returns:
+        IdSpace: Nuevo espacio activo
+    """
+    global _current_space
+    with _space_lock:
+        _current_space = IdSpace(user_ids, moto_ids, version=_current_space.version + 1)
+    logger.info(f"Espacio de ids v{_current_space.version}: "
+                f"{len(_current_space.users)} usuarios, {len(_current_space.motos)} motos")
+    return _current_space
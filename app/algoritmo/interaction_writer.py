@@ -0,0 +1,563 @@
+"""
+Servicio de escritura de interacciones (likes y moto ideal).
+
+Las rutas ``/marcar_moto_ideal``, ``/dar_like_moto``, ``/quitar_like_moto`` y
+``/like_moto`` hacían varias consultas auto-commit seguidas (buscar usuario,
+verificar moto, comprobar like, escribir). Aquí cada operación es una única
+sentencia Cypher parametrizada ejecutada en una transacción gestionada.
+
+Opcionalmente (``write_behind=True``) los likes se confirman al instante contra
+un estado en memoria y se escriben en Neo4j en lotes ``UNWIND`` periódicos,
+agrupando las ráfagas: si un usuario pulsa like/unlike varias veces antes del
+volcado, solo se escribe el estado final. El estado de likes de cada usuario se
+guarda en una caché LRU acotada (``max_cached_users``) y se descarta al volcar su
+lote, de modo que el siguiente cambio vuelve a leerlo de Neo4j e incorpora lo
+escrito por otros workers.
+
+Las sentencias de like/unlike mantienen también los contadores materializados
+(``m.like_count`` y el último like del usuario, ver ``like_counters``), que se
+copian en la ``LikeCounterCache`` del proceso. Tras cada cambio se avisa de
+forma síncrona a los listeners registrados (ranking en memoria, cachés...)
+con ``(user_id, moto_id, kind, added)``.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from .like_counters import last_like_projection
+
+logger = logging.getLogger(__name__)
+
+# Alterna el like de un usuario (esquema User/INTERACTED) en una sola sentencia,
+# manteniendo m.like_count y la proyección del último like del usuario
+TOGGLE_LIKE_QUERY = """
+MATCH (u:User {username: $username})
+MATCH (m:Moto {id: $moto_id})
+OPTIONAL MATCH (u)-[r:INTERACTED {type: 'like'}]->(m)
+WITH u, m, collect(r) AS likes
+FOREACH (x IN likes | DELETE x)
+FOREACH (_ IN CASE WHEN size(likes) = 0 THEN [1] ELSE [] END |
+    CREATE (u)-[:INTERACTED {type: 'like', weight: 3.0, timestamp: timestamp()}]->(m))
+SET m.like_count = CASE WHEN size(likes) = 0 THEN coalesce(m.like_count, 0) + 1
+                        ELSE coalesce(m.like_count, size(likes)) - size(likes) END
+WITH u, m, size(likes) = 0 AS liked
+""" + last_like_projection('m', 'liked') + """
+RETURN u.id AS user_id, liked, m.like_count AS like_count, u.last_like_label AS last_like
+"""
+
+REMOVE_LIKE_QUERY = """
+MATCH (u:User {username: $username})
+OPTIONAL MATCH (u)-[r:INTERACTED {type: 'like'}]->(liked:Moto {id: $moto_id})
+WITH u, collect(r) AS likes, head(collect(liked)) AS m
+FOREACH (x IN likes | DELETE x)
+FOREACH (target IN CASE WHEN m IS NULL THEN [] ELSE [m] END |
+    SET target.like_count = coalesce(target.like_count, size(likes)) - size(likes))
+WITH u, m, size(likes) AS deleted_count
+""" + last_like_projection('m', 'deleted_count') + """
+RETURN u.id AS user_id, deleted_count, m.like_count AS like_count, u.last_like_label AS last_like
+"""
+
+# Sustituye la moto ideal del usuario (solo una por usuario)
+SET_IDEAL_QUERY = """
+MATCH (u:User {username: $username})
+MATCH (m:Moto {id: $moto_id})
+OPTIONAL MATCH (u)-[old:IDEAL]->(prev:Moto)
+WITH u, m, collect(old) AS olds, collect(prev.id) AS previous
+FOREACH (x IN olds | DELETE x)
+CREATE (u)-[r:IDEAL]->(m)
+SET r.score = 100.0,
+    r.reasons = $reasons,
+    r.timestamp = timestamp()
+RETURN u.id AS user_id, previous
+"""
+
+# Alterna el like en el esquema Usuario/LIKES usado por /like_moto
+TOGGLE_LEGACY_LIKE_QUERY = """
+MATCH (u:Usuario)
+WHERE ($user_id IS NOT NULL AND u.user_id = $user_id)
+   OR ($user_id IS NULL AND u.username = $username)
+MATCH (m:Moto {id: $moto_id})
+OPTIONAL MATCH (u)-[r:LIKES]->(m)
+WITH u, m, collect(r) AS likes
+FOREACH (x IN likes | DELETE x)
+FOREACH (_ IN CASE WHEN size(likes) = 0 THEN [1] ELSE [] END |
+    MERGE (u)-[nr:LIKES]->(m)
+    SET nr.timestamp = datetime())
+RETURN u.user_id AS user_id, size(likes) = 0 AS liked
+"""
+
+# Distingue usuario y moto inexistentes cuando una escritura no afecta a nada
+EXISTENCE_QUERY = """
+OPTIONAL MATCH (u:User {username: $username})
+OPTIONAL MATCH (m:Moto {id: $moto_id})
+RETURN u IS NOT NULL AS user_found, m IS NOT NULL AS moto_found
+"""
+
+USER_LIKES_QUERY = """
+MATCH (u:User {username: $username})
+OPTIONAL MATCH (u)-[:INTERACTED {type: 'like'}]->(m:Moto)
+RETURN u.id AS user_id, collect(m.id) AS moto_ids
+"""
+
+# Lote de likes pendientes (write-behind)
+BATCH_LIKE_QUERY = """
+UNWIND $rows AS row
+MATCH (u:User {id: row.user_id})
+MATCH (m:Moto {id: row.moto_id})
+MERGE (u)-[r:INTERACTED {type: 'like'}]->(m)
+ON CREATE SET r.weight = 3.0, r.timestamp = row.timestamp,
+              m.like_count = coalesce(m.like_count, 0) + 1
+"""
+
+BATCH_UNLIKE_QUERY = """
+UNWIND $rows AS row
+MATCH (:User {id: row.user_id})-[r:INTERACTED {type: 'like'}]->(m:Moto {id: row.moto_id})
+DELETE r
+SET m.like_count = coalesce(m.like_count, 1) - 1
+"""
+
+# Recalcula la proyección del último like de los usuarios afectados por un lote
+BATCH_LAST_LIKE_QUERY = """
+UNWIND $user_ids AS user_id
+MATCH (u:User {id: user_id})
+""" + last_like_projection() + """
+RETURN u.id AS user_id, u.username AS username, u.last_like_label AS last_like
+"""
+
+
+def _execute_write(session, work, *args):
+    """Ejecuta una función en una transacción de escritura gestionada (neo4j 4.x y 5+)."""
+    execute = getattr(session, 'execute_write', None) or session.write_transaction
+    return execute(work, *args)
+
+
+def _execute_read(session, work, *args):
+    """Ejecuta una función en una transacción de lectura gestionada (neo4j 4.x y 5+)."""
+    execute = getattr(session, 'execute_read', None) or session.read_transaction
+    return execute(work, *args)
+
+
+def _single(tx, query, **params):
+    """Ejecuta una consulta y devuelve su único registro como diccionario (o None)."""
+    record = tx.run(query, **params).single()
+    return record.data() if record else None
+
+
+class LikeWriteBehindQueue:
+    """
+    Cola de escritura diferida de likes.
+
+    Guarda el estado deseado por (user_id, moto_id); cada cambio sustituye al
+    anterior, de modo que una ráfaga se reduce a una sola escritura. El volcado
+    se hace cada ``flush_interval`` segundos o al superar ``max_batch`` cambios.
+    """
+
+    def __init__(self, get_driver, flush_interval=2.0, max_batch=500, on_flushed=None):
+        self._get_driver = get_driver
+        self.on_flushed = on_flushed
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='like-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def enqueue(self, user_id, moto_id, liked, timestamp):
+        """
+        Registra el estado deseado de un like.
+
+        Args:
+            user_id: ID del usuario
+            moto_id: ID de la moto
+            liked (bool): True para crear el like, False para eliminarlo
+            timestamp (int): Marca de tiempo en milisegundos
+        """
+        with self._lock:
+            self._pending[(user_id, moto_id)] = (liked, timestamp)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def pending_for(self, user_id):
+        """
+        Cambios de un usuario todavía no confirmados en Neo4j.
+
+        Incluye el lote que se está volcando, para que quien lea el estado de
+        Neo4j mientras tanto pueda superponerle lo que aún no está escrito.
+
+        Returns:
+            dict: moto_id -> liked (bool)
+        """
+        with self._lock:
+            changes = {moto_id: liked for (uid, moto_id), (liked, _) in self._in_flight.items()
+                       if uid == user_id}
+            changes.update({moto_id: liked for (uid, moto_id), (liked, _) in self._pending.items()
+                            if uid == user_id})
+        return changes
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Escribe los cambios pendientes en una transacción con dos sentencias UNWIND.
+
+        Returns:
+            int: Número de cambios escritos
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._in_flight = pending
+            if not pending:
+                return 0
+
+            likes, unlikes = [], []
+            for (user_id, moto_id), (liked, timestamp) in pending.items():
+                row = {'user_id': user_id, 'moto_id': moto_id, 'timestamp': timestamp}
+                (likes if liked else unlikes).append(row)
+
+            user_ids = list({user_id for user_id, _ in pending})
+
+            def write_batch(tx):
+                if likes:
+                    tx.run(BATCH_LIKE_QUERY, rows=likes).consume()
+                if unlikes:
+                    tx.run(BATCH_UNLIKE_QUERY, rows=unlikes).consume()
+                return [record.data() for record in tx.run(BATCH_LAST_LIKE_QUERY, user_ids=user_ids)]
+
+            try:
+                driver = self._get_driver()
+                if driver is None:
+                    raise ConnectionError("No hay conexión a Neo4j")
+                with driver.session() as session:
+                    projections = _execute_write(session, write_batch)
+                logger.info(f"Volcados {len(likes)} likes y {len(unlikes)} unlikes a Neo4j")
+                with self._lock:
+                    self._in_flight = {}
+                if self.on_flushed is not None:
+                    self.on_flushed(projections or [], user_ids)
+                return len(pending)
+            except Exception as e:
+                logger.error(f"Error al volcar likes pendientes: {str(e)}")
+                # Reencolar sin pisar cambios más recientes
+                with self._lock:
+                    for key, value in pending.items():
+                        self._pending.setdefault(key, value)
+                    self._in_flight = {}
+                return 0
+
+    def stop(self):
+        """Detiene el hilo de volcado tras escribir lo pendiente."""
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self._wakeup.set()
+            self.flush()
+
+
+class InteractionWriter:
+    """
+    Escribe likes y motos ideales con una sentencia por operación.
+
+    Los métodos devuelven un diccionario con ``status`` ('liked', 'unliked',
+    'removed', 'ideal_set', 'not_found', 'user_not_found' o 'moto_not_found')
+    y, cuando se conoce, ``user_id``.
+    """
+
+    def __init__(self, get_driver, write_behind=False, flush_interval=2.0, max_batch=500,
+                 moto_lookup=None, counters=None, max_cached_users=10000):
+        """
+        Inicializa el servicio.
+
+        Args:
+            get_driver (callable): Devuelve el driver de Neo4j a usar (o None)
+            write_behind (bool): Si es True, los likes se escriben en lotes diferidos
+            flush_interval (float): Segundos entre volcados del lote
+            max_batch (int): Cambios pendientes que fuerzan un volcado
+            moto_lookup (callable, optional): Devuelve la moto en memoria (o None si no existe)
+            counters (LikeCounterCache, optional): Caché de contadores a mantener al día
+            max_cached_users (int): Usuarios cuyo estado de likes se guarda en memoria (LRU)
+        """
+        self._get_driver = get_driver
+        self.moto_lookup = moto_lookup
+        self.counters = counters
+        self._listeners = []
+        self._user_likes = OrderedDict()
+        self.max_cached_users = max_cached_users
+        self._likes_lock = threading.Lock()
+        self.queue = None
+        if write_behind:
+            self.queue = LikeWriteBehindQueue(get_driver, flush_interval, max_batch,
+                                              on_flushed=self._on_batch_flushed)
+
+    @property
+    def write_behind(self):
+        """bool: True si los likes se escriben en diferido."""
+        return self.queue is not None
+
+    def add_listener(self, listener):
+        """
+        Registra una función a la que se avisa tras cada cambio.
+
+        Args:
+            listener (callable): ``listener(user_id, moto_id, kind, added)``
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, user_id, moto_id, kind, added):
+        for listener in self._listeners:
+            try:
+                listener(user_id, moto_id, kind, added)
+            except Exception as e:
+                logger.warning(f"Error al notificar cambio de interacción: {str(e)}")
+
+    def _driver(self):
+        driver = self._get_driver()
+        if driver is None:
+            raise ConnectionError("No hay conexión a Neo4j")
+        return driver
+
+    def _write(self, query, missing_status=None, **params):
+        """
+        Ejecuta una sentencia de escritura en una transacción.
+
+        Si la sentencia no devuelve filas, se averigua en la misma transacción
+        si falta el usuario o la moto.
+        """
+        def work(tx):
+            record = _single(tx, query, **params)
+            if record is None and missing_status is None:
+                existence = _single(tx, EXISTENCE_QUERY, username=params.get('username'),
+                                    moto_id=params.get('moto_id'))
+                record = {'status': 'user_not_found' if not existence['user_found'] else 'moto_not_found'}
+            return record
+
+        with self._driver().session() as session:
+            record = _execute_write(session, work)
+        return record if record is not None else {'status': missing_status}
+
+    def toggle_like(self, username, moto_id):
+        """
+        Alterna el like de un usuario sobre una moto.
+
+        Args:
+            username (str): Nombre de usuario
+            moto_id: ID de la moto
+
+        Returns:
+            dict: ``{'status': 'liked'|'unliked'|..., 'user_id': ...}``
+        """
+        if self.write_behind:
+            return self._toggle_like_deferred(username, moto_id)
+
+        record = self._write(TOGGLE_LIKE_QUERY, username=username, moto_id=moto_id)
+        if 'status' in record:
+            return record
+        result = {'status': 'liked' if record['liked'] else 'unliked', 'user_id': record['user_id']}
+        self._forget_user_likes(username)
+        self._apply_counts(moto_id, username, record)
+        self._notify(record['user_id'], moto_id, 'like', record['liked'])
+        return result
+
+    def remove_like(self, username, moto_id):
+        """
+        Elimina el like de un usuario sobre una moto.
+
+        Returns:
+            dict: ``{'status': 'removed'|'not_found'|'user_not_found', 'user_id': ...}``
+        """
+        if self.write_behind:
+            state = self._load_user_likes(username)
+            if state is None:
+                return {'status': 'user_not_found'}
+            user_id, liked = state
+            with self._likes_lock:
+                if moto_id not in liked:
+                    return {'status': 'not_found', 'user_id': user_id}
+                liked.discard(moto_id)
+            self.queue.enqueue(user_id, moto_id, False, _now_ms())
+            self._adjust_counts(moto_id, username, -1)
+            self._notify(user_id, moto_id, 'like', False)
+            return {'status': 'removed', 'user_id': user_id}
+
+        record = self._write(REMOVE_LIKE_QUERY, missing_status='user_not_found',
+                             username=username, moto_id=moto_id)
+        if 'status' in record:
+            return record
+        self._forget_user_likes(username)
+        if not record['deleted_count']:
+            return {'status': 'not_found', 'user_id': record['user_id']}
+        self._apply_counts(moto_id, username, record)
+        self._notify(record['user_id'], moto_id, 'like', False)
+        return {'status': 'removed', 'user_id': record['user_id']}
+
+    def set_ideal(self, username, moto_id, reasons):
+        """
+        Marca una moto como la ideal del usuario, sustituyendo la anterior.
+
+        Args:
+            username (str): Nombre de usuario
+            moto_id: ID de la moto
+            reasons (str): Razones serializadas en JSON
+
+        Returns:
+            dict: ``{'status': 'ideal_set'|..., 'user_id': ..., 'previous': [...]}``
+        """
+        record = self._write(SET_IDEAL_QUERY, username=username, moto_id=moto_id, reasons=reasons)
+        if 'status' in record:
+            return record
+        for previous_id in record['previous']:
+            self._notify(record['user_id'], previous_id, 'ideal', False)
+        self._notify(record['user_id'], moto_id, 'ideal', True)
+        return {'status': 'ideal_set', 'user_id': record['user_id'], 'previous': record['previous']}
+
+    def toggle_legacy_like(self, user_id, username, moto_id):
+        """
+        Alterna el like en el esquema ``Usuario``/``LIKES`` de ``/like_moto``.
+
+        Args:
+            user_id: ID del usuario (si se conoce)
+            username (str): Nombre de usuario (para buscar el ID si falta)
+            moto_id: ID de la moto
+
+        Returns:
+            dict: ``{'status': 'liked'|'unliked'|'not_found', 'user_id': ...}``
+        """
+        record = self._write(TOGGLE_LEGACY_LIKE_QUERY, missing_status='not_found',
+                             user_id=user_id or None, username=username, moto_id=moto_id)
+        if 'status' in record:
+            return record
+        self._notify(record['user_id'], moto_id, 'like', record['liked'])
+        return {'status': 'liked' if record['liked'] else 'unliked', 'user_id': record['user_id']}
+
+    # ---- Modo write-behind -----------------------------------------------------
+
+    def _load_user_likes(self, username):
+        """
+        Likes actuales del usuario.
+
+        Se leen de Neo4j si no están en la caché LRU, superponiendo los cambios
+        del propio proceso que aún no se han volcado.
+        """
+        with self._likes_lock:
+            state = self._user_likes.get(username)
+            if state is not None:
+                self._user_likes.move_to_end(username)
+                return state
+
+        def work(tx):
+            return _single(tx, USER_LIKES_QUERY, username=username)
+
+        with self._driver().session() as session:
+            record = _execute_read(session, work)
+        if record is None:
+            return None
+        liked = set(record['moto_ids'])
+        if self.queue is not None:
+            for moto_id, added in self.queue.pending_for(record['user_id']).items():
+                if added:
+                    liked.add(moto_id)
+                else:
+                    liked.discard(moto_id)
+        with self._likes_lock:
+            state = self._user_likes.setdefault(username, (record['user_id'], liked))
+            self._user_likes.move_to_end(username)
+            while len(self._user_likes) > self.max_cached_users:
+                self._user_likes.popitem(last=False)
+        return state
+
+    def _forget_user_likes(self, username):
+        with self._likes_lock:
+            self._user_likes.pop(username, None)
+
+    def _on_batch_flushed(self, projections, user_ids):
+        """Tras volcar un lote: actualiza proyecciones y olvida el estado de sus usuarios."""
+        self._apply_projections(projections)
+        flushed = set(user_ids)
+        with self._likes_lock:
+            for username in [name for name, (user_id, _) in self._user_likes.items()
+                             if user_id in flushed]:
+                del self._user_likes[username]
+
+    def _apply_counts(self, moto_id, username, record):
+        """Copia en la caché los contadores devueltos por una escritura confirmada."""
+        if self.counters is not None:
+            self.counters.apply(moto_id=moto_id, like_count=record.get('like_count'),
+                                user_id=record.get('user_id'), username=username,
+                                last_like=record.get('last_like'))
+
+    def _adjust_counts(self, moto_id, username, delta):
+        """Aplica en la caché un cambio todavía pendiente de escribir."""
+        if self.counters is None:
+            return
+        moto = self.moto_lookup(moto_id) if self.moto_lookup is not None else None
+        label = None
+        if moto is not None and moto.get('marca') and moto.get('modelo'):
+            label = f"{moto.get('marca')} {moto.get('modelo')}"
+        self.counters.adjust(moto_id, delta, username=username, label=label)
+
+    def _apply_projections(self, projections):
+        """Copia en la caché las proyecciones de último like recalculadas al volcar un lote."""
+        if self.counters is None:
+            return
+        for record in projections:
+            self.counters.apply(user_id=record['user_id'], username=record['username'],
+                                last_like=record['last_like'])
+
+    def _toggle_like_deferred(self, username, moto_id):
+        if self.moto_lookup is not None and self.moto_lookup(moto_id) is None:
+            return {'status': 'moto_not_found'}
+        state = self._load_user_likes(username)
+        if state is None:
+            return {'status': 'user_not_found'}
+        user_id, liked = state
+        with self._likes_lock:
+            added = moto_id not in liked
+            if added:
+                liked.add(moto_id)
+            else:
+                liked.discard(moto_id)
+        self.queue.enqueue(user_id, moto_id, added, _now_ms())
+        self._adjust_counts(moto_id, username, 1 if added else -1)
+        self._notify(user_id, moto_id, 'like', added)
+        return {'status': 'liked' if added else 'unliked', 'user_id': user_id}
+
+    def flush(self):
+        """Vuelca los likes pendientes (sin efecto si no hay write-behind)."""
+        return self.queue.flush() if self.queue is not None else 0
+
+
+def _now_ms():
+    """Marca de tiempo actual en milisegundos (como timestamp() de Cypher)."""
+    return int(time.time() * 1000)
+
+
+def ranking_listener(ranking):
+    """
+    Crea un listener que mantiene un MotoPageRank al día con cada cambio.
+
+    Args:
+        ranking (MotoPageRank): Ranking en memoria
+
+    Returns:
+        callable: Listener para ``InteractionWriter.add_listener``
+    """
+    def update_ranking(user_id, moto_id, kind, added):
+        if added:
+            ranking.add_user_interaction(user_id, moto_id, kind)
+        else:
+            ranking.remove_user_interaction(user_id, moto_id, kind)
+    return update_ranking
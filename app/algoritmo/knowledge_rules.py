@@ -0,0 +1,198 @@
+"""
+Motor de reglas expertas vectorizado para las recomendaciones basadas en conocimiento.
+
+``HybridMotoRecommender._knowledge_based_recommendations`` recorría el catálogo
+con ``iterrows()`` y, en cada moto, buscaba subcadenas en el tipo y pasaba la
+descripción a minúsculas para detectar ABS o control de tracción. Aquí esas
+comprobaciones se calculan una sola vez por carga del catálogo como columnas
+booleanas (familias de tipo, bandas de cilindrada, sistemas de seguridad) y las
+reglas se declaran como datos: cada petición solo suma los pesos de las reglas
+activas sobre todo el catálogo a la vez.
+"""
+import logging
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Familias de tipo: la moto pertenece si su tipo contiene alguna de las subcadenas
+TIPO_FAMILIES = {
+    'tipo_urbana': ('naked', 'scooter', 'urbana'),
+    'tipo_carretera': ('sport', 'touring', 'deportiva'),
+    'tipo_mixta': ('trail', 'adventure', 'naked')
+}
+
+# Bandas de cilindrada (las comparaciones con NaN dan False: cilindrada desconocida)
+CILINDRADA_BANDS = {
+    'cc_hasta_400': lambda cc: cc <= 400,
+    'cc_desde_500': lambda cc: cc >= 500,
+    'cc_300_700': lambda cc: (cc >= 300) & (cc <= 700),
+    'cc_desde_600': lambda cc: cc >= 600,
+    'cc_mas_de_600': lambda cc: cc > 600
+}
+
+# Sistemas de seguridad detectados en la descripción
+SAFETY_KEYWORDS = ('abs', 'tcs', 'control tracción')
+
+KnowledgeRule = namedtuple('KnowledgeRule', ['preference', 'value', 'feature', 'score', 'reason'])
+KnowledgeRule.__doc__ = """
+Regla experta: si ``preferences[preference] == value`` (o ``preference`` es
+None), las motos con ``feature`` suman ``score`` y, si hay ``reason``, la añaden
+a sus motivos.
+"""
+
+KNOWLEDGE_RULES = (
+    # Reglas por uso
+    KnowledgeRule('uso', 'ciudad', 'tipo_urbana', 3.0, "Ideal para ciudad"),
+    KnowledgeRule('uso', 'ciudad', 'cc_hasta_400', 1.0, "Cilindrada urbana"),
+    KnowledgeRule('uso', 'carretera', 'tipo_carretera', 3.0, "Perfecta para carretera"),
+    KnowledgeRule('uso', 'carretera', 'cc_desde_500', 1.0, "Potencia para carretera"),
+    KnowledgeRule('uso', 'mixto', 'tipo_mixta', 3.0, "Versátil para uso mixto"),
+    KnowledgeRule('uso', 'mixto', 'cc_300_700', 1.0, "Cilindrada versátil"),
+    # Reglas por experiencia
+    KnowledgeRule('experiencia', 'principiante', 'cc_hasta_400', 2.0, "Adecuada para principiantes"),
+    KnowledgeRule('experiencia', 'principiante', 'cc_mas_de_600', -2.0, None),  # Penalizar motos muy potentes
+    KnowledgeRule('experiencia', 'intermedio', 'cc_300_700', 2.0, "Perfecta para nivel intermedio"),
+    KnowledgeRule('experiencia', 'avanzado', 'cc_desde_600', 2.0, "Potencia para expertos"),
+    # Regla de seguridad moderna (siempre activa)
+    KnowledgeRule(None, None, 'seguridad', 0.5, "Sistemas de seguridad modernos")
+)
+
+
+def _contains_any(values, keywords):
+    """Máscara de las cadenas que contienen alguna de las palabras clave."""
+    mask = np.zeros(len(values), dtype=bool)
+    for keyword in keywords:
+        mask |= values.str.contains(keyword, regex=False).to_numpy(dtype=bool)
+    return mask
+
+
+def build_feature_columns(motos_df):
+    """
+    Calcula las columnas booleanas que usan las reglas.
+
+    Args:
+        motos_df (pd.DataFrame): Catálogo con ``tipo``, ``cilindrada`` y ``descripcion``
+
+    Returns:
+        dict: {nombre de la característica: np.ndarray de bool}
+    """
+    n_motos = len(motos_df)
+
+    def column(name, default=''):
+        if name in motos_df.columns:
+            return motos_df[name]
+        return pd.Series([default] * n_motos, index=motos_df.index)
+
+    tipos = column('tipo').astype(str).str.lower()
+    descripciones = column('descripcion').fillna('').astype(str).str.lower()
+    cilindradas = pd.to_numeric(column('cilindrada', np.nan), errors='coerce').to_numpy(dtype=float)
+
+    features = {name: _contains_any(tipos, keywords) for name, keywords in TIPO_FAMILIES.items()}
+    with np.errstate(invalid='ignore'):
+        for name, band in CILINDRADA_BANDS.items():
+            features[name] = np.asarray(band(cilindradas), dtype=bool)
+    features['seguridad'] = _contains_any(descripciones, SAFETY_KEYWORDS)
+    return features
+
+
+class KnowledgeRulesEngine:
+    """
+    Evalúa reglas expertas sobre todo el catálogo con operaciones vectoriales.
+
+    Las columnas de características se recalculan solo cuando cambia el
+    DataFrame del catálogo.
+    """
+
+    def __init__(self, rules=KNOWLEDGE_RULES):
+        """
+        Args:
+            rules (iterable): Reglas ``KnowledgeRule`` a evaluar
+        """
+        self.rules = tuple(rules)
+        self._motos_df = None
+        self._features = {}
+
+    def prepare(self, motos_df):
+        """
+        Precalcula las características del catálogo si ha cambiado.
+
+        Args:
+            motos_df (pd.DataFrame): Catálogo de motos
+        """
+        if motos_df is not self._motos_df:
+            self._features = build_feature_columns(motos_df)
+            self._motos_df = motos_df
+            logger.info(f"Reglas expertas: características precalculadas para {len(motos_df)} motos")
+        return self._features
+
+    @staticmethod
+    def _preference_values(preferences):
+        """Valores de preferencia que seleccionan las reglas."""
+        return {
+            'uso': str(preferences.get('uso', preferences.get('uso_previsto', '')) or '').lower(),
+            'experiencia': str(preferences.get('experiencia', '') or '').lower()
+        }
+
+    def active_rules(self, preferences):
+        """
+        Reglas que aplican a unas preferencias.
+
+        Returns:
+            list: Reglas activas
+        """
+        values = self._preference_values(preferences)
+        return [rule for rule in self.rules
+                if rule.preference is None or values.get(rule.preference) == rule.value]
+
+    def score(self, motos_df, preferences):
+        """
+        Puntuación de cada moto del catálogo.
+
+        Args:
+            motos_df (pd.DataFrame): Catálogo de motos
+            preferences (dict): Preferencias del usuario
+
+        Returns:
+            tuple: (np.ndarray de puntuaciones, lista de reglas activas)
+        """
+        features = self.prepare(motos_df)
+        rules = self.active_rules(preferences)
+        scores = np.zeros(len(motos_df), dtype=float)
+        for rule in rules:
+            scores += features[rule.feature] * rule.score
+        return scores, rules
+
+    def recommend(self, motos_df, preferences, top_n, id_column='id'):
+        """
+        Mejores motos según las reglas.
+
+        Args:
+            motos_df (pd.DataFrame): Catálogo de motos
+            preferences (dict): Preferencias del usuario
+            top_n (int): Número de recomendaciones
+            id_column (str): Columna con el ID de la moto
+
+        Returns:
+            list: Diccionarios con moto_id, score, reasons, method y moto_data
+        """
+        scores, rules = self.score(motos_df, preferences)
+        features = self.prepare(motos_df)
+        candidates = np.flatnonzero(scores > 0)
+        # Orden estable: a igual puntuación se mantiene el orden del catálogo
+        order = candidates[np.argsort(-scores[candidates], kind='stable')][:top_n]
+
+        recommendations = []
+        for position in order:
+            moto = motos_df.iloc[position]
+            reasons = [rule.reason for rule in rules if rule.reason and features[rule.feature][position]]
+            recommendations.append({
+                'moto_id': moto[id_column],
+                'score': float(scores[position]),
+                'reasons': reasons,
+                'method': 'knowledge',
+                'moto_data': moto.to_dict()
+            })
+        return recommendations
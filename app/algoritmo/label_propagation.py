@@ -6,6 +6,11 @@ import numpy as np
 import logging
 import traceback
 from collections import defaultdict
+from scipy.sparse import csr_matrix, diags
+
+from .id_registry import current_id_space, MISSING_ID
+from .metrics import LABEL_PROPAGATION_ITERATIONS, LABEL_PROPAGATION_RESIDUAL
+from .query_profiler import run_query
 
 class MotoLabelPropagation:
     def __init__(self, max_iterations=20, alpha=0.2):
@@ -43,9 +48,77 @@ class MotoLabelPropagation:
             user_id, friend_id = str(user_id), str(friend_id)
             self.social_graph[user_id].append(friend_id)
             self.social_graph[friend_id].append(user_id)  # Las amistades son bidireccionales
-            
+        
+        self._intern_loaded_ids()
         return self.social_graph
-    
+
+    def load_social_graph(self, friend_graph):
+        """
+        Construye el grafo social desde el índice de amistades en memoria,
+        sin volver a consultar la base de datos.
+
+        Args:
+            friend_graph (FriendGraphIndex): Índice de amistades cargado
+
+        Returns:
+            dict: Grafo social como diccionario de adyacencia
+        """
+        adjacency = friend_graph.to_csr(symmetric=True)
+        user_ids = friend_graph.users.decode(np.arange(adjacency.shape[0])).tolist()
+
+        self.social_graph = defaultdict(list)
+        for i in np.flatnonzero(np.diff(adjacency.indptr)):
+            row = adjacency.indices[adjacency.indptr[i]:adjacency.indptr[i + 1]]
+            self.social_graph[user_ids[i]] = [user_ids[j] for j in row.tolist()]
+        self._intern_loaded_ids()
+        return self.social_graph
+
+    def _intern_loaded_ids(self):
+        """
+        Interna en el espacio de ids compartido los usuarios del grafo social y
+        las motos de las preferencias cargadas.
+
+        Solo se llama al cargar datos (y ``sync_friendship`` al mutar el grafo):
+        ``propagate_labels`` se limita a codificar, de modo que calcular no hace
+        crecer el espacio del que dependen los ETags y el catálogo compartido.
+        """
+        id_space = current_id_space()
+        if self.social_graph:
+            id_space.users.intern_many(list(self.social_graph.keys()))
+        if self.user_preferences:
+            id_space.users.intern_many(list(self.user_preferences.keys()))
+            id_space.motos.intern_many([moto_id for prefs in self.user_preferences.values() for moto_id in prefs])
+
+    def sync_friendship(self, friend_graph, user_id, friend_id):
+        """
+        Actualiza la arista entre dos usuarios del grafo social a partir del
+        índice de amistades, tras un alta o baja incremental.
+
+        El grafo social es simétrico: la arista existe mientras quede alguna
+        de las dos direcciones en el índice.
+
+        Args:
+            friend_graph (FriendGraphIndex): Índice ya actualizado
+            user_id: ID de un usuario
+            friend_id: ID del otro usuario
+        """
+        if self.social_graph is None:
+            self.social_graph = defaultdict(list)
+        user_id, friend_id = str(user_id), str(friend_id)
+        current_id_space().users.intern_many([user_id, friend_id])
+        linked = (friend_id in friend_graph.friends(user_id) or
+                  user_id in friend_graph.friends(friend_id))
+        for source, target in ((user_id, friend_id), (friend_id, user_id)):
+            neighbours = self.social_graph.get(source, [])
+            if linked and target not in neighbours:
+                self.social_graph[source] = neighbours + [target]
+            elif not linked and target in neighbours:
+                remaining = [n for n in neighbours if n != target]
+                if remaining:
+                    self.social_graph[source] = remaining
+                else:
+                    self.social_graph.pop(source, None)
+
     def set_user_preferences(self, user_moto_preferences):
         """
         Establece las preferencias iniciales de los usuarios por diferentes motos.
@@ -62,7 +135,8 @@ class MotoLabelPropagation:
             # Asegurar que user_id sea string
             user_id = str(user_id)
             self.user_preferences[user_id][moto_id] = float(rating)
-            
+        
+        self._intern_loaded_ids()
         return self.user_preferences
             
     def propagate_labels(self):
@@ -79,44 +153,72 @@ class MotoLabelPropagation:
         if not hasattr(self, 'user_preferences') or not self.user_preferences:
             self.user_preferences = defaultdict(dict)
         
-        # Inicializa las puntuaciones propagadas con las preferencias originales
-        self.propagated_scores = defaultdict(dict)
+        # Codificar usuarios y motos en el espacio de ids compartido (solo
+        # lectura: los ids se internan al cargar el grafo y las preferencias);
+        # las filas y columnas de las matrices son los códigos del registro
+        id_space = current_id_space()
+        pref_users, pref_motos, ratings = [], [], []
         for user_id, moto_prefs in self.user_preferences.items():
             for moto_id, rating in moto_prefs.items():
-                self.propagated_scores[user_id][moto_id] = rating
+                pref_users.append(user_id)
+                pref_motos.append(moto_id)
+                ratings.append(rating)
+        sources, targets, weights = [], [], []
+        for user_id, friends in self.social_graph.items():
+            for friend_id in friends:
+                sources.append(user_id)
+                targets.append(friend_id)
+                weights.append(1.0 / len(friends))
+        graph_codes = id_space.users.encode(list(self.social_graph.keys()))
+        source_codes = id_space.users.encode(sources)
+        target_codes = id_space.users.encode(targets)
+        pref_user_codes = id_space.users.encode(pref_users)
+        pref_moto_codes = id_space.motos.encode(pref_motos)
+        n_users, n_motos = len(id_space.users), len(id_space.motos)
+        
+        # Preferencias originales y máscara de presencia, dispersas: el coste es
+        # proporcional a las valoraciones y amistades, no a usuarios x motos
+        rated = (pref_user_codes != MISSING_ID) & (pref_moto_codes != MISSING_ID)
+        rated_rows, rated_cols = pref_user_codes[rated], pref_moto_codes[rated]
+        base_scores = csr_matrix((np.asarray(ratings, dtype=np.float64)[rated], (rated_rows, rated_cols)),
+                                 shape=(n_users, n_motos))
+        base_mask = csr_matrix((np.ones(len(rated_rows)), (rated_rows, rated_cols)), shape=(n_users, n_motos))
+        
+        # Matriz de transición: cada amigo aporta 1/len(amigos)
+        in_graph = np.zeros(n_users)
+        in_graph[graph_codes[graph_codes != MISSING_ID]] = 1.0
+        linked = (source_codes != MISSING_ID) & (target_codes != MISSING_ID)
+        transition = csr_matrix((np.asarray(weights, dtype=np.float64)[linked],
+                                 (source_codes[linked], target_codes[linked])), shape=(n_users, n_users))
         
-        # Lista de todas las motos para asegurarnos de que consideramos todas
-        all_motos = set()
-        for user_prefs in self.user_preferences.values():
-            all_motos.update(user_prefs.keys())
+        # Conserva alpha de las preferencias originales solo para usuarios del grafo
+        keep = diags(in_graph)
+        retained = (keep @ base_scores) * self.alpha
+        retained_mask = keep @ base_mask
         
         # Propagación iterativa
+        scores, mask = base_scores, base_mask
+        residual = 0.0
         for _ in range(self.max_iterations):
-            new_scores = defaultdict(dict)
-            
-            # Para cada usuario
-            for user_id in self.social_graph:
-                friends = self.social_graph[user_id]
-                
-                # Conserva alpha de sus preferencias originales
-                if user_id in self.user_preferences:
-                    for moto_id, rating in self.user_preferences[user_id].items():
-                        new_scores[user_id][moto_id] = self.alpha * rating
-                
-                # Agrega (1-alpha) de las preferencias de sus amigos
-                if friends:
-                    for friend_id in friends:
-                        # Obtiene las preferencias propagadas del amigo
-                        friend_prefs = self.propagated_scores.get(friend_id, {})
-                        
-                        for moto_id in all_motos:
-                            if moto_id in friend_prefs:
-                                # Acumula la contribución del amigo
-                                new_scores[user_id][moto_id] = new_scores[user_id].get(moto_id, 0) + \
-                                                             (1 - self.alpha) * friend_prefs[moto_id] / len(friends)
-            
-            # Actualiza los scores
-            self.propagated_scores = new_scores
+            # Agrega (1-alpha) de las preferencias de sus amigos
+            new_scores = (retained + (transition @ scores) * (1 - self.alpha)).tocsr()
+            difference = abs(new_scores - scores)
+            residual = float(difference.max()) if difference.nnz else 0.0
+            scores = new_scores
+            # Los pesos son positivos: la presencia se propaga sin cancelaciones
+            mask = (retained_mask + transition @ mask).tocsr()
+        LABEL_PROPAGATION_ITERATIONS.set(self.max_iterations)
+        LABEL_PROPAGATION_RESIDUAL.set(residual)
+        
+        # Decodificar al formato de diccionarios
+        user_ids = id_space.users.ids
+        moto_ids = id_space.motos.ids
+        self.propagated_scores = defaultdict(dict)
+        for i in np.flatnonzero(np.diff(mask.indptr)):
+            row = slice(scores.indptr[i], scores.indptr[i + 1])
+            row_scores = dict(zip(scores.indices[row].tolist(), scores.data[row].tolist()))
+            columns = mask.indices[mask.indptr[i]:mask.indptr[i + 1]]
+            self.propagated_scores[user_ids[i]] = {moto_ids[j]: row_scores.get(j, 0.0) for j in columns.tolist()}
         
         return self.propagated_scores
     
@@ -249,6 +351,7 @@ class MotoLabelPropagation:
         
         # Inicializar características de motos para recomendaciones basadas en contenido
         self.add_moto_features(moto_features)
+        self._intern_loaded_ids()
         
         # 5. Run the label propagation algorithm
         try:
@@ -736,7 +839,7 @@ class MotoLabelPropagation:
                 if adapter and hasattr(adapter, 'driver'):
                     with adapter.driver.session() as session:
                         # Motos ideales del usuario
-                        user_ideal_result = session.run("""
+                        user_ideal_result = run_query(session, 'user_ideal_motos', """
                             MATCH (u:User {id: $user_id})-[:IDEAL]->(m:Moto)
                             RETURN m.id as moto_id
                         """, user_id=user_id)
@@ -745,7 +848,7 @@ class MotoLabelPropagation:
                             user_motos.add(record["moto_id"])
                         
                         # Motos con like del usuario
-                        user_likes_result = session.run("""
+                        user_likes_result = run_query(session, 'user_liked_motos', """
                             MATCH (u:User {id: $user_id})-[r:INTERACTED]->(m:Moto)
                             WHERE r.type = 'like'
                             RETURN m.id as moto_id
@@ -767,7 +870,7 @@ class MotoLabelPropagation:
                     if adapter and hasattr(adapter, 'driver'):
                         with adapter.driver.session() as session:
                             # 1. MOTOS IDEALES DEL AMIGO (peso máximo: 3.0)
-                            ideal_result = session.run("""
+                            ideal_result = run_query(session, 'friend_ideal_motos', """
                                 MATCH (u:User {id: $friend_id})-[:IDEAL]->(m:Moto)
                                 RETURN m.id as moto_id, m.marca as marca, m.modelo as modelo,
                                        m.tipo as tipo, m.precio as precio, m.imagen as imagen
@@ -785,7 +888,7 @@ class MotoLabelPropagation:
                                     self.logger.debug(f"Moto ideal de {friend_username}: {record['marca']} {record['modelo']}")
                             
                             # 2. LIKES DEL AMIGO (peso medio: 1.5)
-                            likes_result = session.run("""
+                            likes_result = run_query(session, 'friend_liked_motos', """
                                 MATCH (u:User {id: $friend_id})-[r:INTERACTED]->(m:Moto)
                                 WHERE r.type = 'like'
                                 RETURN m.id as moto_id, m.marca as marca, m.modelo as modelo,
@@ -841,7 +944,7 @@ class MotoLabelPropagation:
                 try:
                     if adapter and hasattr(adapter, 'driver'):
                         with adapter.driver.session() as session:
-                            moto_result = session.run("""
+                            moto_result = run_query(session, 'friend_recommended_moto', """
                                 MATCH (m:Moto {id: $moto_id})
                                 RETURN m.id as id, m.marca as marca, m.modelo as modelo,
                                        m.tipo as tipo, m.precio as precio, m.imagen as imagen,
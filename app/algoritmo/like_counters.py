@@ -0,0 +1,232 @@
+"""
+Contadores de likes materializados.
+
+Cada ``Moto`` guarda su número de likes en ``m.like_count`` y cada ``User`` la
+última moto a la que dio like (``u.last_like_moto_id`` y ``u.last_like_label``).
+El camino de escritura (``interaction_writer``) mantiene ambos en la misma
+sentencia que crea o borra el like, de modo que las vistas no necesitan
+agregar relaciones ``INTERACTED`` en cada petición.
+
+``LikeCounterCache`` replica esos valores en memoria: se carga con una sola
+consulta, se actualiza de forma síncrona con cada escritura y se recarga
+periódicamente para recoger los cambios hechos por otros procesos. Las
+recargas son solo de lectura: los contadores que falten en datos antiguos se
+materializan al arrancar (``backfill_missing_like_counters``) o en db_init.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def last_like_projection(*carry):
+    """
+    Fragmento Cypher que recalcula la proyección del último like de ``u``.
+
+    Args:
+        *carry: Variables que deben seguir disponibles después del fragmento
+
+    Returns:
+        str: Fragmento (deja ``latest`` en el ámbito)
+    """
+    carried = ''.join(f"{name}, " for name in carry)
+    return f"""
+OPTIONAL MATCH (u)-[lr:INTERACTED {{type: 'like'}}]->(lm:Moto)
+WITH {carried}u, lm, lr ORDER BY lr.timestamp DESC
+WITH {carried}u, head(collect(lm)) AS latest
+SET u.last_like_moto_id = latest.id,
+    u.last_like_label = CASE WHEN latest IS NULL THEN null
+                             ELSE latest.marca + ' ' + latest.modelo END
+"""
+
+
+# Materializa contadores y proyecciones para datos anteriores a este esquema
+BACKFILL_COUNTS_QUERY = """
+MATCH (m:Moto)
+OPTIONAL MATCH (:User)-[r:INTERACTED {type: 'like'}]->(m)
+WITH m, count(r) AS likes
+SET m.like_count = likes
+"""
+
+BACKFILL_LAST_LIKES_QUERY = """
+MATCH (u:User)
+""" + last_like_projection()
+
+MISSING_COUNTERS_QUERY = """
+MATCH (m:Moto) WHERE m.like_count IS NULL
+RETURN count(m) AS missing
+"""
+
+LOAD_COUNTS_QUERY = """
+MATCH (m:Moto)
+RETURN m.id AS moto_id, coalesce(m.like_count, 0) AS like_count
+"""
+
+LOAD_LAST_LIKES_QUERY = """
+MATCH (u:User) WHERE u.last_like_label IS NOT NULL
+RETURN u.id AS user_id, u.username AS username, u.last_like_label AS label
+"""
+
+
+def materialize_like_counters(driver):
+    """
+    Calcula ``like_count`` y la proyección del último like para todo el grafo.
+
+    Es idempotente; solo es necesario ejecutarlo una vez sobre datos antiguos.
+
+    Args:
+        driver: Driver de Neo4j
+    """
+    with driver.session() as session:
+        session.run(BACKFILL_COUNTS_QUERY).consume()
+        session.run(BACKFILL_LAST_LIKES_QUERY).consume()
+    logger.info("Contadores de likes materializados en Neo4j")
+
+
+def backfill_missing_like_counters(driver):
+    """
+    Materializa los contadores solo si a alguna moto le falta ``like_count``.
+
+    Se llama una vez al cargar los datos al arrancar, nunca desde una vista.
+
+    Args:
+        driver: Driver de Neo4j
+
+    Returns:
+        int: Motos que no tenían contador
+    """
+    with driver.session() as session:
+        missing = session.run(MISSING_COUNTERS_QUERY).single()['missing']
+    if missing:
+        logger.info(f"{missing} motos sin like_count; materializando contadores")
+        materialize_like_counters(driver)
+    return missing
+
+
+class LikeCounterCache:
+    """
+    Copia en memoria de los contadores de likes y del último like por usuario.
+
+    Las lecturas son O(1). Los valores confirmados por Neo4j (``apply``) se
+    copian tal cual; los cambios todavía no escritos (write-behind) se
+    aplican como incrementos (``adjust``).
+    """
+
+    def __init__(self, max_age=60.0):
+        """
+        Inicializa la caché.
+
+        Args:
+            max_age (float): Segundos tras los que se recarga desde Neo4j
+        """
+        self.max_age = max_age
+        self._counts = {}
+        self._last_likes = {}
+        self._usernames = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        """bool: True si la caché tiene datos vigentes."""
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.max_age
+
+    def load(self, driver):
+        """
+        Carga contadores y proyecciones con dos consultas de solo lectura.
+
+        Args:
+            driver: Driver de Neo4j
+
+        Returns:
+            bool: True si la carga fue correcta
+        """
+        try:
+            with driver.session() as session:
+                counts = {r['moto_id']: r['like_count'] for r in session.run(LOAD_COUNTS_QUERY)}
+                last_likes = {}
+                usernames = {}
+                for record in session.run(LOAD_LAST_LIKES_QUERY):
+                    last_likes[record['username']] = record['label']
+                    usernames[record['user_id']] = record['username']
+
+            with self._lock:
+                self._counts, self._last_likes, self._usernames = counts, last_likes, usernames
+                self._loaded_at = time.monotonic()
+            logger.info(f"Caché de likes cargada: {len(counts)} motos, {len(last_likes)} usuarios")
+            return True
+        except Exception as e:
+            logger.error(f"Error al cargar contadores de likes: {str(e)}")
+            return False
+
+    def ensure_loaded(self, driver):
+        """Carga la caché si no tiene datos o han caducado."""
+        if not self.loaded and driver is not None:
+            self.load(driver)
+        return self._loaded_at is not None
+
+    def get_like_count(self, moto_id):
+        """
+        Número de likes de una moto.
+
+        Returns:
+            int or None: Contador o None si la caché no lo conoce
+        """
+        return self._counts.get(moto_id)
+
+    def last_likes(self):
+        """
+        Último like de cada usuario.
+
+        Returns:
+            dict: {username: 'marca modelo'}
+        """
+        return dict(self._last_likes)
+
+    def apply(self, moto_id=None, like_count=None, user_id=None, username=None, last_like=None):
+        """
+        Copia los valores devueltos por una escritura confirmada en Neo4j.
+
+        Args:
+            moto_id: Moto cuyo contador ha cambiado
+            like_count (int): Contador actual de la moto
+            user_id: Usuario cuya proyección ha cambiado
+            username (str): Nombre del usuario
+            last_like (str or None): Etiqueta de su último like
+        """
+        with self._lock:
+            if moto_id is not None and like_count is not None:
+                self._counts[moto_id] = like_count
+            if username is None and user_id is not None:
+                username = self._usernames.get(user_id)
+            if username is not None:
+                if user_id is not None:
+                    self._usernames[user_id] = username
+                if last_like:
+                    self._last_likes[username] = last_like
+                else:
+                    self._last_likes.pop(username, None)
+
+    def adjust(self, moto_id, delta, username=None, label=None):
+        """
+        Aplica un cambio aún no escrito en Neo4j (modo write-behind).
+
+        Args:
+            moto_id: Moto afectada
+            delta (int): +1 al dar like, -1 al quitarlo
+            username (str, optional): Usuario que hizo el cambio
+            label (str, optional): Etiqueta 'marca modelo' de la moto
+        """
+        with self._lock:
+            if self._loaded_at is None:
+                # Sin una carga previa el incremento no tiene base; se verá al cargar
+                return
+            self._counts[moto_id] = max(0, self._counts.get(moto_id, 0) + delta)
+            if username is None:
+                return
+            if delta > 0 and label:
+                self._last_likes[username] = label
+            elif delta < 0 and label and self._last_likes.get(username) == label:
+                # El siguiente último like se conocerá al volcar el lote
+                self._last_likes.pop(username, None)
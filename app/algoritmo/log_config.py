@@ -0,0 +1,139 @@
+"""
+Configuración de logging por subsistema y líneas por elemento muestreadas.
+
+Varios módulos llamaban a ``logging.basicConfig(level=INFO)`` al importarse y
+los evaluadores, el sistema híbrido y ``/populares`` escribían varias líneas
+INFO con f-strings por cada moto: el mensaje se formateaba (y se escribía)
+aunque nadie lo fuese a leer, y bajo carga dominaba el tiempo de CPU.
+
+- ``configure_logging()`` se llama una vez al crear la aplicación y aplica
+  ``LOGGING_CONFIG`` (app/config.py): nivel global, formato y nivel por
+  subsistema (``'evaluator'``, ``'hybrid'``, ``'neo4j'``... o nombres de logger).
+- ``ItemLogger`` es para las líneas de diagnóstico por elemento: usan nivel
+  DEBUG, formato perezoso con ``%`` y solo se escribe 1 de cada
+  ``item_sample_every`` elementos. Con DEBUG desactivado, ``sample()`` cuesta
+  una comprobación de nivel y los argumentos nunca se formatean.
+"""
+import itertools
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Loggers de cada subsistema (los niveles se pueden dar por alias o por nombre)
+SUBSYSTEMS = {
+    'evaluator': ('app.algoritmo.quantitative_evaluator', 'app.algoritmo.qualitative_evaluator'),
+    'hybrid': ('app.algoritmo.hybrid_recommender', 'app.algoritmo.moto_ideal'),
+    'adapter': ('MotoRecommenderAdapter',),
+    'routes': ('routes_fixed', 'app.api_v1'),
+    'algorithms': ('app.algoritmo.pagerank', 'app.algoritmo.label_propagation', 'app.algoritmo.advanced_hybrid'),
+    'neo4j': ('app.algoritmo.neo4j_driver', 'app.algoritmo.neo4j_async', 'neo4j')
+}
+
+DEFAULT_LOGGING_CONFIG = {
+    'level': 'INFO',
+    'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    'levels': {},
+    'item_sample_every': 50
+}
+
+
+def _load_logging_config():
+    """Lee LOGGING_CONFIG de app/config.py (con valores por defecto si no existe)."""
+    config = dict(DEFAULT_LOGGING_CONFIG)
+    try:
+        from app.config import LOGGING_CONFIG
+        config.update(LOGGING_CONFIG)
+    except ImportError:
+        pass
+    return config
+
+
+def parse_levels(spec):
+    """
+    Interpreta niveles con el formato ``'evaluator=DEBUG,neo4j=WARNING'``.
+
+    Returns:
+        dict: {subsistema o logger: nivel}
+    """
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(config=None):
+    """
+    Aplica la configuración de logging (se puede llamar más de una vez).
+
+    El manejador raíz solo se crea si no hay ninguno, como ``basicConfig``;
+    los niveles se aplican siempre. ``MOTOMATCH_LOG_LEVELS`` añade o
+    sustituye niveles por subsistema.
+
+    Args:
+        config (dict, optional): Configuración (por defecto LOGGING_CONFIG)
+    """
+    config = {**DEFAULT_LOGGING_CONFIG, **(config or _load_logging_config())}
+    root = logging.getLogger()
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(config['format']))
+        root.addHandler(handler)
+    root.setLevel(config['level'])
+
+    levels = dict(config.get('levels') or {})
+    levels.update(parse_levels(os.environ.get('MOTOMATCH_LOG_LEVELS')))
+    for name, level in levels.items():
+        for logger_name in SUBSYSTEMS.get(name, (name,)):
+            logging.getLogger(logger_name).setLevel(level)
+    ItemLogger.default_every = max(1, int(config.get('item_sample_every') or 1))
+
+
+class ItemLogger:
+    """
+    Líneas de diagnóstico por elemento, muestreadas y perezosas.
+
+    Uso típico dentro de un bucle::
+
+        if item_log.sample():
+            logger.debug("[HYBRID] Moto %s - score %.2f", moto_id, score)
+
+    o directamente ``item_log.debug(...)`` para una sola línea.
+    """
+
+    # Se actualiza con configure_logging (LOGGING_CONFIG['item_sample_every'])
+    default_every = DEFAULT_LOGGING_CONFIG['item_sample_every']
+
+    def __init__(self, logger, every=None, level=logging.DEBUG):
+        """
+        Args:
+            logger (logging.Logger): Logger de destino
+            every (int, optional): Escribir 1 de cada ``every`` elementos
+                (por defecto ``ItemLogger.default_every``)
+            level (int): Nivel de las líneas
+        """
+        self.logger = logger
+        self.every = every
+        self.level = level
+        self._counter = itertools.count()
+
+    def sample(self):
+        """True si el elemento actual debe registrarse (False barato con el nivel desactivado)."""
+        if not self.logger.isEnabledFor(self.level):
+            return False
+        every = self.every or self.default_every
+        return every <= 1 or next(self._counter) % every == 0
+
+    def debug(self, msg, *args):
+        """Registra una línea (formato ``%``) si el elemento sale en la muestra."""
+        if self.sample():
+            self.logger.log(self.level, msg, *args, stacklevel=2)
+
+
+def item_logger(logger, every=None):
+    """Crea un ``ItemLogger`` para ``logger`` (objeto o nombre)."""
+    if isinstance(logger, str):
+        logger = logging.getLogger(logger)
+    return ItemLogger(logger, every)
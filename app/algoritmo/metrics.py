@@ -0,0 +1,294 @@
+"""
+Métricas de la aplicación en formato de texto de Prometheus.
+
+Hasta ahora la única información operativa eran los ficheros de log. Este
+módulo mantiene un registro en memoria (sin servicios externos) de contadores,
+medidores e histogramas con etiquetas, y ``MetricsRegistry.render()`` los
+escribe en el formato de exposición de Prometheus que sirve ``/metrics``.
+
+Las métricas se actualizan desde los caminos que ya existen: las rutas miden
+su latencia, el adaptador el tiempo de cada algoritmo y las consultas de carga,
+PageRank y label propagation publican sus iteraciones, y en cada lectura de
+``/metrics`` se vuelcan las estadísticas de la caché, los tamaños del catálogo
+y los histogramas por etapa del ``tracer`` (app/algoritmo/tracing.py).
+"""
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from .tracing import LATENCY_BUCKETS, LatencyHistogram, tracer
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    """Escapa un valor de etiqueta."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return 'NaN'
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class _Metric:
+    """Familia de métricas con nombre, ayuda y etiquetas."""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}, recibió {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def get(self, **labels):
+        """Valor actual de una serie (None si no existe)."""
+        return self._values.get(self._key(labels))
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield '', list(zip(self.labelnames, key)), value
+
+    def render(self):
+        """Líneas de la familia en formato de exposición."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Contador que solo crece."""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """Fija el total de un contador que mantiene otro objeto (p. ej. ``ResponseCache.hits``)."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    """Medidor que puede subir y bajar."""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Histograma de duraciones por combinación de etiquetas."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        histogram = self._values.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._values.setdefault(key, LatencyHistogram(self.buckets))
+        histogram.observe(value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Mide la duración del bloque."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def attach(self, histogram, **labels):
+        """Expone un ``LatencyHistogram`` que se actualiza en otro sitio (p. ej. el tracer)."""
+        with self._lock:
+            self._values[self._key(labels)] = histogram
+
+    def get(self, **labels):
+        histogram = self._values.get(self._key(labels))
+        return histogram.snapshot() if histogram is not None else None
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, histogram in items:
+            labels = list(zip(self.labelnames, key))
+            snapshot = histogram.snapshot()
+            for limit, count in snapshot['buckets'].items():
+                yield '_bucket', labels + [('le', _format_value(float(limit)))], count
+            yield '_bucket', labels + [('le', '+Inf')], snapshot['count']
+            yield '_sum', labels, snapshot['sum']
+            yield '_count', labels, snapshot['count']
+
+
+class MetricsRegistry:
+    """
+    Registro de familias de métricas.
+
+    Los ``collectors`` son funciones sin argumentos que se ejecutan antes de
+    cada ``render()`` para actualizar las métricas que se leen de otros
+    objetos en lugar de actualizarse en cada evento.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"La métrica {name} ya existe con otro tipo")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collector):
+        """Registra una función que actualiza métricas antes de cada lectura."""
+        self._collectors.append(collector)
+
+    def render(self):
+        """
+        Todas las métricas en formato de texto de Prometheus (versión 0.0.4).
+
+        Returns:
+            str: Cuerpo de la respuesta de ``/metrics``
+        """
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Error en un recolector de métricas: {str(e)}")
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Registro compartido por las rutas, el adaptador y los algoritmos
+metrics = MetricsRegistry()
+
+REQUEST_LATENCY = metrics.histogram(
+    'motomatch_http_request_duration_seconds', 'Latencia de las peticiones HTTP por ruta',
+    ['route', 'method', 'status'])
+ALGORITHM_LATENCY = metrics.histogram(
+    'motomatch_algorithm_duration_seconds', 'Tiempo de cálculo de cada algoritmo de recomendación',
+    ['algorithm'])
+STAGE_LATENCY = metrics.histogram(
+    'motomatch_stage_duration_seconds', 'Tiempo de cada etapa del flujo de recomendación (spans)',
+    ['stage'])
+PAGERANK_ITERATIONS = metrics.gauge(
+    'motomatch_pagerank_iterations', 'Iteraciones del último cálculo de PageRank')
+PAGERANK_RESIDUAL = metrics.gauge(
+    'motomatch_pagerank_residual', 'Residuo (diferencia L1 normalizada) de la última iteración de PageRank')
+PAGERANK_RUNS = metrics.counter(
+    'motomatch_pagerank_runs_total', 'Cálculos de PageRank', ['converged'])
+LABEL_PROPAGATION_ITERATIONS = metrics.gauge(
+    'motomatch_label_propagation_iterations', 'Iteraciones de la última propagación de etiquetas')
+LABEL_PROPAGATION_RESIDUAL = metrics.gauge(
+    'motomatch_label_propagation_residual', 'Cambio máximo de puntuación en la última iteración de propagación')
+CACHE_HITS = metrics.counter(
+    'motomatch_cache_hits_total', 'Aciertos de caché', ['cache'])
+CACHE_MISSES = metrics.counter(
+    'motomatch_cache_misses_total', 'Fallos de caché', ['cache'])
+CACHE_ENTRIES = metrics.gauge(
+    'motomatch_cache_entries', 'Entradas en caché', ['cache'])
+CACHE_HIT_RATIO = metrics.gauge(
+    'motomatch_cache_hit_ratio', 'Proporción de aciertos de caché', ['cache'])
+NEO4J_QUERIES = metrics.counter(
+    'motomatch_neo4j_queries_total', 'Consultas a Neo4j por nombre y resultado', ['query', 'status'])
+NEO4J_QUERY_LATENCY = metrics.histogram(
+    'motomatch_neo4j_query_duration_seconds', 'Duración de las consultas a Neo4j por nombre', ['query'])
+NEO4J_SERVER_TIME = metrics.histogram(
+    'motomatch_neo4j_server_duration_seconds', 'Tiempo en el servidor de las consultas a Neo4j (según el resumen)',
+    ['query'])
+NEO4J_SLOW_QUERIES = metrics.counter(
+    'motomatch_neo4j_slow_queries_total', 'Consultas a Neo4j por encima del umbral de consulta lenta', ['query'])
+CATALOG_SIZE = metrics.gauge(
+    'motomatch_catalog_size', 'Elementos cargados en memoria por tipo', ['entity'])
+
+
+@contextmanager
+def track_query(name):
+    """
+    Cuenta y mide una consulta a Neo4j.
+
+    Args:
+        name (str): Nombre de la consulta (p. ej. 'load_motos')
+    """
+    start = time.monotonic()
+    status = 'error'
+    try:
+        yield
+        status = 'ok'
+    finally:
+        NEO4J_QUERY_LATENCY.observe(time.monotonic() - start, query=name)
+        NEO4J_QUERIES.inc(query=name, status=status)
+
+
+def record_cache_stats(name, stats):
+    """
+    Vuelca las estadísticas de una caché (``ResponseCache.stats()``).
+
+    Args:
+        name (str): Nombre de la caché
+        stats (dict): hits, misses y entries
+    """
+    hits, misses = stats.get('hits', 0), stats.get('misses', 0)
+    CACHE_HITS.set_total(hits, cache=name)
+    CACHE_MISSES.set_total(misses, cache=name)
+    CACHE_ENTRIES.set(stats.get('entries', 0), cache=name)
+    CACHE_HIT_RATIO.set(hits / (hits + misses) if hits + misses else 0.0, cache=name)
+
+
+def _collect_stage_latencies():
+    """Expone los histogramas por etapa del tracer."""
+    for stage, histogram in tracer.histogram_objects().items():
+        STAGE_LATENCY.attach(histogram, stage=stage)
+
+
+metrics.add_collector(_collect_stage_latencies)
@@ -7,6 +7,9 @@ from ..models import User, Moto, UserPreference
 import logging
 from .hybrid_recommender import HybridMotoRecommender
 from .quantitative_evaluator import QuantitativeEvaluator
+from .source_fanout import SourceFanout
+from .deadline import Deadline
+from .tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -19,18 +22,25 @@ class MotoIdealRecommender:
         self.neo4j_connector = neo4j_connector
         self.hybrid_system = HybridMotoRecommender(neo4j_connector)
         self.quantitative_evaluator = QuantitativeEvaluator()
+        # Pool propio: la fuente híbrida lanza a su vez sus subfuentes en el suyo
+        self.fanout = SourceFanout(max_workers=2, name='moto-ideal-source')
         self.logger = logging.getLogger(__name__)
         self.logger.info("MotoIdealRecommender inicializado con sistema híbrido y evaluador cuantitativo")
     
-    def get_recommendations(self, user_id, top_n=5, preferences=None):
+    def get_recommendations(self, user_id, top_n=5, preferences=None, deadline=None):
         """
         Obtiene recomendaciones usando el sistema híbrido mejorado con evaluación cuantitativa
+        
+        Args:
+            deadline (Deadline, optional): Presupuesto de latencia que se propaga a las fuentes
         """
+        deadline = Deadline.ensure(deadline)
         self.logger.info(f"Calculando recomendaciones híbridas para {user_id} con preferencias: {preferences}")
         
         # Si no se proporcionan preferencias, obtenerlas de Neo4j
         if preferences is None and self.neo4j_connector:
-            preferences = self._get_user_preferences(user_id)
+            with tracer.span('moto_ideal.load_preferences'):
+                preferences = self._get_user_preferences(user_id)
             
         if not preferences:
             self.logger.warning(f"No se encontraron preferencias para {user_id}")
@@ -43,28 +53,35 @@ class MotoIdealRecommender:
             if has_quantitative:
                 self.logger.info("Detectadas preferencias cuantitativas, usando evaluador híbrido")
                 
-                # Combinar recomendaciones híbridas con evaluación cuantitativa
-                hybrid_recommendations = self.hybrid_system.get_hybrid_recommendations(
-                    user_id, preferences, top_n * 2  # Obtener más para diversificar
-                )
-                
-                quantitative_recommendations = self.get_quantitative_recommendations(
-                    user_id, preferences, top_n * 2
-                )
+                # Combinar recomendaciones híbridas con evaluación cuantitativa;
+                # ambas fuentes son independientes y se calculan a la vez
+                outcome = self.fanout.run({
+                    # Obtener más para diversificar
+                    'hybrid': tracer.traced('moto_ideal.hybrid', lambda: self.hybrid_system.get_hybrid_recommendations(
+                        user_id, preferences, top_n * 2, deadline=deadline)),
+                    'quantitative': tracer.traced('moto_ideal.quantitative', lambda: self.get_quantitative_recommendations(
+                        user_id, preferences, top_n * 2))
+                }, deadline=deadline)
+                if outcome.dropped:
+                    self.logger.warning(f"Recomendaciones para {user_id} sin las fuentes: {outcome.dropped}")
+                hybrid_recommendations = outcome.get('hybrid', [])
+                quantitative_recommendations = outcome.get('quantitative', [])
                 
                 # Combinar y rebalancear las recomendaciones
-                final_recommendations = self._combine_recommendations(
-                    hybrid_recommendations, quantitative_recommendations, top_n
-                )
+                with tracer.span('moto_ideal.combine'):
+                    final_recommendations = self._combine_recommendations(
+                        hybrid_recommendations, quantitative_recommendations, top_n
+                    )
                 
                 if final_recommendations:
                     self.logger.info(f"Generadas {len(final_recommendations)} recomendaciones híbrido-cuantitativas")
                     return final_recommendations
             
             # Si no hay datos cuantitativos o falló la combinación, usar solo híbridas
-            hybrid_recommendations = self.hybrid_system.get_hybrid_recommendations(
-                user_id, preferences, top_n
-            )
+            with tracer.span('moto_ideal.hybrid'):
+                hybrid_recommendations = self.hybrid_system.get_hybrid_recommendations(
+                    user_id, preferences, top_n, deadline=deadline
+                )
             
             if hybrid_recommendations:
                 self.logger.info(f"Generadas {len(hybrid_recommendations)} recomendaciones híbridas para {user_id}")
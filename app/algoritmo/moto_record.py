@@ -0,0 +1,384 @@
+"""
+Registro compacto e inmutable de una moto.
+
+Los caminos calientes (evaluadores, adaptador, rutas) recorrían el catálogo con
+``iterrows()``, creando una ``pd.Series`` por fila, y accedían a los campos con
+``moto.get(...)``. ``MotoRecord`` usa ``__slots__``, guarda los campos numéricos
+como ``float`` y la marca y el tipo como códigos enteros internados. Mantiene la
+interfaz de lectura de una Serie (``get``, ``[]``, ``in``, ``to_dict``), de modo
+que el código existente lo acepta sin cambios.
+"""
+import logging
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Campos numéricos tipados (float, NaN si faltan)
+NUMERIC_FIELDS = ('precio', 'potencia', 'cilindrada', 'peso', 'ano', 'torque')
+
+# Campos de texto libre (se guardan tal cual)
+TEXT_FIELDS = ('modelo', 'imagen', 'url', 'descripcion')
+
+# Campos categóricos internados como códigos enteros
+CATEGORICAL_FIELDS = ('marca', 'tipo')
+
+# Nombres alternativos usados por las distintas fuentes de datos
+FIELD_ALIASES = {
+    'moto_id': 'id',
+    'año': 'ano',
+    'anio': 'ano',
+    'URL': 'url',
+}
+
+_ALL_FIELDS = ('id',) + CATEGORICAL_FIELDS + NUMERIC_FIELDS + TEXT_FIELDS
+
+# Nombre de columna original con el que ``to_dict`` exporta cada campo canónico
+EXPORT_NAMES = {
+    'ano': 'año',
+    'url': 'URL',
+}
+
+
+class CategoryVocabulary:
+    """
+    Vocabulario de valores categóricos (marca, tipo) compartido por proceso.
+
+    Cada valor distinto se guarda una sola vez y las motos solo almacenan su
+    código entero.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._values = []
+        self._codes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def intern(self, value):
+        """
+        Devuelve el código de un valor, registrándolo si es nuevo.
+
+        Returns:
+            int: Código del valor o -1 si está vacío
+        """
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return -1
+        value = str(value)
+        code = self._codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(value)
+                if code is None:
+                    code = len(self._values)
+                    self._values.append(value)
+                    self._codes[value] = code
+        return code
+
+    def intern_many(self, values):
+        """
+        Versión vectorizada de ``intern``.
+
+        Returns:
+            np.ndarray: Códigos int32
+        """
+        local_codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+        mapping = np.array([self.intern(v) for v in uniques] + [-1], dtype=np.int32)
+        # El centinela -1 de factorize apunta al último elemento de mapping (-1)
+        return mapping[local_codes]
+
+    def decode(self, code):
+        """
+        Devuelve el valor asociado a un código.
+
+        Returns:
+            str or None: Valor original
+        """
+        return self._values[code] if 0 <= code < len(self._values) else None
+
+
+MARCAS = CategoryVocabulary('marca')
+TIPOS = CategoryVocabulary('tipo')
+
+
+def _is_missing(value):
+    """True si el valor está vacío (None o NaN)."""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+class MotoRecord:
+    """
+    Moto inmutable con campos tipados.
+
+    Los campos numéricos ausentes se guardan como NaN y ``get`` devuelve el
+    valor por defecto para ellos, igual que para cualquier campo vacío.
+    """
+
+    __slots__ = ('id', 'marca_code', 'tipo_code') + NUMERIC_FIELDS + TEXT_FIELDS
+
+    def __init__(self, id, marca_code=-1, tipo_code=-1, precio=math.nan, potencia=math.nan,
+                 cilindrada=math.nan, peso=math.nan, ano=math.nan, torque=math.nan,
+                 modelo=None, imagen=None, url=None, descripcion=None):
+        _set = object.__setattr__
+        _set(self, 'id', id)
+        _set(self, 'marca_code', int(marca_code))
+        _set(self, 'tipo_code', int(tipo_code))
+        _set(self, 'precio', float(precio))
+        _set(self, 'potencia', float(potencia))
+        _set(self, 'cilindrada', float(cilindrada))
+        _set(self, 'peso', float(peso))
+        _set(self, 'ano', float(ano))
+        _set(self, 'torque', float(torque))
+        _set(self, 'modelo', modelo)
+        _set(self, 'imagen', imagen)
+        _set(self, 'url', url)
+        _set(self, 'descripcion', descripcion)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MotoRecord es inmutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("MotoRecord es inmutable")
+
+    @property
+    def marca(self):
+        """str: Marca decodificada desde el vocabulario compartido."""
+        return MARCAS.decode(self.marca_code)
+
+    @property
+    def tipo(self):
+        """str: Tipo decodificado desde el vocabulario compartido."""
+        return TIPOS.decode(self.tipo_code)
+
+    @classmethod
+    def from_mapping(cls, data):
+        """
+        Crea un registro desde un diccionario o una ``pd.Series``.
+
+        Args:
+            data: Mapeo con los campos de la moto (acepta alias como 'moto_id' o 'año')
+
+        Returns:
+            MotoRecord: Registro creado
+        """
+        if isinstance(data, MotoRecord):
+            return data
+
+        values = {}
+        for key, value in dict(data).items():
+            values.setdefault(FIELD_ALIASES.get(key, key), value)
+
+        numeric = {}
+        for field in NUMERIC_FIELDS:
+            number = pd.to_numeric(values.get(field), errors='coerce')
+            numeric[field] = math.nan if number is None or pd.isna(number) else float(number)
+
+        return cls(
+            id=values.get('id'),
+            marca_code=MARCAS.intern(values.get('marca')),
+            tipo_code=TIPOS.intern(values.get('tipo')),
+            modelo=values.get('modelo'),
+            imagen=values.get('imagen'),
+            url=values.get('url'),
+            descripcion=values.get('descripcion'),
+            **numeric
+        )
+
+    def _value(self, key):
+        """Valor crudo de un campo (resolviendo alias); KeyError si no existe."""
+        key = FIELD_ALIASES.get(key, key)
+        if key not in _ALL_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        """
+        Lectura al estilo de ``pd.Series.get``.
+
+        Returns:
+            Valor del campo o ``default`` si no existe o está vacío
+        """
+        try:
+            value = self._value(key)
+        except KeyError:
+            return default
+        return default if _is_missing(value) else value
+
+    def __getitem__(self, key):
+        value = self._value(key)
+        return None if _is_missing(value) else value
+
+    def __contains__(self, key):
+        try:
+            return not _is_missing(self._value(key))
+        except KeyError:
+            return False
+
+    def keys(self):
+        """tuple: Nombres canónicos de los campos."""
+        return _ALL_FIELDS
+
+    def to_dict(self):
+        """
+        Convierte el registro en diccionario (equivalente a ``Series.to_dict``).
+
+        Los campos se exportan con los nombres de columna originales (``año``,
+        ``URL``) y el año como entero, igual que en la fila del DataFrame.
+
+        Returns:
+            dict: Campos de la moto, con 'moto_id' como alias de 'id'
+        """
+        result = {EXPORT_NAMES.get(field, field): self[field] for field in _ALL_FIELDS}
+        if result['año'] is not None:
+            result['año'] = int(result['año'])
+        result['moto_id'] = self.id
+        return result
+
+    def __eq__(self, other):
+        if not isinstance(other, MotoRecord):
+            return NotImplemented
+        return all(
+            (_is_missing(a) and _is_missing(b)) or a == b
+            for a, b in zip(self._astuple(), other._astuple())
+        )
+
+    def __hash__(self):
+        return hash((self.id, self.marca_code, self.tipo_code, self.modelo))
+
+    def _astuple(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        return f"MotoRecord(id={self.id!r}, marca={self.marca!r}, modelo={self.modelo!r}, tipo={self.tipo!r})"
+
+
+class MotoCatalog:
+    """
+    Colección de ``MotoRecord`` construida de forma vectorizada desde un DataFrame.
+
+    Conserva el índice del DataFrame de origen para poder recuperar los
+    registros de un subconjunto filtrado sin volver a construirlos.
+    """
+
+    def __init__(self, records, index=None):
+        self.records = list(records)
+        self.index = pd.Index(index if index is not None else range(len(self.records)))
+        self._by_id = {}
+        self._positions = {}
+        for position, record in enumerate(self.records):
+            if record.id is not None:
+                self._by_id.setdefault(str(record.id), record)
+                self._positions.setdefault(str(record.id), position)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """
+        Construye el catálogo convirtiendo columnas completas en lugar de filas.
+
+        Args:
+            df (pd.DataFrame): Catálogo de motos (columnas 'id' o 'moto_id', ...)
+
+        Returns:
+            MotoCatalog: Catálogo con un registro por fila
+        """
+        if df is None or df.empty:
+            return cls([], index=[] if df is None else df.index)
+
+        columns = {}
+        for column in df.columns:
+            columns.setdefault(FIELD_ALIASES.get(column, column), column)
+
+        n = len(df)
+
+        def column_values(field):
+            source = columns.get(field)
+            return df[source].to_numpy(dtype=object) if source is not None else np.full(n, None, dtype=object)
+
+        numeric = {}
+        for field in NUMERIC_FIELDS:
+            source = columns.get(field)
+            if source is None:
+                numeric[field] = np.full(n, math.nan)
+            else:
+                numeric[field] = pd.to_numeric(df[source], errors='coerce').to_numpy(dtype=np.float64)
+
+        marca_codes = MARCAS.intern_many(column_values('marca'))
+        tipo_codes = TIPOS.intern_many(column_values('tipo'))
+        ids = column_values('id')
+        texts = {field: column_values(field) for field in TEXT_FIELDS}
+
+        records = [
+            MotoRecord(
+                ids[i], marca_codes[i], tipo_codes[i],
+                numeric['precio'][i], numeric['potencia'][i], numeric['cilindrada'][i],
+                numeric['peso'][i], numeric['ano'][i], numeric['torque'][i],
+                texts['modelo'][i], texts['imagen'][i], texts['url'][i], texts['descripcion'][i]
+            )
+            for i in range(n)
+        ]
+        return cls(records, index=df.index)
+
+    def get(self, moto_id):
+        """
+        Busca una moto por id.
+
+        Returns:
+            MotoRecord or None: Registro encontrado
+        """
+        if moto_id is None:
+            return None
+        return self._by_id.get(str(moto_id))
+
+    def position(self, moto_id):
+        """
+        Posición de una moto en el DataFrame de origen.
+
+        Returns:
+            int or None: Posición (para ``df.iloc``) o None si no existe
+        """
+        if moto_id is None:
+            return None
+        return self._positions.get(str(moto_id))
+
+    def records_for(self, labels):
+        """
+        Devuelve los registros de las filas con las etiquetas de índice dadas.
+
+        Args:
+            labels: Índice de un subconjunto del DataFrame de origen
+
+        Returns:
+            list: Registros en el mismo orden que ``labels``
+        """
+        positions = self.index.get_indexer(labels)
+        return [self.records[p] for p in positions if p >= 0]
+
+
+def iter_moto_records(motos, catalog=None):
+    """
+    Itera un DataFrame de motos como ``MotoRecord``.
+
+    Si se pasa el catálogo del DataFrame completo, se reutilizan sus registros
+    en lugar de reconstruirlos.
+
+    Args:
+        motos (pd.DataFrame): DataFrame (o subconjunto) de motos
+        catalog (MotoCatalog, optional): Catálogo del DataFrame de origen
+
+    Returns:
+        list: Registros de las filas de ``motos``
+    """
+    if catalog is not None and catalog.index.is_unique:
+        return catalog.records_for(motos.index)
+    return MotoCatalog.from_dataframe(motos).records
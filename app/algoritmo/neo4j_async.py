@@ -0,0 +1,254 @@
+"""
+Capa de acceso asíncrona a Neo4j para las rutas limitadas por E/S.
+
+Rutas como ``/friends``, ``/moto-detail/<moto_id>`` o ``/motos-recomendadas``
+lanzaban varias consultas Cypher independientes una detrás de otra. Este
+módulo usa el driver asíncrono de Neo4j sobre un bucle de eventos propio (en un
+hilo en segundo plano) y expone métodos síncronos que ejecutan esas consultas
+a la vez, de modo que la latencia de la página es la de la consulta más lenta
+y no la suma de todas.
+
+Las vistas de Flask siguen siendo síncronas (Waitress/WSGI): solo bloquean una
+vez, mientras el bucle resuelve todas las consultas en paralelo.
+
+Con el driver 4.x de requirements.txt (sin ``AsyncGraphDatabase``) cada
+consulta se ejecuta con el driver síncrono compartido en un hilo del ejecutor
+del bucle: las consultas de una página siguen lanzándose a la vez.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+
+try:
+    from neo4j import AsyncGraphDatabase
+except ImportError:
+    # neo4j < 5: sin API asíncrona, se usa el driver síncrono en hilos
+    AsyncGraphDatabase = None
+
+from .neo4j_driver import get_driver, get_provider, resolve_credentials, create_pooled_driver
+from .metrics import track_query
+from .query_profiler import profiler, run_query
+
+logger = logging.getLogger(__name__)
+
+# Tiempo máximo (segundos) que una vista espera al conjunto de consultas
+DEFAULT_TIMEOUT = 15.0
+
+
+class AsyncNeo4jDAL:
+    """
+    Acceso asíncrono a Neo4j con un driver y un bucle de eventos por proceso.
+
+    Cada consulta se ejecuta en su propia sesión (y por tanto en su propia
+    conexión del pool), lo que permite lanzarlas concurrentemente.
+    """
+
+    def __init__(self, uri=None, user=None, password=None, timeout=DEFAULT_TIMEOUT):
+        self.uri, self.user, self.password = resolve_credentials(uri, user, password)
+        self.timeout = timeout
+        self._driver = None
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # Driver asíncrono si la versión instalada lo ofrece
+        self.use_async = AsyncGraphDatabase is not None
+
+    def _ensure_loop(self):
+        """Arranca el bucle de eventos en segundo plano (también tras un fork)."""
+        if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='neo4j-async-dal', daemon=True)
+                thread.start()
+                self._loop, self._thread, self._pid = loop, thread, os.getpid()
+                # El driver asíncrono pertenece al bucle que lo creó
+                self._driver = None
+        return self._loop
+
+    def _get_driver(self):
+        """Driver asíncrono con la misma configuración de pool que el síncrono."""
+        if self._driver is None:
+            self._driver = create_pooled_driver(AsyncGraphDatabase, self.uri, (self.user, self.password),
+                                                get_provider().driver_kwargs())
+            logger.info(f"Driver asíncrono de Neo4j creado para {self.uri}")
+        return self._driver
+
+    def _get_sync_driver(self):
+        """Driver síncrono compartido del proceso (modo sin API asíncrona)."""
+        return get_driver(self.uri, self.user, self.password)
+
+    def _fetch_sync(self, name, query, params):
+        """Ejecuta una consulta con el driver síncrono (en un hilo del ejecutor del bucle)."""
+        with self._get_sync_driver().session() as session:
+            return run_query(session, name, query, params).data()
+
+    async def _fetch(self, name, query, **params):
+        """Ejecuta una consulta de lectura (``name`` la identifica en /metrics y en el perfilador) y devuelve sus registros."""
+        if not self.use_async:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._fetch_sync, name, query, params)
+        start = time.monotonic()
+        summary, records, error = None, [], None
+        try:
+            with track_query(name):
+                async with self._get_driver().session() as session:
+                    result = await session.run(query, **params)
+                    records = [record.data() async for record in result]
+                    summary = await result.consume()
+            return records
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            profiler.record(name, query, params, time.monotonic() - start, summary, len(records), error)
+
+    def run(self, *coroutines, timeout=None):
+        """
+        Ejecuta varias corrutinas a la vez y espera a todas.
+
+        Los errores no se propagan: el resultado de una consulta fallida es la
+        propia excepción, para que cada vista aplique su respaldo habitual.
+
+        Args:
+            *coroutines: Corrutinas a ejecutar
+            timeout (float, optional): Espera máxima en segundos
+
+        Returns:
+            list: Resultados (o excepciones) en el mismo orden
+        """
+        async def gather():
+            return await asyncio.gather(*coroutines, return_exceptions=True)
+
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(gather(), loop)
+        try:
+            return future.result(timeout or self.timeout)
+        except Exception as e:
+            future.cancel()
+            logger.error(f"Error ejecutando consultas concurrentes en Neo4j: {str(e)}")
+            return [e] * len(coroutines)
+
+    # ---- Consultas individuales -------------------------------------------------
+
+    async def friends_of(self, user_id):
+        """Amigos de un usuario (relaciones FRIEND y FRIEND_OF)."""
+        return await self._fetch('friends_of', """
+            MATCH (u:User {id: $user_id})-[:FRIEND|FRIEND_OF]->(f:User)
+            RETURN f.id as friend_id, f.username as friend_username
+        """, user_id=user_id)
+
+    async def likes_map(self):
+        """Última moto con like de cada usuario, como 'marca modelo'."""
+        records = await self._fetch('likes_map', """
+            MATCH (u:User)-[r:INTERACTED]->(m:Moto)
+            WHERE r.type = 'like'
+            RETURN u.username as username, m.marca as marca, m.modelo as modelo
+        """)
+        likes = {}
+        for record in records:
+            if record['username'] and record['marca'] and record['modelo']:
+                likes[record['username']] = f"{record['marca']} {record['modelo']}"
+        return likes
+
+    async def moto_details(self, moto_id):
+        """Todas las propiedades de una moto (o None si no existe)."""
+        records = await self._fetch('moto_details', """
+            MATCH (m:Moto {id: $moto_id})
+            RETURN m {.*} as moto
+        """, moto_id=moto_id)
+        return records[0]['moto'] if records else None
+
+    async def like_count(self, moto_id):
+        """Número de likes de una moto."""
+        records = await self._fetch('like_count', """
+            MATCH (u:User)-[r:INTERACTED]->(m:Moto {id: $moto_id})
+            WHERE r.type = 'like'
+            RETURN count(r) as like_count
+        """, moto_id=moto_id)
+        return records[0]['like_count'] if records else 0
+
+    async def moto_urls(self, moto_ids):
+        """URLs de varias motos en una sola consulta."""
+        records = await self._fetch('moto_urls', """
+            UNWIND $moto_ids as moto_id
+            MATCH (m:Moto {id: moto_id})
+            RETURN m.id as moto_id, m.url as url
+        """, moto_ids=list(moto_ids))
+        return {record['moto_id']: record['url'] for record in records}
+
+    # ---- Datos agregados por página -------------------------------------------
+
+    def friends_page(self, user_id, include_likes=True, include_friends=True):
+        """
+        Datos de la página de amigos: amigos y likes, en paralelo.
+
+        Las sugerencias ya no se obtienen de una lista de todos los usuarios,
+        sino del servicio de sugerencias paginado.
+
+        Args:
+            user_id: ID del usuario
+            include_likes (bool): Si es False no se consulta el mapa de likes
+                (se obtiene de los contadores materializados)
+            include_friends (bool): Si es False no se consultan los amigos
+                (se obtienen del índice de amistades en memoria)
+
+        Returns:
+            tuple: (amigos, likes); cada elemento es el resultado, la
+            excepción o None si no se ha consultado
+        """
+        coroutines = []
+        if include_friends:
+            coroutines.append(self.friends_of(user_id))
+        if include_likes:
+            coroutines.append(self.likes_map())
+        results = iter(self.run(*coroutines)) if coroutines else iter(())
+        friends = next(results) if include_friends else None
+        likes = next(results) if include_likes else None
+        return friends, likes
+
+    def moto_detail_page(self, moto_id):
+        """
+        Datos de la página de detalle: propiedades de la moto y número de likes, en paralelo.
+
+        Returns:
+            tuple: (detalles, likes); cada elemento es el resultado o la excepción
+        """
+        return tuple(self.run(self.moto_details(moto_id), self.like_count(moto_id)))
+
+    def close(self):
+        """Cierra el driver asíncrono y detiene el bucle de eventos."""
+        loop = self._loop
+        if loop is None or self._pid != os.getpid():
+            return
+        if self._driver is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._driver.close(), loop).result(5)
+            except Exception as e:
+                logger.debug(f"Error al cerrar el driver asíncrono: {str(e)}")
+            self._driver = None
+        loop.call_soon_threadsafe(loop.stop)
+        self._loop = None
+
+
+_dal = None
+_dal_lock = threading.Lock()
+
+
+def get_async_dal():
+    """
+    Devuelve la capa de acceso asíncrona del proceso.
+
+    Returns:
+        AsyncNeo4jDAL: Instancia compartida
+    """
+    global _dal
+    if _dal is None:
+        with _dal_lock:
+            if _dal is None:
+                _dal = AsyncNeo4jDAL()
+    return _dal
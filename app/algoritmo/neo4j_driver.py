@@ -0,0 +1,299 @@
+"""
+Proveedor único del driver de Neo4j por proceso.
+
+Antes cada módulo (create_app, el adaptador, DatabaseConnector,
+Neo4jInitializer, friend_routes) creaba su propio ``GraphDatabase.driver`` y,
+con él, su propio pool de conexiones. Este módulo mantiene un único driver por
+proceso y credenciales, configurado desde ``NEO4J_POOL_CONFIG``:
+
+- ``max_connection_pool_size``: conexiones máximas del pool
+- ``connection_acquisition_timeout``: espera máxima para obtener una conexión
+- ``max_connection_lifetime``: vida máxima de una conexión antes de reciclarla
+- ``liveness_check_timeout``: las conexiones ociosas más de este tiempo se
+  verifican con un RESET del protocolo al sacarlas del pool (sin consulta)
+
+La comprobación de conectividad (``verify_connectivity``) solo se hace al crear
+el driver y, después, como mucho una vez cada ``health_check_interval``
+segundos, en lugar de lanzar una consulta de prueba en cada petición.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from neo4j import GraphDatabase
+from neo4j.exceptions import ConfigurationError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URI = 'bolt://localhost:7687'
+DEFAULT_USER = 'neo4j'
+DEFAULT_PASSWORD = '22446688'
+
+
+def _pool_config_from_app():
+    """Lee NEO4J_POOL_CONFIG de app/config.py (con valores por defecto si no existe)."""
+    try:
+        from app.config import NEO4J_POOL_CONFIG
+        return dict(NEO4J_POOL_CONFIG)
+    except ImportError:
+        return {}
+
+
+def _credentials_from_app():
+    """Lee NEO4J_CONFIG de app/config.py (con valores por defecto si no existe)."""
+    try:
+        from app.config import NEO4J_CONFIG
+        return NEO4J_CONFIG.get('uri'), NEO4J_CONFIG.get('user'), NEO4J_CONFIG.get('password')
+    except ImportError:
+        return None, None, None
+
+
+def resolve_credentials(uri=None, user=None, password=None):
+    """
+    Completa las credenciales con NEO4J_CONFIG y los valores por defecto.
+
+    Returns:
+        tuple: (uri, user, password)
+    """
+    default_uri, default_user, default_password = _credentials_from_app()
+    return (uri or default_uri or DEFAULT_URI,
+            user or default_user or DEFAULT_USER,
+            password or default_password or DEFAULT_PASSWORD)
+
+
+def create_pooled_driver(factory, uri, auth, pool_kwargs):
+    """
+    Crea un driver con la configuración del pool.
+
+    Las versiones del driver anteriores a la 5 no aceptan
+    ``liveness_check_timeout``; en ese caso se crea el driver sin ese parámetro.
+
+    Args:
+        factory: ``GraphDatabase`` o ``AsyncGraphDatabase``
+        uri (str): URI de Neo4j
+        auth (tuple): (usuario, contraseña)
+        pool_kwargs (dict): Parámetros del pool
+
+    Returns:
+        Driver creado
+    """
+    try:
+        return factory.driver(uri, auth=auth, **pool_kwargs)
+    except (ConfigurationError, TypeError) as e:
+        if 'liveness_check_timeout' not in pool_kwargs:
+            raise
+        logger.warning(f"El driver de Neo4j no admite liveness_check_timeout: {str(e)}")
+        pool_kwargs = {k: v for k, v in pool_kwargs.items() if k != 'liveness_check_timeout'}
+        return factory.driver(uri, auth=auth, **pool_kwargs)
+
+
+def _driver_key(uri, user, password):
+    """
+    Clave de caché de un driver: (uri, usuario, hash de la contraseña).
+
+    La contraseña forma parte de la clave para que un cambio de credenciales no
+    reutilice un driver autenticado con la anterior; se guarda solo su hash.
+    """
+    digest = hashlib.sha256(str(password).encode('utf-8')).hexdigest()
+    return uri, user, digest
+
+
+class Neo4jDriverProvider:
+    """
+    Mantiene un driver compartido por credenciales (uri, usuario, contraseña)
+    dentro del proceso.
+
+    Los drivers no sobreviven a un ``fork``: si el proceso actual no es el que
+    creó el driver (p. ej. un worker), se crea uno nuevo sin cerrar el del padre.
+    """
+
+    def __init__(self, pool_config=None):
+        self.pool_config = {
+            'max_connection_pool_size': 50,
+            'connection_acquisition_timeout': 30.0,
+            'max_connection_lifetime': 3600.0,
+            'liveness_check_timeout': 30.0,
+            'connection_timeout': 15.0,
+            'health_check_interval': 30.0,
+        }
+        self.pool_config.update(pool_config or {})
+        self._drivers = {}
+        self._healthy_at = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def driver_kwargs(self):
+        """Parámetros del pool que se pasan a GraphDatabase.driver."""
+        return {key: value for key, value in self.pool_config.items()
+                if key != 'health_check_interval' and value is not None}
+
+    def _check_fork(self):
+        """Olvida los drivers heredados del proceso padre tras un fork."""
+        if self._pid != os.getpid():
+            self._drivers = {}
+            self._healthy_at = {}
+            self._pid = os.getpid()
+
+    def get_driver(self, uri=None, user=None, password=None, verify=True):
+        """
+        Devuelve el driver compartido para las credenciales dadas, creándolo si no existe.
+
+        Args:
+            uri (str, optional): URI de Neo4j (por defecto la de NEO4J_CONFIG)
+            user (str, optional): Usuario
+            password (str, optional): Contraseña
+            verify (bool): Si es True, verifica la conectividad al crear el driver
+
+        Returns:
+            neo4j.Driver: Driver compartido
+
+        Raises:
+            neo4j.exceptions.Neo4jError / DriverError: Si no se puede conectar
+        """
+        uri, user, password = resolve_credentials(uri, user, password)
+        key = _driver_key(uri, user, password)
+
+        with self._lock:
+            self._check_fork()
+            # El proveedor retira de _drivers todo driver que cierra (invalidate/close_all)
+            driver = self._drivers.get(key)
+            if driver is not None:
+                return driver
+
+            driver = create_pooled_driver(GraphDatabase, uri, (user, password), self.driver_kwargs())
+            try:
+                if verify:
+                    driver.verify_connectivity()
+                    self._healthy_at[key] = time.monotonic()
+            except Exception:
+                driver.close()
+                raise
+            self._drivers[key] = driver
+            logger.info(f"Driver de Neo4j creado para {uri} (pool máx. "
+                        f"{self.pool_config['max_connection_pool_size']} conexiones)")
+            return driver
+
+    def is_alive(self, driver):
+        """
+        Comprobación barata de que un driver sigue utilizable.
+
+        No lanza consultas: solo verifica la conectividad si ha pasado más de
+        ``health_check_interval`` segundos desde la última verificación correcta.
+        La salud de cada conexión individual la gestiona el propio pool
+        mediante ``liveness_check_timeout``.
+
+        Args:
+            driver (neo4j.Driver): Driver a comprobar
+
+        Returns:
+            bool: True si el driver es el vigente del proveedor y responde
+        """
+        if driver is None:
+            return False
+
+        # Solo los drivers vigentes del proveedor: uno retirado (invalidate,
+        # close_all o fork) ya está cerrado o pertenece a otro proceso
+        with self._lock:
+            self._check_fork()
+            key = next((k for k, d in self._drivers.items() if d is driver), None)
+        if key is None:
+            return False
+        now = time.monotonic()
+        last_ok = self._healthy_at.get(key, 0.0)
+        if now - last_ok < self.pool_config['health_check_interval']:
+            return True
+
+        try:
+            driver.verify_connectivity()
+            self._healthy_at[key] = now
+            return True
+        except Exception as e:
+            logger.warning(f"El driver de Neo4j no responde: {str(e)}")
+            self._healthy_at.pop(key, None)
+            return False
+
+    def invalidate(self, driver):
+        """
+        Cierra y descarta un driver que ha dejado de funcionar.
+
+        Args:
+            driver (neo4j.Driver): Driver a descartar
+        """
+        with self._lock:
+            for key, current in list(self._drivers.items()):
+                if current is driver:
+                    del self._drivers[key]
+                    self._healthy_at.pop(key, None)
+        try:
+            driver.close()
+        except Exception as e:
+            logger.debug(f"Error al cerrar driver descartado: {str(e)}")
+
+    def close_all(self):
+        """Cierra todos los drivers del proceso actual."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            drivers = list(self._drivers.values())
+            self._drivers = {}
+            self._healthy_at = {}
+        for driver in drivers:
+            try:
+                driver.close()
+            except Exception as e:
+                logger.debug(f"Error al cerrar driver: {str(e)}")
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """
+    Devuelve el proveedor de drivers del proceso.
+
+    Returns:
+        Neo4jDriverProvider: Proveedor compartido
+    """
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = Neo4jDriverProvider(_pool_config_from_app())
+                atexit.register(_provider.close_all)
+    return _provider
+
+
+def get_driver(uri=None, user=None, password=None, verify=True):
+    """
+    Atajo para ``get_provider().get_driver(...)``.
+
+    Returns:
+        neo4j.Driver: Driver compartido del proceso
+    """
+    return get_provider().get_driver(uri, user, password, verify=verify)
+
+
+def ensure_driver(driver, uri=None, user=None, password=None):
+    """
+    Devuelve un driver utilizable, reconectando solo si el actual ha fallado.
+
+    Args:
+        driver (neo4j.Driver or None): Driver actual del llamador
+
+    Returns:
+        neo4j.Driver or None: Driver utilizable o None si no hay conexión
+    """
+    provider = get_provider()
+    if provider.is_alive(driver):
+        return driver
+    if driver is not None:
+        provider.invalidate(driver)
+    try:
+        return provider.get_driver(uri, user, password)
+    except Exception as e:
+        logger.error(f"No se pudo conectar a Neo4j: {str(e)}")
+        return None
@@ -5,9 +5,11 @@ import numpy as np
 import pandas as pd
 from collections import defaultdict
 import logging
+import threading
+
+from .id_registry import current_id_space
+from .metrics import PAGERANK_ITERATIONS, PAGERANK_RESIDUAL, PAGERANK_RUNS
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class MotoPageRank:
@@ -33,6 +35,17 @@ class MotoPageRank:
         self.reverse_graph = defaultdict(list)
         self.logger = logger
         
+        # Aristas codificadas en el espacio de ids compartido (usuario -> moto)
+        self.id_space = None
+        self._edges = None
+        
+        # Versión del ranking: cambia con cada modificación del grafo
+        self.version = 0
+        
+        # Protege el grafo, los scores y las aristas codificadas: los likes
+        # llegan desde los hilos de las peticiones mientras otras calculan
+        self._lock = threading.RLock()
+        
     def _safe_numeric_conversion(self, value, default=0.0):
         """
         Convierte un valor a float de manera segura.
@@ -90,6 +103,11 @@ class MotoPageRank:
             interaction_data (list): Lista de diccionarios con interacciones
                 Cada diccionario debe tener: user_id, moto_id, weight
         """
+        with self._lock:
+            self._build_graph(interaction_data)
+    
+    def _build_graph(self, interaction_data):
+        """Cuerpo de ``build_graph`` (se ejecuta con el lock tomado)."""
         self.logger.info("Construyendo grafo desde datos de interacción...")
         
         # Limpiar datos previos
@@ -97,6 +115,8 @@ class MotoPageRank:
         self.reverse_graph.clear()
         self.moto_scores.clear()
         self.user_scores.clear()
+        self._edges = None
+        self.version += 1
         
         # Validar datos de entrada
         if not interaction_data:
@@ -177,6 +197,41 @@ class MotoPageRank:
         # Si aún no hay motos, el PageRank no funcionará
         if not self.moto_scores:
             self.logger.error("No se pudieron crear scores de motos válidos")
+            return
+        
+        self.id_space = current_id_space()
+        self._build_edge_arrays(intern=True)
+    
+    def _build_edge_arrays(self, intern=False):
+        """
+        Codifica el grafo en arrays int32 sobre el espacio de ids compartido.
+        
+        Solo la carga del grafo (``intern=True``) añade ids al espacio; al
+        recodificar tras una mutación los ids ya están internados por
+        ``add_user_interaction`` y los desconocidos quedan como MISSING_ID.
+        
+        Returns:
+            tuple: (edge_users, edge_motos, edge_weights)
+        """
+        if self.id_space is None:
+            # Primera codificación sin build_graph: equivale a la carga
+            self.id_space = current_id_space()
+            intern = True
+        users, motos = self.id_space.users, self.id_space.motos
+        
+        edge_users, edge_motos, edge_weights = [], [], []
+        for user_id, outlinks in self.graph.items():
+            for moto_id, weight in outlinks:
+                edge_users.append(user_id)
+                edge_motos.append(moto_id)
+                edge_weights.append(weight)
+        
+        self._edges = (
+            users.intern_many(edge_users) if intern else users.encode(edge_users),
+            motos.intern_many(edge_motos) if intern else motos.encode(edge_motos),
+            np.asarray(edge_weights, dtype=np.float64)
+        )
+        return self._edges
     
     def calculate_pagerank(self):
         """
@@ -185,39 +240,57 @@ class MotoPageRank:
         Returns:
             dict: Diccionario con scores de PageRank {moto_id: score}
         """
-        if not self.moto_scores:
-            self.logger.warning("No hay motos para calcular PageRank")
-            return {}
+        # Instantánea consistente del grafo; el cálculo se hace fuera del lock
+        with self._lock:
+            if not self.moto_scores:
+                self.logger.warning("No hay motos para calcular PageRank")
+                return {}
+            if self._edges is None or self.id_space is None:
+                self._build_edge_arrays()
+            edge_users, edge_motos, edge_weights = self._edges
+            id_space = self.id_space
+            moto_ids = list(self.moto_scores.keys())
+            user_ids = list(self.user_scores.keys())
         
-        # Inicializar scores
-        all_nodes = set(self.moto_scores.keys()) | set(self.user_scores.keys())
-        N = len(all_nodes)
+        # Nodos: usuarios en las posiciones [0, n_users) y motos a continuación
+        # Solo lectura del espacio compartido: los ids desconocidos quedan como MISSING_ID
+        user_codes = np.unique(np.concatenate([id_space.users.encode(user_ids), edge_users]))
+        user_codes = user_codes[user_codes >= 0]
+        moto_codes = id_space.motos.encode(moto_ids)
+        n_users = len(user_codes)
+        N = n_users + len(moto_ids)
         
         # Verificación adicional: si hay muy pocos nodos, retornar scores uniformes
         if N <= 2:
             self.logger.warning("Muy pocos nodos para PageRank, usando scores uniformes")
-            return {moto_id: 1.0 for moto_id in self.moto_scores.keys()}
+            return {moto_id: 1.0 for moto_id in moto_ids}
+        
+        # Traducir códigos del espacio compartido a posiciones en el vector de scores
+        user_pos = np.full(len(id_space.users), -1, dtype=np.int64)
+        user_pos[user_codes] = np.arange(n_users)
+        moto_pos = np.full(len(id_space.motos), -1, dtype=np.int64)
+        known = moto_codes >= 0
+        moto_pos[moto_codes[known]] = np.arange(n_users, N)[known]
+        
+        src = user_pos[edge_users]
+        dst = moto_pos[edge_motos]
+        valid = (src >= 0) & (dst >= 0)
+        src, dst, weights = src[valid], dst[valid], edge_weights[valid]
+        out_degree = np.bincount(src, minlength=N)
         
         # Inicializar scores con valor uniforme 1/N
-        scores = {node: 1.0 / N for node in all_nodes}
+        scores = np.full(N, 1.0 / N)
+        teleport = (1.0 - self.damping_factor) / N
         
         # Iterar hasta convergencia
+        iteration, norm_diff = -1, float('inf')
         for iteration in range(self.max_iterations):
-            new_scores = {node: (1.0 - self.damping_factor) / N for node in all_nodes}
+            # Cada usuario reparte su score entre sus enlaces salientes
+            share = self.damping_factor * scores[src] / out_degree[src]
+            new_scores = teleport + np.bincount(dst, weights=share * weights, minlength=N)
             
-            # Actualizar scores según enlaces entrantes
-            for source_node in all_nodes:
-                # Solo procesar nodos con enlaces salientes
-                if source_node in self.graph:
-                    outlinks = self.graph[source_node]
-                    if outlinks:  # Evitar división por cero
-                        share = self.damping_factor * scores[source_node] / len(outlinks)
-                        for target_node, weight in outlinks:
-                            new_scores[target_node] += share * weight
-        
             # Verificar convergencia con normalización por número de nodos
-            diff = sum(abs(new_scores.get(node, 0) - scores.get(node, 0)) for node in all_nodes)
-            norm_diff = diff / max(1, len(all_nodes))
+            norm_diff = np.abs(new_scores - scores).sum() / N
             
             # Actualizar scores para la próxima iteración
             scores = new_scores
@@ -228,17 +301,22 @@ class MotoPageRank:
         else:
             self.logger.warning(f"PageRank no convergió después de {self.max_iterations} iteraciones")
         
+        converged = norm_diff < self.tolerance
+        PAGERANK_ITERATIONS.set(iteration + 1)
+        PAGERANK_RESIDUAL.set(float(norm_diff))
+        PAGERANK_RUNS.inc(converged=str(converged).lower())
+        
         # Extraer solo scores de motos
-        moto_pagerank = {moto_id: scores.get(moto_id, 0.0) for moto_id in self.moto_scores.keys()}
+        moto_values = scores[n_users:]
         
         # Normalizar scores
-        max_score = max(moto_pagerank.values()) if moto_pagerank else 1.0
+        max_score = moto_values.max() if len(moto_values) else 1.0
         if max_score > 0:
-            normalized_scores = {moto_id: score / max_score for moto_id, score in moto_pagerank.items()}
-            return normalized_scores
+            moto_values = moto_values / max_score
+        else:
+            self.logger.info(f"PageRank calculado para {len(moto_ids)} motos")
         
-        self.logger.info(f"PageRank calculado para {len(moto_pagerank)} motos")
-        return moto_pagerank
+        return dict(zip(moto_ids, moto_values.tolist()))
     
     def get_top_motos(self, n=10):
         """
@@ -277,6 +355,75 @@ class MotoPageRank:
         pagerank_scores = self.calculate_pagerank()
         return pagerank_scores.get(moto_id, 0.0)
     
+    # Pesos usados por update_from_neo4j para cada tipo de interacción
+    INTERACTION_WEIGHTS = {'like': 3.0, 'ideal': 5.0}
+
+    def add_user_interaction(self, user_id, moto_id, interaction_type='like', weight=None):
+        """
+        Añade una interacción al grafo sin recargarlo desde Neo4j.
+
+        Args:
+            user_id: ID del usuario
+            moto_id: ID de la moto
+            interaction_type (str): Tipo de interacción ('like', 'ideal'...)
+            weight (float, optional): Peso explícito (por defecto según el tipo)
+        """
+        user_id, moto_id = str(user_id).strip(), str(moto_id).strip()
+        if weight is None:
+            weight = self.INTERACTION_WEIGHTS.get(interaction_type, 1.0)
+        weight = self._safe_numeric_conversion(weight, 1.0)
+
+        with self._lock:
+            # Mutación explícita: el par se interna para la próxima recodificación
+            if self.id_space is not None:
+                self.id_space.users.intern(user_id)
+                self.id_space.motos.intern(moto_id)
+            self.graph[user_id].append((moto_id, weight))
+            self.reverse_graph[moto_id].append((user_id, weight))
+            self.moto_scores[moto_id] = float(self.moto_scores.get(moto_id, 0.0)) + weight
+            self.user_scores.setdefault(user_id, 0.0)
+            # Las aristas codificadas se reconstruyen en el próximo cálculo
+            self._edges = None
+            self.version += 1
+
+    def remove_user_interaction(self, user_id, moto_id, interaction_type='like'):
+        """
+        Elimina una interacción del grafo sin recargarlo desde Neo4j.
+
+        Args:
+            user_id: ID del usuario
+            moto_id: ID de la moto
+            interaction_type (str): Tipo de interacción ('like', 'ideal'...)
+
+        Returns:
+            bool: True si la interacción existía
+        """
+        user_id, moto_id = str(user_id).strip(), str(moto_id).strip()
+        weight = self.INTERACTION_WEIGHTS.get(interaction_type, 1.0)
+
+        with self._lock:
+            outlinks = self.graph.get(user_id, [])
+
+            # Preferir la arista con el peso del tipo; si no, la última hacia la moto
+            candidates = [i for i, (m, _) in enumerate(outlinks) if m == moto_id]
+            if not candidates:
+                return False
+            matching = [i for i in candidates if outlinks[i][1] == weight]
+            index = (matching or candidates)[-1]
+            _, removed_weight = outlinks.pop(index)
+
+            inlinks = self.reverse_graph.get(moto_id, [])
+            for i in range(len(inlinks) - 1, -1, -1):
+                if inlinks[i] == (user_id, removed_weight):
+                    inlinks.pop(i)
+                    break
+
+            if moto_id in self.moto_scores:
+                self.moto_scores[moto_id] = max(0.0, float(self.moto_scores[moto_id]) - removed_weight)
+            self._edges = None
+            self.version += 1
+        return True
+
     def update_from_neo4j(self, driver):
         """
         Actualiza el ranking desde Neo4j.
@@ -0,0 +1,209 @@
+"""
+Popularidad precalculada de las motos para el sistema híbrido.
+
+``HybridMotoRecommender._popularity_based_recommendations`` agrupaba todo
+``interactions_df`` y recorría el resultado con ``iterrows()`` en cada
+petición, aunque la popularidad apenas cambia entre peticiones.
+``PopularityBaseline`` agrega los pesos por moto una sola vez al cargar los
+datos, los actualiza con cada like que registra ``InteractionWriter`` y
+mantiene la clasificación ya ordenada (global y por tipo o franja de precio),
+de modo que leer las k motos más populares cuesta O(k).
+"""
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Peso de cada tipo de interacción (igual que r.weight en interaction_writer)
+INTERACTION_WEIGHTS = {'like': 3.0}
+
+# Cada interacción suma su peso más este bonus por número de interacciones
+COUNT_BONUS = 0.5
+
+# Límites superiores de las franjas de precio (la última no tiene límite)
+PRICE_BANDS = (
+    (5000, 'economica'),
+    (10000, 'media'),
+    (20000, 'alta'),
+    (None, 'premium')
+)
+
+
+def price_band(precio):
+    """
+    Franja de precio de una moto.
+
+    Args:
+        precio (float): Precio de la moto
+
+    Returns:
+        str or None: Nombre de la franja (None si el precio es desconocido)
+    """
+    try:
+        precio = float(precio)
+    except (TypeError, ValueError):
+        return None
+    if precio != precio:
+        return None
+    for limit, name in PRICE_BANDS:
+        if limit is None or precio < limit:
+            return name
+    return None
+
+
+class PopularityBaseline:
+    """
+    Pesos de interacción agregados por moto y clasificaciones ordenadas.
+
+    Las clasificaciones se ordenan de forma perezosa: tras un cambio, la
+    primera lectura de cada segmento vuelve a ordenar y las siguientes
+    reutilizan el resultado.
+    """
+
+    def __init__(self):
+        self._weights = {}
+        self._counts = {}
+        self._segments = {}
+        self._rankings = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        # Cambia con cada carga o interacción registrada
+        self.version = 0
+
+    @property
+    def loaded(self):
+        """bool: True si se ha cargado desde las interacciones."""
+        return self._loaded
+
+    def __len__(self):
+        return len(self._weights)
+
+    def load(self, interactions_df, motos_df=None):
+        """
+        Agrega las interacciones cargadas (una sola agrupación).
+
+        Args:
+            interactions_df (pd.DataFrame): Columnas ``moto_id`` y ``weight``
+            motos_df (pd.DataFrame, optional): Catálogo con ``id``, ``tipo`` y ``precio``
+                para segmentar
+        """
+        weights, counts = {}, {}
+        if interactions_df is not None and not interactions_df.empty:
+            grouped = interactions_df.groupby('moto_id')['weight'].agg(['sum', 'count'])
+            weights = dict(zip(grouped.index, grouped['sum'].astype(float)))
+            counts = dict(zip(grouped.index, grouped['count'].astype(int)))
+
+        segments = {}
+        if motos_df is not None and not motos_df.empty:
+            tipos = motos_df['tipo'].fillna('').astype(str).str.lower() if 'tipo' in motos_df else None
+            precios = motos_df['precio'] if 'precio' in motos_df else None
+            for position, moto_id in enumerate(motos_df['id']):
+                segments[moto_id] = {
+                    'tipo': tipos.iloc[position] if tipos is not None else None,
+                    'price_band': price_band(precios.iloc[position]) if precios is not None else None
+                }
+
+        with self._lock:
+            self._weights, self._counts, self._segments = weights, counts, segments
+            self._rankings = {}
+            self._loaded = True
+            self.version += 1
+        logger.info(f"Popularidad precalculada para {len(weights)} motos")
+
+    def record(self, moto_id, weight, added=True):
+        """
+        Suma (o resta) una interacción a la popularidad de una moto.
+
+        Args:
+            moto_id: ID de la moto
+            weight (float): Peso de la interacción
+            added (bool): False si la interacción se ha eliminado
+        """
+        with self._lock:
+            if not self._loaded:
+                # La carga inicial ya leerá esta interacción de Neo4j
+                return
+            sign = 1 if added else -1
+            count = self._counts.get(moto_id, 0) + sign
+            if count <= 0:
+                self._weights.pop(moto_id, None)
+                self._counts.pop(moto_id, None)
+            else:
+                self._weights[moto_id] = self._weights.get(moto_id, 0.0) + sign * weight
+                self._counts[moto_id] = count
+            self._rankings = {}
+            self.version += 1
+
+    def score(self, moto_id):
+        """Puntuación de popularidad de una moto (0 si no tiene interacciones)."""
+        if moto_id not in self._counts:
+            return 0.0
+        return self._weights[moto_id] + self._counts[moto_id] * COUNT_BONUS
+
+    def count(self, moto_id):
+        """Número de interacciones de una moto."""
+        return self._counts.get(moto_id, 0)
+
+    def ranking(self, tipo=None, price_band=None):
+        """
+        Clasificación ordenada de un segmento.
+
+        Args:
+            tipo (str, optional): Solo motos de este tipo
+            price_band (str, optional): Solo motos de esta franja de precio
+
+        Returns:
+            tuple: (np.ndarray de IDs, np.ndarray de puntuaciones) de mayor a menor
+        """
+        key = (tipo.lower() if tipo else None, price_band)
+        with self._lock:
+            ranking = self._rankings.get(key)
+            if ranking is None:
+                ranking = self._build_ranking(*key)
+                self._rankings[key] = ranking
+        return ranking
+
+    def _build_ranking(self, tipo, band):
+        """Ordena las motos de un segmento (con el lock tomado)."""
+        moto_ids = list(self._weights)
+        if tipo is not None or band is not None:
+            def in_segment(moto_id):
+                segment = self._segments.get(moto_id, {})
+                return ((tipo is None or segment.get('tipo') == tipo) and
+                        (band is None or segment.get('price_band') == band))
+            moto_ids = [moto_id for moto_id in moto_ids if in_segment(moto_id)]
+        ids = np.array(moto_ids, dtype=object)
+        scores = np.array([self._weights[m] + self._counts[m] * COUNT_BONUS for m in moto_ids], dtype=float)
+        order = np.argsort(-scores, kind='stable')
+        return ids[order], scores[order]
+
+    def top(self, k, tipo=None, price_band=None):
+        """
+        Las k motos más populares de un segmento.
+
+        Returns:
+            list: Tuplas (moto_id, puntuación, interacciones)
+        """
+        ids, scores = self.ranking(tipo, price_band)
+        return [(moto_id, float(score), self.count(moto_id))
+                for moto_id, score in zip(ids[:k].tolist(), scores[:k].tolist())]
+
+
+def popularity_listener(baseline):
+    """
+    Crea un listener que mantiene un PopularityBaseline al día con cada like.
+
+    Args:
+        baseline (PopularityBaseline): Popularidad en memoria
+
+    Returns:
+        callable: Listener para ``InteractionWriter.add_listener``
+    """
+    def update_popularity(user_id, moto_id, kind, added):
+        weight = INTERACTION_WEIGHTS.get(kind)
+        if weight is not None:
+            baseline.record(moto_id, weight, added)
+    return update_popularity
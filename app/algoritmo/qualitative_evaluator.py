@@ -6,6 +6,8 @@ import pandas as pd
 import numpy as np
 import logging
 from typing import Dict, List, Tuple, Any, Optional, Union
+from .moto_record import MotoRecord
+from .log_config import item_logger
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +19,8 @@ class QualitativeEvaluator:
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        # Diagnóstico por moto: DEBUG y muestreado
+        self._item_log = item_logger(self.logger)
         
         # Mapeos de compatibilidad experiencia -> características de moto
         self.experiencia_compatibility = {
@@ -167,16 +171,13 @@ class QualitativeEvaluator:
         }
 
     def evaluate_moto_qualitative(self, user_preferences: Dict[str, Any], 
-                                 moto: pd.Series) -> Tuple[float, List[str]]:
+                                 moto: Union[pd.Series, MotoRecord]) -> Tuple[float, List[str]]:
         """
         Evalúa una moto usando criterios cualitativos del test
         """
         total_score = 0.0
         reasons = []
         
-        self.logger.info(f"[QUALITATIVE] Iniciando evaluación cualitativa de moto {moto.get('id')}")
-        self.logger.info(f"[QUALITATIVE] Preferencias cualitativas: {user_preferences}")
-        
         # Extraer características de la moto
         moto_potencia = float(moto.get('potencia', 0))
         moto_cilindrada = float(moto.get('cilindrada', 0))
@@ -358,7 +359,7 @@ class QualitativeEvaluator:
                     total_score -= penalty
                     reasons.append(f"⚠ Potencia alta vs preferencia de economía [-{penalty:.1f}]")
 
-        self.logger.info(f"[QUALITATIVE] Moto {moto.get('id')} - Score cualitativo FINAL: {total_score}")
+        self._item_log.debug("[QUALITATIVE] Moto %s - Score cualitativo FINAL: %s", moto.get('id'), total_score)
         
         return total_score, reasons
 
@@ -7,7 +7,9 @@ import pandas as pd
 import numpy as np
 import logging
 from typing import Dict, List, Tuple, Any, Optional, Union
+from .moto_record import MotoRecord
 from .qualitative_evaluator import QualitativeEvaluator
+from .log_config import item_logger
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +27,8 @@ class QuantitativeEvaluator:
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        # Diagnóstico por moto: DEBUG y muestreado (no cuesta nada si está desactivado)
+        self._item_log = item_logger(self.logger)
         self.qualitative_evaluator = QualitativeEvaluator()
         
         # Configurar parámetros por defecto
@@ -44,13 +48,13 @@ class QuantitativeEvaluator:
         self.qualitative_weight = 0.3   # 30% cualitativo
     
     def evaluate_moto_quantitative(self, user_preferences: Dict[str, Any], 
-                                 moto: pd.Series) -> Tuple[float, List[str]]:
+                                 moto: Union[pd.Series, MotoRecord]) -> Tuple[float, List[str]]:
         """
         Evalúa una moto combinando criterios cuantitativos y cualitativos.
         
         Args:
             user_preferences: Diccionario con preferencias del usuario
-            moto: Serie de pandas con datos de la moto
+            moto: MotoRecord (o Serie de pandas) con datos de la moto
             
         Returns:
             Tuple con (score_final, lista_de_razones)
@@ -58,15 +62,10 @@ class QuantitativeEvaluator:
         total_score = 0.0
         reasons = []
         
-        self.logger.info(f"[EVALUATOR] Iniciando evaluación de moto {moto.get('id', 'unknown')}")
-        self.logger.info(f"[EVALUATOR] Preferencias recibidas: {list(user_preferences.keys())}")
-        
         # VALIDAR TIPO DE INPUT
         has_quantitative = self._has_quantitative_inputs(user_preferences)
         has_qualitative = self._has_qualitative_inputs(user_preferences)
         
-        self.logger.info(f"[INPUT_TYPE] Cuantitativo: {has_quantitative}, Cualitativo: {has_qualitative}")
-        
         # === EVALUACIÓN CUANTITATIVA ===
         
         # 1. PRESUPUESTO
@@ -93,8 +92,6 @@ class QuantitativeEvaluator:
         # 8. ESTILOS/TIPOS
         total_score += self._evaluate_estilos(user_preferences, moto, reasons)
         
-        self.logger.info(f"[QUANTITATIVE] Score cuantitativo: {total_score:.2f}")
-        
         # === EVALUACIÓN CUALITATIVA ===
         
         qualitative_score = 0.0
@@ -110,8 +107,6 @@ class QuantitativeEvaluator:
                 qualitative_weight_factor = self.qualitative_evaluator.get_qualitative_weight_factor(user_preferences)
                 qualitative_score *= qualitative_weight_factor
                 
-                self.logger.info(f"[QUALITATIVE] Score cualitativo: {qualitative_score:.2f}")
-                
             except Exception as e:
                 self.logger.warning(f"[QUALITATIVE] Error en evaluación cualitativa: {e}")
                 qualitative_score = 0.0
@@ -148,7 +143,10 @@ class QuantitativeEvaluator:
         if has_quantitative and has_qualitative:
             final_reasons.append(f"[DETALLE] Cuantitativo: {total_score:.1f} | Cualitativo: {qualitative_score:.1f}")
         
-        self.logger.info(f"[FINAL] Moto {moto.get('id', 'unknown')} - Score: {final_score:.2f} (Tipo: {combination_type})")
+        if self._item_log.sample():
+            self.logger.debug("[EVALUATOR] Moto %s - cuantitativo %.2f, cualitativo %.2f, final %.2f (%s); preferencias %s",
+                              moto.get('id', 'unknown'), total_score, qualitative_score, final_score,
+                              combination_type, list(user_preferences.keys()))
         
         return final_score, final_reasons
     
@@ -173,7 +171,7 @@ class QuantitativeEvaluator:
         ]
         return any(key in preferences for key in qualitative_keys)
     
-    def _evaluate_presupuesto(self, preferences: Dict[str, Any], moto: pd.Series, reasons: List[str]) -> float:
+    def _evaluate_presupuesto(self, preferences: Dict[str, Any], moto: Union[pd.Series, MotoRecord], reasons: List[str]) -> float:
         """Evalúa el presupuesto con múltiples formatos de input."""
         precio_moto = float(moto.get('precio', 0))
         
@@ -206,7 +204,7 @@ class QuantitativeEvaluator:
         
         return 0.0
     
-    def _evaluate_potencia(self, preferences: Dict[str, Any], moto: pd.Series, reasons: List[str]) -> float:
+    def _evaluate_potencia(self, preferences: Dict[str, Any], moto: Union[pd.Series, MotoRecord], reasons: List[str]) -> float:
         """Evalúa la potencia."""
         if 'potencia_min' not in preferences or 'potencia_max' not in preferences:
             return 0.0
@@ -225,7 +223,7 @@ class QuantitativeEvaluator:
             reasons.append(f"⚠ Potencia fuera del rango ({potencia_moto}CV) [-{penalty:.1f}]")
             return -penalty
     
-    def _evaluate_cilindrada(self, preferences: Dict[str, Any], moto: pd.Series, reasons: List[str]) -> float:
+    def _evaluate_cilindrada(self, preferences: Dict[str, Any], moto: Union[pd.Series, MotoRecord], reasons: List[str]) -> float:
         """Evalúa la cilindrada."""
         if 'cilindrada_min' not in preferences or 'cilindrada_max' not in preferences:
             return 0.0
@@ -244,7 +242,7 @@ class QuantitativeEvaluator:
             reasons.append(f"⚠ Cilindrada fuera del rango ({cilindrada_moto}cc) [-{penalty:.1f}]")
             return -penalty
     
-    def _evaluate_peso(self, preferences: Dict[str, Any], moto: pd.Series, reasons: List[str]) -> float:
+    def _evaluate_peso(self, preferences: Dict[str, Any], moto: Union[pd.Series, MotoRecord], reasons: List[str]) -> float:
         """Evalúa el peso."""
         if 'peso_min' not in preferences or 'peso_max' not in preferences:
             return 0.0
@@ -263,7 +261,7 @@ class QuantitativeEvaluator:
             reasons.append(f"⚠ Peso fuera del rango ({peso_moto}kg) [-{penalty:.1f}]")
             return -penalty
     
-    def _evaluate_ano(self, preferences: Dict[str, Any], moto: pd.Series, reasons: List[str]) -> float:
+    def _evaluate_ano(self, preferences: Dict[str, Any], moto: Union[pd.Series, MotoRecord], reasons: List[str]) -> float:
         """Evalúa el año."""
         if 'ano_min' not in preferences or 'ano_max' not in preferences:
             return 0.0
@@ -282,7 +280,7 @@ class QuantitativeEvaluator:
             reasons.append(f"⚠ Año fuera del rango ({ano_moto}) [-{penalty:.1f}]")
             return -penalty
     
-    def _evaluate_torque(self, preferences: Dict[str, Any], moto: pd.Series, reasons: List[str]) -> float:
+    def _evaluate_torque(self, preferences: Dict[str, Any], moto: Union[pd.Series, MotoRecord], reasons: List[str]) -> float:
         """Evalúa el torque."""
         if 'torque_min' not in preferences or 'torque_max' not in preferences:
             return 0.0
@@ -301,7 +299,7 @@ class QuantitativeEvaluator:
             reasons.append(f"⚠ Torque fuera del rango ({torque_moto}Nm) [-{penalty:.1f}]")
             return -penalty
     
-    def _evaluate_marcas(self, preferences: Dict[str, Any], moto: pd.Series, reasons: List[str]) -> float:
+    def _evaluate_marcas(self, preferences: Dict[str, Any], moto: Union[pd.Series, MotoRecord], reasons: List[str]) -> float:
         """Evalúa las marcas preferidas."""
         if 'marcas' not in preferences:
             return 0.0
@@ -314,11 +312,11 @@ class QuantitativeEvaluator:
                 points = float(peso_marca) * self.default_weights['marca']
                 total_points += points
                 reasons.append(f"✓ Marca preferida: {marca} [+{points:.1f}]")
-                self.logger.info(f"[MARCA] {marca} coincide: +{points:.1f} puntos")
+                self.logger.debug("[MARCA] %s coincide: +%.1f puntos", marca, points)
         
         return total_points
     
-    def _evaluate_estilos(self, preferences: Dict[str, Any], moto: pd.Series, reasons: List[str]) -> float:
+    def _evaluate_estilos(self, preferences: Dict[str, Any], moto: Union[pd.Series, MotoRecord], reasons: List[str]) -> float:
         """Evalúa los estilos/tipos preferidos."""
         if 'estilos' not in preferences:
             return 0.0
@@ -331,6 +329,6 @@ class QuantitativeEvaluator:
                 points = float(peso_estilo) * self.default_weights['estilo']
                 total_points += points
                 reasons.append(f"✓ Estilo preferido: {estilo} [+{points:.1f}]")
-                self.logger.info(f"[ESTILO] {estilo} coincide: +{points:.1f} puntos")
+                self.logger.debug("[ESTILO] %s coincide: +%.1f puntos", estilo, points)
         
         return total_points
@@ -0,0 +1,391 @@
+"""
+Perfilado de consultas a Neo4j y registro de consultas lentas.
+
+Las consultas Cypher se lanzaban con ``session.run(...)`` directamente desde
+las rutas, el adaptador, label propagation o la inicialización de la base de
+datos, sin ningún registro de cuánto tardaba cada una. ``run_query(session,
+nombre, consulta, ...)`` sustituye a ``session.run`` en esos puntos:
+
+- Consume el resultado y mide el tiempo de ida y vuelta y el tiempo en el
+  servidor (``result_available_after + result_consumed_after`` del resumen).
+- Acumula estadísticas por nombre de consulta (``profiler.report()``) y las
+  publica en ``/metrics`` a través de ``track_query``.
+- Escribe un WARNING para las consultas que superan ``slow_query_ms``, con los
+  parámetros redactados (solo tipo y tamaño, salvo las claves de ``log_params``).
+- Bajo demanda (``profiler.profile_next(nombre)`` o ``profile_queries`` en la
+  configuración) ejecuta la consulta con ``PROFILE`` y guarda el plan con sus
+  db hits para consultarlo con ``profiler.get_plan(nombre)``.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import NEO4J_SERVER_TIME, NEO4J_SLOW_QUERIES, track_query
+from .tracing import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_PROFILER_CONFIG = {
+    'enabled': True,
+    'slow_query_ms': 250.0,
+    'profile_queries': [],
+    'max_plans': 50,
+    'max_profile_requests': 5,
+    'log_params': []
+}
+
+
+def _load_query_profiler_config():
+    """Lee QUERY_PROFILER_CONFIG de app/config.py (con valores por defecto si no existe)."""
+    config = dict(DEFAULT_QUERY_PROFILER_CONFIG)
+    try:
+        from app.config import QUERY_PROFILER_CONFIG
+        config.update(QUERY_PROFILER_CONFIG)
+    except ImportError:
+        pass
+    return config
+
+
+def redact_params(params, allowed=()):
+    """
+    Resume los parámetros de una consulta sin mostrar sus valores.
+
+    Args:
+        params (dict): Parámetros de la consulta
+        allowed (iterable): Claves cuyo valor se muestra tal cual si es un número
+
+    Returns:
+        dict: {clave: valor permitido o descripción como '<str:12>' / '<list:30>'}
+    """
+    allowed = set(allowed)
+    redacted = {}
+    for key, value in (params or {}).items():
+        if value is None or (key in allowed and isinstance(value, (int, float, bool))):
+            redacted[key] = value
+        elif isinstance(value, (str, bytes, list, tuple, dict, set)):
+            redacted[key] = f"<{type(value).__name__}:{len(value)}>"
+        else:
+            redacted[key] = f"<{type(value).__name__}>"
+    return redacted
+
+
+def _compact(query, limit=200):
+    """Consulta en una sola línea (recortada) para el log."""
+    text = ' '.join(query.split())
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def _plan_to_dict(plan):
+    """Convierte el plan de ``PROFILE`` del resumen en un diccionario serializable."""
+    if plan is None:
+        return None
+    if not isinstance(plan, dict):
+        plan = {'operatorType': getattr(plan, 'operator_type', None),
+                'identifiers': list(getattr(plan, 'identifiers', [])),
+                'arguments': dict(getattr(plan, 'arguments', {})),
+                'dbHits': getattr(plan, 'db_hits', 0),
+                'rows': getattr(plan, 'rows', 0),
+                'children': list(getattr(plan, 'children', []))}
+    return {
+        'operator': plan.get('operatorType'),
+        'identifiers': list(plan.get('identifiers') or []),
+        'db_hits': plan.get('dbHits', 0) or 0,
+        'rows': plan.get('rows', 0) or 0,
+        'details': (plan.get('arguments') or {}).get('Details'),
+        'children': [_plan_to_dict(child) for child in plan.get('children') or []]
+    }
+
+
+def _total_db_hits(plan):
+    """Suma los db hits de todos los operadores del plan."""
+    if not plan:
+        return 0
+    return plan['db_hits'] + sum(_total_db_hits(child) for child in plan['children'])
+
+
+def _server_ms(summary):
+    """Tiempo en el servidor (ms) según el resumen (None si el servidor no lo informa)."""
+    if summary is None:
+        return None
+    available = getattr(summary, 'result_available_after', None)
+    consumed = getattr(summary, 'result_consumed_after', None)
+    if available is None and consumed is None:
+        return None
+    return float((available or 0) + (consumed or 0))
+
+
+class QueryResult(list):
+    """
+    Registros de una consulta ya consumida.
+
+    Se comporta como la lista de registros y ofrece lo que los llamadores
+    usaban del ``Result`` del driver: ``single()``, ``data()`` y el resumen.
+    """
+
+    def __init__(self, records=(), summary=None):
+        super().__init__(records)
+        self.summary = summary
+
+    def single(self):
+        """Primer registro (o None si no hay ninguno)."""
+        return self[0] if self else None
+
+    def data(self):
+        """Registros como diccionarios."""
+        return [record.data() for record in self]
+
+    def consume(self):
+        """Resumen de la consulta."""
+        return self.summary
+
+
+class QueryStats:
+    """Estadísticas acumuladas de una consulta con nombre."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.slow = 0
+        self.rows = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.server_ms = 0.0
+        self.server_samples = 0
+        self.histogram = LatencyHistogram()
+        self.last_params = None
+
+    def to_dict(self):
+        count = self.count or 1
+        return {
+            'query': self.name,
+            'count': self.count,
+            'errors': self.errors,
+            'slow': self.slow,
+            'total_ms': round(self.total_seconds * 1000, 3),
+            'avg_ms': round(self.total_seconds * 1000 / count, 3),
+            'p95_ms': round((self.histogram.quantile(0.95) or 0.0) * 1000, 3),
+            'max_ms': round(self.max_seconds * 1000, 3),
+            'server_avg_ms': round(self.server_ms / self.server_samples, 3) if self.server_samples else None,
+            'avg_rows': round(self.rows / count, 1),
+            'last_params': self.last_params
+        }
+
+
+class QueryProfiler:
+    """Estadísticas por consulta, registro de consultas lentas y planes de PROFILE."""
+
+    def __init__(self, config=None):
+        """
+        Args:
+            config (dict, optional): Configuración (por defecto QUERY_PROFILER_CONFIG,
+                que se lee en la primera consulta)
+        """
+        self._config = {**DEFAULT_QUERY_PROFILER_CONFIG, **config} if config is not None else None
+        self._stats = {}
+        self._plans = OrderedDict()
+        self._profile_requests = {}
+        self._lock = threading.Lock()
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = _load_query_profiler_config()
+        return self._config
+
+    def configure(self, **options):
+        """Cambia opciones en caliente (p. ej. ``slow_query_ms``)."""
+        self._config = {**self.config, **options}
+
+    def knows(self, name):
+        """True si ya se ha ejecutado alguna consulta con ese nombre."""
+        return name in self._stats
+
+    def profile_next(self, name, times=1):
+        """
+        Ejecuta con ``PROFILE`` las próximas ``times`` ejecuciones de una consulta.
+
+        Solo se aceptan consultas ya registradas, y las ejecuciones pendientes
+        de cada una se limitan a ``max_profile_requests``.
+
+        Args:
+            name (str): Nombre de la consulta
+            times (int): Número de ejecuciones a perfilar
+
+        Returns:
+            int: Ejecuciones pendientes de perfilar (0 si la consulta no se conoce)
+        """
+        with self._lock:
+            if name not in self._stats:
+                return 0
+            limit = self.config['max_profile_requests']
+            pending = min(self._profile_requests.get(name, 0) + max(0, times), limit)
+            self._profile_requests[name] = pending
+            return pending
+
+    def _should_profile(self, name, query):
+        if query.lstrip()[:7].upper() in ('PROFILE', 'EXPLAIN'):
+            return False
+        with self._lock:
+            pending = self._profile_requests.get(name, 0)
+            if pending:
+                if pending == 1:
+                    del self._profile_requests[name]
+                else:
+                    self._profile_requests[name] = pending - 1
+                return True
+        return name in self.config['profile_queries']
+
+    def run(self, session, name, query, parameters=None, **kwargs):
+        """
+        Ejecuta una consulta con nombre y la registra.
+
+        Args:
+            session: Sesión o transacción de Neo4j (cualquier objeto con ``run``)
+            name (str): Nombre de la consulta (aparece en el informe y en /metrics)
+            query (str): Consulta Cypher
+            parameters (dict, optional): Parámetros (como en ``session.run``)
+            **kwargs: Parámetros adicionales
+
+        Returns:
+            QueryResult: Registros y resumen de la consulta
+
+        Raises:
+            Las excepciones del driver, después de registrarlas
+        """
+        if not self.config['enabled']:
+            result = session.run(query, parameters, **kwargs)
+            records = list(result)
+            return QueryResult(records, result.consume())
+
+        params = {**(parameters or {}), **kwargs}
+        profile = self._should_profile(name, query)
+        start = time.monotonic()
+        summary, records = None, []
+        error = None
+        try:
+            with track_query(name):
+                result = session.run('PROFILE ' + query if profile else query, params)
+                records = list(result)
+                summary = result.consume()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.record(name, query, params, time.monotonic() - start, summary, len(records), error)
+        return QueryResult(records, summary)
+
+    def record(self, name, query, params, seconds, summary=None, rows=0, error=None):
+        """
+        Registra una ejecución (también la usa la capa asíncrona, que consume el resultado por su cuenta).
+
+        Args:
+            name (str): Nombre de la consulta
+            query (str): Consulta Cypher
+            params (dict): Parámetros
+            seconds (float): Tiempo de ida y vuelta
+            summary: Resumen del driver (``ResultSummary``), si lo hay
+            rows (int): Registros devueltos
+            error (Exception, optional): Error de la consulta
+        """
+        config = self.config
+        server_ms = _server_ms(summary)
+        redacted = redact_params(params, config['log_params'])
+        slow = seconds * 1000 >= config['slow_query_ms']
+
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = QueryStats(name)
+            stats.count += 1
+            stats.rows += rows
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.last_params = redacted
+            if error is not None:
+                stats.errors += 1
+            if slow:
+                stats.slow += 1
+            if server_ms is not None:
+                stats.server_ms += server_ms
+                stats.server_samples += 1
+        stats.histogram.observe(seconds)
+
+        if server_ms is not None:
+            NEO4J_SERVER_TIME.observe(server_ms / 1000, query=name)
+        if slow:
+            NEO4J_SLOW_QUERIES.inc(query=name)
+            logger.warning("[NEO4J] Consulta lenta %s: %.1f ms (servidor %s ms, %d filas%s) params=%s consulta=%s",
+                           name, seconds * 1000, server_ms if server_ms is not None else '?', rows,
+                           ', error' if error is not None else '', redacted, _compact(query))
+
+        plan = _plan_to_dict(getattr(summary, 'profile', None)) if summary is not None else None
+        if plan is not None:
+            with self._lock:
+                self._plans[name] = {'query': _compact(query, 2000), 'params': redacted,
+                                     'captured_at': time.time(), 'db_hits': _total_db_hits(plan), 'plan': plan}
+                self._plans.move_to_end(name)
+                while len(self._plans) > config['max_plans']:
+                    self._plans.popitem(last=False)
+            logger.info("[NEO4J] Plan de %s capturado: %d db hits", name, self._plans[name]['db_hits'])
+
+    def get_plan(self, name):
+        """
+        Último plan de ``PROFILE`` capturado para una consulta.
+
+        Returns:
+            dict or None: Consulta, parámetros redactados, db hits totales y árbol de operadores
+        """
+        with self._lock:
+            return self._plans.get(name)
+
+    def report(self, sort_by='total_ms', limit=None):
+        """
+        Estadísticas agregadas por consulta.
+
+        Args:
+            sort_by (str): Columna por la que ordenar (de mayor a menor)
+            limit (int, optional): Número máximo de filas
+
+        Returns:
+            list: Una fila (dict) por consulta
+        """
+        with self._lock:
+            rows = [stats.to_dict() for stats in self._stats.values()]
+            profiled = set(self._plans)
+        for row in rows:
+            row['has_plan'] = row['query'] in profiled
+        rows.sort(key=lambda row: row.get(sort_by) or 0, reverse=True)
+        return rows[:limit] if limit else rows
+
+    def dump_report(self, sort_by='total_ms', limit=20):
+        """Escribe el informe en el log (nivel INFO) y lo devuelve."""
+        rows = self.report(sort_by, limit)
+        logger.info("[NEO4J] %-32s %7s %6s %6s %10s %10s %10s %10s", 'consulta', 'n', 'err', 'lentas',
+                    'total ms', 'media ms', 'p95 ms', 'máx ms')
+        for row in rows:
+            logger.info("[NEO4J] %-32s %7d %6d %6d %10.1f %10.1f %10.1f %10.1f", row['query'], row['count'],
+                        row['errors'], row['slow'], row['total_ms'], row['avg_ms'], row['p95_ms'], row['max_ms'])
+        return rows
+
+    def reset(self):
+        """Vacía estadísticas, planes y peticiones de PROFILE pendientes."""
+        with self._lock:
+            self._stats.clear()
+            self._plans.clear()
+            self._profile_requests.clear()
+
+
+# Instancia compartida por todos los módulos que consultan Neo4j
+profiler = QueryProfiler()
+
+
+def run_query(session, name, query, parameters=None, **kwargs):
+    """
+    Atajo para ``profiler.run(...)``: sustituye a ``session.run(query, ...)``.
+
+    Returns:
+        QueryResult: Registros y resumen de la consulta
+    """
+    return profiler.run(session, name, query, parameters, **kwargs)
@@ -0,0 +1,181 @@
+"""
+Caché de respuestas y fragmentos para páginas que solo dependen del estado global.
+
+``/populares`` devuelve la misma lista a todos los usuarios y ``/moto-detail``
+la misma ficha, pero cada visita recalculaba PageRank, consultaba Neo4j y
+volvía a formatear la página. ``ResponseCache`` guarda esas respuestas (o los
+datos intermedios) en una LRU acotada cuyas claves incluyen la versión del
+ranking, de modo que cualquier cambio en el ranking deja de servir las
+entradas antiguas. Los listeners de ``InteractionWriter`` además descartan
+explícitamente las entradas afectadas cuando cambia un like o una moto ideal.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    LRU de respuestas con versión, caducidad y etiquetas de invalidación.
+
+    Cada entrada se identifica por ``(namespace, key, version)``; las etiquetas
+    (``'moto:<id>'``...) permiten invalidar todas las entradas relacionadas con
+    un objeto sin conocer sus claves.
+    """
+
+    def __init__(self, max_entries=256, ttl=60.0):
+        """
+        Inicializa la caché.
+
+        Args:
+            max_entries (int): Entradas máximas antes de expulsar las menos usadas
+            ttl (float or None): Segundos de validez de una entrada (acota los
+                cambios hechos por otros procesos, que no notifican a este)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, namespace, key, version=None):
+        """
+        Devuelve una entrada vigente o None.
+
+        Args:
+            namespace (str): Tipo de respuesta ('populares', 'moto_detail'...)
+            key: Clave dentro del namespace
+            version: Versión del estado del que depende la respuesta
+        """
+        cache_key = (namespace, key, version)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None or (self.ttl is not None and time.monotonic() - entry[0] >= self.ttl):
+                if entry is not None:
+                    self._remove(cache_key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, namespace, key, value, version=None, tags=()):
+        """
+        Guarda una entrada.
+
+        Args:
+            namespace (str): Tipo de respuesta
+            key: Clave dentro del namespace
+            value: Respuesta o fragmento a guardar
+            version: Versión del estado del que depende
+            tags (iterable): Etiquetas para ``invalidate(tag=...)``
+        """
+        cache_key = (namespace, key, version)
+        tags = tuple(tags)
+        with self._lock:
+            if cache_key in self._entries:
+                self._remove(cache_key)
+            self._entries[cache_key] = (time.monotonic(), value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return value
+
+    def get_or_set(self, namespace, key, compute, version=None, tags=()):
+        """
+        Devuelve la entrada o la calcula y la guarda.
+
+        Los resultados vacíos (None, lista vacía) no se guardan.
+
+        Args:
+            compute (callable): Función sin argumentos que genera el valor
+        """
+        value = self.get(namespace, key, version)
+        if value is None:
+            value = compute()
+            if value:
+                self.set(namespace, key, value, version, tags)
+        return value
+
+    def _remove(self, cache_key):
+        """Elimina una entrada y sus etiquetas (con el lock tomado)."""
+        entry = self._entries.pop(cache_key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(cache_key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, namespace=None, tag=None):
+        """
+        Descarta entradas por namespace, por etiqueta o ambas.
+
+        Args:
+            namespace (str, optional): Namespace a vaciar
+            tag (str, optional): Etiqueta cuyas entradas se descartan
+
+        Returns:
+            int: Número de entradas descartadas
+        """
+        with self._lock:
+            keys = set()
+            if namespace is not None:
+                keys.update(k for k in self._entries if k[0] == namespace)
+            if tag is not None:
+                keys.update(self._tags.get(tag, ()))
+            for cache_key in keys:
+                self._remove(cache_key)
+        if keys:
+            logger.debug(f"Caché de respuestas: {len(keys)} entradas invalidadas "
+                         f"(namespace={namespace}, tag={tag})")
+        return len(keys)
+
+    def clear(self):
+        """Vacía la caché."""
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        """
+        Estadísticas de uso.
+
+        Returns:
+            dict: Entradas, aciertos y fallos
+        """
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def moto_tag(moto_id):
+    """Etiqueta de las entradas que muestran datos de una moto."""
+    return f"moto:{moto_id}"
+
+
+def cache_listener(cache, global_namespaces=('populares', 'popular_motos')):
+    """
+    Crea un listener que invalida la caché con cada like o moto ideal.
+
+    Args:
+        cache (ResponseCache): Caché de respuestas
+        global_namespaces (tuple): Namespaces que dependen del ranking global
+
+    Returns:
+        callable: Listener para ``InteractionWriter.add_listener``
+    """
+    def invalidate_responses(user_id, moto_id, kind, added):
+        for namespace in global_namespaces:
+            cache.invalidate(namespace=namespace)
+        cache.invalidate(tag=moto_tag(moto_id))
+    return invalidate_responses
@@ -0,0 +1,563 @@
+"""
+Catálogo compartido en memoria entre procesos trabajadores.
+
+Cuando el servidor de producción arranca varios procesos, cada uno cargaba por
+separado los DataFrames del catálogo, el grafo de PageRank y las estructuras de
+label propagation. Este módulo publica esos datos de solo lectura una única vez
+en bloques de ``multiprocessing.shared_memory`` y deja un manifiesto JSON que
+los trabajadores usan para adjuntarse sin volver a consultar Neo4j.
+
+Solo las columnas numéricas y booleanas de los DataFrames se exponen como
+vistas directas sobre la memoria compartida (una sola copia física para N
+procesos). Las columnas de texto se publican como códigos int32 más una tabla
+de valores únicos, pero cada trabajador las reconstruye como arrays ``object``
+propios al adjuntarse: no se comparten. No se exponen como
+``pd.Categorical.from_codes`` porque el código existente las trata como texto
+libre (``fillna('')``, asignación de valores nuevos...), operaciones que fallan
+con una columna categórica. Lo mismo ocurre con las columnas residuales
+(listas, tipos mixtos), que se deserializan en cada proceso.
+"""
+import os
+import sys
+import json
+import atexit
+import pickle
+import logging
+import uuid
+from collections import defaultdict
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Variable de entorno con la ruta del manifiesto; los procesos hijos la heredan
+MANIFEST_ENV_VAR = 'MOTOMATCH_SHARED_CATALOG'
+
+# DataFrames del adaptador que se publican
+_DATAFRAME_ATTRS = ('motos_df', 'users_df', 'ratings_df', 'friendships_df')
+
+# Python 3.13+ permite abrir bloques sin registrarlos en el resource_tracker
+_SUPPORTS_TRACK_FLAG = sys.version_info >= (3, 13)
+
+
+class SharedArrayStore:
+    """
+    Almacén de arrays NumPy respaldados por bloques de memoria compartida.
+
+    El proceso que publica es el propietario de los bloques y los libera con
+    ``unlink``; los procesos que se adjuntan solo los cierran y nunca los
+    registran en su resource_tracker (que, tras un fork, puede ser el mismo
+    que el del propietario).
+
+    Antes de Python 3.13 no hay forma pública de adjuntar un bloque sin
+    registrarlo, y desregistrarlo desde un trabajador que comparte el tracker
+    borraría también el registro del propietario. Por eso, en esas versiones,
+    ningún proceso deja los bloques registrados y el propietario los elimina
+    explícitamente en ``close`` (llamado con ``atexit``).
+    """
+
+    def __init__(self, prefix=None):
+        """
+        Inicializa el almacén.
+
+        Args:
+            prefix (str, optional): Prefijo para los nombres de los bloques
+        """
+        self.prefix = prefix or f"motomatch_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        self.blocks = {}
+        self.arrays = {}
+        self.owner = False
+
+    def put(self, key, array):
+        """
+        Copia un array a un bloque de memoria compartida nuevo.
+
+        Args:
+            key (str): Clave lógica del array
+            array (np.ndarray): Array con dtype no-objeto
+
+        Returns:
+            dict: Descriptor del bloque (nombre, forma y dtype)
+        """
+        array = np.ascontiguousarray(array)
+        if array.dtype == object:
+            raise TypeError(f"El array '{key}' tiene dtype object y no se puede compartir")
+
+        block = shared_memory.SharedMemory(
+            name=f"{self.prefix}_{len(self.blocks)}",
+            create=True,
+            size=max(array.nbytes, 1)
+        )
+        if not _SUPPORTS_TRACK_FLAG:
+            _untrack(block)
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        view[...] = array
+        view.flags.writeable = False
+
+        self.owner = True
+        self.blocks[key] = block
+        self.arrays[key] = view
+        return {'name': block.name, 'shape': list(array.shape), 'dtype': array.dtype.str}
+
+    def get(self, key, descriptor):
+        """
+        Adjunta un bloque existente y devuelve una vista de solo lectura.
+
+        Args:
+            key (str): Clave lógica del array
+            descriptor (dict): Descriptor generado por ``put``
+
+        Returns:
+            np.ndarray: Vista sobre la memoria compartida
+        """
+        if key in self.arrays:
+            return self.arrays[key]
+
+        # El propietario se encarga de liberar el bloque; evitamos que el
+        # resource_tracker de este proceso lo elimine al salir
+        if _SUPPORTS_TRACK_FLAG:
+            block = shared_memory.SharedMemory(name=descriptor['name'], create=False, track=False)
+        else:
+            block = shared_memory.SharedMemory(name=descriptor['name'], create=False)
+            _untrack(block)
+        view = np.ndarray(tuple(descriptor['shape']), dtype=np.dtype(descriptor['dtype']), buffer=block.buf)
+        view.flags.writeable = False
+
+        self.blocks[key] = block
+        self.arrays[key] = view
+        return view
+
+    def close(self):
+        """Cierra los bloques y, si este proceso es el propietario, los elimina."""
+        self.arrays.clear()
+        for key, block in list(self.blocks.items()):
+            try:
+                block.close()
+                if self.owner:
+                    if not _SUPPORTS_TRACK_FLAG:
+                        # unlink() desregistra el bloque: se vuelve a registrar
+                        # para que el tracker no avise de un nombre desconocido
+                        resource_tracker.register(block._name, 'shared_memory')
+                    block.unlink()
+            except (BufferError, FileNotFoundError) as e:
+                logger.debug(f"No se pudo liberar el bloque {key}: {str(e)}")
+        self.blocks.clear()
+
+
+def _untrack(block):
+    """Quita un bloque del resource_tracker (Python < 3.13)."""
+    try:
+        resource_tracker.unregister(block._name, 'shared_memory')
+    except Exception:
+        pass
+
+
+def _put_bytes(store, key, payload):
+    """Publica un blob de bytes como array uint8."""
+    return store.put(key, np.frombuffer(payload, dtype=np.uint8))
+
+
+def _get_bytes(store, key, descriptor):
+    """Recupera un blob de bytes publicado con ``_put_bytes``."""
+    return store.get(key, descriptor).tobytes()
+
+
+def _encode_strings(values):
+    """Convierte una secuencia de valores a un array unicode de ancho fijo."""
+    return np.array([str(v) for v in values], dtype=str) if len(values) else np.array([], dtype='<U1')
+
+
+def publish_dataframe(store, key, df):
+    """
+    Publica un DataFrame en memoria compartida.
+
+    Las columnas numéricas y booleanas se copian tal cual. Las columnas de
+    texto se codifican con ``pd.factorize`` (los trabajadores las decodifican
+    a una copia propia). El resto (listas, diccionarios, tipos mixtos) se
+    serializa en un bloque aparte.
+
+    Args:
+        store (SharedArrayStore): Almacén destino
+        key (str): Prefijo de las claves del DataFrame
+        df (pd.DataFrame): DataFrame a publicar
+
+    Returns:
+        dict: Entrada del manifiesto para este DataFrame
+    """
+    entry = {'columns': [], 'residual': None, 'index': None}
+    residual_columns = []
+
+    for column in df.columns:
+        series = df[column]
+        column_key = f"{key}.{len(entry['columns'])}"
+        dtype = series.dtype
+
+        if pd.api.types.is_bool_dtype(dtype) or (pd.api.types.is_numeric_dtype(dtype)
+                                                 and not isinstance(dtype, pd.CategoricalDtype)
+                                                 and not pd.api.types.is_extension_array_dtype(dtype)):
+            entry['columns'].append({
+                'name': column,
+                'kind': 'numeric',
+                'data': store.put(column_key, series.to_numpy())
+            })
+            continue
+
+        non_null = series.dropna()
+        if non_null.map(lambda v: isinstance(v, str)).all():
+            codes, uniques = pd.factorize(series)  # nulos = -1
+            entry['columns'].append({
+                'name': column,
+                'kind': 'strings',
+                'codes': store.put(f"{column_key}.codes", codes.astype(np.int32)),
+                'uniques': store.put(f"{column_key}.uniques", _encode_strings(list(uniques)))
+            })
+        else:
+            residual_columns.append(column)
+            entry['columns'].append({'name': column, 'kind': 'residual'})
+
+    if residual_columns:
+        payload = pickle.dumps(df[residual_columns], protocol=pickle.HIGHEST_PROTOCOL)
+        entry['residual'] = _put_bytes(store, f"{key}.residual", payload)
+
+    if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        entry['index'] = _put_bytes(store, f"{key}.index",
+                                    pickle.dumps(df.index, protocol=pickle.HIGHEST_PROTOCOL))
+
+    return entry
+
+
+def attach_dataframe(store, key, entry):
+    """
+    Reconstruye un DataFrame a partir de su entrada en el manifiesto.
+
+    Args:
+        store (SharedArrayStore): Almacén adjuntado
+        key (str): Prefijo de las claves del DataFrame
+        entry (dict): Entrada generada por ``publish_dataframe``
+
+    Returns:
+        pd.DataFrame: DataFrame cuyas columnas numéricas son vistas compartidas;
+        las de texto y las residuales son copias de este proceso
+    """
+    residual = None
+    if entry.get('residual'):
+        residual = pickle.loads(_get_bytes(store, f"{key}.residual", entry['residual']))
+
+    data = {}
+    for position, column in enumerate(entry['columns']):
+        column_key = f"{key}.{position}"
+        name = column['name']
+
+        if column['kind'] == 'numeric':
+            data[name] = store.get(column_key, column['data'])
+        elif column['kind'] == 'strings':
+            codes = store.get(f"{column_key}.codes", column['codes'])
+            uniques = store.get(f"{column_key}.uniques", column['uniques']).astype(object)
+            values = np.empty(len(codes), dtype=object)
+            valid = codes >= 0
+            values[valid] = uniques[codes[valid]]
+            values[~valid] = None
+            data[name] = values
+        else:
+            data[name] = residual[name].to_numpy() if residual is not None else None
+
+    index = None
+    if entry.get('index'):
+        index = pickle.loads(_get_bytes(store, f"{key}.index", entry['index']))
+
+    # copy=False mantiene las columnas numéricas como vistas sobre la memoria compartida
+    return pd.DataFrame(data, index=index, columns=[c['name'] for c in entry['columns']], copy=False)
+
+
+def _publish_pagerank(store, key, pagerank):
+    """
+    Publica el grafo y los scores de un MotoPageRank como arrays.
+
+    Returns:
+        dict: Entrada del manifiesto
+    """
+    with pagerank._lock:
+        moto_ids = list(pagerank.moto_scores.keys())
+        user_ids = list(pagerank.user_scores.keys())
+        moto_scores = [pagerank.moto_scores[m] for m in moto_ids]
+        moto_index = {moto_id: i for i, moto_id in enumerate(moto_ids)}
+        user_index = {user_id: i for i, user_id in enumerate(user_ids)}
+
+        edge_users, edge_motos, edge_weights = [], [], []
+        for user_id, outlinks in pagerank.graph.items():
+            if user_id not in user_index:
+                continue
+            for moto_id, weight in outlinks:
+                if moto_id in moto_index:
+                    edge_users.append(user_index[user_id])
+                    edge_motos.append(moto_index[moto_id])
+                    edge_weights.append(weight)
+
+    return {
+        'moto_ids': store.put(f"{key}.moto_ids", _encode_strings(moto_ids)),
+        'user_ids': store.put(f"{key}.user_ids", _encode_strings(user_ids)),
+        'moto_scores': store.put(f"{key}.moto_scores",
+                                 np.array(moto_scores, dtype=np.float64)),
+        'edge_users': store.put(f"{key}.edge_users", np.array(edge_users, dtype=np.int32)),
+        'edge_motos': store.put(f"{key}.edge_motos", np.array(edge_motos, dtype=np.int32)),
+        'edge_weights': store.put(f"{key}.edge_weights", np.array(edge_weights, dtype=np.float64)),
+    }
+
+
+def _attach_pagerank(store, key, entry, pagerank):
+    """Restaura el estado de un MotoPageRank desde la memoria compartida."""
+    moto_ids = store.get(f"{key}.moto_ids", entry['moto_ids']).tolist()
+    user_ids = store.get(f"{key}.user_ids", entry['user_ids']).tolist()
+    moto_scores = store.get(f"{key}.moto_scores", entry['moto_scores'])
+    edge_users = store.get(f"{key}.edge_users", entry['edge_users'])
+    edge_motos = store.get(f"{key}.edge_motos", entry['edge_motos'])
+    edge_weights = store.get(f"{key}.edge_weights", entry['edge_weights'])
+
+    with pagerank._lock:
+        pagerank.graph.clear()
+        pagerank.reverse_graph.clear()
+        pagerank._edges = None
+        pagerank.moto_scores = dict(zip(moto_ids, moto_scores.tolist()))
+        pagerank.user_scores = {user_id: 0.0 for user_id in user_ids}
+
+        for u, m, w in zip(edge_users.tolist(), edge_motos.tolist(), edge_weights.tolist()):
+            pagerank.graph[user_ids[u]].append((moto_ids[m], w))
+            pagerank.reverse_graph[moto_ids[m]].append((user_ids[u], w))
+
+    return pagerank
+
+
+def _publish_social_graph(store, key, social_graph):
+    """
+    Publica el grafo social de label propagation en formato CSR.
+
+    Returns:
+        dict: Entrada del manifiesto
+    """
+    user_ids = list(social_graph.keys())
+    for neighbours in social_graph.values():
+        for friend_id in neighbours:
+            if friend_id not in social_graph:
+                user_ids.append(friend_id)
+    user_ids = list(dict.fromkeys(user_ids))
+    user_index = {user_id: i for i, user_id in enumerate(user_ids)}
+
+    indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+    indices = []
+    for i, user_id in enumerate(user_ids):
+        neighbours = social_graph.get(user_id, [])
+        indices.extend(user_index[f] for f in neighbours)
+        indptr[i + 1] = len(indices)
+
+    return {
+        'user_ids': store.put(f"{key}.user_ids", _encode_strings(user_ids)),
+        'indptr': store.put(f"{key}.indptr", indptr),
+        'indices': store.put(f"{key}.indices", np.array(indices, dtype=np.int32)),
+    }
+
+
+def _attach_social_graph(store, key, entry):
+    """Reconstruye el grafo social de label propagation desde su forma CSR."""
+    user_ids = store.get(f"{key}.user_ids", entry['user_ids']).tolist()
+    indptr = store.get(f"{key}.indptr", entry['indptr'])
+    indices = store.get(f"{key}.indices", entry['indices'])
+
+    social_graph = defaultdict(list)
+    for i, user_id in enumerate(user_ids):
+        start, end = int(indptr[i]), int(indptr[i + 1])
+        if end > start:
+            social_graph[user_id] = [user_ids[j] for j in indices[start:end].tolist()]
+    return social_graph
+
+
+class SharedCatalog:
+    """
+    Catálogo de solo lectura compartido entre procesos.
+
+    Uso típico:
+        - El proceso maestro llama a ``publish(adapter, ranking)`` tras cargar
+          los datos y exporta la ruta del manifiesto en ``MANIFEST_ENV_VAR``.
+        - Cada trabajador llama a ``attach(path)`` y luego a
+          ``restore_into(adapter)`` en lugar de ``adapter.load_data()``.
+    """
+
+    def __init__(self):
+        self.store = SharedArrayStore()
+        self.manifest = None
+        self.manifest_path = None
+
+    @classmethod
+    def publish(cls, adapter, ranking=None, manifest_path=None):
+        """
+        Publica el estado cargado del adaptador en memoria compartida.
+
+        Args:
+            adapter: MotoRecommenderAdapter con los datos ya cargados
+            ranking (MotoPageRank, optional): Ranking global de la aplicación
+            manifest_path (str, optional): Ruta del manifiesto JSON
+
+        Returns:
+            SharedCatalog: Catálogo propietario de los bloques publicados
+        """
+        catalog = cls()
+        store = catalog.store
+        manifest = {'version': 1, 'prefix': store.prefix, 'dataframes': {}}
+
+        for attr in _DATAFRAME_ATTRS:
+            df = getattr(adapter, attr, None)
+            if isinstance(df, pd.DataFrame):
+                manifest['dataframes'][attr] = publish_dataframe(store, attr, df)
+
+        if getattr(adapter, 'pagerank', None) is not None:
+            manifest['pagerank'] = _publish_pagerank(store, 'pagerank', adapter.pagerank)
+        if ranking is not None:
+            manifest['ranking'] = _publish_pagerank(store, 'ranking', ranking)
+
+        label_propagation = getattr(adapter, 'label_propagation', None)
+        if label_propagation is not None and label_propagation.social_graph:
+            manifest['social_graph'] = _publish_social_graph(store, 'social_graph',
+                                                             label_propagation.social_graph)
+
+        if manifest_path is None:
+            import tempfile
+            manifest_path = os.path.join(tempfile.gettempdir(), f"{store.prefix}.json")
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+        catalog.manifest = manifest
+        catalog.manifest_path = manifest_path
+        atexit.register(catalog.close)
+
+        total_bytes = sum(block.size for block in store.blocks.values())
+        logger.info(f"Catálogo compartido publicado: {len(store.blocks)} bloques, "
+                    f"{total_bytes / 1024:.1f} KiB (manifiesto: {manifest_path})")
+        return catalog
+
+    @classmethod
+    def attach(cls, manifest_path):
+        """
+        Se adjunta a un catálogo publicado por otro proceso.
+
+        Args:
+            manifest_path (str): Ruta del manifiesto JSON
+
+        Returns:
+            SharedCatalog: Catálogo adjuntado (no propietario)
+        """
+        catalog = cls()
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            catalog.manifest = json.load(f)
+        catalog.manifest_path = manifest_path
+        catalog.store = SharedArrayStore(prefix=catalog.manifest.get('prefix'))
+        atexit.register(catalog.close)
+        return catalog
+
+    def restore_into(self, adapter):
+        """
+        Carga el estado compartido en un adaptador sin consultar Neo4j.
+
+        Args:
+            adapter: MotoRecommenderAdapter creado con ``load_on_init=False``
+
+        Returns:
+            bool: True si se restauraron los datos del catálogo
+        """
+        dataframes = self.manifest.get('dataframes', {})
+        for attr, entry in dataframes.items():
+            setattr(adapter, attr, attach_dataframe(self.store, attr, entry))
+
+        # Mismo espacio de ids que en el proceso que publicó el catálogo
+        from .id_registry import reset_id_space
+        users_df = getattr(adapter, 'users_df', None)
+        motos_df = getattr(adapter, 'motos_df', None)
+        adapter.id_space = reset_id_space(
+            users_df.get('user_id', []) if isinstance(users_df, pd.DataFrame) else None,
+            motos_df.get('moto_id', []) if isinstance(motos_df, pd.DataFrame) else None
+        )
+
+        if 'pagerank' in self.manifest and getattr(adapter, 'pagerank', None) is not None:
+            _attach_pagerank(self.store, 'pagerank', self.manifest['pagerank'], adapter.pagerank)
+
+        label_propagation = getattr(adapter, 'label_propagation', None)
+        if 'social_graph' in self.manifest and label_propagation is not None:
+            label_propagation.social_graph = _attach_social_graph(
+                self.store, 'social_graph', self.manifest['social_graph'])
+
+        motos_df = getattr(adapter, 'motos_df', None)
+        if label_propagation is not None and isinstance(motos_df, pd.DataFrame) \
+                and hasattr(label_propagation, 'add_moto_features') \
+                and not hasattr(label_propagation, 'load_data'):
+            label_propagation.add_moto_features(motos_df.to_dict('records'))
+
+        adapter.data_loaded = 'motos_df' in dataframes
+        adapter.shared_catalog = self
+        logger.info(f"Catálogo compartido adjuntado desde {self.manifest_path}")
+        return adapter.data_loaded
+
+    def get_ranking(self):
+        """
+        Devuelve el ranking global publicado, si existe.
+
+        Returns:
+            MotoPageRank or None: Ranking restaurado desde la memoria compartida
+        """
+        if 'ranking' not in self.manifest:
+            return None
+        from .pagerank import MotoPageRank
+        return _attach_pagerank(self.store, 'ranking', self.manifest['ranking'], MotoPageRank())
+
+    def close(self):
+        """Libera los bloques; el propietario además elimina el manifiesto."""
+        owner = self.store.owner
+        self.store.close()
+        if owner and self.manifest_path and os.path.exists(self.manifest_path):
+            try:
+                os.remove(self.manifest_path)
+            except OSError:
+                pass
+
+
+def publish_catalog(adapter, ranking=None):
+    """
+    Publica el catálogo y exporta la ruta del manifiesto para los trabajadores.
+
+    Args:
+        adapter: MotoRecommenderAdapter con los datos cargados
+        ranking (MotoPageRank, optional): Ranking global
+
+    Returns:
+        SharedCatalog or None: Catálogo publicado o None si falló
+    """
+    try:
+        catalog = SharedCatalog.publish(adapter, ranking)
+        os.environ[MANIFEST_ENV_VAR] = catalog.manifest_path
+        return catalog
+    except Exception as e:
+        logger.error(f"Error al publicar el catálogo compartido: {str(e)}")
+        return None
+
+
+def attach_catalog(adapter, manifest_path=None):
+    """
+    Adjunta un adaptador al catálogo compartido indicado en el entorno.
+
+    Args:
+        adapter: MotoRecommenderAdapter sin datos cargados
+        manifest_path (str, optional): Ruta del manifiesto; por defecto
+            se lee de ``MANIFEST_ENV_VAR``
+
+    Returns:
+        bool: True si el adaptador quedó cargado desde memoria compartida
+    """
+    manifest_path = manifest_path or os.environ.get(MANIFEST_ENV_VAR)
+    if not manifest_path or not os.path.exists(manifest_path):
+        return False
+
+    try:
+        catalog = SharedCatalog.attach(manifest_path)
+        return catalog.restore_into(adapter)
+    except Exception as e:
+        logger.error(f"Error al adjuntar el catálogo compartido: {str(e)}")
+        return False
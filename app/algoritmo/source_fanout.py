@@ -0,0 +1,272 @@
+"""
+Ejecución concurrente de fuentes de recomendación independientes.
+
+``MotoIdealRecommender`` (sistema híbrido + evaluación cuantitativa) y
+``HybridMotoRecommender`` (contenido, colaborativo, conocimiento y popularidad)
+calculaban sus fuentes una detrás de otra, así que la fuente más lenta (o una
+que fallase) bloqueaba toda la respuesta. ``SourceFanout`` las lanza a la vez
+en un pool de hilos acotado con un tiempo máximo por fuente: las que fallan o
+no terminan a tiempo se descartan y se registran, y la combinación continúa
+con las demás.
+
+Se usan hilos y no procesos: las fuentes comparten los DataFrames y matrices
+del recomendador (que no conviene serializar en cada petición) y la mayor parte
+de su tiempo es NumPy/scikit-learn o espera de Neo4j, que liberan el GIL.
+
+Configuración en ``SOURCE_FANOUT_CONFIG`` (app/config.py):
+
+- ``parallel``: si es False, las fuentes se ejecutan en serie (mismo resultado)
+- ``max_workers``: hilos del pool de cada recomendador
+- ``max_pending``: fuentes en curso o en cola admitidas por el pool; por
+  encima de ese número las nuevas se descartan al momento ('saturated')
+- ``timeout``: tiempo máximo por defecto de una fuente (segundos)
+- ``timeouts``: tiempo máximo por nombre de fuente
+
+El tiempo máximo de una fuente cuenta desde que empieza a ejecutarse, no desde
+que se encola: el pool es compartido por todas las peticiones, y una fuente que
+espera hilo libre no debe gastar su plazo en la cola. La espera en cola está
+acotada por ese mismo plazo ('queued') y por el ``Deadline`` de la petición
+(app/algoritmo/deadline.py), que recorta además el tiempo de cada fuente.
+
+Limitación: los hilos de Python no se pueden interrumpir. Una fuente descartada
+por tiempo sigue ejecutándose hasta terminar y ocupa su hilo mientras tanto;
+``max_pending`` evita que esas fuentes abandonadas se acumulen sin límite
+cuando una dependencia se vuelve lenta.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FANOUT_CONFIG = {
+    'parallel': True,
+    'max_workers': 4,
+    'max_pending': 8,
+    'timeout': 5.0,
+    'timeouts': {}
+}
+
+
+def _load_fanout_config():
+    """Lee SOURCE_FANOUT_CONFIG de app/config.py (con valores por defecto si no existe)."""
+    config = dict(DEFAULT_FANOUT_CONFIG)
+    try:
+        from app.config import SOURCE_FANOUT_CONFIG
+        config.update(SOURCE_FANOUT_CONFIG)
+    except ImportError:
+        pass
+    return config
+
+
+class FanoutResult:
+    """
+    Resultado de ejecutar varias fuentes.
+
+    Attributes:
+        results (dict): {fuente: resultado} de las fuentes que terminaron
+        dropped (dict): {fuente: motivo} de las descartadas ('timeout' o el error)
+        elapsed (dict): {fuente: segundos} de las que terminaron
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.dropped = {}
+        self.elapsed = {}
+
+    def get(self, name, default=None):
+        """Resultado de una fuente o ``default`` si se descartó."""
+        return self.results.get(name, default)
+
+    def __repr__(self):
+        return f"FanoutResult(ok={sorted(self.results)}, dropped={self.dropped})"
+
+
+class _SourceStart:
+    """Momento en que una fuente encolada empieza a ejecutarse."""
+
+    __slots__ = ('event', 'at')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.at = None
+
+    def mark(self, at):
+        self.at = at
+        self.event.set()
+
+
+class SourceFanout:
+    """
+    Ejecuta fuentes de recomendación en un pool de hilos acotado.
+
+    Cada recomendador tiene su propio pool para que una fuente que a su vez
+    lanza subfuentes (el sistema híbrido dentro de ``MotoIdealRecommender``)
+    no agote los hilos de las que espera.
+    """
+
+    def __init__(self, parallel=None, max_workers=None, timeout=None, timeouts=None, name='fanout',
+                 max_pending=None):
+        """
+        Inicializa el ejecutor (los argumentos omitidos salen de SOURCE_FANOUT_CONFIG).
+
+        Args:
+            parallel (bool): Ejecutar las fuentes a la vez o en serie
+            max_workers (int): Hilos máximos del pool
+            timeout (float): Tiempo máximo por defecto de una fuente (segundos)
+            timeouts (dict): Tiempo máximo por nombre de fuente
+            name (str): Prefijo de los hilos del pool
+            max_pending (int): Fuentes en curso o en cola admitidas a la vez
+        """
+        config = _load_fanout_config()
+        self.parallel = config['parallel'] if parallel is None else parallel
+        self.max_workers = max_workers or config['max_workers']
+        self.max_pending = max(max_pending or config.get('max_pending') or 2 * self.max_workers,
+                               self.max_workers)
+        self.timeout = timeout or config['timeout']
+        self.timeouts = dict(config.get('timeouts') or {})
+        self.timeouts.update(timeouts or {})
+        self.name = name
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        """Pool de hilos del proceso actual (se recrea tras un fork)."""
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix=self.name)
+                    self._pid = os.getpid()
+                    self._pending = 0
+        return self._executor
+
+    @property
+    def pending(self):
+        """int: Fuentes en curso o en cola (incluidas las abandonadas por tiempo)."""
+        return self._pending
+
+    def _submit(self, executor, source):
+        """
+        Encola una fuente si el pool tiene sitio.
+
+        Returns:
+            tuple or None: (future, _SourceStart) o None si el pool está saturado
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return None
+            self._pending += 1
+        start = _SourceStart()
+        # Cada fuente corre en una copia del contexto (traza y span en curso)
+        future = executor.submit(contextvars.copy_context().run, self._timed, source, start)
+        # Se libera el hueco al terminar o al cancelarse, aunque nadie espere ya el resultado
+        future.add_done_callback(self._release)
+        return future, start
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending = max(0, self._pending - 1)
+
+    def timeout_for(self, name):
+        """Tiempo máximo de una fuente."""
+        return self.timeouts.get(name, self.timeout)
+
+    def run(self, sources, deadline=None):
+        """
+        Ejecuta las fuentes y espera a cada una como máximo su tiempo límite.
+
+        Args:
+            sources (dict): {nombre: callable sin argumentos}
+            deadline (Deadline, optional): Presupuesto de la petición; recorta
+                el tiempo de cada fuente y recibe las fuentes descartadas
+
+        Returns:
+            FanoutResult: Resultados y fuentes descartadas
+        """
+        outcome = FanoutResult()
+        if not self.parallel:
+            for name, source in sources.items():
+                # Sin presupuesto no se lanza ninguna fuente más
+                if deadline is not None and deadline.expired:
+                    self._drop(outcome, deadline, name, 'deadline')
+                    continue
+                self._run_inline(name, source, outcome, deadline)
+            return outcome
+
+        if deadline is not None and deadline.expired:
+            for name in sources:
+                self._drop(outcome, deadline, name, 'deadline')
+            return outcome
+
+        executor = self._get_executor()
+        budget_end = time.monotonic() + deadline.remaining() if deadline is not None else float('inf')
+        queued_at = time.monotonic()
+        futures = {}
+        for name, source in sources.items():
+            submitted = self._submit(executor, source)
+            if submitted is None:
+                self._drop(outcome, deadline, name, 'saturated')
+                logger.warning(f"Fuente '{name}' descartada (saturated): "
+                               f"{self.max_pending} fuentes pendientes en el pool")
+                continue
+            futures[name] = submitted
+
+        for name, (future, start) in futures.items():
+            limit = self.timeout_for(name)
+            # Espera en cola: como máximo el plazo de la fuente y lo que quede de presupuesto
+            queue_end = min(queued_at + limit, budget_end)
+            if not start.event.wait(max(0.0, queue_end - time.monotonic())) and future.cancel():
+                reason = 'deadline' if budget_end <= queue_end else 'queued'
+                self._drop(outcome, deadline, name, reason)
+                logger.warning(f"Fuente '{name}' descartada ({reason}): no obtuvo hilo a tiempo")
+                continue
+            # El plazo de la fuente cuenta desde que empezó a ejecutarse
+            start.event.wait()
+            end = min(start.at + limit, budget_end)
+            try:
+                result, elapsed = future.result(timeout=max(0.0, end - time.monotonic()))
+                outcome.results[name] = result
+                outcome.elapsed[name] = elapsed
+            except FutureTimeoutError:
+                reason = 'deadline' if budget_end < start.at + limit else 'timeout'
+                self._drop(outcome, deadline, name, reason)
+                logger.warning(f"Fuente '{name}' descartada ({reason}): superó {end - start.at:.2f}s")
+            except Exception as e:
+                self._drop(outcome, deadline, name, f"error: {str(e)}")
+                logger.error(f"Fuente '{name}' descartada por error: {str(e)}")
+        return outcome
+
+    @staticmethod
+    def _drop(outcome, deadline, name, reason):
+        outcome.dropped[name] = reason
+        if deadline is not None:
+            deadline.drop(name, reason)
+
+    @staticmethod
+    def _timed(source, start=None):
+        begin = time.monotonic()
+        if start is not None:
+            start.mark(begin)
+        return source(), time.monotonic() - begin
+
+    def _run_inline(self, name, source, outcome, deadline=None):
+        """Ejecución en serie: los errores también descartan solo su fuente."""
+        try:
+            result, elapsed = self._timed(source)
+            outcome.results[name] = result
+            outcome.elapsed[name] = elapsed
+        except Exception as e:
+            self._drop(outcome, deadline, name, f"error: {str(e)}")
+            logger.error(f"Fuente '{name}' descartada por error: {str(e)}")
+
+    def shutdown(self):
+        """Detiene el pool sin esperar a las fuentes abandonadas."""
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
@@ -0,0 +1,110 @@
+"""
+Matrices usuario x moto dispersas para ``AdvancedHybridRecommender``.
+
+``_build_interaction_matrices`` construía ``ratings_df`` e ``interaction_df``
+con ``pivot_table`` (un DataFrame denso usuarios x motos) y después los
+convertía con ``csr_matrix(df.values)``, así que la matriz densa se
+materializaba entera. Aquí las matrices se construyen directamente con
+``coo_matrix`` sobre los códigos del espacio de ids (sumando los duplicados) y
+``SparseInteractionFrame`` ofrece las consultas que usaba el recomendador
+(``user_id in df.index``, ``df.loc[user_id]``) sin densificar.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+
+logger = logging.getLogger(__name__)
+
+
+def sparse_matrix(user_codes, moto_codes, values, shape):
+    """
+    Matriz CSR a partir de tripletes; los pares repetidos se suman.
+
+    Args:
+        user_codes (np.ndarray): Fila de cada valor
+        moto_codes (np.ndarray): Columna de cada valor
+        values (np.ndarray): Valores
+        shape (tuple): (usuarios, motos)
+
+    Returns:
+        scipy.sparse.csr_matrix: Matriz sin ceros explícitos
+    """
+    matrix = coo_matrix((np.asarray(values, dtype=np.float64),
+                         (np.asarray(user_codes), np.asarray(moto_codes))), shape=shape).tocsr()
+    matrix.sum_duplicates()
+    matrix.eliminate_zeros()
+    return matrix
+
+
+class _RowLocator:
+    """Implementa ``frame.loc[user_id]``."""
+
+    def __init__(self, frame):
+        self._frame = frame
+
+    def __getitem__(self, user_id):
+        return self._frame.row(user_id)
+
+
+class SparseInteractionFrame:
+    """
+    Vista de solo lectura de una matriz dispersa con etiquetas de usuario y moto.
+
+    Sustituye a los DataFrames densos ``ratings_df`` / ``interaction_df``:
+    ``loc[user_id]`` devuelve una ``pd.Series`` con las motos no nulas del
+    usuario (las ausentes valen 0).
+    """
+
+    def __init__(self, matrix, index, columns):
+        """
+        Args:
+            matrix (scipy.sparse.csr_matrix): Matriz usuarios x motos
+            index (pd.Index): ID de usuario de cada fila
+            columns (pd.Index): ID de moto de cada columna
+        """
+        self.matrix = matrix.tocsr()
+        self.index = pd.Index(index)
+        self.columns = pd.Index(columns)
+        self.loc = _RowLocator(self)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def values(self):
+        """np.ndarray: Matriz densa (solo para compatibilidad; evita usarla con catálogos grandes)."""
+        return self.matrix.toarray()
+
+    def row(self, user_id):
+        """
+        Valores no nulos de un usuario.
+
+        Args:
+            user_id: ID del usuario
+
+        Returns:
+            pd.Series: {moto_id: valor}
+
+        Raises:
+            KeyError: Si el usuario no está en la matriz
+        """
+        position = self.index.get_loc(user_id)
+        start, end = self.matrix.indptr[position], self.matrix.indptr[position + 1]
+        return pd.Series(self.matrix.data[start:end],
+                         index=self.columns[self.matrix.indices[start:end]], name=user_id)
+
+    def get(self, user_id, moto_id, default=0.0):
+        """Valor de una celda (``default`` si el usuario o la moto no existen)."""
+        if user_id not in self.index or moto_id not in self.columns:
+            return default
+        return float(self.matrix[self.index.get_loc(user_id), self.columns.get_loc(moto_id)])
+
+    def to_dense(self):
+        """DataFrame denso equivalente al antiguo ``pivot_table``."""
+        return pd.DataFrame(self.values, index=self.index, columns=self.columns)
+
+    def __repr__(self):
+        return f"SparseInteractionFrame({self.shape[0]}x{self.shape[1]}, nnz={self.matrix.nnz})"
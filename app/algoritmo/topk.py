@@ -0,0 +1,128 @@
+"""
+Selección de los k mejores elementos de un vector (o de cada fila de una matriz).
+
+Ordenar todas las puntuaciones para quedarse con las k primeras cuesta
+O(n log n); ``np.argpartition`` separa las k mayores en O(n) y solo esas k se
+ordenan después. Los elementos excluidos (motos ya valoradas...) se marcan con
+``-inf`` y nunca se devuelven.
+"""
+import heapq
+
+import numpy as np
+
+
+def top_k(scores, k, exclude=None):
+    """
+    Índices de las k puntuaciones más altas, de mayor a menor.
+
+    Args:
+        scores (np.ndarray): Puntuaciones (1D)
+        k (int): Número de elementos
+        exclude (array-like, optional): Índices que no se pueden devolver
+
+    Returns:
+        np.ndarray: Índices ordenados por puntuación descendente
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if exclude is not None and len(exclude):
+        scores = scores.copy()
+        scores[np.asarray(exclude)] = -np.inf
+    candidates = np.flatnonzero(scores > -np.inf)
+    if k <= 0 or len(candidates) == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(candidates):
+        partition = np.argpartition(-scores[candidates], k - 1)[:k]
+        candidates = candidates[partition]
+    # Orden estable por índice para que los empates sean deterministas
+    candidates = np.sort(candidates)
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def top_k_rows(scores, k, exclude=None):
+    """
+    Top-k de cada fila de una matriz de puntuaciones.
+
+    Args:
+        scores (np.ndarray): Matriz filas x elementos
+        k (int): Número de elementos por fila
+        exclude (scipy.sparse matrix, optional): Matriz de la misma forma cuyas
+            celdas no nulas no se pueden devolver
+
+    Returns:
+        tuple: (índices filas x k', puntuaciones filas x k') con k' = min(k, elementos);
+        las posiciones sin candidato tienen puntuación ``-inf``
+    """
+    scores = np.array(scores, dtype=np.float64, copy=True)
+    if exclude is not None:
+        exclude = exclude.tocsr()
+        rows = np.repeat(np.arange(exclude.shape[0]), np.diff(exclude.indptr))
+        scores[rows, exclude.indices] = -np.inf
+    n_items = scores.shape[1]
+    k = min(k, n_items)
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty
+    if k < n_items:
+        partition = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        partition.sort(axis=1)
+    else:
+        partition = np.tile(np.arange(n_items), (scores.shape[0], 1))
+    selected = np.take_along_axis(scores, partition, axis=1)
+    order = np.argsort(-selected, axis=1, kind='stable')
+    return np.take_along_axis(partition, order, axis=1), np.take_along_axis(selected, order, axis=1)
+
+
+class CandidateAccumulator:
+    """
+    Candidatos deduplicados que conservan su mejor puntuación.
+
+    Sustituye a las listas en las que cada candidato se buscaba con un
+    recorrido lineal: la deduplicación es un diccionario y la selección final
+    un heap acotado (``heapq.nlargest``), que respeta el orden de inserción en
+    los empates igual que ``sorted(..., reverse=True)``.
+    """
+
+    def __init__(self, exclude=()):
+        """
+        Args:
+            exclude (iterable): Candidatos que se ignoran (p. ej. motos ya valoradas)
+        """
+        self.exclude = set(exclude)
+        self._best = {}
+
+    def __len__(self):
+        return len(self._best)
+
+    def __contains__(self, candidate):
+        return candidate in self._best
+
+    def add(self, candidate, score, reason=None):
+        """
+        Registra un candidato si es nuevo o mejora su puntuación.
+
+        Args:
+            candidate: Identificador del candidato
+            score (float): Puntuación
+            reason: Motivo o callable sin argumentos que lo genera (solo se
+                evalúa si el candidato se guarda)
+
+        Returns:
+            bool: True si se guardó
+        """
+        if candidate in self.exclude:
+            return False
+        current = self._best.get(candidate)
+        if current is not None and current[0] >= score:
+            return False
+        self._best[candidate] = (score, reason() if callable(reason) else reason)
+        return True
+
+    def top(self, n):
+        """
+        Los n mejores candidatos.
+
+        Returns:
+            list: Tuplas (candidato, puntuación, motivo) de mayor a menor
+        """
+        best = heapq.nlargest(n, self._best.items(), key=lambda item: item[1][0])
+        return [(candidate, score, reason) for candidate, (score, reason) in best]
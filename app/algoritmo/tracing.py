@@ -0,0 +1,285 @@
+"""
+Trazas y latencias por etapa del flujo de recomendación.
+
+Hasta ahora la única información de una petición eran las líneas INFO de cada
+etapa (``[HYBRID] Evaluando moto ...``), sin tiempos. ``Tracer`` ofrece:
+
+- ``tracer.trace(nombre)``: abre la traza de una petición con un ``trace_id``
+  propio (si ya hay una abierta, la reutiliza). Las últimas trazas se guardan
+  para consultarlas después con ``tracer.get_trace(trace_id)``.
+- ``tracer.span(nombre)``: mide una etapa (carga de datos, filtrado, cada
+  subrecomendador, combinación, diversidad, hidratación...). La duración se
+  añade a la traza en curso con su span padre y, siempre, al histograma de la
+  etapa (``tracer.histograms()``).
+
+La traza en curso vive en ``contextvars``; ``SourceFanout`` copia el contexto
+al lanzar cada fuente, así que los spans de los hilos del pool cuelgan de la
+misma traza.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (segundos) de los cubos de los histogramas
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current_trace = contextvars.ContextVar('motomatch_trace', default=None)
+_current_span = contextvars.ContextVar('motomatch_span', default=None)
+
+
+class LatencyHistogram:
+    """Histograma de latencias con cubos fijos (acumulables como los de Prometheus)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """Registra una duración."""
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+            self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """
+        Cuantil aproximado (límite superior del cubo en el que cae).
+
+        Args:
+            q (float): Cuantil (0-1)
+
+        Returns:
+            float or None: Segundos (None si no hay observaciones)
+        """
+        with self._lock:
+            if not self.count:
+                return None
+            target = q * self.count
+            seen = 0
+            for position, count in enumerate(self.counts):
+                seen += count
+                if seen >= target and count:
+                    return self.buckets[position] if position < len(self.buckets) else self.max
+            return self.max
+
+    def snapshot(self):
+        """
+        Estado del histograma.
+
+        Returns:
+            dict: count, sum, max, p50/p95/p99 y cubos acumulados {límite: observaciones <= límite}
+        """
+        with self._lock:
+            cumulative, seen = {}, 0
+            for limit, count in zip(self.buckets, self.counts):
+                seen += count
+                cumulative[limit] = seen
+            state = {'count': self.count, 'sum': self.sum, 'max': self.max, 'buckets': cumulative}
+        for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            state[name] = self.quantile(q)
+        return state
+
+
+class Span:
+    """Una etapa medida dentro de una traza."""
+
+    __slots__ = ('name', 'parent', 'start', 'duration', 'attributes', 'error')
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.start = time.monotonic()
+        self.duration = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def set(self, **attributes):
+        """Añade atributos al span (p. ej. número de candidatos)."""
+        self.attributes.update(attributes)
+
+    def to_dict(self, origin):
+        return {
+            'name': self.name,
+            'parent': self.parent.name if self.parent is not None else None,
+            'offset_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'attributes': self.attributes,
+            'error': self.error
+        }
+
+
+class Trace:
+    """Spans de una petición."""
+
+    def __init__(self, name, trace_id=None):
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.start = time.monotonic()
+        self.duration = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        """Volcado de la traza (los spans en orden de inicio)."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'spans': [span.to_dict(self.start) for span in spans]
+        }
+
+
+class Tracer:
+    """Registro de trazas recientes e histogramas por etapa."""
+
+    def __init__(self, max_traces=200, buckets=LATENCY_BUCKETS):
+        """
+        Args:
+            max_traces (int): Trazas que se conservan para consultarlas
+            buckets (tuple): Cubos de los histogramas
+        """
+        self.max_traces = max_traces
+        self.buckets = buckets
+        self._traces = OrderedDict()
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, LatencyHistogram(self.buckets))
+        return histogram
+
+    def observe(self, name, seconds):
+        """Añade una duración al histograma de una etapa."""
+        self._histogram(name).observe(seconds)
+
+    @contextmanager
+    def trace(self, name, trace_id=None):
+        """
+        Abre la traza de una petición (o reutiliza la que ya está abierta).
+
+        Yields:
+            Trace: Traza en curso
+        """
+        current = _current_trace.get()
+        if current is not None:
+            yield current
+            return
+        trace = Trace(name, trace_id)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            trace.duration = time.monotonic() - trace.start
+            _current_trace.reset(token)
+            self.observe(name, trace.duration)
+            with self._lock:
+                self._traces[trace.trace_id] = trace
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Mide una etapa.
+
+        Yields:
+            Span: Span en curso (admite ``span.set(...)``)
+        """
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = str(e)
+            raise
+        finally:
+            span.duration = time.monotonic() - span.start
+            _current_span.reset(token)
+            self.observe(name, span.duration)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.add(span)
+
+    def traced(self, name, source):
+        """Envuelve un callable sin argumentos para medirlo como un span (útil con SourceFanout)."""
+        def run():
+            with self.span(name):
+                return source()
+        return run
+
+    def current_trace_id(self):
+        """ID de la traza en curso (None si no hay)."""
+        trace = _current_trace.get()
+        return trace.trace_id if trace is not None else None
+
+    def get_trace(self, trace_id):
+        """
+        Volcado de una traza reciente.
+
+        Returns:
+            dict or None: Traza (None si ya no se conserva)
+        """
+        with self._lock:
+            trace = self._traces.get(trace_id)
+        return trace.to_dict() if trace is not None else None
+
+    def recent_traces(self, limit=20):
+        """Resumen de las últimas trazas (más reciente primero)."""
+        with self._lock:
+            traces = list(self._traces.values())[-limit:]
+        return [{'trace_id': trace.trace_id, 'name': trace.name, 'started_at': trace.started_at,
+                 'duration_ms': round(trace.duration * 1000, 3), 'spans': len(trace.spans)}
+                for trace in reversed(traces)]
+
+    def dump(self, trace_id):
+        """Escribe una traza en el log (nivel INFO) y la devuelve."""
+        trace = self.get_trace(trace_id)
+        if trace is None:
+            logger.warning(f"Traza {trace_id} no disponible")
+            return None
+        logger.info(f"Traza {trace_id} ({trace['name']}, {trace['duration_ms']} ms)")
+        for span in trace['spans']:
+            logger.info(f"  {span['name']}: {span['duration_ms']} ms (+{span['offset_ms']} ms, padre {span['parent']})")
+        return trace
+
+    def histograms(self):
+        """Estado de los histogramas {etapa: snapshot}."""
+        return {name: histogram.snapshot() for name, histogram in sorted(self.histogram_objects().items())}
+
+    def histogram_objects(self):
+        """Histogramas por etapa (los propios objetos, para exponerlos en /metrics)."""
+        with self._lock:
+            return dict(self._histograms)
+
+    def reset(self):
+        """Vacía trazas e histogramas."""
+        with self._lock:
+            self._traces.clear()
+            self._histograms.clear()
+
+
+# Instancia compartida por el adaptador, los recomendadores y la API
+tracer = Tracer()
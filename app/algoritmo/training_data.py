@@ -0,0 +1,165 @@
+"""
+Datos de entrenamiento de la red neuronal de ``AdvancedHybridRecommender``.
+
+``_train_neural_network`` recorría la matriz densa usuario x moto con
+``iterrows()`` y, por cada celda no nula, buscaba con ``.loc`` las
+características del usuario y de la moto para construir una lista de
+diccionarios: trabajo en Python proporcional a U·M y memoria proporcional al
+número de interacciones por la dimensión de las características.
+
+``TripletTrainingData`` extrae directamente los tripletes (usuario, moto,
+valor) no nulos de la matriz dispersa y guarda, para cada código de usuario y
+de moto, la posición de su fila de características. Los lotes se montan al
+vuelo indexando las tablas de características con arrays enteros, así que la
+memoria solo depende del tamaño del lote.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _feature_table(features_df, ids):
+    """
+    Tabla de características alineada con los códigos del espacio de ids.
+
+    Args:
+        features_df (pd.DataFrame or None): Características indexadas por id
+        ids (sequence): Id de cada código (posición = código)
+
+    Returns:
+        tuple: (matriz float32 con una fila de ceros al final, posiciones por código)
+        o (None, None) si no hay características para ningún id
+    """
+    if features_df is None or features_df.shape[1] == 0:
+        return None, None
+    positions = features_df.index.get_indexer(ids)
+    if not (positions >= 0).any():
+        return None, None
+    values = features_df.to_numpy(dtype=np.float32)
+    table = np.vstack([values, np.zeros((1, values.shape[1]), dtype=np.float32)])
+    # Los ids sin características apuntan a la fila de ceros
+    positions = np.where(positions >= 0, positions, len(values)).astype(np.int64)
+    return table, positions
+
+
+class TripletTrainingData:
+    """
+    Tripletes (usuario, moto, valor) de una matriz dispersa y sus lotes.
+
+    Attributes:
+        users (np.ndarray): Código de usuario de cada triplete
+        motos (np.ndarray): Código de moto de cada triplete
+        values (np.ndarray): Valor de cada triplete
+    """
+
+    def __init__(self, matrix, user_features=None, moto_features=None, user_ids=None, moto_ids=None):
+        """
+        Args:
+            matrix (scipy.sparse matrix): Matriz usuario x moto (fila/columna = código)
+            user_features (pd.DataFrame, optional): Características por id de usuario
+            moto_features (pd.DataFrame, optional): Características por id de moto
+            user_ids (sequence, optional): Id de cada fila de la matriz
+            moto_ids (sequence, optional): Id de cada columna de la matriz
+        """
+        coo = matrix.tocoo()
+        positive = coo.data > 0
+        self.users = coo.row[positive].astype(np.int64)
+        self.motos = coo.col[positive].astype(np.int64)
+        self.values = coo.data[positive].astype(np.float64)
+        self.shape = matrix.shape
+
+        self.user_table, self._user_positions = (
+            _feature_table(user_features, user_ids) if user_ids is not None else (None, None))
+        self.moto_table, self._moto_positions = (
+            _feature_table(moto_features, moto_ids) if moto_ids is not None else (None, None))
+        logger.info(f"Datos de entrenamiento: {len(self)} tripletes de una matriz {self.shape[0]}x{self.shape[1]}")
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def user_feature_dim(self):
+        """int: Dimensión de las características de usuario (0 si no hay)."""
+        return 0 if self.user_table is None else self.user_table.shape[1]
+
+    @property
+    def moto_feature_dim(self):
+        """int: Dimensión de las características de moto (0 si no hay)."""
+        return 0 if self.moto_table is None else self.moto_table.shape[1]
+
+    def split(self, validation_fraction=0.1, seed=None):
+        """
+        Separa índices de entrenamiento y validación.
+
+        Returns:
+            tuple: (índices de entrenamiento, índices de validación)
+        """
+        order = np.random.default_rng(seed).permutation(len(self))
+        n_validation = int(len(order) * validation_fraction)
+        return order[n_validation:], order[:n_validation]
+
+    def batch(self, indices, targets=None):
+        """
+        Entradas del modelo para unos tripletes.
+
+        Args:
+            indices (np.ndarray): Índices de los tripletes
+            targets (np.ndarray, optional): Valores objetivo (por defecto ``self.values``)
+
+        Returns:
+            tuple: (tupla de entradas en el orden del modelo, objetivos)
+        """
+        users, motos = self.users[indices], self.motos[indices]
+        inputs = [users, motos]
+        if self.user_table is not None:
+            inputs.append(self.user_table[self._user_positions[users]])
+        if self.moto_table is not None:
+            inputs.append(self.moto_table[self._moto_positions[motos]])
+        targets = self.values if targets is None else targets
+        return tuple(inputs), targets[indices]
+
+    def batches(self, batch_size, indices=None, targets=None, shuffle=False, rng=None):
+        """
+        Generador de lotes.
+
+        Args:
+            batch_size (int): Tripletes por lote
+            indices (np.ndarray, optional): Tripletes a recorrer (por defecto todos)
+            targets (np.ndarray, optional): Valores objetivo (p. ej. normalizados)
+            shuffle (bool): Barajar el orden en cada recorrido
+            rng (np.random.Generator, optional): Generador aleatorio
+
+        Yields:
+            tuple: (entradas, objetivos) de cada lote
+        """
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        if shuffle:
+            indices = (rng or np.random.default_rng()).permutation(indices)
+        for start in range(0, len(indices), batch_size):
+            yield self.batch(indices[start:start + batch_size], targets)
+
+    def dataset(self, batch_size, indices=None, targets=None, shuffle=False, seed=None):
+        """
+        ``tf.data.Dataset`` que recorre los lotes (se vuelve a generar en cada época).
+
+        Returns:
+            tf.data.Dataset: Lotes (entradas, objetivos)
+        """
+        import tensorflow as tf
+
+        rng = np.random.default_rng(seed)
+        input_specs = [tf.TensorSpec(shape=(None,), dtype=tf.int64),
+                       tf.TensorSpec(shape=(None,), dtype=tf.int64)]
+        if self.user_table is not None:
+            input_specs.append(tf.TensorSpec(shape=(None, self.user_feature_dim), dtype=tf.float32))
+        if self.moto_table is not None:
+            input_specs.append(tf.TensorSpec(shape=(None, self.moto_feature_dim), dtype=tf.float32))
+        signature = (tuple(input_specs), tf.TensorSpec(shape=(None,), dtype=tf.float64))
+        n_items = len(self) if indices is None else len(indices)
+        n_batches = -(-n_items // batch_size)
+        return tf.data.Dataset.from_generator(
+            lambda: self.batches(batch_size, indices, targets, shuffle, rng),
+            output_signature=signature
+        ).apply(tf.data.experimental.assert_cardinality(n_batches)).prefetch(1)
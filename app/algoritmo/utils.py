@@ -4,11 +4,11 @@ Incluye funciones para conectar con la base de datos y preprocesar datos.
 """
 import pandas as pd
 import numpy as np
-from neo4j import GraphDatabase
+from neo4j import Driver
 import logging
+from .neo4j_driver import get_driver, ensure_driver
+from .query_profiler import run_query
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class DatabaseConnector:
@@ -30,22 +30,26 @@ class DatabaseConnector:
         self.is_connected = False
         
         try:
-            self.driver = GraphDatabase.driver(uri, auth=(user, password))
-            # Probar la conexión
-            with self.driver.session() as session:
-                session.run("RETURN 1")
+            if isinstance(uri, Driver):
+                # Se ha pasado directamente un driver ya creado
+                self.driver = uri
+                self.uri = None
+            else:
+                # Driver compartido del proceso (verifica la conectividad al crearse)
+                self.driver = get_driver(uri, user, password)
             self.is_connected = True
             logger.info("Conexión a Neo4j establecida correctamente")
         except Exception as e:
             logger.error(f"No se pudo conectar a Neo4j: {str(e)}")
     
-    def execute_query(self, query, params=None):
+    def execute_query(self, query, params=None, name='execute_query'):
         """
         Ejecuta una consulta en Neo4j.
         
         Args:
             query (str): Consulta Cypher a ejecutar
             params (dict, optional): Parámetros para la consulta
+            name (str): Nombre de la consulta en el perfilador
             
         Returns:
             list: Resultados de la consulta
@@ -56,7 +60,7 @@ class DatabaseConnector:
             
         try:
             with self.driver.session() as session:
-                result = session.run(query, params or {})
+                result = run_query(session, name, query, params or {})
                 return [record.data() for record in result]
         except Exception as e:
             logger.error(f"Error al ejecutar consulta: {str(e)}")
@@ -83,7 +87,7 @@ class DatabaseConnector:
                    u.password as password
             """
             with self.driver.session() as session:
-                result = session.run(query)
+                result = run_query(session, 'user_data', query)
                 data = [record.data() for record in result]
                 return pd.DataFrame(data)
         except Exception as e:
@@ -98,7 +102,7 @@ class DatabaseConnector:
             
         try:
             with self.driver.session() as session:
-                result = session.run("""
+                result = run_query(session, 'load_users', """
                 MATCH (u:User)
                 RETURN u.id AS user_id, 
                        u.username AS username,
@@ -152,7 +156,7 @@ class DatabaseConnector:
                    m.url as url
             """
             with self.driver.session() as session:
-                result = session.run(query)
+                result = run_query(session, 'moto_data', query)
                 data = [record.data() for record in result]
                 return pd.DataFrame(data)
         except Exception as e:
@@ -177,7 +181,7 @@ class DatabaseConnector:
                    r.rating as rating
             """
             with self.driver.session() as session:
-                result = session.run(query)
+                result = run_query(session, 'ratings_data', query)
                 data = [record.data() for record in result]
                 return pd.DataFrame(data)
         except Exception as e:
@@ -245,9 +249,9 @@ class DatabaseConnector:
             return False
     
     def close(self):
-        """Cierra la conexión a Neo4j."""
+        """Libera la conexión a Neo4j (el driver compartido se cierra al salir del proceso)."""
         if self.driver:
-            self.driver.close()
+            self.driver = None
             self.is_connected = False
     
     def get_motos(self):
@@ -258,7 +262,7 @@ class DatabaseConnector:
             
         try:
             with self.driver.session() as session:
-                result = session.run("""
+                result = run_query(session, 'load_motos', """
                 MATCH (m:Moto)
                 RETURN m.id AS moto_id, 
                        m.marca AS marca,
@@ -300,7 +304,7 @@ class DatabaseConnector:
             
         try:
             with self.driver.session() as session:
-                result = session.run("""
+                result = run_query(session, 'load_ratings', """
                 MATCH (u:User)-[r:RATED]->(m:Moto)
                 RETURN u.id AS user_id, 
                        m.id AS moto_id,
@@ -322,27 +326,16 @@ class DatabaseConnector:
     
     def _ensure_neo4j_connection(self):
         """Asegura que hay una conexión activa a Neo4j, reintentando si es necesario"""
-        if self.is_connected and self.driver:
-            try:
-                # Verificar que la conexión sigue siendo válida
-                with self.driver.session() as session:
-                    session.run("RETURN 1")
-                return True
-            except Exception:
-                self.is_connected = False
-                self.driver = None
-        
-        # Si no hay conexión, intentar conectar
-        try:
-            self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
-            with self.driver.session() as session:
-                session.run("RETURN 1")
-            self.is_connected = True
-            logger.info("Conexión a Neo4j restablecida correctamente")
-            return True
-        except Exception as e:
-            logger.error(f"No se pudo restaurar la conexión a Neo4j: {str(e)}")
+        driver = ensure_driver(self.driver, self.uri, self.user, self.password)
+        if driver is None:
+            self.is_connected = False
+            logger.error("No se pudo restaurar la conexión a Neo4j")
             return False
+        if driver is not self.driver:
+            logger.info("Conexión a Neo4j restablecida correctamente")
+        self.driver = driver
+        self.is_connected = True
+        return True
 
 
 class DataPreprocessor:
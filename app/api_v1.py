@@ -0,0 +1,422 @@
+"""
+API JSON versionada (``/api/v1``) para las recomendaciones.
+
+Expone las mismas llamadas al adaptador que las páginas ``/populares``,
+``/recomendaciones``, ``/motos-que-podrian-gustarte`` y ``/motos-recomendadas``,
+pero devuelve JSON con paginación ``limit``/``cursor`` y selección de campos
+(``fields=moto_id,marca,precio``).
+
+Cada respuesta lleva un ETag calculado a partir de la versión del ranking, de
+los datos cargados y del índice de amistades (más el usuario y los parámetros
+de la petición). El ETag se calcula antes de generar las recomendaciones, de
+modo que una petición con ``If-None-Match`` vigente responde 304 sin ejecutar
+ningún algoritmo. Esto exige que el ranking sea determinista para el mismo
+usuario y la misma versión de datos: la exploración del sistema híbrido se
+siembra con ambos en lugar de ser aleatoria.
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+from functools import wraps
+
+import numpy as np
+from flask import Blueprint, current_app, jsonify, request, session
+
+from .algoritmo.deadline import Deadline
+from .algoritmo.label_propagation import MotoLabelPropagation
+from .algoritmo.neo4j_async import get_async_dal
+from .algoritmo.query_profiler import profiler
+from .algoritmo.tracing import tracer
+from .routes_fixed import get_friend_graph, get_session_preferences, get_cached_popular_motos
+
+logger = logging.getLogger(__name__)
+
+api_v1 = Blueprint('api_v1', __name__)
+
+# Valores por defecto (se pueden sobrescribir con API_CONFIG en app/config.py)
+DEFAULT_API_CONFIG = {
+    'default_limit': 10,
+    'max_limit': 50,
+    # Resultados máximos que se generan por consulta (offset + limit)
+    'max_results': 100,
+    # Usuarios con acceso a los recursos de diagnóstico (trazas y consultas);
+    # en modo debug cualquier sesión iniciada puede consultarlos
+    'admin_users': []
+}
+
+# Los contadores de versión son locales al proceso: el ETag incluye una época
+# para que un worker nunca valide el ETag emitido por otro con otros datos
+_PROCESS_EPOCH = f"{os.getpid()}-{time.time_ns()}"
+
+
+class ApiError(Exception):
+    """Error de la API con su código HTTP."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api_v1.errorhandler(ApiError)
+def handle_api_error(error):
+    """Devuelve los errores de la API como JSON."""
+    return jsonify({'error': error.message}), error.status
+
+
+def api_login_required(f):
+    """Decorador que responde 401 en JSON si no hay sesión iniciada."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'username' not in session:
+            raise ApiError('Debes iniciar sesión', 401)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def api_admin_required(f):
+    """
+    Decorador para los recursos de diagnóstico: exige sesión y que la
+    aplicación esté en modo debug o que el usuario esté en ``admin_users``.
+    Responde 403 en JSON en otro caso.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'username' not in session:
+            raise ApiError('Debes iniciar sesión', 401)
+        if not current_app.debug and session['username'] not in get_api_config()['admin_users']:
+            raise ApiError('Acceso restringido a administradores', 403)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def get_api_config():
+    """Configuración de la API combinada con los valores por defecto."""
+    config = dict(DEFAULT_API_CONFIG)
+    config.update(current_app.config.get('API_CONFIG', {}))
+    return config
+
+
+# ---- Paginación y selección de campos ------------------------------------------
+
+def encode_cursor(offset):
+    """
+    Codifica una posición como cursor opaco.
+
+    Args:
+        offset (int): Posición del primer elemento de la siguiente página
+
+    Returns:
+        str: Cursor
+    """
+    return base64.urlsafe_b64encode(f"o:{offset}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decodifica un cursor generado por ``encode_cursor``.
+
+    Raises:
+        ApiError: Si el cursor no es válido
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        prefix, offset = base64.urlsafe_b64decode(padded.encode()).decode().split(':', 1)
+        offset = int(offset)
+        if prefix != 'o' or offset < 0:
+            raise ValueError(cursor)
+        return offset
+    except (ValueError, UnicodeDecodeError):
+        raise ApiError('Cursor no válido')
+
+
+def parse_pagination():
+    """
+    Lee ``limit`` y ``cursor`` de la petición.
+
+    Returns:
+        tuple: (offset, limit)
+    """
+    config = get_api_config()
+    limit = request.args.get('limit', config['default_limit'], type=int)
+    if limit is None or limit < 1 or limit > config['max_limit']:
+        raise ApiError(f"limit debe estar entre 1 y {config['max_limit']}")
+    cursor = request.args.get('cursor')
+    offset = decode_cursor(cursor) if cursor else 0
+    if offset + limit > config['max_results']:
+        raise ApiError(f"Solo se sirven los primeros {config['max_results']} resultados")
+    return offset, limit
+
+
+def parse_fields():
+    """
+    Lee la selección de campos (``fields=a,b,c``).
+
+    Returns:
+        list or None: Campos pedidos o None para devolver todos
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
+def _to_json_value(value):
+    """Convierte tipos de NumPy/pandas a tipos serializables."""
+    if isinstance(value, dict):
+        return {key: _to_json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json_value(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def select_fields(item, fields):
+    """Reduce un elemento a los campos pedidos."""
+    if fields is None:
+        return item
+    return {field: item[field] for field in fields if field in item}
+
+
+# ---- Versiones y ETags ---------------------------------------------------------
+
+def model_version():
+    """
+    Versión de los datos de los que dependen las recomendaciones.
+
+    Returns:
+        dict: Versiones del ranking global, del PageRank del adaptador,
+        de los datos cargados y del índice de amistades
+    """
+    adapter = current_app.config.get('MOTO_RECOMMENDER')
+    ranking = current_app.config.get('MOTO_RANKING')
+    friend_graph = getattr(adapter, 'friend_graph', None)
+    return {
+        'epoch': _PROCESS_EPOCH,
+        'ranking': getattr(ranking, 'version', None),
+        'pagerank': getattr(getattr(adapter, 'pagerank', None), 'version', None),
+        'data': getattr(adapter, 'data_version', None),
+        'friends': getattr(friend_graph, 'version', None)
+    }
+
+
+def compute_etag(endpoint, *parts):
+    """
+    Calcula el ETag de una respuesta sin generarla.
+
+    Args:
+        endpoint (str): Nombre del recurso
+        *parts: Valores adicionales que determinan la respuesta (usuario, preferencias...)
+
+    Returns:
+        str: ETag (sin comillas)
+    """
+    payload = json.dumps([endpoint, model_version(), sorted(request.args.items(multi=True)), parts],
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def not_modified(etag):
+    """Respuesta 304 si el cliente ya tiene la versión actual (o None)."""
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return None
+
+
+def paginated_response(items, offset, limit, fields, etag, meta=None):
+    """
+    Construye la respuesta JSON de una página.
+
+    Args:
+        items (list): Resultados desde la posición 0 (al menos offset + limit + 1 si hay más)
+        offset (int): Posición de la página
+        limit (int): Tamaño de la página
+        fields (list or None): Campos a devolver
+        etag (str): ETag de la respuesta
+        meta (dict, optional): Información adicional sobre cómo se generó la respuesta
+    """
+    page = items[offset:offset + limit]
+    has_next = len(items) > offset + limit and offset + limit < get_api_config()['max_results']
+    body = {
+        'data': [select_fields(_to_json_value(item), fields) for item in page],
+        'limit': limit,
+        'next_cursor': encode_cursor(offset + limit) if has_next else None,
+        'version': etag
+    }
+    if meta:
+        body['meta'] = meta
+    response = jsonify(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _get_adapter():
+    adapter = current_app.config.get('MOTO_RECOMMENDER')
+    if not adapter:
+        raise ApiError('El sistema de recomendaciones no está disponible', 503)
+    return adapter
+
+
+# ---- Recursos --------------------------------------------------------------------
+
+@api_v1.route('/populares')
+@api_login_required
+def populares():
+    """Motos populares según PageRank."""
+    offset, limit = parse_pagination()
+    fields = parse_fields()
+    etag = compute_etag('populares')
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    adapter = _get_adapter()
+    try:
+        motos = get_cached_popular_motos(adapter, offset + limit + 1)
+    except Exception as e:
+        logger.error(f"Error al obtener motos populares para la API: {str(e)}")
+        raise ApiError('No se pudieron obtener las motos populares', 500)
+    return paginated_response(motos or [], offset, limit, fields, etag)
+
+
+def _normalize_recommendation(recommendation):
+    """Convierte las tuplas (moto_id, score, reasons) del adaptador en diccionarios."""
+    if isinstance(recommendation, dict):
+        return recommendation
+    if isinstance(recommendation, tuple) and len(recommendation) >= 2:
+        reasons = recommendation[2] if len(recommendation) >= 3 else []
+        return {'moto_id': recommendation[0], 'score': recommendation[1], 'reasons': reasons}
+    return None
+
+
+@api_v1.route('/recomendaciones')
+@api_login_required
+def recomendaciones():
+    """Recomendaciones personalizadas a partir del test de preferencias."""
+    offset, limit = parse_pagination()
+    fields = parse_fields()
+    user_id = session.get('user_id')
+    preferences = get_session_preferences()
+    etag = compute_etag('recomendaciones', user_id, preferences)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    adapter = _get_adapter()
+    deadline = Deadline.from_config()
+    with tracer.trace('api.recomendaciones') as trace:
+        try:
+            recommendations = adapter.get_recommendations(user_id, algorithm='hybrid',
+                                                          top_n=offset + limit + 1,
+                                                          user_preferences=preferences,
+                                                          deadline=deadline)
+        except Exception as e:
+            logger.error(f"Error al generar recomendaciones para la API: {str(e)}")
+            raise ApiError('No se pudieron generar las recomendaciones', 500)
+        with tracer.span('api.hydration'):
+            items = [item for item in map(_normalize_recommendation, recommendations or []) if item is not None]
+            response = paginated_response(items, offset, limit, fields, etag,
+                                          meta={'dropped_sources': deadline.dropped} if deadline.dropped else None)
+    # La traza se puede consultar después en /api/v1/trazas/<trace_id>
+    response.headers['X-Trace-Id'] = trace.trace_id
+    if deadline.dropped:
+        # Respuesta parcial: no se debe revalidar como si fuera la completa
+        response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def _friends_of(user_id):
+    """Amigos del usuario desde el índice en memoria (o Neo4j como respaldo)."""
+    friend_graph = get_friend_graph()
+    if friend_graph is not None:
+        records = friend_graph.friend_records(user_id)
+    else:
+        dal = get_async_dal()
+        records = dal.run(dal.friends_of(user_id))[0]
+        if isinstance(records, Exception):
+            raise records
+    return [{"id": record["friend_id"], "username": record["friend_username"]} for record in records]
+
+
+@api_v1.route('/recomendaciones/amigos')
+@api_login_required
+def recomendaciones_amigos():
+    """Recomendaciones basadas en amigos (label propagation multi-amigo)."""
+    offset, limit = parse_pagination()
+    fields = parse_fields()
+    user_id = session.get('user_id')
+    etag = compute_etag('recomendaciones/amigos', user_id)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    _get_adapter()
+    try:
+        friends = _friends_of(user_id)
+        items = []
+        if friends:
+            label_propagation = MotoLabelPropagation()
+            label_propagation.initialize_from_interactions([])
+            items = label_propagation.get_multi_friend_recommendations(
+                user_id=user_id, friends_data=friends, top_n=offset + limit + 1)
+    except Exception as e:
+        logger.error(f"Error al generar recomendaciones de amigos para la API: {str(e)}")
+        raise ApiError('No se pudieron generar las recomendaciones de amigos', 500)
+    return paginated_response(items, offset, limit, fields, etag)
+
+
+@api_v1.route('/trazas')
+@api_admin_required
+def trazas():
+    """Últimas trazas de recomendación y latencias por etapa."""
+    limit = min(request.args.get('limit', 20, type=int) or 20, 200)
+    return jsonify({'traces': tracer.recent_traces(limit), 'stages': tracer.histograms()})
+
+
+@api_v1.route('/trazas/<trace_id>')
+@api_admin_required
+def traza(trace_id):
+    """Spans de una traza reciente (el ID llega en la cabecera X-Trace-Id)."""
+    trace = tracer.get_trace(trace_id)
+    if trace is None:
+        raise ApiError('Traza no encontrada', 404)
+    return jsonify(trace)
+
+
+@api_v1.route('/consultas')
+@api_admin_required
+def consultas():
+    """Estadísticas agregadas de las consultas a Neo4j (``sort`` = total_ms, avg_ms, p95_ms, count...)."""
+    sort_by = request.args.get('sort', 'total_ms')
+    limit = min(request.args.get('limit', 50, type=int) or 50, 500)
+    return jsonify({'queries': profiler.report(sort_by, limit),
+                    'slow_query_ms': profiler.config['slow_query_ms']})
+
+
+@api_v1.route('/consultas/<name>/plan', methods=['GET', 'POST'])
+@api_admin_required
+def consulta_plan(name):
+    """Último plan de PROFILE de una consulta; con POST se perfila su próxima ejecución."""
+    if not profiler.knows(name):
+        raise ApiError('Consulta desconocida', 404)
+    if request.method == 'POST':
+        max_times = profiler.config['max_profile_requests']
+        times = request.args.get('veces', 1, type=int) or 1
+        if times < 1 or times > max_times:
+            raise ApiError(f"veces debe estar entre 1 y {max_times}")
+        pending = profiler.profile_next(name, times)
+        return jsonify({'query': name, 'profile_pending': pending}), 202
+    plan = profiler.get_plan(name)
+    if plan is None:
+        raise ApiError('No hay plan capturado para esta consulta', 404)
+    return jsonify(plan)
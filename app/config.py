@@ -10,6 +10,111 @@ NEO4J_CONFIG = {
     'password': os.environ.get('NEO4J_PASSWORD', '22446688')
 }
 
+# Pool de conexiones del driver compartido (app/algoritmo/neo4j_driver.py)
+NEO4J_POOL_CONFIG = {
+    'max_connection_pool_size': int(os.environ.get('NEO4J_MAX_POOL_SIZE', 50)),
+    'connection_acquisition_timeout': float(os.environ.get('NEO4J_ACQUISITION_TIMEOUT', 30)),
+    'max_connection_lifetime': float(os.environ.get('NEO4J_MAX_CONNECTION_LIFETIME', 3600)),
+    # Conexiones ociosas más de estos segundos se verifican al reutilizarlas
+    'liveness_check_timeout': float(os.environ.get('NEO4J_LIVENESS_CHECK_TIMEOUT', 30)),
+    'connection_timeout': float(os.environ.get('NEO4J_CONNECTION_TIMEOUT', 15)),
+    # Intervalo mínimo entre verificaciones de conectividad del driver
+    'health_check_interval': float(os.environ.get('NEO4J_HEALTH_CHECK_INTERVAL', 30))
+}
+
+# Escritura de interacciones (likes / moto ideal)
+INTERACTION_WRITE_CONFIG = {
+    # Si es True, los likes se confirman al instante y se escriben en lotes UNWIND
+    'write_behind': os.environ.get('MOTOMATCH_LIKE_WRITE_BEHIND', '0') == '1',
+    # Segundos entre volcados del lote pendiente
+    'flush_interval': float(os.environ.get('MOTOMATCH_LIKE_FLUSH_INTERVAL', 2.0)),
+    # Número de cambios pendientes que fuerza un volcado inmediato
+    'max_batch': 500,
+    # Usuarios cuyo estado de likes se mantiene en memoria (LRU, por proceso)
+    'max_cached_users': int(os.environ.get('MOTOMATCH_LIKE_CACHE_USERS', 10000))
+}
+
+# Caché de respuestas de páginas globales (/populares, /moto-detail)
+RESPONSE_CACHE_CONFIG = {
+    'max_entries': int(os.environ.get('MOTOMATCH_RESPONSE_CACHE_SIZE', 256)),
+    # Acota los cambios hechos por otros procesos, que no invalidan esta caché
+    'ttl': float(os.environ.get('MOTOMATCH_RESPONSE_CACHE_TTL', 60))
+}
+
+# API JSON (/api/v1)
+API_CONFIG = {
+    'default_limit': 10,
+    'max_limit': 50,
+    # Resultados máximos generados por consulta (cursor + limit)
+    'max_results': 100,
+    # Usuarios que pueden ver trazas y estadísticas de consultas fuera de debug
+    'admin_users': [name.strip() for name in os.environ.get('MOTOMATCH_ADMIN_USERS', '').split(',')
+                    if name.strip()]
+}
+
+# Ejecución concurrente de las fuentes de recomendación (app/algoritmo/source_fanout.py)
+SOURCE_FANOUT_CONFIG = {
+    # Si es False, las fuentes se evalúan en serie
+    'parallel': os.environ.get('MOTOMATCH_PARALLEL_SOURCES', '1') == '1',
+    'max_workers': int(os.environ.get('MOTOMATCH_SOURCE_WORKERS', 4)),
+    # Fuentes en curso o en cola admitidas por pool (las abandonadas por
+    # tiempo siguen ocupando su hilo); por encima se descartan al momento
+    'max_pending': int(os.environ.get('MOTOMATCH_SOURCE_MAX_PENDING', 8)),
+    # Segundos máximos por fuente antes de descartarla
+    'timeout': 5.0,
+    'timeouts': {
+        'content': 3.0,
+        'collaborative': 2.0,
+        'knowledge': 1.0,
+        'popularity': 1.0,
+        'hybrid': 4.0,
+        'quantitative': 3.0
+    }
+}
+
+# Logging (app/algoritmo/log_config.py)
+LOGGING_CONFIG = {
+    'level': os.environ.get('MOTOMATCH_LOG_LEVEL', 'INFO'),
+    'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    # Niveles por subsistema (se completan con MOTOMATCH_LOG_LEVELS="evaluator=DEBUG,neo4j=WARNING")
+    'levels': {
+        'neo4j': 'WARNING'
+    },
+    # Las líneas por moto (nivel DEBUG) se escriben 1 de cada N
+    'item_sample_every': int(os.environ.get('MOTOMATCH_LOG_SAMPLE_EVERY', 50))
+}
+
+# Perfilado de consultas a Neo4j (app/algoritmo/query_profiler.py)
+QUERY_PROFILER_CONFIG = {
+    'enabled': os.environ.get('MOTOMATCH_QUERY_PROFILER', '1') == '1',
+    # Las consultas más lentas que esto (ida y vuelta) se registran como WARNING
+    'slow_query_ms': float(os.environ.get('MOTOMATCH_SLOW_QUERY_MS', 250)),
+    # Consultas que se ejecutan siempre con PROFILE (p. ej. MOTOMATCH_PROFILE_QUERIES="load_motos,likes_map")
+    'profile_queries': [name for name in os.environ.get('MOTOMATCH_PROFILE_QUERIES', '').split(',') if name],
+    # Planes de PROFILE que se conservan (uno por consulta)
+    'max_plans': 50,
+    # Ejecuciones con PROFILE pendientes como máximo por consulta (POST /api/v1/consultas/<name>/plan)
+    'max_profile_requests': 5,
+    # Parámetros numéricos que se muestran sin redactar en el log de consultas lentas
+    'log_params': ['limit', 'top_n', 'skip']
+}
+
+# Endpoint /metrics (formato de texto de Prometheus)
+METRICS_CONFIG = {
+    'enabled': os.environ.get('MOTOMATCH_METRICS', '1') == '1'
+}
+
+# Reordenación por diversidad de los sistemas híbridos (app/algoritmo/diversity.py)
+DIVERSITY_CONFIG = {
+    # Peso de la relevancia frente a la novedad (1 = solo relevancia)
+    'lambda': 0.8,
+    # Máximo de resultados con la misma marca / tipo
+    'caps': {
+        'marca': 2,
+        'tipo': 3
+    }
+}
+
 # Configuración de la aplicación
 APP_CONFIG = {
     'DEBUG': True,
@@ -29,7 +134,10 @@ RECOMMENDATION_CONFIG = {
     'collaborative_weight': 0.35,
     'feature_weight': 0.45,
     'contextual_weight': 0.2,
-    'model_path': 'models/'
+    'model_path': 'models/',
+    # Presupuesto de latencia (segundos) de una petición de recomendaciones;
+    # las fuentes que no terminen a tiempo se descartan
+    'latency_budget': float(os.environ.get('RECOMMENDATION_LATENCY_BUDGET', 3.0))
 }
 
 # Configuración general de la aplicación
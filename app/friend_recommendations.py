@@ -6,6 +6,7 @@ para recomendar motos ideales y motos con likes de otros usuarios.
 import logging
 from flask import session, flash, render_template, redirect, url_for, jsonify, current_app
 from .algoritmo.label_propagation import MotoLabelPropagation
+from .algoritmo.query_profiler import run_query
 from .utils import get_db_connection, get_friend_recommendations
 
 # Configurar logging
@@ -43,7 +44,7 @@ def get_friend_profile_recommendations(user_id, friend_id):
         # Inicializar el algoritmo con los datos del grafo
         with connector.driver.session() as session:
             # Obtener todas las interacciones del usuario y su amigo
-            result = session.run("""
+            result = run_query(session, 'friend_shared_likes', """
                 MATCH (u:User)-[r:INTERACTED]->(m:Moto)
                 WHERE u.id IN [$user_id, $friend_id] AND r.type = 'like'
                 RETURN u.id as user_id, m.id as moto_id, m.marca as marca, 
@@ -93,7 +94,7 @@ def get_friend_ideal_moto(friend_id, connector):
     try:
         # Consultar Neo4j para obtener la moto ideal del amigo
         with connector.driver.session() as session:
-            result = session.run("""
+            result = run_query(session, 'friend_ideal_moto', """
                 MATCH (u:User {id: $friend_id})-[r:IDEAL|IDEAL_MOTO]->(m:Moto)
                 RETURN m.id as moto_id, m.marca as marca, m.modelo as modelo, 
                        m.precio as precio, m.tipo as tipo, m.imagen as imagen,
@@ -140,7 +141,7 @@ def get_friend_liked_motos(friend_id, connector, limit=5):
     try:
         # Consultar Neo4j para obtener motos con likes del amigo
         with connector.driver.session() as session:
-            result = session.run("""
+            result = run_query(session, 'friend_liked_motos', """
                 MATCH (u:User {id: $friend_id})-[r:INTERACTED]->(m:Moto)
                 WHERE r.type = 'like'
                 RETURN m.id as moto_id, m.marca as marca, m.modelo as modelo, 
@@ -164,7 +165,7 @@ def get_friend_liked_motos(friend_id, connector, limit=5):
             
             # Si no hay interacciones, buscar relaciones LIKES
             if not liked_motos:
-                result = session.run("""
+                result = run_query(session, 'friend_likes_rel', """
                     MATCH (u:User {id: $friend_id})-[r:LIKES]->(m:Moto)
                     RETURN m.id as moto_id, m.marca as marca, m.modelo as modelo, 
                            m.precio as precio, m.tipo as tipo, m.imagen as imagen
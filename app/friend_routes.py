@@ -157,6 +157,7 @@ def friend_recommendations_view():
 def create_db_connector():
     """
     Helper function to create a database connector with proper parameters.
+    The connector reuses the process-wide Neo4j driver instead of opening a new pool.
     """
     try:
         from app.algoritmo.utils import DatabaseConnector
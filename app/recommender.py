@@ -5,8 +5,6 @@ Este módulo proporciona funciones para obtener recomendaciones utilizando el ad
 import logging
 from moto_adapter_fixed import MotoRecommenderAdapter
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def get_recommendations_for_user(app, user_id, top_n=5):
@@ -2,19 +2,227 @@ import os
 import logging
 import traceback
 import json
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, current_app, jsonify
+import time
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, current_app, jsonify, g
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from .utils import get_db_connection, login_required
 from .algoritmo.label_propagation import MotoLabelPropagation
+from .algoritmo.neo4j_async import get_async_dal
+from .algoritmo.query_profiler import run_query
+from .algoritmo.interaction_writer import InteractionWriter, ranking_listener
+from .algoritmo.friend_suggestions import FriendSuggestionService
+from .algoritmo.response_cache import ResponseCache, cache_listener, moto_tag
+from .algoritmo.popularity_baseline import popularity_listener
+from .algoritmo.metrics import metrics, record_cache_stats, REQUEST_LATENCY
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('routes_fixed')
 
 # Blueprint para rutas fijas (optimizado)
 fixed_routes = Blueprint('main', __name__)
 
+def get_interaction_writer():
+    """
+    Devuelve el servicio de escritura de likes/moto ideal de la aplicación,
+    creándolo la primera vez con el ranking global como listener.
+    """
+    writer = current_app.config.get('INTERACTION_WRITER')
+    if writer is not None:
+        return writer
+    
+    adapter = current_app.config.get('MOTO_RECOMMENDER')
+    
+    def get_driver():
+        if adapter is None:
+            return None
+        if hasattr(adapter, '_ensure_neo4j_connection') and not adapter._ensure_neo4j_connection():
+            return None
+        return getattr(adapter, 'driver', None)
+    
+    moto_lookup = getattr(adapter, 'get_moto_record', None)
+    counters = getattr(adapter, 'like_counters', None)
+    
+    config = current_app.config.get('INTERACTION_WRITE_CONFIG', {})
+    writer = InteractionWriter(get_driver,
+                               write_behind=config.get('write_behind', False),
+                               flush_interval=config.get('flush_interval', 2.0),
+                               max_batch=config.get('max_batch', 500),
+                               moto_lookup=moto_lookup,
+                               counters=counters,
+                               max_cached_users=config.get('max_cached_users', 10000))
+    
+    # Mantener el ranking global al día de forma síncrona
+    ranking = current_app.config.get('MOTO_RANKING')
+    if ranking is not None and hasattr(ranking, 'add_user_interaction'):
+        writer.add_listener(ranking_listener(ranking))
+    
+    # Mantener la popularidad precalculada del sistema híbrido
+    hybrid_system = getattr(getattr(adapter, 'moto_ideal', None), 'hybrid_system', None)
+    if hybrid_system is not None and hasattr(hybrid_system, 'popularity'):
+        writer.add_listener(popularity_listener(hybrid_system.popularity))
+    
+    # Descartar las respuestas cacheadas que dependen del like o la moto ideal
+    writer.add_listener(cache_listener(get_response_cache()))
+    
+    current_app.config['INTERACTION_WRITER'] = writer
+    return writer
+
+def get_response_cache():
+    """Devuelve la caché de respuestas de la aplicación (se crea la primera vez)."""
+    cache = current_app.config.get('RESPONSE_CACHE')
+    if cache is None:
+        config = current_app.config.get('RESPONSE_CACHE_CONFIG', {})
+        cache = ResponseCache(max_entries=config.get('max_entries', 256), ttl=config.get('ttl', 60.0))
+        current_app.config['RESPONSE_CACHE'] = cache
+    return cache
+
+def ranking_snapshot_version():
+    """
+    Versión del estado global del que dependen las páginas cacheadas.
+    
+    Returns:
+        tuple: (versión del ranking global, versión de los datos del adaptador)
+    """
+    ranking = current_app.config.get('MOTO_RANKING')
+    adapter = current_app.config.get('MOTO_RECOMMENDER')
+    return (getattr(ranking, 'version', None), getattr(adapter, 'data_version', None))
+
+def get_cached_popular_motos(adapter, top_n):
+    """
+    Motos populares del adaptador, cacheadas por versión del ranking.
+    
+    Args:
+        adapter: Adaptador de recomendaciones
+        top_n (int): Número de motos
+        
+    Returns:
+        list: Motos populares (como ``adapter.get_popular_motos``)
+    """
+    return get_response_cache().get_or_set(
+        'popular_motos', top_n, lambda: adapter.get_popular_motos(top_n=top_n),
+        version=ranking_snapshot_version())
+
+def get_friend_suggestions():
+    """Devuelve el servicio de sugerencias de amistad de la aplicación (se crea la primera vez)."""
+    service = current_app.config.get('FRIEND_SUGGESTIONS')
+    if service is None:
+        adapter = current_app.config.get('MOTO_RECOMMENDER')
+        
+        def get_driver():
+            if adapter is None:
+                return None
+            if hasattr(adapter, '_ensure_neo4j_connection') and not adapter._ensure_neo4j_connection():
+                return None
+            return getattr(adapter, 'driver', None)
+        
+        service = FriendSuggestionService(get_driver)
+        current_app.config['FRIEND_SUGGESTIONS'] = service
+    return service
+
+def get_friend_graph():
+    """Índice de amistades en memoria del adaptador (None si no está cargado)."""
+    adapter = current_app.config.get('MOTO_RECOMMENDER')
+    if adapter is None or not hasattr(adapter, 'get_friend_graph'):
+        return None
+    graph = adapter.get_friend_graph()
+    return graph if graph.loaded else None
+
+def get_session_preferences(test_data=None):
+    """
+    Preferencias del test del usuario actual.
+    
+    Usa las preferencias corregidas guardadas en la sesión o, si no existen,
+    las infiere desde ``test_data``.
+    
+    Args:
+        test_data (dict, optional): Datos del test (por defecto los de la sesión)
+        
+    Returns:
+        dict: Preferencias para ``adapter.get_recommendations``
+    """
+    if test_data is None:
+        test_data = session.get('test_data', {})
+    
+    # Verificar si existen preferencias corregidas en la sesión
+    preferences_corregidas = session.get('preferences_corregidas')
+    
+    if preferences_corregidas:
+        # Usar las preferencias ya corregidas
+        preferences = preferences_corregidas
+        logger.info("Usando preferencias corregidas desde la sesión")
+    else:
+        # Si no existen, crearlas aquí mismo con la lógica de inferencia
+        estilos_data = test_data.get('estilos', {})
+        tipo_inferido = ''
+        if estilos_data:
+            if 'naked' in estilos_data:
+                tipo_inferido = 'Naked'
+            elif 'sport' in estilos_data:
+                tipo_inferido = 'Deportiva'
+            elif 'cruiser' in estilos_data:
+                tipo_inferido = 'Cruiser'
+            else:
+                tipo_inferido = 'Mixto'
+        
+        experiencia_inferida = 'Avanzado'  # Inferir desde datos disponibles
+        
+        preferences = {
+            'tipo': tipo_inferido,
+            'experiencia': experiencia_inferida,
+            'uso_principal': 'Mixto',
+            'presupuesto_min': test_data.get('presupuesto_min', 0),
+            'presupuesto_max': test_data.get('presupuesto_max', 100000),
+            'cilindrada_min': test_data.get('cilindrada_min', 0),
+            'cilindrada_max': test_data.get('cilindrada_max', 2000),
+            'ano_min': test_data.get('ano_min', 2000),
+            'ano_max': test_data.get('ano_max', 2025),
+            'estilos': test_data.get('estilos', {}),
+            'marcas': test_data.get('marcas', {}),
+            'peso_min': test_data.get('peso_min', 0),
+            'peso_max': test_data.get('peso_max', 500),
+            'potencia_min': test_data.get('potencia_min', 0),
+            'potencia_max': test_data.get('potencia_max', 300),
+            'torque_min': test_data.get('torque_min', 0),
+            'torque_max': test_data.get('torque_max', 200),
+        }
+        logger.info("Creadas preferencias corregidas desde test_data")
+    
+    return preferences
+
+@fixed_routes.before_app_request
+def start_request_timer():
+    """Marca el inicio de cada petición (de cualquier blueprint) para medir su latencia."""
+    g.request_started = time.monotonic()
+
+@fixed_routes.after_app_request
+def record_request_latency(response):
+    """Registra la latencia por ruta (la plantilla de la URL, no la URL concreta)."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_LATENCY.observe(time.monotonic() - started, route=route,
+                                method=request.method, status=response.status_code)
+    return response
+
+@fixed_routes.route('/metrics')
+def metrics_endpoint():
+    """Métricas de la aplicación en formato de texto de Prometheus."""
+    if not current_app.config.get('METRICS_CONFIG', {}).get('enabled', True):
+        return "Métricas desactivadas", 404
+    
+    # Estadísticas que se leen en el momento de la consulta
+    cache = current_app.config.get('RESPONSE_CACHE')
+    if cache is not None:
+        record_cache_stats('response', cache.stats())
+    adapter = current_app.config.get('MOTO_RECOMMENDER')
+    if adapter is not None and hasattr(adapter, 'report_metrics'):
+        try:
+            adapter.report_metrics()
+        except Exception as e:
+            logger.error(f"Error al obtener las métricas del adaptador: {str(e)}")
+    
+    return current_app.response_class(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @fixed_routes.route('/')
 @fixed_routes.route('/home')
 def home():
@@ -148,7 +356,7 @@ def register():
                     with adapter.driver.session() as neo4j_session:
                         # Verificar primero que la conexión funciona
                         try:
-                            test_result = neo4j_session.run("RETURN 'test' as test").single()
+                            test_result = run_query(neo4j_session, 'connection_test', "RETURN 'test' as test").single()
                             if not test_result:
                                 logger.error("La prueba de conexión a Neo4j falló")
                                 flash('Error: Problema de conexión con la base de datos.')
@@ -160,7 +368,7 @@ def register():
                         
                         # Crear el usuario
                         try:
-                            neo4j_session.run(
+                            run_query(neo4j_session, 'create_user',
                                 """
                                 CREATE (u:User {id: $user_id, username: $username, password: $password})
                                 """,
@@ -207,6 +415,13 @@ def populares():
     
     logger.info("🔍 DEBUG: Entrando a la función populares()")
     
+    # La página es igual para todos los usuarios: servirla desde la caché si el ranking no ha cambiado
+    cache = get_response_cache()
+    version = ranking_snapshot_version()
+    cached_page = cache.get('populares', 'html', version)
+    if cached_page is not None:
+        return cached_page
+    
     adapter = current_app.config.get('MOTO_RECOMMENDER')
     
     if not adapter:
@@ -218,7 +433,7 @@ def populares():
     try:
         # Primero intentar usar get_popular_motos del adaptador
         if hasattr(adapter, 'get_popular_motos'):
-            motos_populares = adapter.get_popular_motos(top_n=6)
+            motos_populares = get_cached_popular_motos(adapter, 6)
             logger.info(f"✅ Obtenidas {len(motos_populares)} motos del adaptador")
         else:
             # Si no existe, usar la función de utils como fallback
@@ -232,9 +447,10 @@ def populares():
     
     # DEBUG: Ver qué datos recibimos
     if motos_populares:
-        logger.info(f"🔍 Primera moto cruda: {motos_populares[0]}")
+        logger.debug("🔍 Primera moto cruda: %s", motos_populares[0])
     
-    # DATOS DE EMERGENCIA si no hay motos
+    # DATOS DE EMERGENCIA si no hay motos (la página de emergencia no se cachea)
+    cacheable = bool(motos_populares)
     if not motos_populares:
         logger.warning("⚠️ No se obtuvieron motos del backend, usando datos de emergencia")
         motos_populares = [
@@ -292,11 +508,15 @@ def populares():
         motos_formateadas.append(moto_formateada)
         
         # DEBUG: Ver moto formateada
-        logger.info(f"🔍 Moto {i+1} formateada: {moto_formateada}")
+        logger.debug("🔍 Moto %d formateada: %s", i + 1, moto_formateada)
     
-    logger.info(f"🔍 DEBUG: Enviando {len(motos_formateadas)} motos al template")
+    logger.debug("🔍 Enviando %d motos al template", len(motos_formateadas))
     
-    return render_template('populares.html', motos_populares=motos_formateadas)
+    page = render_template('populares.html', motos_populares=motos_formateadas)
+    if cacheable:
+        cache.set('populares', 'html', page, version,
+                  tags=[moto_tag(moto['moto_id']) for moto in motos_formateadas])
+    return page
 
 @fixed_routes.route('/test')
 def test():
@@ -339,7 +559,7 @@ def moto_ideal():
             adapter._ensure_neo4j_connection()
             with adapter.driver.session() as neo4j_session:                # Consulta mejorada para obtener directamente toda la información de la moto
                 # Ordenamos por timestamp para obtener la relación más reciente
-                result = neo4j_session.run(
+                result = run_query(neo4j_session, 'user_ideal_moto',
                     """
                     MATCH (u:User {id: $user_id})-[r:IDEAL]->(m:Moto)
                     RETURN m.id as moto_id, m.marca as marca, m.modelo as modelo, 
@@ -389,19 +609,17 @@ def moto_ideal():
                     }
                     
                     # Si no tenemos toda la información de la moto desde Neo4j, intentar completar desde el DataFrame
-                    if adapter.motos_df is not None:
-                        moto_info = adapter.motos_df[adapter.motos_df['moto_id'] == moto_id]
-                        if not moto_info.empty:
-                            moto_row = moto_info.iloc[0]
-                            # Actualizar campos adicionales si están disponibles en el DataFrame
-                            if 'año' in moto_row:
-                                moto["año"] = moto_row.get('año')
-                            if 'URL' in moto_row:
-                                moto["URL"] = moto_row.get('URL')
+                    moto_row = adapter.get_moto_record(moto_id) if hasattr(adapter, 'get_moto_record') else None
+                    if moto_row is not None:
+                        # Actualizar campos adicionales si están disponibles en el catálogo
+                        if 'año' in moto_row:
+                            moto["año"] = int(moto_row.get('año'))
+                        if 'URL' in moto_row:
+                            moto["URL"] = moto_row.get('URL')
                     
                     # Contar likes de la moto desde Neo4j
                     try:
-                        likes_result = neo4j_session.run(
+                        likes_result = run_query(neo4j_session, 'moto_like_count',
                             """
                             MATCH (u:User)-[r:INTERACTED]->(m:Moto {id: $moto_id})
                             WHERE r.type = 'like'
@@ -673,50 +891,8 @@ def recomendaciones():
         motos_recomendadas = []
         logger.info("Usando sistema de recomendaciones basado en test de preferencias")
         
-        # ✅ CAMBIAR ESTA SECCIÓN COMPLETA:
-        # Verificar si existen preferencias corregidas en la sesión
-        preferences_corregidas = session.get('preferences_corregidas')
-        
-        if preferences_corregidas:
-            # Usar las preferencias ya corregidas
-            preferences = preferences_corregidas
-            logger.info("Usando preferencias corregidas desde la sesión")
-        else:
-            # Si no existen, crearlas aquí mismo con la lógica de inferencia
-            estilos_data = test_data.get('estilos', {})
-            tipo_inferido = ''
-            if estilos_data:
-                if 'naked' in estilos_data:
-                    tipo_inferido = 'Naked'
-                elif 'sport' in estilos_data:
-                    tipo_inferido = 'Deportiva'
-                elif 'cruiser' in estilos_data:
-                    tipo_inferido = 'Cruiser'
-                else:
-                    tipo_inferido = 'Mixto'
-            
-            experiencia_inferida = 'Avanzado'  # Inferir desde datos disponibles
-            
-            preferences = {
-                'tipo': tipo_inferido,
-                'experiencia': experiencia_inferida,
-                'uso_principal': 'Mixto',
-                'presupuesto_min': test_data.get('presupuesto_min', 0),
-                'presupuesto_max': test_data.get('presupuesto_max', 100000),
-                'cilindrada_min': test_data.get('cilindrada_min', 0),
-                'cilindrada_max': test_data.get('cilindrada_max', 2000),
-                'ano_min': test_data.get('ano_min', 2000),
-                'ano_max': test_data.get('ano_max', 2025),
-                'estilos': test_data.get('estilos', {}),
-                'marcas': test_data.get('marcas', {}),
-                'peso_min': test_data.get('peso_min', 0),
-                'peso_max': test_data.get('peso_max', 500),
-                'potencia_min': test_data.get('potencia_min', 0),
-                'potencia_max': test_data.get('potencia_max', 300),
-                'torque_min': test_data.get('torque_min', 0),
-                'torque_max': test_data.get('torque_max', 200),
-            }
-            logger.info("Creadas preferencias corregidas desde test_data")
+        # Preferencias corregidas de la sesión (o inferidas desde test_data)
+        preferences = get_session_preferences(test_data)
         
         # El resto del código permanece igual...
         recomendaciones = adapter.get_recommendations(
@@ -776,13 +952,17 @@ def motos_que_podrian_gustarte():
             flash("Error: Sistema de recomendación no disponible")
             return redirect(url_for('main.dashboard'))
             
-        # Obtener lista de amigos
+        # Obtener lista de amigos (del índice en memoria si está cargado)
         friends = []
-        if hasattr(adapter, '_ensure_neo4j_connection'):
+        friend_graph = get_friend_graph()
+        if friend_graph is not None:
+            friends = [{"id": record["friend_id"], "username": record["friend_username"]}
+                       for record in friend_graph.friend_records(user_id)]
+        elif hasattr(adapter, '_ensure_neo4j_connection'):
             adapter._ensure_neo4j_connection()
             with adapter.driver.session() as db_session:
                 # Buscar amigos del usuario
-                result = db_session.run("""
+                result = run_query(db_session, 'user_friends', """
                     MATCH (u:User {id: $user_id})-[:FRIEND|FRIEND_OF]->(f:User)
                     RETURN f.id as friend_id, f.username as friend_username
                 """, user_id=user_id)
@@ -810,7 +990,7 @@ def motos_que_podrian_gustarte():
                 # Obtener la URL de la moto desde Neo4j
                 try:
                     with adapter.driver.session() as neo4j_session:
-                        url_result = neo4j_session.run("""
+                        url_result = run_query(neo4j_session, 'moto_url', """
                             MATCH (m:Moto {id: $moto_id})
                             RETURN m.url as url
                         """, moto_id=rec["moto_id"])
@@ -903,17 +1083,26 @@ def friends():
                                  title="Sistema no disponible",
                                  error="El sistema de recomendaciones no está disponible en este momento.")
         
-        # Obtener los amigos actuales del usuario desde Neo4j
-        amigos = []
+        # Amigos y likes son consultas independientes: se lanzan a la vez.
+        # El último like de cada usuario sale de los contadores materializados si están cargados.
         if hasattr(adapter, '_ensure_neo4j_connection'):
             adapter._ensure_neo4j_connection()
-            with adapter.driver.session() as neo4j_session:
-                # Consultar amigos desde Neo4j (relación FRIEND_OF)
-                result = neo4j_session.run("""
-                    MATCH (u:User {id: $user_id})-[:FRIEND|:FRIEND_OF]->(a:User)
-                    RETURN a.username as amigo
-                """, user_id=user_id)
-                amigos = [record['amigo'] for record in result if record['amigo']]
+        counters = adapter.get_like_counters() if hasattr(adapter, 'get_like_counters') else None
+        use_counters = counters is not None and counters.loaded
+        friend_graph = get_friend_graph()
+        amigos_result, likes_result = get_async_dal().friends_page(
+            user_id, include_likes=not use_counters, include_friends=friend_graph is None)
+        if friend_graph is not None:
+            amigos_result = friend_graph.friend_records(user_id)
+        if use_counters:
+            likes_result = counters.last_likes()
+        
+        # Obtener los amigos actuales del usuario desde Neo4j
+        amigos = []
+        if isinstance(amigos_result, Exception):
+            logger.error(f"Error al obtener amigos de Neo4j: {str(amigos_result)}")
+        else:
+            amigos = [record['friend_username'] for record in amigos_result if record['friend_username']]
         
         # Si no hay amigos en Neo4j, usar la variable en memoria como respaldo
         if not amigos:
@@ -922,58 +1111,39 @@ def friends():
             # Actualizar la variable en memoria para mantenerla sincronizada
             amigos_por_usuario_fixed[username] = amigos
         
-        # Obtener todos los usuarios reales de la base de datos
-        todos_usuarios = []
-        if hasattr(adapter, 'users_df') and adapter.users_df is not None:
-            todos_usuarios = adapter.users_df['username'].tolist()
-        else:
-            # Si no podemos acceder al DataFrame, intentar consultar directamente a Neo4j
-            try:
-                if hasattr(adapter, '_ensure_neo4j_connection'):
-                    adapter._ensure_neo4j_connection()
-                    with adapter.driver.session() as neo4j_session:
-                        result = neo4j_session.run("""
-                            MATCH (u:User)
-                            RETURN u.username as username
-                        """)
-                        todos_usuarios = [record['username'] for record in result]
-            except Exception as e:
-                logger.error(f"Error al obtener usuarios de Neo4j: {str(e)}")
-                # Usuarios de respaldo si falla la consulta
-                todos_usuarios = ["motoloco", "roadrider", "bikerboy", "racer99", "motogirl", "speedking"]
-        
-        # Filtrar sugerencias para que no incluyan al usuario actual ni a sus amigos actuales
-        sugerencias = [u for u in todos_usuarios if u != username and u not in amigos]
-          # Datos de likes por usuario para mostrar en el popup
-        motos_likes = {}
-        
-        # Obtener los likes reales de la base de datos
+        # Sugerencias ordenadas por amigos en común y likes compartidos, paginadas
+        page = request.args.get('page', 1, type=int)
         try:
-            if hasattr(adapter, '_ensure_neo4j_connection'):
-                adapter._ensure_neo4j_connection()
-                with adapter.driver.session() as neo4j_session:
-                    result = neo4j_session.run("""
-                        MATCH (u:User)-[r:INTERACTED]->(m:Moto)
-                        WHERE r.type = 'like'
-                        RETURN u.username as username, m.marca as marca, m.modelo as modelo
-                    """)
-                    for record in result:
-                        if record['username'] and record['marca'] and record['modelo']:
-                            motos_likes[record['username']] = f"{record['marca']} {record['modelo']}"
+            sugerencias_page = get_friend_suggestions().get_page(user_id, page=page, exclude=amigos + [username])
         except Exception as e:
-            logger.error(f"Error al obtener likes de motos: {str(e)}")
+            logger.error(f"Error al obtener sugerencias de amistad: {str(e)}")
+            # Usuarios de respaldo si falla la consulta
+            respaldo = ["motoloco", "roadrider", "bikerboy", "racer99", "motogirl", "speedking"]
+            sugerencias_page = {
+                'items': [{'username': u, 'mutual_friends': 0, 'shared_likes': 0, 'score': 0.0}
+                          for u in respaldo if u != username and u not in amigos],
+                'page': 1, 'page_size': len(respaldo), 'has_next': False, 'total': len(respaldo)
+            }
+        sugerencias = [item['username'] for item in sugerencias_page['items']]
+        
+        # Datos de likes por usuario para mostrar en el popup
+        if isinstance(likes_result, Exception):
+            logger.error(f"Error al obtener likes de motos: {str(likes_result)}")
             # Datos de respaldo si falla la consulta
             motos_likes = {
                 "motoloco": "Yamaha MT-07",
                 "roadrider": "Ducati Monster",
                 "bikerboy": "Honda CBR 600RR",
-                "admin": "Kawasaki Ninja ZX-10R"            }
+                "admin": "Kawasaki Ninja ZX-10R"}
+        else:
+            motos_likes = likes_result
             
         # Usar la plantilla que incluye soporte para las recomendaciones de amigos
         return render_template('friends_with_recommendations.html', 
                             username=username,
                             amigos=amigos,
                             sugerencias=sugerencias,
+                            sugerencias_page=sugerencias_page,
                             motos_likes=motos_likes)
         
     except Exception as e:
@@ -1020,7 +1190,7 @@ def agregar_amigo():
             
             with adapter.driver.session() as neo4j_session:
                 # Primero buscamos el ID del amigo
-                result = neo4j_session.run("""
+                result = run_query(neo4j_session, 'user_id_by_username', """
                     MATCH (u:User {username: $username})
                     RETURN u.id as amigo_id
                 """, username=nuevo_amigo_username)
@@ -1030,12 +1200,15 @@ def agregar_amigo():
                     amigo_id = record['amigo_id']
                     
                     # Crear relación de amistad
-                    neo4j_session.run("""
+                    run_query(neo4j_session, 'add_friend', """
                         MATCH (u1:User {id: $user_id}), (u2:User {id: $amigo_id})
                         MERGE (u1)-[:FRIEND_OF]->(u2)
                     """, user_id=user_id, amigo_id=amigo_id)
                     
                     logger.info(f"Usuario {username} agregó a {nuevo_amigo_username} como amigo")
+                    get_friend_suggestions().invalidate(user_id, amigo_id)
+                    if hasattr(adapter, 'add_friendship'):
+                        adapter.add_friendship(user_id, amigo_id, username, nuevo_amigo_username)
     except Exception as e:
         logger.error(f"Error al guardar amistad en Neo4j: {str(e)}")
     
@@ -1091,7 +1264,7 @@ def eliminar_amigo():
             
             with adapter.driver.session() as neo4j_session:
                 # Primero buscamos el ID del amigo
-                result = neo4j_session.run("""
+                result = run_query(neo4j_session, 'user_id_by_username', """
                     MATCH (u:User {username: $username})
                     RETURN u.id as amigo_id
                 """, username=amigo_username)
@@ -1101,12 +1274,15 @@ def eliminar_amigo():
                     amigo_id = record['amigo_id']
                     
                     # Eliminar relación de amistad
-                    neo4j_session.run("""
+                    run_query(neo4j_session, 'remove_friend', """
                         MATCH (u1:User {id: $user_id})-[r:FRIEND_OF]->(u2:User {id: $amigo_id})
                         DELETE r
                     """, user_id=user_id, amigo_id=amigo_id)
                     
                     logger.info(f"Usuario {username} eliminó a {amigo_username} como amigo")
+                    get_friend_suggestions().invalidate(user_id, amigo_id)
+                    if hasattr(adapter, 'remove_friendship'):
+                        adapter.remove_friendship(user_id, amigo_id)
     except Exception as e:
         logger.error(f"Error al eliminar amistad en Neo4j: {str(e)}")
     
@@ -1165,7 +1341,7 @@ def motos_recomendadas():
                 if adapter and hasattr(adapter, '_ensure_neo4j_connection'):
                     adapter._ensure_neo4j_connection()
                     with adapter.driver.session() as neo4j_session:
-                        result = neo4j_session.run("""
+                        result = run_query(neo4j_session, 'user_id_by_username', """
                             MATCH (u:User {username: $username})
                             RETURN u.id as user_id
                         """, username=username)
@@ -1193,17 +1369,17 @@ def motos_recomendadas():
                 flash('No se pudo conectar a la base de datos. Intente más tarde.', 'error')
                 return redirect(url_for('main.dashboard'))
             
-            # Obtener lista de amigos usando el adaptador
-            friends = []
-            with adapter.driver.session() as db_session:
-                # Modificar para buscar tanto FRIEND como FRIEND_OF relaciones
-                result = db_session.run("""
-                    MATCH (u:User {id: $user_id})-[:FRIEND|FRIEND_OF]->(f:User)
-                    RETURN f.id as friend_id, f.username as friend_username
-                """, user_id=user_id)
-                
-                friends = [{"id": record["friend_id"], "username": record["friend_username"]} 
-                          for record in result]
+            # Obtener lista de amigos (relaciones FRIEND y FRIEND_OF), del índice en memoria si está cargado
+            dal = get_async_dal()
+            friend_graph = get_friend_graph()
+            if friend_graph is not None:
+                friends_result = friend_graph.friend_records(user_id)
+            else:
+                friends_result = dal.run(dal.friends_of(user_id))[0]
+            if isinstance(friends_result, Exception):
+                raise friends_result
+            friends = [{"id": record["friend_id"], "username": record["friend_username"]} 
+                      for record in friends_result]
             
             # Si no hay amigos, mostrar página con mensaje
             if not friends:
@@ -1220,25 +1396,22 @@ def motos_recomendadas():
                 friends_data=friends,
                 top_n=10
             )
-              # Convertir al formato esperado por la plantilla
+            # URLs de todas las motos recomendadas en una sola consulta
+            urls = dal.run(dal.moto_urls([rec["moto_id"] for rec in propagation_motos]))[0]
+            if isinstance(urls, Exception):
+                logger.warning(f"Error al obtener URLs de motos: {str(urls)}")
+                urls = None
+            
+            # Convertir al formato esperado por la plantilla
             formatted_propagation_motos = []
             for rec in propagation_motos:
-                # Obtener la URL de la moto desde Neo4j
-                try:
-                    with adapter.driver.session() as neo4j_session:
-                        url_result = neo4j_session.run("""
-                            MATCH (m:Moto {id: $moto_id})
-                            RETURN m.url as url
-                        """, moto_id=rec["moto_id"])
-                        url_record = url_result.single()
-                        if url_record and url_record['url']:
-                            rec["url"] = url_record['url']
-                        else:
-                            logger.warning(f"URL no encontrada para moto {rec['moto_id']}")
-                            rec["url"] = "https://example.com/default-url"  # Use a more meaningful default URL
-                except Exception as e:
-                    logger.warning(f"Error al obtener URL para moto {rec['moto_id']}: {str(e)}")
+                if urls is None:
                     rec["url"] = "https://example.com/error-url"  # Use a fallback URL in case of error
+                elif urls.get(rec["moto_id"]):
+                    rec["url"] = urls[rec["moto_id"]]
+                else:
+                    logger.warning(f"URL no encontrada para moto {rec['moto_id']}")
+                    rec["url"] = "https://example.com/default-url"  # Use a more meaningful default URL
 
                 formatted_propagation_motos.append({
                     "friend_name": "Múltiples amigos",  # Indicar que viene de múltiples fuentes
@@ -1276,7 +1449,7 @@ def motos_recomendadas():
             friends = []
             with connector.driver.session() as db_session:
                 # Modificar para buscar tanto FRIEND como FRIEND_OF relaciones
-                result = db_session.run("""
+                result = run_query(db_session, 'user_friends', """
                     MATCH (u:User {id: $user_id})-[:FRIEND|FRIEND_OF]->(f:User)
                     RETURN f.id as friend_id, f.username as friend_username
                 """, user_id=user_id)
@@ -1319,40 +1492,47 @@ def moto_detail(moto_id):
         if not adapter:
             flash('Sistema de recomendaciones no disponible.', 'error')
             return redirect(url_for('main.dashboard'))
-          # Asegurar conexión a Neo4j
+        
+        # La ficha no depende del usuario; se invalida al cambiar los likes de la moto
+        cache = get_response_cache()
+        version = getattr(adapter, 'data_version', None)
+        cached_page = cache.get('moto_detail', moto_id, version)
+        if cached_page is not None:
+            return cached_page
+        
+        # Asegurar conexión a Neo4j
         adapter._ensure_neo4j_connection()
         
-        moto_details = None
-        with adapter.driver.session() as neo4j_session:
-            result = neo4j_session.run("""
-                MATCH (m:Moto {id: $moto_id})
-                RETURN m {.*} as moto
-            """, moto_id=moto_id)
-            
-            record = result.single()
-            if record and record['moto']:
-                moto_details = record['moto']
-                # Asegurar que URL esté presente, si no establecer valor por defecto
-                if 'URL' not in moto_details or not moto_details['URL']:
-                    logger.warning(f"URL no encontrada para moto {moto_id}")
-                    moto_details['URL'] = "#"  # URL por defecto
+        # El número de likes sale de los contadores materializados; si no están
+        # disponibles, detalles y número de likes se consultan en paralelo
+        counters = adapter.get_like_counters() if hasattr(adapter, 'get_like_counters') else None
+        like_count = counters.get_like_count(moto_id) if counters is not None else None
+        dal = get_async_dal()
+        if like_count is not None:
+            moto_details = dal.run(dal.moto_details(moto_id))[0]
+        else:
+            moto_details, like_count = dal.moto_detail_page(moto_id)
+        if isinstance(moto_details, Exception):
+            raise moto_details
+        
+        if moto_details:
+            # Asegurar que URL esté presente, si no establecer valor por defecto
+            if 'URL' not in moto_details or not moto_details['URL']:
+                logger.warning(f"URL no encontrada para moto {moto_id}")
+                moto_details['URL'] = "#"  # URL por defecto
         
         if not moto_details:
             flash('Moto no encontrada.', 'error')
             return redirect(url_for('main.dashboard'))
             
-        # Obtener información adicional como likes, comentarios, etc.
-        with adapter.driver.session() as neo4j_session:
-            # Contar likes
-            likes_result = neo4j_session.run("""
-                MATCH (u:User)-[r:INTERACTED]->(m:Moto {id: $moto_id})
-                WHERE r.type = 'like'
-                RETURN count(r) as like_count
-            """, moto_id=moto_id)
-            like_record = likes_result.single()
-            moto_details['likes'] = like_record['like_count'] if like_record else 0
-            
-        return render_template('moto_detail.html', moto=moto_details)
+        # Información adicional como likes
+        if isinstance(like_count, Exception):
+            logger.warning(f"Error al contar likes de la moto {moto_id}: {str(like_count)}")
+            like_count = 0
+        moto_details['likes'] = like_count
+        
+        page = render_template('moto_detail.html', moto=moto_details)
+        return cache.set('moto_detail', moto_id, page, version, tags=[moto_tag(moto_id)])
         
     except Exception as e:
         logger.error(f"Error al mostrar detalles de la moto {moto_id}: {str(e)}")
@@ -1389,52 +1569,22 @@ def marcar_moto_ideal():
         if not hasattr(adapter, '_ensure_neo4j_connection') or not adapter._ensure_neo4j_connection():
             return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'})
         
-        with adapter.driver.session() as neo4j_session:
-            # Primero obtener el ID del usuario desde la base de datos
-            user_result = neo4j_session.run(
-                "MATCH (u:User {username: $username}) RETURN u.id as user_id",
-                username=username
-            )
-            user_record = user_result.single()
-            
-            if not user_record:
-                return jsonify({'success': False, 'error': 'Usuario no encontrado en la base de datos'})
-            
-            db_user_id = user_record['user_id']
-            
-            # Verificar que la moto existe
-            moto_result = neo4j_session.run(
-                "MATCH (m:Moto {id: $moto_id}) RETURN m.id as moto_id",
-                moto_id=moto_id
-            )
-            if not moto_result.single():
-                return jsonify({'success': False, 'error': 'Moto no encontrada'})
-            
-            # Eliminar cualquier relación IDEAL existente (solo una moto ideal por usuario)
-            neo4j_session.run(
-                "MATCH (u:User {id: $user_id})-[r:IDEAL]->(:Moto) DELETE r",
-                user_id=db_user_id
-            )
-            
-            # Crear nueva relación IDEAL
-            reasons = [
-                "Seleccionada desde recomendaciones",
-                "Coincide con tus preferencias",
-                "Recomendada por nuestro sistema"
-            ]
-            reasons_json = json.dumps(reasons)
-            
-            neo4j_session.run("""
-                MATCH (u:User {id: $user_id})
-                MATCH (m:Moto {id: $moto_id})
-                CREATE (u)-[r:IDEAL]->(m)
-                SET r.score = 100.0,
-                    r.reasons = $reasons,
-                    r.timestamp = timestamp()
-            """, user_id=db_user_id, moto_id=moto_id, reasons=reasons_json)
-            
-            logger.info(f"Moto {moto_id} marcada como ideal para usuario {username}")
-            return jsonify({'success': True, 'message': 'Moto marcada como ideal exitosamente'})
+        # Crear nueva relación IDEAL (sustituye la anterior en la misma transacción)
+        reasons = [
+            "Seleccionada desde recomendaciones",
+            "Coincide con tus preferencias",
+            "Recomendada por nuestro sistema"
+        ]
+        reasons_json = json.dumps(reasons)
+        
+        result = get_interaction_writer().set_ideal(username, moto_id, reasons_json)
+        if result['status'] == 'user_not_found':
+            return jsonify({'success': False, 'error': 'Usuario no encontrado en la base de datos'})
+        if result['status'] == 'moto_not_found':
+            return jsonify({'success': False, 'error': 'Moto no encontrada'})
+        
+        logger.info(f"Moto {moto_id} marcada como ideal para usuario {username}")
+        return jsonify({'success': True, 'message': 'Moto marcada como ideal exitosamente'})
             
     except Exception as e:
         logger.error(f"Error al marcar moto como ideal: {str(e)}")
@@ -1470,57 +1620,19 @@ def dar_like_moto():
         if not hasattr(adapter, '_ensure_neo4j_connection') or not adapter._ensure_neo4j_connection():
             return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'})
         
-        with adapter.driver.session() as neo4j_session:
-            # Obtener el ID del usuario desde la base de datos
-            user_result = neo4j_session.run(
-                "MATCH (u:User {username: $username}) RETURN u.id as user_id",
-                username=username
-            )
-            user_record = user_result.single()
-            
-            if not user_record:
-                return jsonify({'success': False, 'error': 'Usuario no encontrado en la base de datos'})
-            
-            db_user_id = user_record['user_id']
-            
-            # Verificar que la moto existe
-            moto_result = neo4j_session.run(
-                "MATCH (m:Moto {id: $moto_id}) RETURN m.id as moto_id",
-                moto_id=moto_id
-            )
-            if not moto_result.single():
-                return jsonify({'success': False, 'error': 'Moto no encontrada'})
-            
-            # Verificar si ya existe un like
-            existing_like = neo4j_session.run("""
-                MATCH (u:User {id: $user_id})-[r:INTERACTED]->(m:Moto {id: $moto_id})
-                WHERE r.type = 'like'
-                RETURN r
-            """, user_id=db_user_id, moto_id=moto_id)
-            
-            if existing_like.single():
-                # NUEVO: Si ya existe, quitar el like
-                neo4j_session.run("""
-                    MATCH (u:User {id: $user_id})-[r:INTERACTED]->(m:Moto {id: $moto_id})
-                    WHERE r.type = 'like'
-                    DELETE r
-                """, user_id=db_user_id, moto_id=moto_id)
-                
-                logger.info(f"Like removido de moto {moto_id} por usuario {username}")
-                return jsonify({'success': True, 'action': 'unliked', 'message': 'Like removido'})
-            else:
-                # Crear nuevo like (código existente)
-                neo4j_session.run("""
-                    MATCH (u:User {id: $user_id})
-                    MATCH (m:Moto {id: $moto_id})
-                    CREATE (u)-[r:INTERACTED]->(m)
-                    SET r.type = 'like',
-                        r.weight = 3.0,
-                        r.timestamp = timestamp()
-                """, user_id=db_user_id, moto_id=moto_id)
-                
-                logger.info(f"Like dado a moto {moto_id} por usuario {username}")
-                return jsonify({'success': True, 'action': 'liked', 'message': 'Like registrado'})
+        # Alternar el like en una sola sentencia (si ya existe, se quita)
+        result = get_interaction_writer().toggle_like(username, moto_id)
+        if result['status'] == 'user_not_found':
+            return jsonify({'success': False, 'error': 'Usuario no encontrado en la base de datos'})
+        if result['status'] == 'moto_not_found':
+            return jsonify({'success': False, 'error': 'Moto no encontrada'})
+        
+        if result['status'] == 'unliked':
+            logger.info(f"Like removido de moto {moto_id} por usuario {username}")
+            return jsonify({'success': True, 'action': 'unliked', 'message': 'Like removido'})
+        
+        logger.info(f"Like dado a moto {moto_id} por usuario {username}")
+        return jsonify({'success': True, 'action': 'liked', 'message': 'Like registrado'})
         
     except Exception as e:
         error_response = {'success': False, 'error': str(e)}
@@ -1557,34 +1669,16 @@ def quitar_like_moto():
         if not hasattr(adapter, '_ensure_neo4j_connection') or not adapter._ensure_neo4j_connection():
             return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'})
         
-        with adapter.driver.session() as neo4j_session:
-            # Obtener el ID del usuario desde la base de datos
-            user_result = neo4j_session.run(
-                "MATCH (u:User {username: $username}) RETURN u.id as user_id",
-                username=username
-            )
-            user_record = user_result.single()
-            
-            if not user_record:
-                return jsonify({'success': False, 'error': 'Usuario no encontrado en la base de datos'})
-            
-            db_user_id = user_record['user_id']
-            
-            # Eliminar la relación INTERACTED de tipo 'like'
-            result = neo4j_session.run("""
-                MATCH (u:User {id: $user_id})-[r:INTERACTED]->(m:Moto {id: $moto_id})
-                WHERE r.type = 'like'
-                DELETE r
-                RETURN count(r) as deleted_count
-            """, user_id=db_user_id, moto_id=moto_id)
-            
-            deleted_count = result.single()['deleted_count']
-            
-            if deleted_count > 0:
-                logger.info(f"Like quitado de moto {moto_id} por usuario {username}")
-                return jsonify({'success': True, 'message': 'Like quitado exitosamente'})
-            else:
-                return jsonify({'success': False, 'error': 'No se encontró like para quitar'})
+        # Eliminar la relación INTERACTED de tipo 'like'
+        result = get_interaction_writer().remove_like(username, moto_id)
+        if result['status'] == 'user_not_found':
+            return jsonify({'success': False, 'error': 'Usuario no encontrado en la base de datos'})
+        
+        if result['status'] == 'removed':
+            logger.info(f"Like quitado de moto {moto_id} por usuario {username}")
+            return jsonify({'success': True, 'message': 'Like quitado exitosamente'})
+        else:
+            return jsonify({'success': False, 'error': 'No se encontró like para quitar'})
             
     except Exception as e:
         logger.error(f"Error al quitar like de la moto: {str(e)}")
@@ -1620,61 +1714,25 @@ def like_moto():
         if not adapter or not hasattr(adapter, 'driver'):
             return jsonify({'success': False, 'error': 'No hay conexión a la base de datos'}), 500
         
-        # Procesar el like en Neo4j
-        with adapter.driver.session() as neo_session:
-            # Si no tenemos user_id, obtenerlo del username
-            if not user_id and username:
-                user_result = neo_session.run("""
-                    MATCH (u:Usuario {username: $username})
-                    RETURN u.user_id as user_id
-                """, username=username)
-                user_record = user_result.single()
-                if user_record:
-                    user_id = user_record['user_id']
-                    session['user_id'] = user_id
-            
-            if not user_id:
-                return jsonify({'success': False, 'error': 'No se pudo identificar al usuario'}), 400
-            
-            # Verificar si ya existe el like
-            check_result = neo_session.run("""
-                MATCH (u:Usuario {user_id: $user_id})-[r:LIKES]->(m:Moto {id: $moto_id})
-                RETURN r
-            """, user_id=user_id, moto_id=moto_id)
-            
-            if check_result.single():
-                # Ya existe el like, quitarlo (unlike)
-                neo_session.run("""
-                    MATCH (u:Usuario {user_id: $user_id})-[r:LIKES]->(m:Moto {id: $moto_id})
-                    DELETE r
-                """, user_id=user_id, moto_id=moto_id)
-                
-                current_app.logger.info(f"✅ Like removido: {user_id} -> {moto_id}")
-                return jsonify({'success': True, 'action': 'unliked', 'message': 'Like removido'})
-            else:
-                # No existe, crear el like
-                neo_session.run("""
-                    MATCH (u:Usuario {user_id: $user_id})
-                    MATCH (m:Moto {id: $moto_id})
-                    MERGE (u)-[r:LIKES]->(m)
-                    SET r.timestamp = datetime()
-                """, user_id=user_id, moto_id=moto_id)
-                
-                current_app.logger.info(f"✅ Like agregado: {user_id} -> {moto_id}")
-                
-                # Actualizar ranking si está disponible
-                ranking = current_app.config.get('MOTO_RANKING')
-                if ranking:
-                    try:
-                        ranking.add_user_interaction(user_id, moto_id, 'like')
-                        current_app.logger.info("✅ Ranking actualizado con el like")
-                    except Exception as ranking_error:
-                        current_app.logger.warning(f"⚠️ No se pudo actualizar ranking: {ranking_error}")
-                
-                # NUEVO: Log la respuesta que se está enviando
-                response = {'success': True, 'action': 'liked', 'message': 'Like registrado'}
-                logger.info(f"📤 Enviando respuesta: {response}")
-                return jsonify(response)
+        # Procesar el like en Neo4j (una sola sentencia; el ranking se actualiza vía listener)
+        result = get_interaction_writer().toggle_legacy_like(user_id, username, moto_id)
+        if result['status'] == 'not_found':
+            return jsonify({'success': False, 'error': 'No se pudo identificar al usuario'}), 400
+        
+        if result.get('user_id') and not user_id:
+            session['user_id'] = result['user_id']
+        user_id = result.get('user_id') or user_id
+        
+        if result['status'] == 'unliked':
+            current_app.logger.info(f"✅ Like removido: {user_id} -> {moto_id}")
+            return jsonify({'success': True, 'action': 'unliked', 'message': 'Like removido'})
+        
+        current_app.logger.info(f"✅ Like agregado: {user_id} -> {moto_id}")
+        
+        # NUEVO: Log la respuesta que se está enviando
+        response = {'success': True, 'action': 'liked', 'message': 'Like registrado'}
+        logger.info(f"📤 Enviando respuesta: {response}")
+        return jsonify(response)
         
     except Exception as e:
         error_response = {'success': False, 'error': str(e)}
@@ -9,8 +9,6 @@ import traceback
 from flask import current_app, g, redirect, url_for, session, flash
 from functools import wraps
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def login_required(f):
@@ -5,21 +5,33 @@ import os
 import time
 import traceback
 import json
-from neo4j import GraphDatabase
+from app.algoritmo.neo4j_driver import get_driver, ensure_driver
 from app.algoritmo.pagerank import MotoPageRank
 from app.algoritmo.label_propagation import MotoLabelPropagation
 from app.algoritmo.moto_ideal import MotoIdealRecommender
 from app.algoritmo.utils import DatabaseConnector, DataPreprocessor
+from app.algoritmo.id_registry import reset_id_space
+from app.algoritmo.moto_record import MotoCatalog, iter_moto_records
+from app.algoritmo.like_counters import LikeCounterCache, backfill_missing_like_counters
+from app.algoritmo.friend_graph import FriendGraphIndex
+from app.algoritmo.deadline import Deadline
+from app.algoritmo.tracing import tracer
+from app.algoritmo.metrics import ALGORITHM_LATENCY, CATALOG_SIZE
+from app.algoritmo.query_profiler import run_query
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('MotoRecommenderAdapter')
 
 class MotoRecommenderAdapter:
     """Adaptador que integra diferentes algoritmos de recomendación para motos."""
     
-    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="22446688"):
-        """Inicializa el adaptador con parámetros de conexión."""
+    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="22446688", load_on_init=True):
+        """
+        Inicializa el adaptador con parámetros de conexión.
+        
+        Args:
+            load_on_init (bool): Si es False no se cargan los datos al construir
+                el adaptador (p. ej. al adjuntarse a un catálogo compartido)
+        """
         self.neo4j_uri = uri
         self.neo4j_user = user
         self.neo4j_password = password
@@ -41,6 +53,19 @@ class MotoRecommenderAdapter:
         self.motos_df = None
         self.ratings_df = None
         
+        # Catálogo de MotoRecord derivado de motos_df (se reconstruye si cambia)
+        self._moto_catalog = None
+        self._moto_catalog_source = None
+        
+        # Contadores de likes materializados (réplica en memoria)
+        self.like_counters = LikeCounterCache()
+        
+        # Índice de amistades en memoria (CSR sobre los ids internos)
+        self.friend_graph = FriendGraphIndex()
+        
+        # Versión de los datos cargados (cambia con cada recarga desde Neo4j)
+        self.data_version = 0
+        
         # Configuración
         self.allow_mock_data = False  # Solo usar datos de Neo4j
         
@@ -62,25 +87,16 @@ class MotoRecommenderAdapter:
         self.connect_to_neo4j()
         
         # Cargar datos inmediatamente
-        self.load_data()
+        if load_on_init:
+            self.load_data()
         
     def connect_to_neo4j(self, max_retries=3, timeout=10):
-        """Establecer conexión robusta a Neo4j."""
-        from neo4j import GraphDatabase
-        
+        """Establecer conexión robusta a Neo4j usando el driver compartido del proceso."""
         for attempt in range(max_retries):
             try:
                 logger.info(f"Intento {attempt+1}/{max_retries} de conexión a Neo4j: {self.neo4j_uri}")
-                self.driver = GraphDatabase.driver(
-                    self.neo4j_uri, 
-                    auth=(self.neo4j_user, self.neo4j_password)
-                )
-                
-                # Test connection
-                with self.driver.session() as session:
-                    result = session.run("RETURN 'Conexión exitosa' as mensaje")
-                    message = result.single()["mensaje"]
-                    logger.info(f"Neo4j: {message}")
+                # get_driver verifica la conectividad al crear el driver
+                self.driver = get_driver(self.neo4j_uri, self.neo4j_user, self.neo4j_password)
                 
                 logger.info("Conexión a Neo4j establecida exitosamente")
                 return True
@@ -102,34 +118,31 @@ class MotoRecommenderAdapter:
             if not self.driver:
                 return self.connect_to_neo4j(max_retries=1)
                 
-            with self.driver.session() as session:
-                result = session.run("RETURN 'Test exitoso' as mensaje")
-                message = result.single()["mensaje"]
-                logger.info(f"Test de conexión a Neo4j: {message}")
-                return True
+            self.driver.verify_connectivity()
+            logger.info("Test de conexión a Neo4j exitoso")
+            return True
         except Exception as e:
             logger.error(f"Error en test de conexión: {str(e)}")
             return False
     
     def _ensure_neo4j_connection(self):
-        """Asegura que hay una conexión activa a Neo4j o intenta reconectar."""
+        """
+        Asegura que hay una conexión activa a Neo4j o intenta reconectar.
+        
+        No lanza una consulta de prueba por petición: el proveedor compartido
+        solo verifica la conectividad periódicamente y el pool comprueba las
+        conexiones ociosas al reutilizarlas.
+        """
         try:
             if not self.driver:
                 logger.warning("No hay un driver de Neo4j, intentando conectar...")
-                return self.connect_to_neo4j()
+                return self.connect_to_neo4j(max_retries=1)
             
-            # Probar la conexión existente
-            with self.driver.session() as session:
-                try:
-                    result = session.run("RETURN 'Conexión verificada' as mensaje")
-                    message = result.single()["mensaje"]
-                    logger.debug(f"Neo4j conexión verificada: {message}")
-                    return True
-                except Exception as session_error:
-                    logger.warning(f"Error con la sesión actual: {str(session_error)}. Reconectando...")
-                    self.driver.close()
-                    self.driver = None
-                    return self.connect_to_neo4j()
+            driver = ensure_driver(self.driver, self.neo4j_uri, self.neo4j_user, self.neo4j_password)
+            if driver is not self.driver:
+                logger.warning("El driver de Neo4j dejó de responder; se ha reemplazado")
+            self.driver = driver
+            return driver is not None
         except Exception as e:
             logger.error(f"Error al verificar conexión Neo4j: {str(e)}")
             return False
@@ -147,7 +160,8 @@ class MotoRecommenderAdapter:
         
         try:
             # Intentar cargar datos reales desde Neo4j
-            success = self._load_from_neo4j()
+            with tracer.span('adapter.load_data'):
+                success = self._load_from_neo4j()
             if success:
                 self.logger.info(f"Datos cargados desde Neo4j: {len(self.motos_df)} motos, {len(self.users_df)} usuarios, {len(self.ratings_df)} ratings")
                 
@@ -214,22 +228,12 @@ class MotoRecommenderAdapter:
         return False
     
     def connect_to_neo4j(self, max_retries=3, timeout=10):
-        """Establecer conexión robusta a Neo4j."""
-        from neo4j import GraphDatabase
-        
+        """Establecer conexión robusta a Neo4j usando el driver compartido del proceso."""
         for attempt in range(max_retries):
             try:
                 logger.info(f"Intento {attempt+1}/{max_retries} de conexión a Neo4j: {self.neo4j_uri}")
-                self.driver = GraphDatabase.driver(
-                    self.neo4j_uri, 
-                    auth=(self.neo4j_user, self.neo4j_password)
-                )
-                
-                # Test connection
-                with self.driver.session() as session:
-                    result = session.run("RETURN 'Conexión exitosa' as mensaje")
-                    message = result.single()["mensaje"]
-                    logger.info(f"Neo4j: {message}")
+                # get_driver verifica la conectividad al crear el driver
+                self.driver = get_driver(self.neo4j_uri, self.neo4j_user, self.neo4j_password)
                 
                 logger.info("Conexión a Neo4j establecida exitosamente")
                 return True
@@ -251,34 +255,31 @@ class MotoRecommenderAdapter:
             if not self.driver:
                 return self.connect_to_neo4j(max_retries=1)
                 
-            with self.driver.session() as session:
-                result = session.run("RETURN 'Test exitoso' as mensaje")
-                message = result.single()["mensaje"]
-                logger.info(f"Test de conexión a Neo4j: {message}")
-                return True
+            self.driver.verify_connectivity()
+            logger.info("Test de conexión a Neo4j exitoso")
+            return True
         except Exception as e:
             logger.error(f"Error en test de conexión: {str(e)}")
             return False
     
     def _ensure_neo4j_connection(self):
-        """Asegura que hay una conexión activa a Neo4j o intenta reconectar."""
+        """
+        Asegura que hay una conexión activa a Neo4j o intenta reconectar.
+        
+        No lanza una consulta de prueba por petición: el proveedor compartido
+        solo verifica la conectividad periódicamente y el pool comprueba las
+        conexiones ociosas al reutilizarlas.
+        """
         try:
             if not self.driver:
                 logger.warning("No hay un driver de Neo4j, intentando conectar...")
-                return self.connect_to_neo4j()
+                return self.connect_to_neo4j(max_retries=1)
             
-            # Probar la conexión existente
-            with self.driver.session() as session:
-                try:
-                    result = session.run("RETURN 'Conexión verificada' as mensaje")
-                    message = result.single()["mensaje"]
-                    logger.debug(f"Neo4j conexión verificada: {message}")
-                    return True
-                except Exception as session_error:
-                    logger.warning(f"Error con la sesión actual: {str(session_error)}. Reconectando...")
-                    self.driver.close()
-                    self.driver = None
-                    return self.connect_to_neo4j()
+            driver = ensure_driver(self.driver, self.neo4j_uri, self.neo4j_user, self.neo4j_password)
+            if driver is not self.driver:
+                logger.warning("El driver de Neo4j dejó de responder; se ha reemplazado")
+            self.driver = driver
+            return driver is not None
         except Exception as e:
             logger.error(f"Error al verificar conexión Neo4j: {str(e)}")
             return False
@@ -296,7 +297,8 @@ class MotoRecommenderAdapter:
         
         try:
             # Intentar cargar datos reales desde Neo4j
-            success = self._load_from_neo4j()
+            with tracer.span('adapter.load_data'):
+                success = self._load_from_neo4j()
             if success:
                 self.logger.info(f"Datos cargados desde Neo4j: {len(self.motos_df)} motos, {len(self.users_df)} usuarios, {len(self.ratings_df)} ratings")
                 
@@ -372,7 +374,7 @@ class MotoRecommenderAdapter:
                 logger.error("No se pudo conectar a Neo4j. La aplicación requiere Neo4j.")
                 raise ConnectionError("No hay conexión a Neo4j")
                 
-            # Usar DatabaseConnector para obtener datos
+            # Usar DatabaseConnector para obtener datos (cada consulta queda en el perfilador)
             db_connector = DatabaseConnector(self.driver)
             self.users_df = db_connector.get_users()
             self.motos_df = db_connector.get_motos()
@@ -385,6 +387,9 @@ class MotoRecommenderAdapter:
             
             logger.info(f"Datos cargados desde Neo4j: {len(self.motos_df)} motos, {len(self.users_df)} usuarios, {len(self.ratings_df)} ratings")
             
+            # Asignar ids enteros compartidos por todos los algoritmos para esta carga
+            self.id_space = reset_id_space(self.users_df.get('user_id', []), self.motos_df.get('moto_id', []))
+            
             # Inicializar algoritmos con los datos de Neo4j
             if hasattr(self.pagerank, 'build_graph'):
                 # Preparar datos para PageRank
@@ -415,6 +420,14 @@ class MotoRecommenderAdapter:
             except Exception as e:
                 logger.warning(f"Error al cargar relaciones de amistad: {str(e)}")
             
+            # Contadores de likes que falten en datos antiguos: se materializan
+            # aquí, al cargar, para que la recarga de la caché sea solo lectura
+            try:
+                backfill_missing_like_counters(self.driver)
+            except Exception as e:
+                logger.warning(f"Error al materializar contadores de likes: {str(e)}")
+            
+            self.data_version += 1
             return True
             
         except Exception as e:
@@ -426,34 +439,45 @@ class MotoRecommenderAdapter:
             raise RuntimeError("No se pudieron cargar datos desde Neo4j")
     
     def _load_friendships_from_neo4j(self):
-        """Carga relaciones de amistad entre usuarios desde Neo4j."""
+        """Carga relaciones de amistad entre usuarios desde Neo4j en el índice en memoria."""
         logger.info("Cargando relaciones de amistad desde Neo4j...")
         
         try:
-            with self.driver.session() as session:
-                result = session.run("""
-                MATCH (u1:User)-[:FRIEND]->(u2:User)
-                RETURN u1.id AS user_id, u2.id AS friend_id
-                """)
-                
-                friendships_data = []
-                for record in result:
-                    friendships_data.append({
-                        'user_id': record['user_id'],
-                        'friend_id': record['friend_id']
-                    })
-                
-                self.friendships_df = pd.DataFrame(friendships_data)
-                logger.info(f"Relaciones de amistad cargadas: {len(self.friendships_df)}")
+            loaded = self.friend_graph.load(self.driver)
+            if not loaded:
+                raise RuntimeError("No se pudo cargar el índice de amistades")
+            
+            # El grafo social de label propagation sale del índice, sin otra consulta
+            self.label_propagation.load_social_graph(self.friend_graph)
+            self.friendships_df = self.friend_graph.to_dataframe()
+            logger.info(f"Relaciones de amistad cargadas: {len(self.friendships_df)}")
                 
         except Exception as e:
             logger.error(f"Error al cargar relaciones de amistad: {str(e)}")
             self.friendships_df = pd.DataFrame(columns=['user_id', 'friend_id'])
     
-    def get_recommendations(self, user_id, algorithm='hybrid', top_n=5, save_to_db=False, user_preferences=None, **kwargs):
+    def get_recommendations(self, user_id, algorithm='hybrid', top_n=5, save_to_db=False, user_preferences=None,
+                            deadline=None, **kwargs):
         """
         Obtiene recomendaciones utilizando el algoritmo especificado.
+        
+        Args:
+            deadline (Deadline, optional): Presupuesto de latencia de la petición
+                (por defecto RECOMMENDATION_CONFIG['latency_budget']). Lo que se
+                descarta por él queda en ``deadline.dropped``, propio de la petición.
         """
+        if deadline is None:
+            deadline = Deadline.from_config()
+        # Traza de la petición (se une a la de la ruta si ya hay una abierta)
+        with tracer.trace('recommendations'), \
+                tracer.span('adapter.recommendations', algorithm=algorithm, top_n=top_n) as span:
+            with ALGORITHM_LATENCY.time(algorithm=algorithm):
+                recommendations = self._dispatch_recommendations(user_id, algorithm, top_n, user_preferences, deadline)
+            span.set(results=len(recommendations or []))
+            return recommendations
+    
+    def _dispatch_recommendations(self, user_id, algorithm, top_n, user_preferences, deadline):
+        """Genera las recomendaciones con el algoritmo pedido (ver get_recommendations)."""
         logger.info(f"Obteniendo recomendaciones para user_id={user_id} usando {algorithm}")
         logger.info(f"Preferencias recibidas: {user_preferences}")
         
@@ -467,7 +491,7 @@ class MotoRecommenderAdapter:
             logger.warning(f"Usuario {user_id} no encontrado")
             # Si tenemos preferencias, podemos usarlas directamente aunque el usuario no exista
             if user_preferences:
-                return self._get_recommendations_with_preferences(user_id, user_preferences, top_n)
+                return self._get_recommendations_with_preferences(user_id, user_preferences, top_n, deadline)
             return []
         
         # Obtener recomendaciones según el algoritmo
@@ -490,18 +514,19 @@ class MotoRecommenderAdapter:
             elif algorithm == 'hybrid' or algorithm == 'moto_ideal':
                 # Si tenemos preferencias específicas del test, usarlas
                 if user_preferences:
-                    return self._get_recommendations_with_preferences(user_id, user_preferences, top_n)
+                    return self._get_recommendations_with_preferences(user_id, user_preferences, top_n, deadline)
                 # De lo contrario, usar el método normal
-                return self.moto_ideal.get_recommendations(user_id, top_n)
+                return self.moto_ideal.get_recommendations(user_id, top_n, deadline=deadline)
             else:
                 logger.warning(f"Algoritmo desconocido: {algorithm}, usando moto_ideal")
-                return self.moto_ideal.get_recommendations(user_id, top_n)
+                return self.moto_ideal.get_recommendations(user_id, top_n, deadline=deadline)
         except Exception as e:
             logger.error(f"Error al generar recomendaciones: {str(e)}")
             return []
     
-    def _get_recommendations_with_preferences(self, user_id, preferences, top_n=5):
+    def _get_recommendations_with_preferences(self, user_id, preferences, top_n=5, deadline=None):
         """Genera recomendaciones personalizadas basadas en preferencias específicas del test."""
+        deadline = Deadline.ensure(deadline)
         logger.info(f"Calculando recomendaciones para {user_id} con preferencias: {preferences}")
         
         # Extraer parámetros de preferencias
@@ -542,222 +567,231 @@ class MotoRecommenderAdapter:
         logger.info(f"Torque: {torque_min_tolerancia:.0f} - {torque_max_tolerancia:.0f}")
         logger.info(f"Peso: {peso_min_tolerancia:.0f} - {peso_max_tolerancia:.0f}")
           # FILTROS ESTRICTOS: Solo motos que cumplan TODOS los requisitos
-        filtered_motos = self.motos_df.copy()
-        
-        # PASO 1: FILTROS DE PREFERENCIAS (PRIORIDAD ALTA)
-        # Filtro por estilo preferido (aplicar PRIMERO)
-        if estilos_preferidos:
-            estilo_filter = filtered_motos['tipo'].str.lower().isin(estilos_preferidos.keys())
-            filtered_motos = filtered_motos[estilo_filter]
-            logger.info(f"Después de filtro por estilo {list(estilos_preferidos.keys())}: {len(filtered_motos)} motos")
-            
-            if filtered_motos.empty:
-                logger.warning(f"No hay motos del estilo preferido. Relajando filtro de estilo...")
-                filtered_motos = self.motos_df.copy()
-        
-        # Filtro por marca preferida (aplicar SEGUNDO)
-        if marcas_preferidas and not filtered_motos.empty:
-            marca_filter = filtered_motos['marca'].str.lower().isin(marcas_preferidas.keys())
-            filtered_motos_marca = filtered_motos[marca_filter]
-            
-            if not filtered_motos_marca.empty:
-                filtered_motos = filtered_motos_marca
-                logger.info(f"Después de filtro por marca {list(marcas_preferidas.keys())}: {len(filtered_motos)} motos")
-            else:
-                logger.warning(f"No hay motos de la marca preferida en el estilo elegido. Manteniendo filtro de estilo...")
-        
-        # PASO 2: FILTROS TÉCNICOS (aplicar después de preferencias)
-        # Filtro por presupuesto (estricto con 10% tolerancia)
-        filtered_motos = filtered_motos[
-            (filtered_motos['precio'] >= presupuesto_min_tolerancia) & 
-            (filtered_motos['precio'] <= presupuesto_max_tolerancia)
-        ]
-        
-        # Filtro por cilindrada (estricto con 10% tolerancia)
-        if 'cilindrada' in filtered_motos.columns:
-            filtered_motos = filtered_motos[
-                (filtered_motos['cilindrada'] >= cilindrada_min_tolerancia) & 
-                (filtered_motos['cilindrada'] <= cilindrada_max_tolerancia)
-            ]
-        
-        # Filtro por potencia (estricto con 10% tolerancia)
-        if 'potencia' in filtered_motos.columns:
-            filtered_motos = filtered_motos[
-                (filtered_motos['potencia'] >= potencia_min_tolerancia) & 
-                (filtered_motos['potencia'] <= potencia_max_tolerancia)
-            ]
-        
-        # Filtro por torque (estricto con 10% tolerancia)
-        if 'torque' in filtered_motos.columns:
-            filtered_motos = filtered_motos[
-                (filtered_motos['torque'] >= torque_min_tolerancia) & 
-                (filtered_motos['torque'] <= torque_max_tolerancia)
-            ]
-        
-        # Filtro por peso (estricto con 10% tolerancia)
-        if 'peso' in filtered_motos.columns:
-            filtered_motos = filtered_motos[
-                (filtered_motos['peso'] >= peso_min_tolerancia) & 
-                (filtered_motos['peso'] <= peso_max_tolerancia)
-            ]
-            logger.info(f"Motos que cumplen TODOS los filtros (preferencias + técnicos): {len(filtered_motos)} de {len(self.motos_df)}")
-        if filtered_motos.empty:
-            logger.warning(f"No hay motos que cumplan TODOS los filtros. Aplicando filtros relajados...")
-            
-            # FILTROS RELAJADOS: Mantener preferencias de estilo/marca pero relajar especificaciones técnicas
+        with tracer.span('adapter.filtering') as span:
             filtered_motos = self.motos_df.copy()
-            
-            # SIEMPRE mantener filtros de preferencias si existen
+        
+            # PASO 1: FILTROS DE PREFERENCIAS (PRIORIDAD ALTA)
+            # Filtro por estilo preferido (aplicar PRIMERO)
             if estilos_preferidos:
                 estilo_filter = filtered_motos['tipo'].str.lower().isin(estilos_preferidos.keys())
                 filtered_motos = filtered_motos[estilo_filter]
-                logger.info(f"Filtros relajados - Manteniendo filtro de estilo: {len(filtered_motos)} motos")
-                
+                logger.info(f"Después de filtro por estilo {list(estilos_preferidos.keys())}: {len(filtered_motos)} motos")
+            
                 if filtered_motos.empty:
-                    logger.warning(f"Sin motos del estilo preferido. Expandiendo búsqueda...")
+                    logger.warning(f"No hay motos del estilo preferido. Relajando filtro de estilo...")
                     filtered_motos = self.motos_df.copy()
-            
+        
+            # Filtro por marca preferida (aplicar SEGUNDO)
             if marcas_preferidas and not filtered_motos.empty:
                 marca_filter = filtered_motos['marca'].str.lower().isin(marcas_preferidas.keys())
                 filtered_motos_marca = filtered_motos[marca_filter]
-                
+            
                 if not filtered_motos_marca.empty:
                     filtered_motos = filtered_motos_marca
-                    logger.info(f"Filtros relajados - Manteniendo filtro de marca: {len(filtered_motos)} motos")
-            
-            # Aplicar solo los filtros técnicos más importantes con mayor tolerancia (30%)
-            tolerancia_relajada = 0.30
-            presupuesto_min_rel = presupuesto_min * (1 - tolerancia_relajada)
-            presupuesto_max_rel = presupuesto_max * (1 + tolerancia_relajada)
-            cilindrada_min_rel = cilindrada_min * (1 - tolerancia_relajada)
-            cilindrada_max_rel = cilindrada_max * (1 + tolerancia_relajada)
-            
-            logger.info(f"Filtros relajados con 30% tolerancia:")
-            logger.info(f"Presupuesto: {presupuesto_min_rel:.0f} - {presupuesto_max_rel:.0f}")
-            logger.info(f"Cilindrada: {cilindrada_min_rel:.0f} - {cilindrada_max_rel:.0f}")
-            
-            # Aplicar filtros relajados solo para presupuesto y cilindrada
+                    logger.info(f"Después de filtro por marca {list(marcas_preferidas.keys())}: {len(filtered_motos)} motos")
+                else:
+                    logger.warning(f"No hay motos de la marca preferida en el estilo elegido. Manteniendo filtro de estilo...")
+        
+            # PASO 2: FILTROS TÉCNICOS (aplicar después de preferencias)
+            # Filtro por presupuesto (estricto con 10% tolerancia)
+            filtered_motos = filtered_motos[
+                (filtered_motos['precio'] >= presupuesto_min_tolerancia) & 
+                (filtered_motos['precio'] <= presupuesto_max_tolerancia)
+            ]
+        
+            # Filtro por cilindrada (estricto con 10% tolerancia)
             if 'cilindrada' in filtered_motos.columns:
                 filtered_motos = filtered_motos[
-                    (filtered_motos['cilindrada'] >= cilindrada_min_rel) &
-                    (filtered_motos['cilindrada'] <= cilindrada_max_rel)
+                    (filtered_motos['cilindrada'] >= cilindrada_min_tolerancia) & 
+                    (filtered_motos['cilindrada'] <= cilindrada_max_tolerancia)
+                ]
+        
+            # Filtro por potencia (estricto con 10% tolerancia)
+            if 'potencia' in filtered_motos.columns:
+                filtered_motos = filtered_motos[
+                    (filtered_motos['potencia'] >= potencia_min_tolerancia) & 
+                    (filtered_motos['potencia'] <= potencia_max_tolerancia)
+                ]
+        
+            # Filtro por torque (estricto con 10% tolerancia)
+            if 'torque' in filtered_motos.columns:
+                filtered_motos = filtered_motos[
+                    (filtered_motos['torque'] >= torque_min_tolerancia) & 
+                    (filtered_motos['torque'] <= torque_max_tolerancia)
+                ]
+        
+            # Filtro por peso (estricto con 10% tolerancia)
+            if 'peso' in filtered_motos.columns:
+                filtered_motos = filtered_motos[
+                    (filtered_motos['peso'] >= peso_min_tolerancia) & 
+                    (filtered_motos['peso'] <= peso_max_tolerancia)
                 ]
-              # Si aún no hay resultados, intentar con solo preferencias (sin filtros técnicos)
+                logger.info(f"Motos que cumplen TODOS los filtros (preferencias + técnicos): {len(filtered_motos)} de {len(self.motos_df)}")
             if filtered_motos.empty:
-                logger.warning(f"No hay motos que cumplan filtros relajados. Intentando solo con preferencias...")
-                
+                logger.warning(f"No hay motos que cumplan TODOS los filtros. Aplicando filtros relajados...")
+            
+                # FILTROS RELAJADOS: Mantener preferencias de estilo/marca pero relajar especificaciones técnicas
                 filtered_motos = self.motos_df.copy()
-                
-                # Aplicar solo filtros de preferencias sin restricciones técnicas
+            
+                # SIEMPRE mantener filtros de preferencias si existen
                 if estilos_preferidos:
                     estilo_filter = filtered_motos['tipo'].str.lower().isin(estilos_preferidos.keys())
                     filtered_motos = filtered_motos[estilo_filter]
-                    logger.info(f"Solo filtro de estilo: {len(filtered_motos)} motos")
+                    logger.info(f"Filtros relajados - Manteniendo filtro de estilo: {len(filtered_motos)} motos")
                 
+                    if filtered_motos.empty:
+                        logger.warning(f"Sin motos del estilo preferido. Expandiendo búsqueda...")
+                        filtered_motos = self.motos_df.copy()
+            
                 if marcas_preferidas and not filtered_motos.empty:
                     marca_filter = filtered_motos['marca'].str.lower().isin(marcas_preferidas.keys())
                     filtered_motos_marca = filtered_motos[marca_filter]
-                    
+                
                     if not filtered_motos_marca.empty:
                         filtered_motos = filtered_motos_marca
-                        logger.info(f"Solo filtros de preferencias (estilo + marca): {len(filtered_motos)} motos")
-                
-                # Si aún no hay resultados, usar motos populares como último recurso
+                        logger.info(f"Filtros relajados - Manteniendo filtro de marca: {len(filtered_motos)} motos")
+            
+                # Aplicar solo los filtros técnicos más importantes con mayor tolerancia (30%)
+                tolerancia_relajada = 0.30
+                presupuesto_min_rel = presupuesto_min * (1 - tolerancia_relajada)
+                presupuesto_max_rel = presupuesto_max * (1 + tolerancia_relajada)
+                cilindrada_min_rel = cilindrada_min * (1 - tolerancia_relajada)
+                cilindrada_max_rel = cilindrada_max * (1 + tolerancia_relajada)
+            
+                logger.info(f"Filtros relajados con 30% tolerancia:")
+                logger.info(f"Presupuesto: {presupuesto_min_rel:.0f} - {presupuesto_max_rel:.0f}")
+                logger.info(f"Cilindrada: {cilindrada_min_rel:.0f} - {cilindrada_max_rel:.0f}")
+            
+                # Aplicar filtros relajados solo para presupuesto y cilindrada
+                if 'cilindrada' in filtered_motos.columns:
+                    filtered_motos = filtered_motos[
+                        (filtered_motos['cilindrada'] >= cilindrada_min_rel) &
+                        (filtered_motos['cilindrada'] <= cilindrada_max_rel)
+                    ]
+                  # Si aún no hay resultados, intentar con solo preferencias (sin filtros técnicos)
                 if filtered_motos.empty:
-                    logger.warning(f"No hay motos que cumplan las preferencias. Usando top motos populares.")
+                    logger.warning(f"No hay motos que cumplan filtros relajados. Intentando solo con preferencias...")
+                
+                    filtered_motos = self.motos_df.copy()
+                
+                    # Aplicar solo filtros de preferencias sin restricciones técnicas
+                    if estilos_preferidos:
+                        estilo_filter = filtered_motos['tipo'].str.lower().isin(estilos_preferidos.keys())
+                        filtered_motos = filtered_motos[estilo_filter]
+                        logger.info(f"Solo filtro de estilo: {len(filtered_motos)} motos")
+                
+                    if marcas_preferidas and not filtered_motos.empty:
+                        marca_filter = filtered_motos['marca'].str.lower().isin(marcas_preferidas.keys())
+                        filtered_motos_marca = filtered_motos[marca_filter]
                     
-                    # Ordenar por popularidad o ID si no hay campo de popularidad
-                    if 'popularity' in self.motos_df.columns:
-                        filtered_motos = self.motos_df.sort_values('popularity', ascending=False).head(top_n)
-                    else:
-                        filtered_motos = self.motos_df.head(top_n)
+                        if not filtered_motos_marca.empty:
+                            filtered_motos = filtered_motos_marca
+                            logger.info(f"Solo filtros de preferencias (estilo + marca): {len(filtered_motos)} motos")
+                
+                    # Si aún no hay resultados, usar motos populares como último recurso
+                    if filtered_motos.empty:
+                        logger.warning(f"No hay motos que cumplan las preferencias. Usando top motos populares.")
                     
-                    logger.info(f"Seleccionadas {len(filtered_motos)} motos populares como recomendación de respaldo")
+                        # Ordenar por popularidad o ID si no hay campo de popularidad
+                        if 'popularity' in self.motos_df.columns:
+                            filtered_motos = self.motos_df.sort_values('popularity', ascending=False).head(top_n)
+                        else:
+                            filtered_motos = self.motos_df.head(top_n)
+                    
+                        logger.info(f"Seleccionadas {len(filtered_motos)} motos populares como recomendación de respaldo")
+                    else:
+                        logger.info(f"Usando solo filtros de preferencias: {len(filtered_motos)} motos")
                 else:
-                    logger.info(f"Usando solo filtros de preferencias: {len(filtered_motos)} motos")
-            else:
-                logger.info(f"Motos que cumplen filtros relajados (preferencias + técnicos relajados): {len(filtered_motos)} de {len(self.motos_df)}")
+                    logger.info(f"Motos que cumplen filtros relajados (preferencias + técnicos relajados): {len(filtered_motos)} de {len(self.motos_df)}")
+            span.set(catalog=len(self.motos_df), remaining=len(filtered_motos))
         
         # Calcular score para cada moto que cumple los filtros
-        results = []
-        for _, moto in filtered_motos.iterrows():
-            score = 1.0  # Empezar con score alto ya que cumple todos los filtros
-            reasons = ["Cumple todos tus requisitos técnicos"]
+        with tracer.span('adapter.scoring', candidates=len(filtered_motos)):
+            results = []
+            for moto in iter_moto_records(filtered_motos, self.get_moto_catalog()):
+                # Si se agota el presupuesto se ordenan las motos puntuadas hasta ahora
+                if deadline.expired and results:
+                    deadline.drop('preference_scoring')
+                    logger.warning(f"Presupuesto agotado: puntuadas {len(results)} de {len(filtered_motos)} motos")
+                    break
+                score = 1.0  # Empezar con score alto ya que cumple todos los filtros
+                reasons = ["Cumple todos tus requisitos técnicos"]
             
-            # Bonus por preferencias de estilo
-            if 'tipo' in moto and estilos_preferidos:
-                tipo = str(moto['tipo']).lower()
-                if tipo in estilos_preferidos:
-                    nivel = estilos_preferidos[tipo]
-                    score += nivel * 0.5
-                    reasons.append(f"Estilo {tipo} entre tus preferidos (nivel {nivel})")
+                # Bonus por preferencias de estilo
+                if 'tipo' in moto and estilos_preferidos:
+                    tipo = str(moto['tipo']).lower()
+                    if tipo in estilos_preferidos:
+                        nivel = estilos_preferidos[tipo]
+                        score += nivel * 0.5
+                        reasons.append(f"Estilo {tipo} entre tus preferidos (nivel {nivel})")
             
-            # Bonus por marca preferida
-            if 'marca' in moto and marcas_preferidas:
-                marca = str(moto['marca']).lower()
-                if marca in marcas_preferidas:
-                    nivel = marcas_preferidas[marca]
-                    score += nivel * 0.3
-                    reasons.append(f"Marca {marca} entre tus preferidas (nivel {nivel})")
+                # Bonus por marca preferida
+                if 'marca' in moto and marcas_preferidas:
+                    marca = str(moto['marca']).lower()
+                    if marca in marcas_preferidas:
+                        nivel = marcas_preferidas[marca]
+                        score += nivel * 0.3
+                        reasons.append(f"Marca {marca} entre tus preferidas (nivel {nivel})")
             
-            # Bonus por experiencia del usuario
-            if experiencia == 'avanzado':
-                if moto.get('potencia', 0) > 100:
-                    score += 0.2
-                    reasons.append("Alta potencia adecuada para tu experiencia avanzada")
-            elif experiencia == 'inexperto':
-                if moto.get('potencia', 0) <= 50:
-                    score += 0.2
-                    reasons.append("Potencia moderada adecuada para principiantes")
+                # Bonus por experiencia del usuario
+                if experiencia == 'avanzado':
+                    if moto.get('potencia', 0) > 100:
+                        score += 0.2
+                        reasons.append("Alta potencia adecuada para tu experiencia avanzada")
+                elif experiencia == 'inexperto':
+                    if moto.get('potencia', 0) <= 50:
+                        score += 0.2
+                        reasons.append("Potencia moderada adecuada para principiantes")
             
-            # Bonus por uso previsto
-            if 'tipo' in moto:
-                tipo = str(moto['tipo']).lower()
-                if uso == 'ciudad' and tipo in ['naked', 'scooter']:
-                    score += 0.15
-                    reasons.append(f"Tipo {tipo} ideal para uso en ciudad")
-                elif uso == 'carretera' and tipo in ['sport', 'touring']:
-                    score += 0.15
-                    reasons.append(f"Tipo {tipo} ideal para carretera")
-                elif uso == 'mixto' and tipo in ['naked', 'adventure']:
-                    score += 0.15
-                    reasons.append(f"Tipo {tipo} versátil para uso mixto")
+                # Bonus por uso previsto
+                if 'tipo' in moto:
+                    tipo = str(moto['tipo']).lower()
+                    if uso == 'ciudad' and tipo in ['naked', 'scooter']:
+                        score += 0.15
+                        reasons.append(f"Tipo {tipo} ideal para uso en ciudad")
+                    elif uso == 'carretera' and tipo in ['sport', 'touring']:
+                        score += 0.15
+                        reasons.append(f"Tipo {tipo} ideal para carretera")
+                    elif uso == 'mixto' and tipo in ['naked', 'adventure']:
+                        score += 0.15
+                        reasons.append(f"Tipo {tipo} versátil para uso mixto")
             
-            # Obtener datos de la moto para el resultado
-            moto_id = str(moto.get('moto_id', moto.get('id', '')))
+                # Obtener datos de la moto para el resultado
+                moto_id = str(moto.get('moto_id', moto.get('id', '')))
 
             
 
             
-            # Crear resultado completo con todos los datos de la moto
-            moto_result = {
-                'moto_id': moto_id,
-                'score': score,
-                'reasons': reasons,
-                'marca': moto.get('marca', ''),
-                'modelo': moto.get('modelo', ''),
-                'tipo': moto.get('tipo', ''),
-                'precio': moto.get('precio', 0),
-                'cilindrada': moto.get('cilindrada', 0),
-                'potencia': moto.get('potencia', 0),
-                'torque': moto.get('torque', 0),
-                'peso': moto.get('peso', 0),
-                'imagen': moto.get('imagen', ''),
-                'note': '; '.join(reasons),
-                'url': moto.get('url', ''),
-            }
+                # Crear resultado completo con todos los datos de la moto
+                moto_result = {
+                    'moto_id': moto_id,
+                    'score': score,
+                    'reasons': reasons,
+                    'marca': moto.get('marca', ''),
+                    'modelo': moto.get('modelo', ''),
+                    'tipo': moto.get('tipo', ''),
+                    'precio': moto.get('precio', 0),
+                    'cilindrada': moto.get('cilindrada', 0),
+                    'potencia': moto.get('potencia', 0),
+                    'torque': moto.get('torque', 0),
+                    'peso': moto.get('peso', 0),
+                    'imagen': moto.get('imagen', ''),
+                    'note': '; '.join(reasons),
+                    'url': moto.get('url', ''),
+                }
             
-            results.append(moto_result)
+                results.append(moto_result)
         
-        # Ordenar por score (mayor a menor)
-        results.sort(key=lambda x: x['score'], reverse=True)
-        
-        # Limitar a top_n resultados
-        final_results = results[:top_n]
+        with tracer.span('adapter.ranking'):
+            # Ordenar por score (mayor a menor)
+            results.sort(key=lambda x: x['score'], reverse=True)
+            
+            # Limitar a top_n resultados
+            final_results = results[:top_n]
         
         logger.info(f"Generadas {len(final_results)} recomendaciones estrictas para {user_id}")
         for i, result in enumerate(final_results):
-            logger.info(f"#{i+1}: {result['marca']} {result['modelo']} - Score: {result['score']:.2f}")
+            logger.debug("#%d: %s %s - Score: %.2f", i + 1, result['marca'], result['modelo'], result['score'])
         
         return final_results
         
@@ -821,7 +855,7 @@ class MotoRecommenderAdapter:
                 reasons_json = json.dumps(reasons)
                 
                 # Actualizar o crear la relación de IDEAL
-                result = session.run("""
+                result = run_query(session, 'save_ideal_moto', """
                 MATCH (u:User {id: $user_id})
                 MATCH (m:Moto {id: $moto_id})
                 MERGE (u)-[r:IDEAL]->(m)
@@ -837,21 +871,96 @@ class MotoRecommenderAdapter:
             logger.error(traceback.format_exc())
             return False
     
+    def report_metrics(self):
+        """Publica en /metrics el tamaño de los datos cargados en memoria."""
+        for entity, df in (('motos', self.motos_df), ('users', self.users_df),
+                           ('ratings', self.ratings_df), ('friendships', getattr(self, 'friendships_df', None))):
+            CATALOG_SIZE.set(len(df) if df is not None else 0, entity=entity)
+        CATALOG_SIZE.set(len(self.friend_graph), entity='friend_graph_edges')
+    
+    def get_moto_catalog(self):
+        """
+        Devuelve el catálogo de MotoRecord correspondiente a motos_df.
+        
+        Returns:
+            MotoCatalog or None: Catálogo actual o None si no hay motos cargadas
+        """
+        if self.motos_df is None:
+            return None
+        if self._moto_catalog is None or self._moto_catalog_source is not self.motos_df:
+            self._moto_catalog = MotoCatalog.from_dataframe(self.motos_df)
+            self._moto_catalog_source = self.motos_df
+        return self._moto_catalog
+    
+    def get_moto_record(self, moto_id):
+        """
+        Obtiene el MotoRecord de una moto del catálogo cargado.
+        
+        Args:
+            moto_id: ID de la moto
+            
+        Returns:
+            MotoRecord or None: Registro de la moto
+        """
+        catalog = self.get_moto_catalog()
+        return catalog.get(moto_id) if catalog is not None else None
+    
+    def get_like_counters(self):
+        """
+        Devuelve la caché de contadores de likes, cargándola si es necesario.
+        
+        Returns:
+            LikeCounterCache: Caché de contadores (puede estar vacía si no hay conexión)
+        """
+        self.like_counters.ensure_loaded(self.driver)
+        return self.like_counters
+    
+    def get_friend_graph(self):
+        """
+        Devuelve el índice de amistades en memoria, cargándolo si es necesario.
+        
+        Returns:
+            FriendGraphIndex: Índice (sin cargar si no hay conexión)
+        """
+        if not self.friend_graph.loaded and self.driver is not None:
+            self.friend_graph.ensure_loaded(self.driver)
+            if self.friend_graph.loaded:
+                self.label_propagation.load_social_graph(self.friend_graph)
+        return self.friend_graph
+
+    def add_friendship(self, user_id, friend_id, username=None, friend_username=None):
+        """
+        Registra una amistad nueva en el índice y en el grafo social de
+        label propagation, para que ambos vean el mismo estado.
+        """
+        if not self.friend_graph.loaded:
+            return
+        self.friend_graph.add_friendship(user_id, friend_id, username, friend_username)
+        self.label_propagation.sync_friendship(self.friend_graph, user_id, friend_id)
+
+    def remove_friendship(self, user_id, friend_id):
+        """
+        Elimina una amistad del índice y del grafo social de label propagation.
+        """
+        if not self.friend_graph.loaded:
+            return
+        self.friend_graph.remove_friendship(user_id, friend_id)
+        self.label_propagation.sync_friendship(self.friend_graph, user_id, friend_id)
+
     def get_moto_by_id(self, moto_id):
         """Obtiene los datos de una moto por su ID"""
         try:
-            if not self.moto_df.empty:
-                # Buscar la moto en el DataFrame
-                moto_data = self.moto_df[self.moto_df['moto_id'] == moto_id]
-                if len(moto_data) > 0:
-                    # Convertir a diccionario y devolver
-                    moto_dict = moto_data.iloc[0].to_dict()
-                    return moto_dict
+            # Buscar la moto en el catálogo cargado (la fila original, con todas sus columnas)
+            catalog = self.get_moto_catalog()
+            position = catalog.position(moto_id) if catalog is not None else None
+            if position is not None:
+                return self.motos_df.iloc[position].to_dict()
         
-            # Si no se encuentra en el DataFrame o está vacío, intentar con Neo4j
+            # Si no se encuentra en el catálogo o está vacío, intentar con Neo4j
             if self.driver:
                 with self.driver.session() as session:
-                    result = session.run(
+                    result = run_query(
+                        session, 'moto_by_id',
                         "MATCH (m:Moto) WHERE m.id = $moto_id RETURN m",
                         moto_id=moto_id
                     )
@@ -900,7 +1009,7 @@ class MotoRecommenderAdapter:
             """
             
             with self.driver.session() as session:
-                result = session.run(query)
+                result = run_query(session, 'popular_interactions', query)
                 
                 # FIXED: Convertir a formato de diccionario con validación
                 interactions = []
@@ -933,11 +1042,12 @@ class MotoRecommenderAdapter:
                 
             # Inicializar y ejecutar PageRank
             from app.algoritmo.pagerank import MotoPageRank
-            pagerank = MotoPageRank()
-            pagerank.build_graph(interactions)
-            
-            # FIXED: Usar el parámetro correcto 'n' en lugar de 'top_n'
-            popular_moto_rankings = pagerank.get_top_motos(n=top_n)
+            with ALGORITHM_LATENCY.time(algorithm='pagerank'):
+                pagerank = MotoPageRank()
+                pagerank.build_graph(interactions)
+                
+                # FIXED: Usar el parámetro correcto 'n' en lugar de 'top_n'
+                popular_moto_rankings = pagerank.get_top_motos(n=top_n)
             
             if not popular_moto_rankings:
                 logger.warning("No se obtuvieron rankings de PageRank, usando datos mock")
@@ -946,33 +1056,37 @@ class MotoRecommenderAdapter:
             # Obtener información detallada de las motos
             popular_motos_info = []
             
+            # Datos de todas las motos del ranking en una sola consulta; los likes
+            # salen de los contadores materializados en lugar de agregarse aquí
+            moto_query = """
+            UNWIND $moto_ids as moto_id
+            MATCH (m:Moto {id: moto_id})
+            RETURN m.id as moto_id, m.marca as marca, m.modelo as modelo, m.tipo as estilo,
+                   m.precio as precio, m.imagen as imagen, coalesce(m.like_count, 0) as likes
+            """
+            
+            with self.driver.session() as session:
+                result = run_query(session, 'popular_moto_details', moto_query, moto_ids=[moto_id for moto_id, _ in popular_moto_rankings])
+                records = {record['moto_id']: record for record in result}
+            
+            counters = self.get_like_counters()
             for i, (moto_id, score) in enumerate(popular_moto_rankings):
-                # Buscar datos de la moto en Neo4j
-                moto_query = """
-                MATCH (m:Moto {id: $moto_id})
-                OPTIONAL MATCH (u:User)-[r:INTERACTED]->(m) WHERE r.type = 'like'
-                RETURN m.marca as marca, m.modelo as modelo, m.tipo as estilo,
-                       m.precio as precio, m.imagen as imagen, count(r) as likes
-                """
-                
-                with self.driver.session() as session:
-                    result = session.run(moto_query, moto_id=moto_id)
-                    record = result.single()
-                    
-                    if record:
-                        # FIXED: Asegurar que todos los campos requeridos están presentes
-                        moto_info = {
-                            'moto_id': moto_id,
-                            'marca': record.get('marca', 'Marca desconocida'),
-                            'modelo': record.get('modelo', 'Modelo desconocido'),
-                            'estilo': record.get('estilo', 'Estilo desconocido'),
-                            'precio': record.get('precio', 0),
-                            'imagen': record.get('imagen', '/static/images/default-moto.jpg'),
-                            'likes': record.get('likes', 0),
-                            'score': round(score * 100, 1),  # Convertir a escala 0-100
-                            'ranking_position': i + 1
-                        }
-                        popular_motos_info.append(moto_info)
+                record = records.get(moto_id)
+                if record:
+                    likes = counters.get_like_count(moto_id)
+                    # FIXED: Asegurar que todos los campos requeridos están presentes
+                    moto_info = {
+                        'moto_id': moto_id,
+                        'marca': record.get('marca', 'Marca desconocida'),
+                        'modelo': record.get('modelo', 'Modelo desconocido'),
+                        'estilo': record.get('estilo', 'Estilo desconocido'),
+                        'precio': record.get('precio', 0),
+                        'imagen': record.get('imagen', '/static/images/default-moto.jpg'),
+                        'likes': likes if likes is not None else record.get('likes', 0),
+                        'score': round(score * 100, 1),  # Convertir a escala 0-100
+                        'ranking_position': i + 1
+                    }
+                    popular_motos_info.append(moto_info)
             
             logger.info(f"Obtenidas {len(popular_motos_info)} motos populares del ranking PageRank")
             
@@ -1022,7 +1136,7 @@ class MotoRecommenderAdapter:
                 RETURN u
                 """
                 
-                result = session.run(query, user_id=user_id, preferences=prefs_json)
+                result = run_query(session, 'save_preferences', query, user_id=user_id, preferences=prefs_json)
                 summary = result.consume()
                 
                 if summary.counters.properties_set > 0:
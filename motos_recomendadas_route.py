@@ -6,8 +6,6 @@ import os
 import sys
 from flask import render_template, session, redirect, url_for, flash, current_app
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('update_routes')
 
 # Importar la función de recomendaciones 
@@ -8,13 +8,15 @@ import traceback
 from flask import Flask, render_template, session, render_template_string, redirect, url_for, jsonify, request
 from neo4j import GraphDatabase
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
-
 # Agregar la ruta del proyecto al path para importaciones
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
+# Configurar logging con LOGGING_CONFIG (formato y niveles por subsistema);
+# un basicConfig aquí crearía antes el manejador raíz y su formato se impondría
+from app.algoritmo.log_config import configure_logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
 def main():
     """Función principal para ejecutar la aplicación"""
     logger.info("Iniciando aplicación MotoMatch con carga anticipada de datos...")
@@ -81,7 +83,12 @@ def main():
             from app.algoritmo.pagerank import MotoPageRank
             try:
                 ranking = MotoPageRank()
-                if hasattr(adapter, 'driver') and adapter.driver:
+                shared_catalog = getattr(adapter, 'shared_catalog', None)
+                shared_ranking = shared_catalog.get_ranking() if shared_catalog else None
+                if shared_ranking is not None:
+                    app.config['MOTO_RANKING'] = shared_ranking
+                    logger.info("✅ Ranking de motos adjuntado desde el catálogo compartido")
+                elif hasattr(adapter, 'driver') and adapter.driver:
                     logger.info("🔄 Inicializando ranking de motos desde Neo4j...")
                     ranking.update_from_neo4j(adapter.driver)
                     app.config['MOTO_RANKING'] = ranking
@@ -165,34 +172,149 @@ def run_server(app=None, suppress_warnings=False):
         logger.error("❌ No se pudo iniciar el servidor en ninguno de los puertos disponibles")
         print("\n❌ Error: Todos los puertos están ocupados. Intenta cerrar otras aplicaciones o especificar un puerto manualmente.")
 
-def run_production_server():
-    """Ejecutar el servidor en modo producción usando Waitress"""
+def publish_shared_catalog(app):
+    """
+    Publica el catálogo y los modelos de solo lectura en memoria compartida.
+    
+    Los procesos trabajadores que ``run_prefork_server`` crea después heredan
+    la variable de entorno con el manifiesto y, al construir su aplicación,
+    se adjuntan al catálogo en lugar de recargarlo desde Neo4j.
+    """
+    adapter = app.config.get('MOTO_RECOMMENDER')
+    if not adapter or getattr(adapter, 'motos_df', None) is None:
+        logger.warning("⚠️ No hay datos cargados para publicar en memoria compartida")
+        return None
+    
+    from app.algoritmo.shared_catalog import publish_catalog
+    catalog = publish_catalog(adapter, app.config.get('MOTO_RANKING'))
+    if catalog:
+        app.config['SHARED_CATALOG'] = catalog
+        logger.info("✅ Catálogo compartido disponible para los procesos trabajadores")
+    return catalog
+
+def _bind_socket(puertos):
+    """Abre el socket de escucha en el primer puerto libre de la lista."""
+    import socket
+    for puerto in puertos:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(('0.0.0.0', puerto))
+            sock.listen(1024)
+            return sock, puerto
+        except OSError as e:
+            sock.close()
+            if e.errno == 48 or e.errno == 98 or "Address already in use" in str(e):
+                logger.warning(f"⚠️ Puerto {puerto} ocupado, intentando con el siguiente...")
+                continue
+            raise
+    return None, None
+
+def run_prefork_server(workers):
+    """
+    Servidor de producción con varios procesos Waitress (solo POSIX).
+    
+    El proceso maestro carga los datos una vez, publica el catálogo en memoria
+    compartida y abre el socket de escucha. Después crea ``workers`` procesos
+    con ``fork``: cada uno construye su propia aplicación (que se adjunta al
+    catálogo publicado sin consultar Neo4j) y atiende con Waitress sobre el
+    socket heredado. El maestro solo espera a los trabajadores y, al terminar,
+    libera los bloques compartidos.
+    """
+    import signal
+    import waitress
+    
+    app = main()
+    if not app or publish_shared_catalog(app) is None:
+        logger.warning("⚠️ Sin catálogo compartido: se usa un único proceso")
+        run_single_process_server(app)
+        return
+    
+    sock, puerto = _bind_socket([5000, 8080, 3000, 8000, 4000, 5001])
+    if sock is None:
+        logger.error("❌ No se pudo iniciar el servidor en ninguno de los puertos disponibles")
+        return
+    
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            # Trabajador: aplicación propia adjuntada al catálogo; sale con
+            # os._exit para no ejecutar los atexit del maestro (unlink de bloques)
+            status = 0
+            try:
+                worker_app = main()
+                waitress.serve(worker_app, sockets=[sock])
+            except Exception as e:
+                logger.error(f"❌ Error en el trabajador {os.getpid()}: {str(e)}")
+                status = 1
+            finally:
+                os._exit(status)
+        children.append(pid)
+    sock.close()
+    logger.info(f"🚀 {workers} procesos Waitress en http://0.0.0.0:{puerto} (maestro {os.getpid()})")
+    
+    def stop_children(signum=None, frame=None):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    signal.signal(signal.SIGTERM, lambda signum, frame: (stop_children(), sys.exit(0)))
     try:
-        import waitress
-        app = main()
-        if app:
-            # Lista de puertos alternativos para probar
-            puertos = [5000, 8080, 3000, 8000, 4000, 5001]
-            
-            for puerto in puertos:
-                try:
-                    logger.info(f"🚀 Iniciando servidor de producción con Waitress en http://0.0.0.0:{puerto}")
-                    waitress.serve(app, host='0.0.0.0', port=puerto)
-                    break
-                except OSError as e:
-                    if e.errno == 48 or "Address already in use" in str(e):
-                        logger.warning(f"⚠️ Puerto {puerto} ocupado, intentando con el siguiente...")
-                        continue
-                    else:
-                        logger.error(f"Error al iniciar el servidor: {str(e)}")
-                        break
+        for child in children:
+            os.waitpid(child, 0)
+    except KeyboardInterrupt:
+        logger.info("Servidor detenido por el usuario")
+        stop_children()
+
+def run_single_process_server(app=None):
+    """Servidor de producción en un único proceso Waitress (con hilos)."""
+    import waitress
+    app = app or main()
+    if not app:
+        return
+    
+    # Lista de puertos alternativos para probar
+    puertos = [5000, 8080, 3000, 8000, 4000, 5001]
+    
+    for puerto in puertos:
+        try:
+            logger.info(f"🚀 Iniciando servidor de producción con Waitress en http://0.0.0.0:{puerto}")
+            waitress.serve(app, host='0.0.0.0', port=puerto)
+            break
+        except OSError as e:
+            if e.errno == 48 or "Address already in use" in str(e):
+                logger.warning(f"⚠️ Puerto {puerto} ocupado, intentando con el siguiente...")
+                continue
             else:
-                logger.error("❌ No se pudo iniciar el servidor en ninguno de los puertos disponibles")
+                logger.error(f"Error al iniciar el servidor: {str(e)}")
+                break
+    else:
+        logger.error("❌ No se pudo iniciar el servidor en ninguno de los puertos disponibles")
+
+def run_production_server(workers=None):
+    """
+    Ejecutar el servidor en modo producción usando Waitress.
+    
+    Con ``workers`` > 1 (o MOTOMATCH_WORKERS) y ``os.fork`` disponible se usa
+    ``run_prefork_server``; si no, un único proceso sin catálogo compartido.
+    """
+    workers = workers or int(os.environ.get('MOTOMATCH_WORKERS', 1))
+    try:
+        import waitress  # noqa: F401
     except ImportError:
         logger.warning("⚠️ Waitress no está instalado. Para usar un servidor de producción ejecute:")
         logger.warning("   pip install waitress")
         # Fallback to development server
         run_server(main(), suppress_warnings=True)
+        return
+    
+    if workers > 1 and hasattr(os, 'fork'):
+        run_prefork_server(workers)
+    else:
+        run_single_process_server()
 
 # Modify your if __name__ == "__main__" block:
 if __name__ == "__main__":
@@ -200,7 +322,8 @@ if __name__ == "__main__":
     
     # Check for production mode
     if len(sys.argv) > 1 and sys.argv[1] == "--production":
-        run_production_server()
+        # python run_fixed_app.py --production [número de procesos]
+        run_production_server(int(sys.argv[2]) if len(sys.argv) > 2 else None)
     elif len(sys.argv) > 1 and sys.argv[1] == "--no-warnings":
         app = main()
         if app:
@@ -148,3 +148,1098 @@ class TestLabelPropagation(unittest.TestCase):
         recommended_motos = [rec[0] for rec in recommendations]
         self.assertNotIn("moto1", recommended_motos)
         self.assertNotIn("moto2", recommended_motos)
+
+class TestSharedCatalog(unittest.TestCase):
+    def test_dataframe_round_trip(self):
+        """Test para verificar que un DataFrame se comparte sin pérdida de datos"""
+        from app.algoritmo.shared_catalog import SharedArrayStore, publish_dataframe, attach_dataframe
+        
+        df = pd.DataFrame({
+            'moto_id': ['m1', 'm2', None],
+            'potencia': [50.0, 120.5, 95.0],
+            'cilindrada': [300, 1000, 650],
+            'extras': [['abs'], [], None]
+        })
+        owner = SharedArrayStore()
+        entry = publish_dataframe(owner, 'motos_df', df)
+        worker = SharedArrayStore(prefix=owner.prefix)
+        try:
+            shared_df = attach_dataframe(worker, 'motos_df', entry)
+            self.assertEqual(list(shared_df['moto_id'][:2]), ['m1', 'm2'])
+            self.assertTrue(pd.isna(shared_df['moto_id'].iloc[2]))
+            self.assertEqual(shared_df['cilindrada'].tolist(), [300, 1000, 650])
+            self.assertAlmostEqual(shared_df['potencia'].iloc[1], 120.5)
+            self.assertEqual(shared_df['extras'].iloc[0], ['abs'])
+            # Solo las columnas numéricas son vistas sobre la memoria compartida
+            self.assertFalse(shared_df['cilindrada'].to_numpy().flags.writeable)
+            self.assertNotIsInstance(shared_df['moto_id'].dtype, pd.CategoricalDtype)
+        finally:
+            worker.close()
+            owner.close()
+
+class TestIdRegistry(unittest.TestCase):
+    def test_registry_codes_are_stable(self):
+        """Test para verificar que los códigos son densos, estables y reversibles"""
+        from app.algoritmo.id_registry import IdRegistry, MISSING_ID
+
+        registry = IdRegistry('users', ['u1', 'u2'])
+        self.assertEqual(registry.intern_many(['u2', ' u3 ', None, 'u1']).tolist(), [1, 2, MISSING_ID, 0])
+        self.assertEqual(registry.encode(['u3', 'u9']).tolist(), [2, MISSING_ID])
+        self.assertEqual(registry.decode([0, 2, MISSING_ID]).tolist(), ['u1', 'u3', None])
+        self.assertEqual(len(registry), 3)
+
+    def test_reset_scopes_space_per_load(self):
+        """Test para verificar que cada carga de datos parte de un espacio de ids nuevo"""
+        from app.algoritmo.id_registry import current_id_space, reset_id_space
+
+        old_space = reset_id_space(['u1', 'u2', 'u3'], ['m1'])
+        old_space.users.intern('u4')
+        space = reset_id_space(['u1'], ['m1'])
+        self.assertIs(current_id_space(), space)
+        self.assertEqual(space.version, old_space.version + 1)
+        self.assertEqual(len(space.users), 1)
+        # El espacio anterior sigue siendo coherente para quien lo conserve
+        self.assertEqual(old_space.users.encode_one('u4'), 3)
+
+    def test_label_propagation_indexes_by_registry_code(self):
+        """Test para verificar que la propagación indexa por código y devuelve los ids originales"""
+        from app.algoritmo.id_registry import reset_id_space
+
+        space = reset_id_space(['u0', 'u1', 'u2'], ['m0', 'm1'])
+        label_prop = MotoLabelPropagation(max_iterations=3)
+        label_prop.build_social_graph([('u1', 'u2')])
+        label_prop.set_user_preferences([('u1', 'm1', 4.0), ('u2', 'm2', 2.0)])
+        scores = label_prop.propagate_labels()
+
+        self.assertEqual(set(scores), {'u1', 'u2'})
+        self.assertEqual(set(scores['u1']), {'m1', 'm2'})
+        self.assertGreater(scores['u2']['m1'], 0.0)
+        # Solo se internan los ids nuevos; los existentes conservan su código
+        self.assertEqual(space.users.encode_one('u1'), 1)
+        self.assertEqual(space.motos.encode_one('m2'), 2)
+        self.assertEqual(len(space.users), 3)
+
+    def test_compute_paths_do_not_grow_the_space(self):
+        """Test para verificar que propagar y calcular PageRank solo codifican (no internan) ids"""
+        from app.algoritmo.id_registry import reset_id_space
+
+        space = reset_id_space(['u1', 'u2'], ['m1'])
+        label_prop = MotoLabelPropagation(max_iterations=3)
+        label_prop.build_social_graph([('u1', 'u2')])
+        label_prop.set_user_preferences([('u1', 'm1', 4.0)])
+        # Ids añadidos sin pasar por una carga se ignoran al propagar
+        label_prop.user_preferences['fantasma']['m9'] = 5.0
+        scores = label_prop.propagate_labels()
+        self.assertNotIn('fantasma', scores)
+        self.assertAlmostEqual(scores['u2']['m1'], 0.8 * 4.0 * (0.2 + 0.8 * 0.8), places=6)
+        self.assertEqual((len(space.users), len(space.motos)), (2, 1))
+
+        pagerank = MotoPageRank()
+        pagerank.build_graph([{'user_id': u, 'moto_id': m, 'weight': 1.0}
+                              for u, m in (('u1', 'm1'), ('u2', 'm1'), ('u2', 'm2'))])
+        size = (len(space.users), len(space.motos))
+        pagerank.user_scores['fantasma'] = 0.0
+        pagerank.calculate_pagerank()
+        self.assertEqual((len(space.users), len(space.motos)), size)
+        # Las mutaciones explícitas sí internan
+        pagerank.add_user_interaction('u3', 'm3')
+        self.assertIn('u3', space.users)
+        self.assertIn('m3', space.motos)
+
+    def test_advanced_hybrid_uses_load_scoped_space(self):
+        """Test para verificar que las matrices del híbrido avanzado solo cubren los ids de su carga"""
+        import tempfile
+        from app.algoritmo.id_registry import reset_id_space
+
+        shared = reset_id_space(['x%d' % i for i in range(50)], ['y%d' % i for i in range(20)])
+        recommender = AdvancedHybridRecommender({'model_path': tempfile.mkdtemp() + '/'})
+        recommender._build_interaction_matrices(pd.DataFrame({
+            'user_id': ['u1', 'u2'], 'moto_id': ['m1', 'm1'], 'rating': [4.0, 3.0]
+        }))
+
+        self.assertEqual(recommender.ratings_matrix.shape, (2, 1))
+        self.assertEqual(set(recommender.user_map), {'u1', 'u2'})
+        self.assertNotIn('u1', shared.users)
+
+class TestMotoRecord(unittest.TestCase):
+    def test_catalog_matches_series_access(self):
+        """Test para verificar que MotoRecord se lee igual que una fila del DataFrame"""
+        from app.algoritmo.moto_record import MotoCatalog, iter_moto_records
+        
+        df = pd.DataFrame({
+            'moto_id': ['m1', 'm2'],
+            'marca': ['Honda', 'Yamaha'],
+            'tipo': ['naked', None],
+            'precio': ['8000', None],
+            'año': [2020, 2022]
+        })
+        catalog = MotoCatalog.from_dataframe(df)
+        record = catalog.get('m1')
+        self.assertEqual(record['id'], 'm1')
+        self.assertEqual(record.get('marca'), 'Honda')
+        self.assertEqual(record.get('precio'), 8000.0)
+        self.assertEqual(record.get('año'), 2020.0)
+        self.assertIsNone(catalog.get('m2').get('precio'))
+        self.assertEqual(catalog.get('m2').get('tipo', 'desconocido'), 'desconocido')
+        with self.assertRaises(AttributeError):
+            record.precio = 1
+        
+        subset = df[df['marca'] == 'Yamaha']
+        self.assertEqual([r.id for r in iter_moto_records(subset, catalog)], ['m2'])
+        
+        # La fila original conserva todas las columnas y sus nombres
+        self.assertEqual(df.iloc[catalog.position('m2')].to_dict()['año'], 2022)
+        self.assertIsNone(catalog.position('m3'))
+        
+        # to_dict exporta los nombres de columna originales y el año como entero
+        exported = catalog.get('m1').to_dict()
+        self.assertEqual(exported['año'], 2020)
+        self.assertIsInstance(exported['año'], int)
+        self.assertIn('URL', exported)
+        self.assertNotIn('ano', exported)
+        self.assertEqual(exported['moto_id'], 'm1')
+
+class TestNeo4jDriverProvider(unittest.TestCase):
+    def test_driver_is_shared_per_process(self):
+        """Test para verificar que todos los módulos reciben el mismo driver"""
+        import time
+        from app.algoritmo.neo4j_driver import Neo4jDriverProvider
+        
+        provider = Neo4jDriverProvider({'max_connection_pool_size': 5})
+        try:
+            first = provider.get_driver('bolt://localhost:7687', 'neo4j', 'x', verify=False)
+            second = provider.get_driver('bolt://localhost:7687', 'neo4j', 'x', verify=False)
+            self.assertIs(first, second)
+            
+            # Tras un fork el proceso hijo no debe reutilizar el driver del padre
+            provider._pid = -1
+            third = provider.get_driver('bolt://localhost:7687', 'neo4j', 'x', verify=False)
+            self.assertIsNot(first, third)
+            first.close()
+            
+            # Cerrar un DatabaseConnector no cierra el driver compartido
+            from app.algoritmo.utils import DatabaseConnector
+            connector = DatabaseConnector(third)
+            connector.close()
+            self.assertIsNone(connector.driver)
+            self.assertIs(provider.get_driver('bolt://localhost:7687', 'neo4j', 'x', verify=False), third)
+            
+            # Otra contraseña no reutiliza el driver autenticado con la anterior
+            other = provider.get_driver('bolt://localhost:7687', 'neo4j', 'y', verify=False)
+            self.assertIsNot(other, third)
+            self.assertNotIn('y', [part for key in provider._drivers for part in key])
+            
+            # Tras un fork, is_alive no da por vivo un driver heredado del padre
+            provider._healthy_at = {key: time.monotonic() for key in provider._drivers}
+            self.assertTrue(provider.is_alive(other))
+            provider._pid = -1
+            self.assertFalse(provider.is_alive(other))
+            other.close()
+            third.close()
+            
+            # Un driver retirado por el proveedor deja de considerarse vivo
+            third = provider.get_driver('bolt://localhost:7687', 'neo4j', 'x', verify=False)
+            provider.invalidate(third)
+            self.assertFalse(provider.is_alive(third))
+        finally:
+            provider.close_all()
+
+class TestAsyncNeo4jDAL(unittest.TestCase):
+    def test_queries_run_concurrently_without_async_driver(self):
+        """Test para verificar que, sin driver asíncrono, las consultas de una página se lanzan a la vez"""
+        import time
+        from app.algoritmo.neo4j_async import AsyncNeo4jDAL
+        
+        class FakeRecord(dict):
+            def data(self):
+                return dict(self)
+        
+        class FakeSession:
+            def __enter__(self):
+                return self
+            def __exit__(self, *exc):
+                return False
+            def run(self, query, parameters=None, **kwargs):
+                time.sleep(0.2)
+                if 'count(r)' in query:
+                    raise RuntimeError('consulta fallida')
+                return FakeResult([FakeRecord(moto={'id': parameters['moto_id']})])
+        
+        class FakeResult(list):
+            def consume(self):
+                return None
+        
+        class FakeDriver:
+            def session(self):
+                return FakeSession()
+        
+        dal = AsyncNeo4jDAL('bolt://localhost:7687', 'neo4j', 'x', timeout=5)
+        dal.use_async = False
+        dal._get_sync_driver = lambda: FakeDriver()
+        try:
+            start = time.monotonic()
+            details, likes = dal.run(dal.moto_details('m1'), dal.like_count('m1'))
+            elapsed = time.monotonic() - start
+        finally:
+            dal.close()
+        
+        self.assertEqual(details, {'id': 'm1'})
+        # El error de una consulta se devuelve en su posición, sin afectar a las demás
+        self.assertIsInstance(likes, RuntimeError)
+        self.assertLess(elapsed, 0.35)
+
+class TestInteractionWriter(unittest.TestCase):
+    def test_write_behind_coalesces_bursts(self):
+        """Test para verificar que una ráfaga de likes se reduce a un único lote UNWIND"""
+        from app.algoritmo.interaction_writer import InteractionWriter, ranking_listener
+        
+        executed = []
+        
+        class FakeResult:
+            def __init__(self, record=None):
+                self.record = record
+            def single(self):
+                return self.record
+            def consume(self):
+                pass
+            def __iter__(self):
+                return iter([])
+        
+        class FakeRecord(dict):
+            def data(self):
+                return dict(self)
+        
+        class FakeTx:
+            def run(self, query, **params):
+                executed.append((query, params))
+                if 'collect(m.id)' in query:
+                    return FakeResult(FakeRecord(user_id='u1', moto_ids=['m9']))
+                return FakeResult()
+        
+        class FakeSession:
+            def __enter__(self):
+                return self
+            def __exit__(self, *args):
+                return False
+            def execute_write(self, work, *args):
+                return work(FakeTx(), *args)
+            execute_read = execute_write
+        
+        class FakeDriver:
+            def session(self):
+                return FakeSession()
+        
+        ranking = MotoPageRank()
+        writer = InteractionWriter(lambda: FakeDriver(), write_behind=True, flush_interval=60)
+        writer.add_listener(ranking_listener(ranking))
+        try:
+            self.assertEqual(writer.toggle_like('ana', 'm1')['status'], 'liked')
+            self.assertEqual(writer.toggle_like('ana', 'm1')['status'], 'unliked')
+            self.assertEqual(writer.toggle_like('ana', 'm1')['status'], 'liked')
+            self.assertEqual(writer.toggle_like('ana', 'm9')['status'], 'unliked')
+            self.assertEqual(len(ranking.graph['u1']), 1)
+            
+            executed.clear()
+            self.assertEqual(writer.flush(), 2)
+            # Un MERGE para m1 y un DELETE para m9 (una fila cada uno) y la proyección de u1
+            self.assertEqual(len(executed), 3)
+            self.assertEqual([len(params['rows']) for _, params in executed[:2]], [1, 1])
+            self.assertEqual(executed[2][1]['user_ids'], ['u1'])
+            
+            # Al volcar el lote se olvida el estado del usuario y se relee de Neo4j
+            self.assertNotIn('ana', writer._user_likes)
+            self.assertEqual(writer.toggle_like('ana', 'm9')['status'], 'unliked')
+        finally:
+            writer.queue.stop()
+        
+        # La caché de estados es LRU y, al releer, se superponen los cambios sin volcar
+        writer = InteractionWriter(lambda: FakeDriver(), write_behind=True, flush_interval=60,
+                                   max_cached_users=1)
+        try:
+            self.assertEqual(writer.toggle_like('ana', 'm9')['status'], 'unliked')
+            writer.toggle_like('bea', 'm2')
+            self.assertEqual(list(writer._user_likes), ['bea'])
+            self.assertEqual(writer.toggle_like('ana', 'm9')['status'], 'liked')
+        finally:
+            writer.queue.stop()
+    
+    def test_pagerank_updates_from_concurrent_requests(self):
+        """Test para verificar que los likes concurrentes no interfieren con el cálculo de PageRank"""
+        import threading
+        
+        ranking = MotoPageRank()
+        ranking.build_graph([{'user_id': f'u{i}', 'moto_id': f'm{i % 5}', 'weight': 1.0} for i in range(20)])
+        errors = []
+        
+        def likes(worker):
+            try:
+                for i in range(300):
+                    ranking.add_user_interaction(f'w{worker}', f'm{i % 7}')
+                    ranking.remove_user_interaction(f'w{worker}', f'm{i % 7}')
+            except Exception as e:
+                errors.append(e)
+        
+        def rankings():
+            try:
+                for _ in range(100):
+                    ranking.calculate_pagerank()
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=likes, args=(w,)) for w in range(4)] + [threading.Thread(target=rankings)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        self.assertTrue(all(not ranking.graph[f'w{w}'] for w in range(4)))
+
+class TestLikeCounterCache(unittest.TestCase):
+    def test_load_is_read_only_and_updates_apply(self):
+        """Test para verificar que la caché de likes se carga solo con lecturas y aplica los cambios"""
+        import time
+        from app.algoritmo.like_counters import LikeCounterCache, backfill_missing_like_counters
+        
+        executed = []
+        
+        class FakeResult(list):
+            def single(self):
+                return self[0] if self else None
+            def consume(self):
+                pass
+        
+        class FakeSession:
+            def __enter__(self):
+                return self
+            def __exit__(self, *args):
+                return False
+            def run(self, query, **params):
+                executed.append(query)
+                if 'missing' in query:
+                    return FakeResult([{'missing': 2}])
+                if 'like_count' in query and 'RETURN' in query:
+                    return FakeResult([{'moto_id': 'm1', 'like_count': 3}])
+                if 'last_like_label AS label' in query:
+                    return FakeResult([{'user_id': 'u1', 'username': 'ana', 'label': 'Honda CB500F'}])
+                return FakeResult()
+        
+        class FakeDriver:
+            def session(self):
+                return FakeSession()
+        
+        cache = LikeCounterCache(max_age=0.05)
+        # Antes de cargar, los incrementos no tienen base
+        cache.adjust('m1', 1)
+        self.assertIsNone(cache.get_like_count('m1'))
+        
+        self.assertTrue(cache.load(FakeDriver()))
+        self.assertFalse(any('SET' in query for query in executed))
+        self.assertEqual(cache.get_like_count('m1'), 3)
+        self.assertEqual(cache.last_likes(), {'ana': 'Honda CB500F'})
+        
+        cache.adjust('m1', -1, username='ana', label='Honda CB500F')
+        self.assertEqual(cache.get_like_count('m1'), 2)
+        self.assertEqual(cache.last_likes(), {})
+        cache.apply(moto_id='m2', like_count=5, user_id='u1', last_like='Yamaha MT-07')
+        self.assertEqual(cache.get_like_count('m2'), 5)
+        self.assertEqual(cache.last_likes(), {'ana': 'Yamaha MT-07'})
+        
+        self.assertTrue(cache.loaded)
+        time.sleep(0.06)
+        self.assertFalse(cache.loaded)
+        
+        # La materialización es un paso aparte (arranque o db_init)
+        executed.clear()
+        self.assertEqual(backfill_missing_like_counters(FakeDriver()), 2)
+        self.assertTrue(any('SET m.like_count' in query for query in executed))
+
+class TestFriendGraphIndex(unittest.TestCase):
+    def test_queries_and_incremental_updates(self):
+        """Test para verificar amigos, amigos en común, dos saltos y actualizaciones"""
+        from app.algoritmo.friend_graph import FriendGraphIndex
+        
+        graph = FriendGraphIndex(compact_threshold=1)
+        graph.load_edges([('a', 'b'), ('a', 'c'), ('b', 'c'), ('b', 'd'), ('c', 'd'), ('a', 'b')],
+                         usernames={'a': 'ana', 'b': 'bea'})
+        self.assertEqual(sorted(graph.friends('a')), ['b', 'c'])
+        self.assertEqual(len(graph), 5)
+        self.assertEqual(graph.mutual_friends('a', 'b'), ['c'])
+        self.assertEqual(graph.two_hop('a'), {'d': 2})
+        self.assertEqual(graph.friend_records('x'), [])
+        
+        graph.add_friendship('a', 'e', friend_username='eva')
+        graph.remove_friendship('a', 'b')
+        self.assertEqual(sorted(graph.friends('a')), ['c', 'e'])
+        # Una segunda fila modificada supera el umbral y reconstruye el CSR
+        graph.add_friendship('d', 'a')
+        self.assertEqual(graph._overlay, {})
+        self.assertEqual(sorted(graph.friends('a')), ['c', 'e'])
+        self.assertEqual(graph.friend_records('d'), [{'friend_id': 'a', 'friend_username': 'ana'}])
+        
+        lp = MotoLabelPropagation()
+        lp.load_social_graph(graph)
+        self.assertIn('d', lp.social_graph['a'])
+        self.assertIn('a', lp.social_graph['e'])
+
+        # Las altas y bajas incrementales llegan también al grafo social
+        graph.add_friendship('e', 'f')
+        lp.sync_friendship(graph, 'e', 'f')
+        self.assertIn('f', lp.social_graph['e'])
+        self.assertEqual(lp.social_graph['f'], ['e'])
+        graph.remove_friendship('a', 'e')
+        lp.sync_friendship(graph, 'a', 'e')
+        self.assertNotIn('e', lp.social_graph['a'])
+        self.assertEqual(lp.social_graph['e'], ['f'])
+        # Con la otra dirección aún presente la arista se mantiene
+        graph.add_friendship('c', 'a')
+        graph.remove_friendship('a', 'c')
+        lp.sync_friendship(graph, 'a', 'c')
+        self.assertIn('c', lp.social_graph['a'])
+
+class TestFriendSuggestionService(unittest.TestCase):
+    def test_cache_and_fill(self):
+        """Test para verificar la caché LRU/TTL de sugerencias y el relleno acotado"""
+        import time
+        from app.algoritmo.friend_suggestions import FriendSuggestionService, FILL_QUERY
+        
+        calls = []
+        
+        class FakeRecord(dict):
+            def data(self):
+                return dict(self)
+        
+        class FakeSession:
+            def __enter__(self):
+                return self
+            def __exit__(self, *args):
+                return False
+            def run(self, query, **params):
+                calls.append((query, params))
+                if query is FILL_QUERY:
+                    return [FakeRecord(username=f"fill{i}", mutual_friends=0, shared_likes=0, score=0.0)
+                            for i in range(params['limit'])]
+                return [FakeRecord(username='bea', mutual_friends=2, shared_likes=1, score=5.0)]
+        
+        class FakeDriver:
+            def session(self):
+                return FakeSession()
+        
+        service = FriendSuggestionService(lambda: FakeDriver(), page_size=2, max_candidates=4,
+                                          ttl=0.05, max_users=2)
+        page = service.get_page('u1', exclude=['fill0'])
+        self.assertEqual([c['username'] for c in page['items']], ['bea', 'fill1'])
+        self.assertTrue(page['has_next'])
+        # El relleno solo pide lo que falta y excluye a los candidatos conectados
+        fill_params = calls[1][1]
+        self.assertEqual(fill_params['limit'], 3)
+        self.assertEqual(fill_params['exclude'], ['bea'])
+        self.assertNotIn('ORDER BY', FILL_QUERY)
+        
+        # Acierto de caché: sin consultas nuevas
+        calls.clear()
+        service.get_page('u1', page=2)
+        self.assertEqual(calls, [])
+        
+        # LRU: u1 es el más reciente, así que al entrar u3 sale u2
+        service.get_suggestions('u2')
+        service.get_suggestions('u1')
+        service.get_suggestions('u3')
+        calls.clear()
+        service.get_suggestions('u1')
+        self.assertEqual(calls, [])
+        service.get_suggestions('u2')
+        self.assertEqual(len(calls), 2)
+        
+        # TTL e invalidación
+        calls.clear()
+        time.sleep(0.06)
+        service.get_suggestions('u2')
+        self.assertEqual(len(calls), 2)
+        service.invalidate('u2')
+        service.get_suggestions('u2')
+        self.assertEqual(len(calls), 4)
+
+class TestRecommendationApi(unittest.TestCase):
+    def setUp(self):
+        from flask import Flask
+        from app.api_v1 import api_v1
+
+        class FakeAdapter:
+            def __init__(self):
+                self.calls = 0
+                self.data_version = 1
+
+            def get_recommendations(self, user_id, top_n=5, **kwargs):
+                self.calls += 1
+                return [(f"m{i}", 1.0 - i / 10.0, ['razón']) for i in range(top_n)]
+
+        self.adapter = FakeAdapter()
+        app = Flask(__name__)
+        app.secret_key = 'test'
+        app.config['MOTO_RECOMMENDER'] = self.adapter
+        app.register_blueprint(api_v1, url_prefix='/api/v1')
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['username'] = 'ana'
+            sess['user_id'] = 'u1'
+
+    def test_cursor_round_trip(self):
+        """Test para verificar que el cursor codifica y decodifica la posición"""
+        from app.api_v1 import encode_cursor, decode_cursor, ApiError
+
+        self.assertEqual(decode_cursor(encode_cursor(0)), 0)
+        self.assertEqual(decode_cursor(encode_cursor(37)), 37)
+        for invalid in ('###', encode_cursor(-1), 'eDo1'):
+            with self.assertRaises(ApiError):
+                decode_cursor(invalid)
+
+    def test_pagination_and_fields(self):
+        """Test para verificar la paginación por cursor y la selección de campos"""
+        response = self.client.get('/api/v1/recomendaciones?limit=2&fields=moto_id')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body['data'], [{'moto_id': 'm0'}, {'moto_id': 'm1'}])
+        self.assertIsNotNone(body['next_cursor'])
+
+        response = self.client.get(f"/api/v1/recomendaciones?limit=2&fields=moto_id,score&cursor={body['next_cursor']}")
+        self.assertEqual([item['moto_id'] for item in response.get_json()['data']], ['m2', 'm3'])
+        self.assertEqual(set(response.get_json()['data'][0]), {'moto_id', 'score'})
+
+        self.assertEqual(self.client.get('/api/v1/recomendaciones?cursor=eDo1').status_code, 400)
+
+    def test_not_modified_skips_recommender(self):
+        """Test para verificar que un ETag vigente responde 304 sin generar recomendaciones"""
+        response = self.client.get('/api/v1/recomendaciones?limit=2')
+        etag = response.headers['ETag']
+        self.assertEqual(self.adapter.calls, 1)
+
+        cached = self.client.get('/api/v1/recomendaciones?limit=2', headers={'If-None-Match': etag})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.adapter.calls, 1)
+
+        # Con datos nuevos el ETag cambia y la respuesta se vuelve a generar
+        self.adapter.data_version = 2
+        fresh = self.client.get('/api/v1/recomendaciones?limit=2', headers={'If-None-Match': etag})
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(self.adapter.calls, 2)
+
+    def test_hybrid_ranking_is_deterministic(self):
+        """Test para verificar que la exploración del híbrido se siembra por usuario y no es aleatoria"""
+        from app.algoritmo.hybrid_recommender import HybridMotoRecommender
+
+        hybrid = HybridMotoRecommender()
+        hybrid.interactions_df = None
+
+        def ranking(user_id):
+            recs = {f"m{i}": {'combined_score': 1.0, 'methods': [], 'all_reasons': [], 'moto_data': {}}
+                    for i in range(8)}
+            recs = hybrid._add_exploration_factor(recs, user_id)
+            return [moto_id for moto_id, _ in sorted(
+                recs.items(), key=lambda x: (x[1]['combined_score'], x[1]['exploration_key']), reverse=True)]
+
+        self.assertEqual(ranking('u1'), ranking('u1'))
+        self.assertNotEqual(ranking('u1'), ranking('u2'))
+
+class TestResponseCache(unittest.TestCase):
+    def test_lru_versions_and_invalidation(self):
+        """Test para verificar la expulsión LRU, las versiones y las invalidaciones por etiqueta"""
+        from app.algoritmo.response_cache import ResponseCache, cache_listener, moto_tag
+        
+        cache = ResponseCache(max_entries=2, ttl=None)
+        cache.set('populares', 'html', '<p>v1</p>', version=1)
+        self.assertEqual(cache.get('populares', 'html', 1), '<p>v1</p>')
+        self.assertIsNone(cache.get('populares', 'html', 2))
+        
+        cache.set('moto_detail', 'm1', 'ficha m1', tags=[moto_tag('m1')])
+        cache.get('populares', 'html', 1)
+        cache.set('moto_detail', 'm2', 'ficha m2', tags=[moto_tag('m2')])
+        # m1 era la entrada menos usada
+        self.assertIsNone(cache.get('moto_detail', 'm1'))
+        self.assertEqual(len(cache), 2)
+        
+        cache_listener(cache)('u1', 'm2', 'like', True)
+        self.assertEqual(len(cache), 0)
+
+class TestSourceFanout(unittest.TestCase):
+    def test_slow_and_failing_sources_are_dropped(self):
+        """Test para verificar que una fuente lenta o con error no bloquea a las demás"""
+        import time
+        from app.algoritmo.source_fanout import SourceFanout
+        
+        def failing():
+            raise ValueError("sin datos")
+        
+        fanout = SourceFanout(parallel=True, max_workers=3, timeout=1.0, timeouts={'slow': 0.05})
+        try:
+            start = time.monotonic()
+            outcome = fanout.run({'fast': lambda: [1, 2], 'slow': lambda: time.sleep(0.5), 'broken': failing})
+            self.assertLess(time.monotonic() - start, 0.4)
+            self.assertEqual(outcome.results, {'fast': [1, 2]})
+            self.assertEqual(outcome.dropped['slow'], 'timeout')
+            self.assertTrue(outcome.dropped['broken'].startswith('error'))
+            
+            serial = SourceFanout(parallel=False).run({'fast': lambda: [1], 'broken': failing})
+            self.assertEqual(serial.get('fast'), [1])
+            self.assertIn('broken', serial.dropped)
+        finally:
+            fanout.shutdown()
+
+    def test_timeout_counts_from_start_and_queue_is_bounded(self):
+        """Test para verificar que el plazo cuenta desde el inicio y que el pool saturado rechaza fuentes"""
+        import threading
+        import time
+        from app.algoritmo.source_fanout import SourceFanout
+
+        fanout = SourceFanout(parallel=True, max_workers=1, max_pending=2, timeout=0.3)
+        release = threading.Event()
+        try:
+            # La segunda fuente espera en cola a la primera: su plazo no se consume en la cola
+            outcome = fanout.run({'first': lambda: time.sleep(0.2) or 'a', 'second': lambda: time.sleep(0.2) or 'b'})
+            self.assertEqual(outcome.results, {'first': 'a', 'second': 'b'})
+
+            # Una fuente abandonada sigue ocupando su hueco hasta terminar
+            outcome = fanout.run({'stuck': release.wait})
+            self.assertEqual(outcome.dropped, {'stuck': 'timeout'})
+            self.assertEqual(fanout.pending, 1)
+            outcome = fanout.run({'queued': lambda: 'c', 'rejected': lambda: 'd'})
+            self.assertEqual(outcome.dropped, {'queued': 'queued', 'rejected': 'saturated'})
+
+            release.set()
+            time.sleep(0.05)
+            self.assertEqual(fanout.pending, 0)
+            self.assertEqual(fanout.run({'again': lambda: 'e'}).results, {'again': 'e'})
+        finally:
+            release.set()
+            fanout.shutdown()
+
+
+class TestDeadline(unittest.TestCase):
+    def test_expired_budget_returns_best_available_blend(self):
+        """Test para verificar que al agotarse el presupuesto se descartan fuentes y refinamientos"""
+        import time
+        from app.algoritmo.deadline import Deadline
+        from app.algoritmo.hybrid_recommender import HybridMotoRecommender
+        from app.algoritmo.source_fanout import SourceFanout
+        
+        fanout = SourceFanout(parallel=True, max_workers=2, timeout=1.0)
+        try:
+            deadline = Deadline(0.05)
+            outcome = fanout.run({'fast': lambda: [1], 'slow': lambda: time.sleep(0.3)}, deadline=deadline)
+            self.assertEqual(outcome.get('fast'), [1])
+            self.assertEqual(deadline.dropped, {'slow': 'deadline'})
+        finally:
+            fanout.shutdown()
+        
+        deadline = Deadline(1e-6)
+        time.sleep(0.001)
+        recs = [{'moto_id': 'm1', 'score': 0.5, 'moto_data': {'marca': 'Honda'}},
+                {'moto_id': 'm2', 'score': 0.9, 'moto_data': {'marca': 'Yamaha'}}]
+        final = HybridMotoRecommender()._combine_and_diversify_recommendations(
+            recs, [], [], [], 'u1', {}, 2, deadline=deadline)
+        self.assertEqual([rec['moto_id'] for rec in final], ['m2', 'm1'])
+        self.assertIn('final_diversity', deadline.dropped)
+
+
+class TestKnowledgeRules(unittest.TestCase):
+    def test_rules_are_evaluated_over_precomputed_features(self):
+        """Test para verificar las reglas expertas vectorizadas"""
+        from app.algoritmo.knowledge_rules import KnowledgeRulesEngine
+        
+        motos_df = pd.DataFrame({
+            'id': ['m1', 'm2', 'm3'],
+            'tipo': ['Naked', 'Sport', 'Scooter'],
+            'cilindrada': [650, 1000, 125],
+            'descripcion': ['Con ABS', '', None]
+        })
+        engine = KnowledgeRulesEngine()
+        recs = engine.recommend(motos_df, {'uso': 'ciudad', 'experiencia': 'principiante'}, top_n=5)
+        
+        self.assertEqual([(r['moto_id'], r['score']) for r in recs], [('m3', 6.0), ('m1', 1.5)])
+        self.assertIn("Sistemas de seguridad modernos", recs[1]['reasons'])
+        # Las características se calculan una sola vez por catálogo
+        self.assertIs(engine.prepare(motos_df), engine.prepare(motos_df))
+
+
+class TestPopularityBaseline(unittest.TestCase):
+    def test_incremental_updates_and_segments(self):
+        """Test para verificar la popularidad precalculada y sus segmentos"""
+        from app.algoritmo.popularity_baseline import PopularityBaseline, popularity_listener
+        
+        motos_df = pd.DataFrame({'id': ['m1', 'm2', 'm3'], 'tipo': ['Naked', 'Sport', 'Naked'],
+                                 'precio': [4000, 12000, 25000]})
+        interactions_df = pd.DataFrame({'user_id': ['u1', 'u2', 'u1'], 'moto_id': ['m1', 'm1', 'm2'],
+                                        'weight': [3.0, 3.0, 3.0]})
+        baseline = PopularityBaseline()
+        baseline.load(interactions_df, motos_df)
+        self.assertEqual(baseline.top(2), [('m1', 7.0, 2), ('m2', 3.5, 1)])
+        
+        listener = popularity_listener(baseline)
+        for user_id in ['u1', 'u2', 'u3']:
+            listener(user_id, 'm3', 'like', True)
+        listener('u1', 'm3', 'like', False)
+        self.assertEqual((baseline.score('m3'), baseline.count('m3')), (7.0, 2))
+        self.assertEqual([m for m, _, _ in baseline.top(5, tipo='naked')], ['m1', 'm3'])
+        self.assertEqual([m for m, _, _ in baseline.top(5, price_band='economica')], ['m1'])
+
+
+class TestTripletTrainingData(unittest.TestCase):
+    def test_triplets_and_feature_batches(self):
+        """Test para verificar la extracción de tripletes y el montaje de lotes"""
+        from scipy.sparse import csr_matrix
+        from app.algoritmo.training_data import TripletTrainingData
+        
+        matrix = csr_matrix(np.array([[0, 2.0, 0], [1.0, 0, 3.0]]))
+        user_features = pd.DataFrame({'edad': [0.5]}, index=['u2'])
+        moto_features = pd.DataFrame({'precio': [0.1, 0.2, 0.3]}, index=['m1', 'm2', 'm3'])
+        data = TripletTrainingData(matrix, user_features, moto_features,
+                                   user_ids=['u1', 'u2'], moto_ids=['m1', 'm2', 'm3'])
+        
+        self.assertEqual(len(data), 3)
+        batches = list(data.batches(batch_size=2))
+        self.assertEqual([len(targets) for _, targets in batches], [2, 1])
+        (users, motos, user_feats, moto_feats), targets = data.batch(np.arange(3))
+        self.assertEqual(list(zip(users, motos, targets)), [(0, 1, 2.0), (1, 0, 1.0), (1, 2, 3.0)])
+        # Los usuarios sin características reciben una fila de ceros
+        np.testing.assert_allclose(user_feats[:, 0], [0.0, 0.5, 0.5])
+        np.testing.assert_allclose(moto_feats[:, 0], [0.2, 0.1, 0.3])
+
+
+class TestSparseInteractionMatrices(unittest.TestCase):
+    def test_interaction_matrix_is_built_sparse(self):
+        """Test para verificar las matrices de interacción dispersas y sus consultas"""
+        import tempfile
+        from app.algoritmo.id_registry import reset_id_space
+        
+        reset_id_space()
+        recommender = AdvancedHybridRecommender({'model_path': tempfile.mkdtemp() + '/'})
+        recommender._build_interaction_matrices(pd.DataFrame({
+            'user_id': ['u1', 'u1', 'u1', 'u2'],
+            'moto_id': ['m1', 'm1', 'm2', 'm2'],
+            'interaction_type': ['view', 'click', 'purchase', 'like'],
+            'weight': [1.0, 1.0, 1.0, 2.0]
+        }))
+        
+        frame = recommender.interaction_df
+        self.assertEqual(frame.shape, (2, 2))
+        self.assertEqual(recommender.interaction_matrix.nnz, 3)
+        self.assertIn('u1', frame.index)
+        self.assertEqual(frame.loc['u1'].to_dict(), {'m1': 3.0, 'm2': 5.0})
+        self.assertEqual(frame.get('u2', 'm1'), 0.0)
+        self.assertEqual(frame.get('u2', 'm2'), 2.0)
+
+
+class TestTopK(unittest.TestCase):
+    def test_top_k_excludes_and_orders(self):
+        """Test para verificar la selección top-k individual y por lotes"""
+        from scipy.sparse import csr_matrix
+        from app.algoritmo.topk import top_k, top_k_rows
+        
+        scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+        self.assertEqual(top_k(scores, 3).tolist(), [1, 3, 2])
+        self.assertEqual(top_k(scores, 3, exclude=[1]).tolist(), [3, 2, 4])
+        self.assertEqual(top_k(scores, 10, exclude=[0, 1, 2, 3]).tolist(), [4])
+        
+        matrix = np.vstack([scores, scores[::-1]])
+        rated = csr_matrix(np.array([[0, 1, 0, 0, 0], [0, 0, 0, 0, 0]]))
+        indices, values = top_k_rows(matrix, 2, exclude=rated)
+        self.assertEqual(indices.tolist(), [[3, 2], [3, 1]])
+        np.testing.assert_allclose(values, [[0.7, 0.5], [0.9, 0.7]])
+
+
+class TestCandidateAccumulator(unittest.TestCase):
+    def test_keeps_best_score_and_skips_excluded(self):
+        """Test para verificar la deduplicación de candidatos de contenido"""
+        from app.algoritmo.topk import CandidateAccumulator
+        
+        candidates = CandidateAccumulator(exclude=['m1'])
+        self.assertFalse(candidates.add('m1', 5.0, 'ya valorada'))
+        candidates.add('m2', 0.4, 'por m1')
+        candidates.add('m3', 0.6, 'por m1')
+        self.assertTrue(candidates.add('m2', 0.9, lambda: 'por m4'))
+        self.assertFalse(candidates.add('m3', 0.5, lambda: self.fail('motivo evaluado sin necesidad')))
+        
+        self.assertEqual(candidates.top(5), [('m2', 0.9, 'por m4'), ('m3', 0.6, 'por m1')])
+        self.assertEqual(candidates.top(1), [('m2', 0.9, 'por m4')])
+
+
+class TestAnnIndex(unittest.TestCase):
+    def test_ivf_recall_and_exclude(self):
+        """Test para verificar el índice IVF frente a la búsqueda exacta"""
+        from app.algoritmo.ann_index import ExactIndex, IVFIndex, build_ann_index
+        
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(2000, 16))
+        queries = rng.normal(size=(20, 16))
+        exact = ExactIndex(metric='cosine').build(vectors)
+        ivf = IVFIndex(metric='cosine', n_lists=20, n_probe=8).build(vectors)
+        
+        hits = 0
+        for query in queries:
+            expected, _ = exact.search(query, 10)
+            found, _ = ivf.search(query, 10)
+            hits += len(set(expected.tolist()) & set(found.tolist()))
+        self.assertGreaterEqual(hits / (10 * len(queries)), 0.8)
+        
+        best = exact.search(queries[0], 1)[0][0]
+        self.assertNotIn(best, ivf.search(queries[0], 10, exclude=[best])[0].tolist())
+        self.assertIsInstance(build_ann_index(vectors[:100], kind='auto', n_probe=4), ExactIndex)
+        self.assertNotIsInstance(build_ann_index(vectors[:100], kind='auto'), IVFIndex)
+        self.assertIsInstance(build_ann_index(vectors, kind='auto'), IVFIndex)
+
+
+class TestMMRReranker(unittest.TestCase):
+    def test_caps_and_marginal_relevance(self):
+        """Test para verificar la reordenación MMR con límites por categoría"""
+        from app.algoritmo.diversity import MMRReranker
+        
+        relevance = [1.0, 0.9, 0.8, 0.7]
+        marcas = {'marca': ['honda', 'honda', 'honda', 'yamaha']}
+        
+        # Solo relevancia: el límite por marca se respeta y después se rellena
+        reranker = MMRReranker(lambda_=1.0, caps={'marca': 2})
+        self.assertEqual(reranker.rerank(relevance, 3, categories=marcas).tolist(), [0, 1, 3])
+        self.assertEqual(reranker.rerank(relevance, 4, categories=marcas).tolist(), [0, 1, 3, 2])
+        
+        # Con vectores, el casi duplicado de la primera moto pierde frente a una distinta
+        vectors = np.array([[1.0, 0.0], [0.99, 0.01], [0.0, 1.0], [0.5, 0.5]])
+        order = MMRReranker(lambda_=0.5).rerank(relevance, 2, vectors=vectors)
+        self.assertEqual(order.tolist(), [0, 2])
+
+
+class TestTracing(unittest.TestCase):
+    def test_spans_join_trace_across_fanout(self):
+        """Test para verificar las trazas por etapa (también desde los hilos de las fuentes)"""
+        from app.algoritmo.source_fanout import SourceFanout
+        from app.algoritmo.tracing import Tracer, LatencyHistogram
+        
+        tracer = Tracer()
+        fanout = SourceFanout(parallel=True, max_workers=2, timeout=5.0)
+        try:
+            with tracer.trace('recommendations') as trace:
+                with tracer.span('hybrid.sources'):
+                    outcome = fanout.run({
+                        'a': tracer.traced('hybrid.a', lambda: 1),
+                        'b': tracer.traced('hybrid.b', lambda: 2)
+                    })
+                self.assertEqual(tracer.current_trace_id(), trace.trace_id)
+        finally:
+            fanout.shutdown()
+        
+        self.assertEqual(outcome.results, {'a': 1, 'b': 2})
+        self.assertIsNone(tracer.current_trace_id())
+        dump = tracer.get_trace(trace.trace_id)
+        parents = {span['name']: span['parent'] for span in dump['spans']}
+        self.assertEqual(parents, {'hybrid.sources': None, 'hybrid.a': 'hybrid.sources',
+                                   'hybrid.b': 'hybrid.sources'})
+        self.assertEqual(tracer.histograms()['hybrid.a']['count'], 1)
+        self.assertIn('recommendations', tracer.histograms())
+        
+        histogram = LatencyHistogram(buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.05, 0.5, 2.0):
+            histogram.observe(seconds)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['buckets'], {0.1: 2, 1.0: 3})
+        self.assertEqual(snapshot['p50'], 0.1)
+        self.assertEqual(snapshot['p99'], 2.0)
+
+    def test_trace_endpoints_require_admin(self):
+        """Test para verificar que /trazas solo se sirve en modo debug o a administradores"""
+        from flask import Flask
+        from app.api_v1 import api_v1
+
+        app = Flask(__name__)
+        app.secret_key = 'test'
+        app.config['API_CONFIG'] = {'admin_users': ['root']}
+        app.register_blueprint(api_v1, url_prefix='/api/v1')
+        client = app.test_client()
+
+        self.assertEqual(client.get('/api/v1/trazas').status_code, 401)
+        with client.session_transaction() as sess:
+            sess['username'] = 'ana'
+        self.assertEqual(client.get('/api/v1/trazas').status_code, 403)
+        self.assertEqual(client.get('/api/v1/trazas/abc').status_code, 403)
+
+        app.debug = True
+        self.assertEqual(client.get('/api/v1/trazas').status_code, 200)
+        app.debug = False
+        with client.session_transaction() as sess:
+            sess['username'] = 'root'
+        self.assertEqual(client.get('/api/v1/trazas').status_code, 200)
+        self.assertEqual(client.get('/api/v1/trazas/abc').status_code, 404)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_prometheus_exposition(self):
+        """Test para verificar el formato de /metrics y las métricas de PageRank"""
+        from app.algoritmo.metrics import MetricsRegistry, PAGERANK_ITERATIONS, metrics, track_query
+        from app.algoritmo.pagerank import MotoPageRank
+        
+        registry = MetricsRegistry()
+        requests_total = registry.counter('demo_requests_total', 'Peticiones', ['route'])
+        requests_total.inc(route='/populares')
+        requests_total.inc(2, route='/populares')
+        latency = registry.histogram('demo_latency_seconds', 'Latencia', ['route'], buckets=(0.1, 1.0))
+        latency.observe(0.05, route='/x')
+        latency.observe(0.5, route='/x')
+        text = registry.render()
+        self.assertIn('# TYPE demo_requests_total counter', text)
+        self.assertIn('demo_requests_total{route="/populares"} 3', text)
+        self.assertIn('demo_latency_seconds_bucket{route="/x",le="0.1"} 1', text)
+        self.assertIn('demo_latency_seconds_bucket{route="/x",le="+Inf"} 2', text)
+        self.assertIn('demo_latency_seconds_count{route="/x"} 2', text)
+        
+        pagerank = MotoPageRank()
+        pagerank.build_graph([{'user_id': 'u1', 'moto_id': 'm1', 'weight': 1.0},
+                              {'user_id': 'u2', 'moto_id': 'm2', 'weight': 1.0},
+                              {'user_id': 'u2', 'moto_id': 'm1', 'weight': 1.0}])
+        pagerank.calculate_pagerank()
+        self.assertGreater(PAGERANK_ITERATIONS.get(), 0)
+        
+        with self.assertRaises(RuntimeError):
+            with track_query('demo_query'):
+                raise RuntimeError('fallo')
+        text = metrics.render()
+        self.assertIn('motomatch_neo4j_queries_total{query="demo_query",status="error"} 1', text)
+        self.assertIn('motomatch_pagerank_iterations ', text)
+
+
+class TestLogConfig(unittest.TestCase):
+    def test_item_logger_samples_and_skips_when_disabled(self):
+        """Test para verificar el muestreo de ItemLogger y que no formatea con DEBUG desactivado"""
+        import logging
+        from app.algoritmo.log_config import ItemLogger, parse_levels
+        
+        logger = logging.getLogger('tests.item_logger')
+        logger.propagate = False
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger.addHandler(handler)
+        try:
+            logger.setLevel(logging.DEBUG)
+            item_log = ItemLogger(logger, every=3)
+            for i in range(7):
+                item_log.debug("moto %s", i)
+            self.assertEqual([record.getMessage() for record in records], ['moto 0', 'moto 3', 'moto 6'])
+            
+            # Con DEBUG desactivado no se escribe ni se formatea nada
+            logger.setLevel(logging.INFO)
+            records.clear()
+            self.assertFalse(item_log.sample())
+            item_log.debug("moto %s", object())
+            self.assertEqual(records, [])
+        finally:
+            logger.removeHandler(handler)
+        
+        self.assertEqual(parse_levels('evaluator=debug, neo4j=WARNING,,x'),
+                         {'evaluator': 'DEBUG', 'neo4j': 'WARNING'})
+
+    def test_configure_logging_applies_format_and_levels(self):
+        """Test para verificar que configure_logging aplica el formato de LOGGING_CONFIG y los niveles"""
+        import logging
+        from app.algoritmo.log_config import configure_logging
+
+        root = logging.getLogger()
+        saved_handlers, saved_level = root.handlers[:], root.level
+        root.handlers = []
+        try:
+            configure_logging({'level': 'WARNING', 'format': '%(levelname)s|%(message)s',
+                               'levels': {'tests.subsystem': 'DEBUG'}})
+            self.assertEqual(len(root.handlers), 1)
+            self.assertEqual(root.handlers[0].formatter._fmt, '%(levelname)s|%(message)s')
+            self.assertEqual(root.level, logging.WARNING)
+            self.assertEqual(logging.getLogger('tests.subsystem').level, logging.DEBUG)
+        finally:
+            root.handlers = saved_handlers
+            root.setLevel(saved_level)
+            logging.getLogger('tests.subsystem').setLevel(logging.NOTSET)
+
+
+class TestQueryProfiler(unittest.TestCase):
+    def test_profiler_records_stats_slow_queries_and_plans(self):
+        """Test para verificar las estadísticas, el log de consultas lentas y los planes de PROFILE"""
+        from types import SimpleNamespace
+        from app.algoritmo.query_profiler import QueryProfiler, redact_params
+        
+        class FakeResult:
+            def __init__(self, rows, profile=None):
+                self.rows = rows
+                self.summary = SimpleNamespace(result_available_after=3, result_consumed_after=2, profile=profile)
+            def __iter__(self):
+                return iter(self.rows)
+            def consume(self):
+                return self.summary
+        
+        class FakeSession:
+            def __init__(self):
+                self.queries = []
+            def run(self, query, parameters=None, **kwargs):
+                self.queries.append(query)
+                if 'FALLA' in query:
+                    raise RuntimeError('fallo')
+                profile = None
+                if query.startswith('PROFILE'):
+                    profile = {'operatorType': 'ProduceResults', 'dbHits': 1, 'rows': 2,
+                               'children': [{'operatorType': 'NodeByLabelScan', 'dbHits': 4, 'rows': 2}]}
+                return FakeResult([{'id': 'm1'}, {'id': 'm2'}], profile)
+        
+        profiler = QueryProfiler({'slow_query_ms': 0.0, 'log_params': ['limit']})
+        session = FakeSession()
+        with self.assertLogs('app.algoritmo.query_profiler', level='WARNING') as logs:
+            result = profiler.run(session, 'motos', "MATCH (m:Moto) RETURN m.id AS id", user_id='secreto', limit=5)
+        self.assertEqual(result.single(), {'id': 'm1'})
+        self.assertEqual(len(result), 2)
+        self.assertNotIn('secreto', logs.output[0])
+        self.assertIn('<str:7>', logs.output[0])
+        self.assertIn("'limit': 5", logs.output[0])
+        
+        profiler.profile_next('motos')
+        profiler.run(session, 'motos', "MATCH (m:Moto) RETURN m.id AS id")
+        profiler.run(session, 'motos', "MATCH (m:Moto) RETURN m.id AS id")
+        self.assertEqual([q.startswith('PROFILE') for q in session.queries], [False, True, False])
+        self.assertEqual(profiler.get_plan('motos')['db_hits'], 5)
+        
+        with self.assertRaises(RuntimeError):
+            profiler.run(session, 'rota', "FALLA")
+        report = {row['query']: row for row in profiler.report()}
+        self.assertEqual(report['motos']['count'], 3)
+        self.assertEqual(report['motos']['server_avg_ms'], 5.0)
+        self.assertTrue(report['motos']['has_plan'])
+        self.assertEqual(report['rota']['errors'], 1)
+        self.assertEqual(redact_params({'ids': [1, 2, 3], 'x': None}), {'ids': '<list:3>', 'x': None})
+        
+        # Solo se perfilan consultas conocidas y las peticiones pendientes están acotadas
+        self.assertEqual(profiler.profile_next('inventada', 3), 0)
+        self.assertFalse(profiler.knows('inventada'))
+        self.assertEqual(profiler.profile_next('motos', 100), profiler.config['max_profile_requests'])
+
+    def test_plan_endpoint_is_restricted_and_bounded(self):
+        """Test para verificar que /consultas exige administrador, consultas conocidas y veces acotado"""
+        from flask import Flask
+        from app.api_v1 import api_v1
+        from app.algoritmo.query_profiler import profiler
+        
+        profiler.reset()
+        profiler.record('load_motos', 'MATCH (m:Moto) RETURN m', {}, 0.001)
+        app = Flask(__name__)
+        app.secret_key = 'test'
+        app.config['API_CONFIG'] = {'admin_users': ['root']}
+        app.register_blueprint(api_v1, url_prefix='/api/v1')
+        client = app.test_client()
+        try:
+            with client.session_transaction() as sess:
+                sess['username'] = 'ana'
+            self.assertEqual(client.get('/api/v1/consultas').status_code, 403)
+            self.assertEqual(client.post('/api/v1/consultas/load_motos/plan').status_code, 403)
+            
+            with client.session_transaction() as sess:
+                sess['username'] = 'root'
+            self.assertEqual(client.get('/api/v1/consultas').status_code, 200)
+            self.assertEqual(client.post('/api/v1/consultas/inventada/plan').status_code, 404)
+            self.assertEqual(client.post('/api/v1/consultas/load_motos/plan?veces=1000').status_code, 400)
+            response = client.post('/api/v1/consultas/load_motos/plan?veces=2')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.get_json()['profile_pending'], 2)
+        finally:
+            profiler.reset()